@@ -64,6 +64,7 @@ type.
    subtype 0.
 """
 
+import array
 import calendar
 import datetime
 import itertools
@@ -77,10 +78,13 @@ from codecs import (utf_8_decode as _utf_8_decode,
 
 from bson.binary import (Binary, OLD_UUID_SUBTYPE,
                          JAVA_LEGACY, CSHARP_LEGACY,
-                         UUIDLegacy)
+                         UUIDLegacy, PackedArray, VECTOR_SUBTYPE,
+                         _PACKED_TYPES, _PACKED_TYPECODES)
 from bson.code import Code
 from bson.codec_options import (
-    CodecOptions, DEFAULT_CODEC_OPTIONS, _raw_document_class)
+    CodecOptions, DEFAULT_CODEC_OPTIONS, _MAX_CACHED_TYPES,
+    _raw_document_class, _record_type)
+from bson.datetime_ms import DatetimeConversion, DatetimeMS
 from bson.dbref import DBRef
 from bson.decimal128 import Decimal128
 from bson.errors import (InvalidBSON,
@@ -92,11 +96,13 @@ from bson.min_key import MinKey
 from bson.objectid import ObjectId
 from bson.py3compat import (abc,
                             b,
+                            integer_types,
                             PY3,
                             iteritems,
                             text_type,
                             string_type,
                             reraise)
+from bson.record import _MISSING
 from bson.regex import Regex
 from bson.son import SON, RE_TYPE
 from bson.timestamp import Timestamp
@@ -139,6 +145,7 @@ BSONMAX = b"\x7F" # Max key
 
 _UNPACK_FLOAT = struct.Struct("<d").unpack
 _UNPACK_INT = struct.Struct("<i").unpack
+_UNPACK_INT_FROM = struct.Struct("<i").unpack_from
 _UNPACK_LENGTH_SUBTYPE = struct.Struct("<iB").unpack
 _UNPACK_LONG = struct.Struct("<q").unpack
 _UNPACK_TIMESTAMP = struct.Struct("<II").unpack
@@ -157,11 +164,30 @@ def _get_int(data, position, dummy0, dummy1, dummy2):
     return _UNPACK_INT(data[position:end])[0], end
 
 
+# Decoded C strings, mostly document keys, by their encoded bytes.
+_C_STRING_CACHE = {}
+_C_STRING_CACHE_SIZE = 1024
+_C_STRING_CACHE_MAX_LENGTH = 64
+
+
 def _get_c_string(data, position, opts):
     """Decode a BSON 'C' string to python unicode string."""
     end = data.index(b"\x00", position)
-    return _utf_8_decode(data[position:end],
-                         opts.unicode_decode_error_handler, True)[0], end + 1
+    encoded = data[position:end]
+    string = _C_STRING_CACHE.get(encoded)
+    if string is None:
+        try:
+            string = _utf_8_decode(encoded, 'strict', True)[0]
+        except UnicodeDecodeError:
+            # Don't cache invalid strings, they decode differently with
+            # each unicode_decode_error_handler.
+            return _utf_8_decode(encoded, opts.unicode_decode_error_handler,
+                                 True)[0], end + 1
+        if len(encoded) <= _C_STRING_CACHE_MAX_LENGTH:
+            if len(_C_STRING_CACHE) >= _C_STRING_CACHE_SIZE:
+                _C_STRING_CACHE.clear()
+            _C_STRING_CACHE[encoded] = string
+    return string, end + 1
 
 
 def _get_float(data, position, dummy0, dummy1, dummy2):
@@ -174,10 +200,11 @@ def _get_string(data, position, obj_end, opts, dummy):
     """Decode a BSON string to python unicode string."""
     length = _UNPACK_INT(data[position:position + 4])[0]
     position += 4
+    end = position + length - 1
+    # Even trusted BSON must not move the position backwards.
     if length < 1 or obj_end - position < length:
         raise InvalidBSON("invalid string length")
-    end = position + length - 1
-    if data[end:end + 1] != b"\x00":
+    if opts.validate and data[end:end + 1] != b"\x00":
         raise InvalidBSON("invalid end of string")
     return _utf_8_decode(data[position:end],
                          opts.unicode_decode_error_handler, True)[0], end + 1
@@ -213,6 +240,10 @@ def _get_array(data, position, obj_end, opts, element_name):
 
     position += 4
     end -= 1
+    if opts.typed_arrays:
+        result = _get_typed_array(data, position, end)
+        if result is not None:
+            return result, end + 2
     result = []
 
     # Avoid doing global and attibute lookups in the loop.
@@ -236,6 +267,60 @@ def _get_array(data, position, obj_end, opts, element_name):
     return result, position + 1
 
 
+def _get_typed_array(data, position, end):
+    """Decode the values of a BSON array of numbers to an array.array.
+
+    Returns None unless all the values are doubles, all are int32 or all are
+    int64.
+    """
+    element_type = data[position:position + 1]
+    try:
+        typecode, size = _TYPED_ARRAY_TYPES[element_type]
+    except KeyError:
+        return None
+    if typecode is None:
+        typecode = _array_typecode(size)
+        if typecode is None:
+            # Decoded to a list, like the C extension does.
+            return None
+    index = data.index
+    values = []
+    append = values.append
+    while position < end:
+        if data[position:position + 1] != element_type:
+            return None
+        # Just skip the keys.
+        position = index(b'\x00', position + 1) + 1
+        append(data[position:position + size])
+        position += size
+    if position != end + 1:
+        raise InvalidBSON('bad array length')
+    result = _make_array(typecode, b"".join(values))
+    if sys.byteorder == "big":
+        result.byteswap()
+    return result
+
+
+def _get_packed_array(data, position, end):
+    """Decode a packed array to a memoryview, or None if its type is unknown.
+    """
+    if end - position < 2 or data[position + 1:position + 2] != b"\x00":
+        return None
+    typecode = _PACKED_TYPECODES.get(ord(bytes(data[position:position + 1])))
+    if typecode is None:
+        return None
+    # Truncated numbers are decoded to Binary, like the C extension.
+    if (end - position - 2) % array.array(typecode).itemsize:
+        return None
+    if PY3 and sys.byteorder == "little":
+        # A view of the numbers in data, without copying them.
+        return memoryview(data)[position + 2:end].cast(typecode)
+    result = _make_array(typecode, data[position + 2:end])
+    if sys.byteorder == "big":
+        result.byteswap()
+    return memoryview(result) if PY3 else result
+
+
 def _get_binary(data, position, obj_end, opts, dummy1):
     """Decode a BSON binary to bson.binary.Binary or python UUID."""
     length, subtype = _UNPACK_LENGTH_SUBTYPE(data[position:position + 5])
@@ -264,6 +349,10 @@ def _get_binary(data, position, obj_end, opts, dummy1):
         return value, end
     if subtype == 4:
         return uuid.UUID(bytes=data[position:end]), end
+    if subtype == VECTOR_SUBTYPE and opts.typed_arrays and length >= 2:
+        value = _get_packed_array(data, position, end)
+        if value is not None:
+            return value, end
     # Python3 special case. Decode subtype 0 to 'bytes'.
     if PY3 and subtype == 0:
         value = data[position:end]
@@ -293,7 +382,7 @@ def _get_date(data, position, dummy0, opts, dummy1):
     """Decode a BSON datetime to python datetime.datetime."""
     end = position + 8
     millis = _UNPACK_LONG(data[position:end])[0]
-    return _millis_to_datetime(millis, opts), end
+    return _millis_to_date(millis, opts), end
 
 
 def _get_code(data, position, obj_end, opts, element_name):
@@ -406,8 +495,116 @@ def _iterate_elements(data, position, obj_end, opts):
         yield key, value, position
 
 
-def _elements_to_dict(data, position, obj_end, opts):
+# Size of the values of fixed length BSON types.
+_ELEMENT_SIZE = {
+    BSONNUM: 8,
+    BSONUND: 0,
+    BSONOID: 12,
+    BSONBOO: 1,
+    BSONDAT: 8,
+    BSONNUL: 0,
+    BSONINT: 4,
+    BSONTIM: 8,
+    BSONLON: 8,
+    BSONDEC: 16,
+    BSONMIN: 0,
+    BSONMAX: 0,
+}
+
+
+def _skip_element(data, position, obj_end, element_type, element_name):
+    """Return the position just past an element value, without decoding it.
+    """
+    size = _ELEMENT_SIZE.get(element_type)
+    if size is None:
+        if element_type == BSONRGX:
+            # Pattern and options are both C strings.
+            end = data.index(b"\x00", data.index(b"\x00", position) + 1) + 1
+            if end > obj_end:
+                raise InvalidBSON("invalid regex length")
+            return end
+        if element_type not in (BSONSTR, BSONOBJ, BSONARR, BSONBIN,
+                                BSONREF, BSONCOD, BSONSYM, BSONCWS):
+            _raise_unknown_type(element_type, _utf_8_decode(
+                element_name, "replace", True)[0])
+        size = _UNPACK_INT(data[position:position + 4])[0]
+        if size < 0:
+            raise InvalidBSON("invalid element length")
+        if element_type in (BSONSTR, BSONCOD, BSONSYM):
+            size += 4
+        elif element_type == BSONBIN:
+            size += 5
+        elif element_type == BSONREF:
+            size += 16
+    end = position + size
+    if end > obj_end:
+        raise InvalidBSON("invalid element length")
+    return end
+
+
+def _element_offsets(data, position, obj_end, opts):
+    """Map the name of each element of a BSON document to its position.
+
+    Only the names are decoded, the values are skipped by length. The element
+    at a position can be decoded later with :func:`_element_to_dict`.
+    """
+    offsets = {}
+    end = obj_end - 1
+    while position < end:
+        element_type = data[position:position + 1]
+        name, value_position = _get_c_string(data, position + 1, opts)
+        offsets[name] = position
+        position = _skip_element(data, value_position, obj_end, element_type,
+                                 data[position + 1:value_position - 1])
+    if position != obj_end:
+        raise InvalidBSON('bad object or element length')
+    return offsets
+if _USE_C:
+    _element_offsets = _cbson._element_offsets
+
+
+def _fields_filter(fields):
+    """Convert the `fields` argument of the decode functions to a frozenset
+    of UTF-8 encoded key names, or None to decode every field.
+    """
+    if fields is None:
+        return None
+    if isinstance(fields, (string_type, bytes)):
+        raise TypeError("fields must be an iterable of key names, not %r" % (
+            fields,))
+    return frozenset(_utf_8_encode(name)[0] if isinstance(name, text_type)
+                     else name for name in fields)
+
+
+def _selected_elements_to_dict(data, position, obj_end, opts, fields):
+    """Decode only the elements of a BSON document named in `fields`.
+
+    The other elements are skipped by length, without decoding their names
+    or values.
+    """
+    result = opts.document_class()
+    end = obj_end - 1
+    index = data.index
+    while position < end:
+        name_end = index(b"\x00", position + 1)
+        if data[position + 1:name_end] in fields:
+            key, value, position = _element_to_dict(
+                data, position, obj_end, opts)
+            result[key] = value
+        else:
+            position = _skip_element(data, name_end + 1, obj_end,
+                                     data[position:position + 1],
+                                     data[position + 1:name_end])
+    if position != obj_end:
+        raise InvalidBSON('bad object or element length')
+    return result
+
+
+def _elements_to_dict(data, position, obj_end, opts, fields=None):
     """Decode a BSON document."""
+    if fields is not None:
+        return _selected_elements_to_dict(data, position, obj_end, opts,
+                                          fields)
     result = opts.document_class()
     pos = position
     for key, value, pos in _iterate_elements(data, position, obj_end, opts):
@@ -417,7 +614,35 @@ def _elements_to_dict(data, position, obj_end, opts):
     return result
 
 
-def _bson_to_dict(data, opts):
+def _elements_to_record(data, position, obj_end, opts, fields=None):
+    """Decode a BSON document to a record of the RecordType
+    opts.document_class.
+
+    Elements that aren't fields of the record, or aren't in `fields`, are
+    skipped by length without decoding their values.
+    """
+    record_type = opts.document_class
+    keys = record_type._keys
+    values = [_MISSING] * len(keys)
+    # Embedded documents are decoded to dict.
+    opts = opts._replace(document_class=dict)
+    end = obj_end - 1
+    index = data.index
+    while position < end:
+        name_end = index(b"\x00", position + 1)
+        name = data[position + 1:name_end]
+        if name in keys and (fields is None or name in fields):
+            _, values[keys.index(name)], position = _element_to_dict(
+                data, position, obj_end, opts)
+        else:
+            position = _skip_element(data, name_end + 1, obj_end,
+                                     data[position:position + 1], name)
+    if position != obj_end:
+        raise InvalidBSON('bad object or element length')
+    return record_type._new(values)
+
+
+def _bson_to_dict(data, opts, fields=None):
     """Decode a BSON string to document_class."""
     try:
         obj_size = _UNPACK_INT(data[:4])[0]
@@ -430,7 +655,9 @@ def _bson_to_dict(data, opts):
     try:
         if _raw_document_class(opts.document_class):
             return opts.document_class(data, opts)
-        return _elements_to_dict(data, 4, obj_size - 1, opts)
+        if _record_type(opts.document_class):
+            return _elements_to_record(data, 4, obj_size - 1, opts, fields)
+        return _elements_to_dict(data, 4, obj_size - 1, opts, fields)
     except InvalidBSON:
         raise
     except Exception:
@@ -447,6 +674,22 @@ _PACK_LENGTH_SUBTYPE = struct.Struct("<iB").pack
 _PACK_LONG = struct.Struct("<q").pack
 _PACK_TIMESTAMP = struct.Struct("<II").pack
 _LIST_NAMES = tuple(b(str(i)) + b"\x00" for i in range(1000))
+# Cache of array keys, grown as needed up to _MAX_CACHED_LIST_NAMES keys.
+_LIST_NAME_CACHE = list(_LIST_NAMES)
+_MAX_CACHED_LIST_NAMES = 65536
+
+
+def _list_names(count):
+    """Return a list of at least `count` array keys, b"0\x00", b"1\x00", ...
+    """
+    global _LIST_NAME_CACHE
+    names = _LIST_NAME_CACHE
+    if len(names) < count:
+        more = [b(str(i)) + b"\x00" for i in range(len(names), count)]
+        if count > _MAX_CACHED_LIST_NAMES:
+            return names + more
+        names = _LIST_NAME_CACHE = names + more
+    return names
 
 
 def gen_list_name():
@@ -561,13 +804,62 @@ def _encode_dbref(name, value, check_keys, opts):
 
 def _encode_list(name, value, check_keys, opts):
     """Encode a list/tuple."""
-    lname = gen_list_name()
-    data = b"".join([_name_value_to_bson(next(lname), item,
+    names = _list_names(len(value))
+    data = b"".join([_name_value_to_bson(names[i], item,
                                          check_keys, opts)
-                     for item in value])
+                     for i, item in enumerate(value)])
     return b"\x04" + name + _PACK_INT(len(data) + 5) + data + b"\x00"
 
 
+# The BSON type and little endian struct format of the values of a buffer,
+# for each buffer format that can be encoded as a BSON array.
+_BUFFER_FORMATS = {
+    "f": (BSONNUM, "d"),
+    "d": (BSONNUM, "d"),
+    "b": (BSONINT, "i"),
+    "B": (BSONINT, "i"),
+    "h": (BSONINT, "i"),
+    "H": (BSONINT, "i"),
+    "i": (BSONINT, "i"),
+    "I": (BSONLON, "q"),
+    "l": (BSONLON, "q"),
+    "L": (BSONLON, "q"),
+    "q": (BSONLON, "q"),
+    "Q": (BSONLON, "q"),
+    "?": (BSONBOO, "?"),
+}
+
+
+def _encode_buffer(name, value, dummy0, dummy1):
+    """Encode an array.array, memoryview or other buffer of numbers."""
+    if isinstance(value, array.array):
+        # Python 2's array.array does not support the buffer protocol.
+        buffer_format = value.typecode
+    else:
+        value = memoryview(value)
+        buffer_format = value.format.lstrip("@")
+    element_type, pack_format = _BUFFER_FORMATS[buffer_format]
+    values = value.tolist()
+    count = len(values)
+    try:
+        packed = struct.pack("<%d%s" % (count, pack_format), *values)
+    except struct.error:
+        raise OverflowError("BSON can only handle up to 8-byte ints")
+    size = len(packed) // count if count else 0
+    names = _list_names(count)
+    data = b"".join([element_type + names[i] + packed[i * size:i * size + size]
+                     for i in range(count)])
+    return b"\x04" + name + _PACK_INT(len(data) + 5) + data + b"\x00"
+
+
+def _encode_packed_array(name, value, dummy0, dummy1):
+    """Encode bson.binary.PackedArray."""
+    data = value.data.tobytes()
+    return (b"\x05" + name +
+            _PACK_LENGTH_SUBTYPE(len(data) + 2, VECTOR_SUBTYPE) +
+            struct.pack("<BB", _PACKED_TYPES[value.typecode], 0) + data)
+
+
 def _encode_text(name, value, dummy0, dummy1):
     """Encode a python unicode (python 2.x) / str (python 3.x)."""
     value = _utf_8_encode(value)[0]
@@ -618,6 +910,11 @@ def _encode_datetime(name, value, dummy0, dummy1):
     return b"\x09" + name + _PACK_LONG(millis)
 
 
+def _encode_datetime_ms(name, value, dummy0, dummy1):
+    """Encode bson.datetime_ms.DatetimeMS."""
+    return b"\x09" + name + _PACK_LONG(int(value))
+
+
 def _encode_none(name, dummy0, dummy1, dummy2):
     """Encode python None."""
     return b"\x0A" + name
@@ -709,6 +1006,7 @@ _ENCODERS = {
     bool: _encode_bool,
     bytes: _encode_bytes,
     datetime.datetime: _encode_datetime,
+    DatetimeMS: _encode_datetime_ms,
     dict: _encode_mapping,
     float: _encode_float,
     int: _encode_int,
@@ -731,6 +1029,7 @@ _ENCODERS = {
     Timestamp: _encode_timestamp,
     UUIDLegacy: _encode_binary,
     Decimal128: _encode_decimal128,
+    PackedArray: _encode_packed_array,
     # Special case. This will never be looked up directly.
     abc.Mapping: _encode_mapping,
 }
@@ -739,11 +1038,13 @@ _ENCODERS = {
 _MARKERS = {
     5: _encode_binary,
     7: _encode_objectid,
+    9: _encode_datetime_ms,
     11: _encode_regex,
     13: _encode_code,
     17: _encode_timestamp,
     18: _encode_long,
     100: _encode_dbref,
+    102: _encode_packed_array,
     127: _encode_maxkey,
     255: _encode_minkey,
 }
@@ -752,47 +1053,74 @@ if not PY3:
     _ENCODERS[long] = _encode_long
 
 
-def _name_value_to_bson(name, value, check_keys, opts,
-                        in_fallback_call=False):
-    """Encode a single name, value pair."""
-    # Custom encoder (if any) takes precedence over default encoders.
-    # Using 'if' instead of 'try...except' for performance since this will
-    # usually not be true.
-    # No support for auto-encoding subtypes of registered custom types.
-    if opts.type_registry._encoder_map:
-        custom_encoder = opts.type_registry._encoder_map.get(type(value))
-        if custom_encoder is not None:
-            value = custom_encoder(value)
-
-    # First see if the type is already cached. KeyError will only ever
-    # happen once per subtype.
-    try:
-        return _ENCODERS[type(value)](name, value, check_keys, opts)
-    except KeyError:
-        pass
+def _builtin_encoder(value_type):
+    """Return the function encoding values of `value_type`, or None."""
+    # First see if the type is already cached.
+    func = _ENCODERS.get(value_type)
+    if func is not None:
+        return func
 
     # Second, fall back to trying _type_marker. This has to be done
     # before the loop below since users could subclass one of our
     # custom types that subclasses a python built-in (e.g. Binary)
-    marker = getattr(value, "_type_marker", None)
+    marker = getattr(value_type, "_type_marker", None)
     if isinstance(marker, int) and marker in _MARKERS:
         func = _MARKERS[marker]
-        # Cache this type for faster subsequent lookup.
-        _ENCODERS[type(value)] = func
+    else:
+        # If all else fails test each base type. This will only happen once
+        # for a subtype of a supported base type.
+        for base in _ENCODERS:
+            if issubclass(value_type, base):
+                func = _ENCODERS[base]
+                break
+        else:
+            return None
+    # Cache this type for faster subsequent lookup.
+    _ENCODERS[value_type] = func
+    return func
+
+
+def _name_value_to_bson(name, value, check_keys, opts,
+                        in_fallback_call=False):
+    """Encode a single name, value pair."""
+    registry = opts.type_registry
+    if registry._encoder_map or registry._fallback_encoder is not None:
+        # Resolve the custom encoder or the encoding function of each type
+        # once per type registry, including the types that can only be
+        # encoded by the fallback encoder.
+        # No support for auto-encoding subtypes of registered custom types.
+        value_type = type(value)
+        try:
+            custom_encoder, func = registry._encoder_cache[value_type]
+        except KeyError:
+            custom_encoder = registry._encoder_map.get(value_type)
+            func = None
+            if custom_encoder is None:
+                func = _builtin_encoder(value_type)
+            cache = registry._encoder_cache
+            if len(cache) >= _MAX_CACHED_TYPES:
+                cache.clear()
+            cache[value_type] = (custom_encoder, func)
+        # Custom encoder (if any) takes precedence over default encoders.
+        if custom_encoder is not None:
+            value = custom_encoder(value)
+            func = _builtin_encoder(type(value))
+    else:
+        func = _ENCODERS.get(type(value))
+        if func is None:
+            func = _builtin_encoder(type(value))
+
+    if func is not None:
         return func(name, value, check_keys, opts)
 
-    # If all else fails test each base type. This will only happen once for
-    # a subtype of a supported base type.
-    for base in _ENCODERS:
-        if isinstance(value, base):
-            func = _ENCODERS[base]
-            # Cache this type for faster subsequent lookup.
-            _ENCODERS[type(value)] = func
-            return func(name, value, check_keys, opts)
+    # Objects supporting the buffer protocol, like array.array, memoryview
+    # or a NumPy ndarray.
+    if _is_numeric_buffer(value):
+        return _encode_buffer(name, value, check_keys, opts)
 
     # As a last resort, try using the fallback encoder, if the user has
     # provided one.
-    fallback_encoder = opts.type_registry._fallback_encoder
+    fallback_encoder = registry._fallback_encoder
     if not in_fallback_call and fallback_encoder is not None:
         return _name_value_to_bson(
             name, fallback_encoder(value), check_keys, opts, True)
@@ -801,6 +1129,21 @@ def _name_value_to_bson(name, value, check_keys, opts,
         "cannot convert value of type %s to bson" % type(value))
 
 
+def _is_numeric_buffer(value):
+    """Is value a one dimensional buffer of numbers that _encode_buffer
+    supports, other than a bytearray?
+    """
+    if isinstance(value, array.array):
+        return value.typecode in _BUFFER_FORMATS
+    if isinstance(value, bytearray):
+        return False
+    try:
+        view = memoryview(value)
+    except TypeError:
+        return False
+    return view.ndim == 1 and view.format.lstrip("@") in _BUFFER_FORMATS
+
+
 def _element_to_bson(key, value, check_keys, opts):
     """Encode a single key, value pair."""
     if not isinstance(key, string_type):
@@ -816,10 +1159,24 @@ def _element_to_bson(key, value, check_keys, opts):
     return _name_value_to_bson(name, value, check_keys, opts)
 
 
+def _record_items(doc, opts, top_level):
+    """The (key, value) pairs of `doc` if it is a top-level record of the
+    RecordType opts.document_class, or None.
+    """
+    record_type = opts.document_class
+    if (top_level and _record_type(record_type) and
+            isinstance(doc, record_type.record_class)):
+        return record_type._items(doc)
+    return None
+
+
 def _dict_to_bson(doc, check_keys, opts, top_level=True):
     """Encode a document to BSON."""
     if _raw_document_class(doc):
         return doc.raw
+    items = _record_items(doc, opts, top_level)
+    if items is not None:
+        doc = SON(items)
     try:
         elements = []
         if top_level and "_id" in doc:
@@ -838,6 +1195,134 @@ if _USE_C:
     _dict_to_bson = _cbson._dict_to_bson
 
 
+def _encode_into(doc, buf, offset, check_keys, opts):
+    """Encode a document into `buf` at `offset`, return the length written."""
+    if offset < 0 or offset > len(buf):
+        raise ValueError("offset %d is out of range for a buffer of "
+                         "length %d" % (offset, len(buf)))
+    encoded = _dict_to_bson(doc, check_keys, opts)
+    length = len(encoded)
+    if isinstance(buf, bytearray):
+        # Slice assignment grows the bytearray as needed.
+        buf[offset:offset + length] = encoded
+    else:
+        view = memoryview(buf)
+        if view.readonly:
+            raise TypeError("encode_into requires a writable buffer")
+        if offset + length > len(view):
+            raise ValueError("buffer too small: %d bytes needed at offset %d "
+                             "but only %d available" % (
+                                 length, offset, len(view) - offset))
+        view[offset:offset + length] = encoded
+    return length
+if _USE_C:
+    _encode_into = _cbson._encode_into
+
+
+def _name_value_size(name, value, check_keys, opts):
+    """The size of a single name, value pair encoded to BSON."""
+    registry = opts.type_registry
+    value_type = type(value)
+    if not registry._encoder_map or value_type not in registry._encoder_map:
+        sizer = _SIZERS.get(_ENCODERS.get(value_type))
+        if sizer is not None:
+            return sizer(name, value, check_keys, opts)
+    # Measure other values by encoding them.
+    return len(_name_value_to_bson(name, value, check_keys, opts))
+
+
+def _element_size(key, value, check_keys, opts):
+    """The size of a single key, value pair encoded to BSON."""
+    if not isinstance(key, string_type):
+        raise InvalidDocument("documents must have only string keys, "
+                              "key was %r" % (key,))
+    if check_keys:
+        if key.startswith("$"):
+            raise InvalidDocument("key %r must not start with '$'" % (key,))
+        if "." in key:
+            raise InvalidDocument("key %r must not contain '.'" % (key,))
+
+    name = _make_name(key)
+    return _name_value_size(name, value, check_keys, opts)
+
+
+def _dict_size(doc, check_keys, opts, top_level=True):
+    """The size of a document encoded to BSON."""
+    if _raw_document_class(doc):
+        return len(doc.raw)
+    items = _record_items(doc, opts, top_level)
+    if items is not None:
+        doc = SON(items)
+    # Length and trailing NUL.
+    size = 5
+    try:
+        if top_level and "_id" in doc:
+            size += _name_value_size(b"_id\x00", doc["_id"], check_keys, opts)
+        for (key, value) in iteritems(doc):
+            if not top_level or key != "_id":
+                size += _element_size(key, value, check_keys, opts)
+    except AttributeError:
+        raise TypeError("encoder expected a mapping type but got: %r" % (doc,))
+    return size
+if _USE_C:
+    _dict_size = _cbson._calculate_size
+
+
+def _size_mapping(name, value, check_keys, opts):
+    """The size of an encoded mapping type."""
+    return 1 + len(name) + _dict_size(value, check_keys, opts, False)
+
+
+def _size_list(name, value, check_keys, opts):
+    """The size of an encoded list/tuple."""
+    names = _list_names(len(value))
+    return 6 + len(name) + sum([_name_value_size(names[i], item,
+                                                 check_keys, opts)
+                                for i, item in enumerate(value)])
+
+
+def _size_text(name, value, dummy0, dummy1):
+    """The size of an encoded python unicode (python 2.x) / str (python 3.x).
+    """
+    return 6 + len(name) + len(_utf_8_encode(value)[0])
+
+
+def _size_int(name, value, check_keys, opts):
+    """The size of an encoded python int."""
+    if -2147483648 <= value <= 2147483647:
+        return 5 + len(name)
+    if -9223372036854775808 <= value <= 9223372036854775807:
+        return 9 + len(name)
+    # Raise OverflowError.
+    return len(_encode_int(name, value, check_keys, opts))
+
+
+def _fixed_size(value_size):
+    """A function returning the size of an encoded value of `value_size`
+    bytes.
+    """
+    def size(name, dummy0, dummy1, dummy2):
+        return 1 + len(name) + value_size
+    return size
+
+
+# The function returning the encoded size of the values each encoder
+# function encodes, for the common types. Values of other types are measured
+# by encoding them.
+_SIZERS = {
+    _encode_bool: _fixed_size(1),
+    _encode_datetime: _fixed_size(8),
+    _encode_datetime_ms: _fixed_size(8),
+    _encode_float: _fixed_size(8),
+    _encode_int: _size_int,
+    _encode_list: _size_list,
+    _encode_mapping: _size_mapping,
+    _encode_none: _fixed_size(0),
+    _encode_objectid: _fixed_size(12),
+    _encode_text: _size_text,
+}
+
+
 def _millis_to_datetime(millis, opts):
     """Convert milliseconds since epoch UTC to datetime."""
     diff = ((millis % 1000) + 1000) % 1000
@@ -854,6 +1339,18 @@ def _millis_to_datetime(millis, opts):
                                                 microseconds=micros)
 
 
+def _millis_to_date(millis, opts):
+    """Convert milliseconds since epoch UTC to the type
+    opts.datetime_conversion specifies.
+    """
+    conversion = opts.datetime_conversion
+    if conversion == DatetimeConversion.DATETIME:
+        return _millis_to_datetime(millis, opts)
+    if conversion == DatetimeConversion.DATETIME_MS:
+        return DatetimeMS(millis)
+    return millis
+
+
 def _datetime_to_millis(dtm):
     """Convert datetime to milliseconds since epoch UTC."""
     if dtm.utcoffset() is not None:
@@ -866,42 +1363,91 @@ _CODEC_OPTIONS_TYPE_ERROR = TypeError(
     "codec_options must be an instance of CodecOptions")
 
 
-def decode_all(data, codec_options=DEFAULT_CODEC_OPTIONS):
-    """Decode BSON data to multiple documents.
+def encode_into(document, buffer, offset=0, check_keys=False,
+                codec_options=DEFAULT_CODEC_OPTIONS):
+    """Encode a document directly into an existing buffer.
 
-    `data` must be a string of concatenated, valid, BSON-encoded
-    documents.
+    The encoded document is written to `buffer` starting at `offset`,
+    overwriting any data already there. A :class:`bytearray` is grown as
+    needed; any other writable buffer (for example a :class:`memoryview`)
+    must already be large enough to hold the encoded document. Reusing one
+    buffer for many documents avoids allocating a new :class:`bytes`
+    object per document::
+
+        >>> import bson
+        >>> buf = bytearray()
+        >>> length = bson.encode_into({'a': 1}, buf)
+        >>> length, len(buf)
+        (12, 12)
+        >>> bson.encode_into({'b': 2}, buf, length)
+        12
+
+    Returns the number of bytes written.
 
     :Parameters:
-      - `data`: BSON data
+      - `document`: mapping type representing a document
+      - `buffer`: a :class:`bytearray` or other writable buffer
+      - `offset` (optional): the position in `buffer` at which to start
+        writing. Must not be greater than ``len(buffer)``.
+      - `check_keys` (optional): check if keys start with '$' or
+        contain '.', raising :class:`~bson.errors.InvalidDocument` in
+        either case
       - `codec_options` (optional): An instance of
         :class:`~bson.codec_options.CodecOptions`.
 
-    .. versionchanged:: 3.0
-       Removed `compile_re` option: PyMongo now always represents BSON regular
-       expressions as :class:`~bson.regex.Regex` objects. Use
-       :meth:`~bson.regex.Regex.try_compile` to attempt to convert from a
-       BSON regular expression to a Python regular expression object.
+    .. versionadded:: 3.9
+    """
+    if not isinstance(codec_options, CodecOptions):
+        raise _CODEC_OPTIONS_TYPE_ERROR
 
-       Replaced `as_class`, `tz_aware`, and `uuid_subtype` options with
-       `codec_options`.
+    return _encode_into(document, buffer, offset, check_keys, codec_options)
 
-    .. versionchanged:: 2.7
-       Added `compile_re` option. If set to False, PyMongo represented BSON
-       regular expressions as :class:`~bson.regex.Regex` objects instead of
-       attempting to compile BSON regular expressions as Python native
-       regular expressions, thus preventing errors for some incompatible
-       patterns, see `PYTHON-500`_.
 
-    .. _PYTHON-500: https://jira.mongodb.org/browse/PYTHON-500
+def calculate_size(document, codec_options=DEFAULT_CODEC_OPTIONS,
+                   check_keys=False):
+    """Calculate the size of a document encoded to BSON, without encoding it.
+
+    The C extension walks the document and adds up the size of each value,
+    so no output is allocated for the common types. Values of other types,
+    and values transformed by the
+    :class:`~bson.codec_options.TypeRegistry` of `codec_options`, are
+    encoded to measure them::
+
+        >>> import bson
+        >>> bson.calculate_size({'a': 1})
+        12
+
+    Raises the same exceptions as :meth:`BSON.encode` for documents that
+    cannot be encoded.
+
+    :Parameters:
+      - `document`: mapping type representing a document
+      - `codec_options` (optional): An instance of
+        :class:`~bson.codec_options.CodecOptions`.
+      - `check_keys` (optional): check if keys start with '$' or
+        contain '.', raising :class:`~bson.errors.InvalidDocument` in
+        either case
+
+    .. versionadded:: 3.9
     """
     if not isinstance(codec_options, CodecOptions):
         raise _CODEC_OPTIONS_TYPE_ERROR
+    if not isinstance(check_keys, bool):
+        raise TypeError("check_keys must be True or False")
+
+    return _dict_size(document, check_keys, codec_options)
 
+
+def _decode_all(data, opts, fields=None):
+    """Decode a BSON string to a list of document_class."""
     docs = []
     position = 0
     end = len(data) - 1
-    use_raw = _raw_document_class(codec_options.document_class)
+    use_raw = _raw_document_class(opts.document_class)
+    if _record_type(opts.document_class):
+        decode_elements = _elements_to_record
+    else:
+        decode_elements = _elements_to_dict
     try:
         while position < end:
             obj_size = _UNPACK_INT(data[position:position + 4])[0]
@@ -912,13 +1458,14 @@ def decode_all(data, codec_options=DEFAULT_CODEC_OPTIONS):
                 raise InvalidBSON("bad eoo")
             if use_raw:
                 docs.append(
-                    codec_options.document_class(
-                        data[position:obj_end + 1], codec_options))
+                    opts.document_class(
+                        data[position:obj_end + 1], opts))
             else:
-                docs.append(_elements_to_dict(data,
-                                              position + 4,
-                                              obj_end,
-                                              codec_options))
+                docs.append(decode_elements(data,
+                                            position + 4,
+                                            obj_end,
+                                            opts,
+                                            fields))
             position += obj_size
         return docs
     except InvalidBSON:
@@ -930,10 +1477,64 @@ def decode_all(data, codec_options=DEFAULT_CODEC_OPTIONS):
 
 
 if _USE_C:
-    decode_all = _cbson.decode_all
+    _decode_all = _cbson.decode_all
+
+
+def decode_all(data, codec_options=DEFAULT_CODEC_OPTIONS, fields=None):
+    """Decode BSON data to multiple documents.
+
+    `data` must be a string of concatenated, valid, BSON-encoded
+    documents.
+
+    Pass `fields` to decode only some of the top-level fields of each
+    document. The other fields are skipped over by length without being
+    decoded, which is much faster when only a few fields of large
+    documents are needed::
+
+      >>> data = bson.BSON.encode({'a': 1, 'b': [1, 2, 3]})
+      >>> bson.decode_all(data, fields=['a'])
+      [{u'a': 1}]
+
+    Embedded documents are always decoded in full. `fields` is ignored when
+    the `document_class` is :class:`~bson.raw_bson.RawBSONDocument`.
 
+    :Parameters:
+      - `data`: BSON data
+      - `codec_options` (optional): An instance of
+        :class:`~bson.codec_options.CodecOptions`.
+      - `fields` (optional): An iterable of the names of the top-level fields
+        to decode. ``None`` (the default) decodes every field.
+
+    .. versionchanged:: 3.9
+       Added the `fields` parameter.
+
+    .. versionchanged:: 3.0
+       Removed `compile_re` option: PyMongo now always represents BSON regular
+       expressions as :class:`~bson.regex.Regex` objects. Use
+       :meth:`~bson.regex.Regex.try_compile` to attempt to convert from a
+       BSON regular expression to a Python regular expression object.
 
-def decode_iter(data, codec_options=DEFAULT_CODEC_OPTIONS):
+       Replaced `as_class`, `tz_aware`, and `uuid_subtype` options with
+       `codec_options`.
+
+    .. versionchanged:: 2.7
+       Added `compile_re` option. If set to False, PyMongo represented BSON
+       regular expressions as :class:`~bson.regex.Regex` objects instead of
+       attempting to compile BSON regular expressions as Python native
+       regular expressions, thus preventing errors for some incompatible
+       patterns, see `PYTHON-500`_.
+
+    .. _PYTHON-500: https://jira.mongodb.org/browse/PYTHON-500
+    """
+    if not isinstance(codec_options, CodecOptions):
+        raise _CODEC_OPTIONS_TYPE_ERROR
+
+    if fields is None:
+        return _decode_all(data, codec_options)
+    return _decode_all(data, codec_options, _fields_filter(fields))
+
+
+def decode_iter(data, codec_options=DEFAULT_CODEC_OPTIONS, fields=None):
     """Decode BSON data to multiple documents as a generator.
 
     Works similarly to the decode_all function, but yields one document at a
@@ -946,6 +1547,11 @@ def decode_iter(data, codec_options=DEFAULT_CODEC_OPTIONS):
       - `data`: BSON data
       - `codec_options` (optional): An instance of
         :class:`~bson.codec_options.CodecOptions`.
+      - `fields` (optional): An iterable of the names of the top-level fields
+        to decode. See :func:`decode_all`.
+
+    .. versionchanged:: 3.9
+       Added the `fields` parameter.
 
     .. versionchanged:: 3.0
        Replaced `as_class`, `tz_aware`, and `uuid_subtype` options with
@@ -956,6 +1562,7 @@ def decode_iter(data, codec_options=DEFAULT_CODEC_OPTIONS):
     if not isinstance(codec_options, CodecOptions):
         raise _CODEC_OPTIONS_TYPE_ERROR
 
+    fields = _fields_filter(fields)
     position = 0
     end = len(data) - 1
     while position < end:
@@ -963,10 +1570,11 @@ def decode_iter(data, codec_options=DEFAULT_CODEC_OPTIONS):
         elements = data[position:position + obj_size]
         position += obj_size
 
-        yield _bson_to_dict(elements, codec_options)
+        yield _bson_to_dict(elements, codec_options, fields)
 
 
-def decode_file_iter(file_obj, codec_options=DEFAULT_CODEC_OPTIONS):
+def decode_file_iter(file_obj, codec_options=DEFAULT_CODEC_OPTIONS,
+                     fields=None):
     """Decode bson data from a file to multiple documents as a generator.
 
     Works similarly to the decode_all function, but reads from the file object
@@ -976,6 +1584,11 @@ def decode_file_iter(file_obj, codec_options=DEFAULT_CODEC_OPTIONS):
       - `file_obj`: A file object containing BSON data.
       - `codec_options` (optional): An instance of
         :class:`~bson.codec_options.CodecOptions`.
+      - `fields` (optional): An iterable of the names of the top-level fields
+        to decode. See :func:`decode_all`.
+
+    .. versionchanged:: 3.9
+       Added the `fields` parameter.
 
     .. versionchanged:: 3.0
        Replaced `as_class`, `tz_aware`, and `uuid_subtype` options with
@@ -983,6 +1596,7 @@ def decode_file_iter(file_obj, codec_options=DEFAULT_CODEC_OPTIONS):
 
     .. versionadded:: 2.8
     """
+    fields = _fields_filter(fields)
     while True:
         # Read size of next object.
         size_data = file_obj.read(4)
@@ -992,7 +1606,349 @@ def decode_file_iter(file_obj, codec_options=DEFAULT_CODEC_OPTIONS):
             raise InvalidBSON("cut off in middle of objsize")
         obj_size = _UNPACK_INT(size_data)[0] - 4
         elements = size_data + file_obj.read(obj_size)
-        yield _bson_to_dict(elements, codec_options)
+        yield _bson_to_dict(elements, codec_options, fields)
+
+
+class StreamDecoder(object):
+    """Decode a stream of concatenated BSON documents fed in chunks.
+
+    Bytes can be fed as they arrive, from a socket, a pipe or a large file,
+    split anywhere, including in the middle of a document::
+
+      >>> decoder = bson.StreamDecoder()
+      >>> with open('dump.bson', 'rb') as dump:
+      ...     for chunk in iter(lambda: dump.read(65536), b''):
+      ...         for doc in decoder.feed(chunk):
+      ...             process(doc)
+      ...     decoder.close()
+
+    Partial documents are kept in an internal buffer which is reused for
+    the whole stream. Unconsumed bytes are only moved back to the start of
+    the buffer when a chunk doesn't fit after them, and the buffer only grows
+    when a single document and chunk don't fit in it. Memory use is bounded
+    by the largest document plus the largest chunk.
+
+    :Parameters:
+      - `codec_options` (optional): An instance of
+        :class:`~bson.codec_options.CodecOptions`.
+      - `buffer_size` (optional): The initial size of the internal buffer,
+        in bytes.
+
+    .. versionadded:: 3.9
+    """
+
+    def __init__(self, codec_options=DEFAULT_CODEC_OPTIONS,
+                 buffer_size=65536):
+        if not isinstance(codec_options, CodecOptions):
+            raise _CODEC_OPTIONS_TYPE_ERROR
+        if not isinstance(buffer_size, integer_types) or buffer_size < 1:
+            raise ValueError("buffer_size must be a positive integer")
+        self.__codec_options = codec_options
+        self.__buffer = bytearray(buffer_size)
+        # The buffered bytes are self.__buffer[self.__start:self.__end].
+        self.__start = 0
+        self.__end = 0
+
+    @property
+    def pending(self):
+        """The number of bytes fed that are not part of a complete document
+        yet.
+        """
+        return self.__end - self.__start
+
+    def feed(self, data):
+        """Add the next chunk of the stream.
+
+        Returns a list of the documents completed by `data`, which may be
+        empty.
+
+        Raises :class:`~bson.errors.InvalidBSON` if the stream is not valid
+        BSON. No documents are consumed then, they stay :attr:`pending`.
+
+        :Parameters:
+          - `data`: The next bytes of the stream, as :class:`bytes`,
+            :class:`bytearray` or :class:`memoryview`.
+        """
+        size = len(data)
+        if self.__end + size > len(self.__buffer):
+            self.__make_room(size)
+        self.__buffer[self.__end:self.__end + size] = data
+        self.__end += size
+        return self.__decode_complete()
+
+    def close(self):
+        """Check that the stream ended at the end of a document.
+
+        Raises :class:`~bson.errors.InvalidBSON` if a partial document is
+        left in the buffer.
+        """
+        if self.__start != self.__end:
+            raise InvalidBSON("stream ended in the middle of a document (%d "
+                              "bytes pending)" % (self.pending,))
+
+    def __make_room(self, size):
+        """Make room for `size` more bytes at the end of the buffer."""
+        pending = self.__end - self.__start
+        if pending + size > len(self.__buffer):
+            buf = bytearray(max(2 * len(self.__buffer), pending + size))
+            buf[:pending] = self.__buffer[self.__start:self.__end]
+            self.__buffer = buf
+        else:
+            # Same size slice assignment, the buffer is not resized.
+            self.__buffer[:pending] = self.__buffer[self.__start:self.__end]
+        self.__start = 0
+        self.__end = pending
+
+    def __decode_complete(self):
+        """Decode and consume the complete documents in the buffer."""
+        buf = self.__buffer
+        start = position = self.__start
+        end = self.__end
+        while end - position >= 4:
+            obj_size = _UNPACK_INT_FROM(buf, position)[0]
+            if obj_size < 5:
+                raise InvalidBSON("invalid object size")
+            if end - position < obj_size:
+                break
+            position += obj_size
+        if position == start:
+            return []
+        # Decode before consuming anything, so that an invalid document
+        # doesn't drop the valid ones before it from the stream.
+        docs = _decode_all(memoryview(buf)[start:position].tobytes(),
+                           self.__codec_options)
+        if position == end:
+            # Everything was consumed, start again at the front.
+            self.__start = self.__end = 0
+        else:
+            self.__start = position
+        return docs
+
+
+# Cache of _array_typecode.
+_ARRAY_TYPECODES = {}
+
+
+def _array_typecode(itemsize):
+    """The array module typecode for signed integers of `itemsize` bytes, or
+    None if there is none.
+
+    Python 2 has no "q" typecode and "l" is 4 bytes on Windows and 32-bit
+    platforms, so 8 byte integers may have no typecode. Looked up when
+    first needed rather than at import time.
+    """
+    try:
+        return _ARRAY_TYPECODES[itemsize]
+    except KeyError:
+        pass
+    result = None
+    for typecode in ("i", "l", "q"):
+        try:
+            if array.array(typecode).itemsize == itemsize:
+                result = typecode
+                break
+        except ValueError:
+            # No "q" typecode before Python 3.3.
+            pass
+    _ARRAY_TYPECODES[itemsize] = result
+    return result
+
+
+# The array typecode and size of the values of BSON arrays decoded to an
+# array.array with the typed_arrays option, by BSON type. A typecode of
+# None is the platform's typecode for signed integers of that size.
+_TYPED_ARRAY_TYPES = {
+    BSONNUM: ("d", 8),
+    BSONINT: (None, 4),
+    BSONLON: (None, 8),
+}
+
+
+# Column kinds for decode_columns, keep in sync with _cbsonmodule.c.
+_COLUMN_INT32 = 1
+_COLUMN_INT64 = 2
+_COLUMN_DOUBLE = 3
+_COLUMN_BOOL = 4
+_COLUMN_DATETIME = 5
+
+# Column kind and array typecode for each decode_columns schema type. The
+# integer columns give the size of their values instead, see
+# _array_typecode.
+_COLUMN_TYPES = {
+    "int32": (_COLUMN_INT32, 4),
+    "int64": (_COLUMN_INT64, 8),
+    "double": (_COLUMN_DOUBLE, "d"),
+    "bool": (_COLUMN_BOOL, "B"),
+    "datetime": (_COLUMN_DATETIME, 8),
+}
+
+_COLUMN_NAMES = dict((kind, name)
+                     for name, (kind, _) in iteritems(_COLUMN_TYPES))
+
+# Native packers for each column kind.
+_COLUMN_PACK = {
+    _COLUMN_INT32: struct.Struct("=i").pack,
+    _COLUMN_INT64: struct.Struct("=q").pack,
+    _COLUMN_DOUBLE: struct.Struct("=d").pack,
+    _COLUMN_BOOL: struct.Struct("=B").pack,
+    _COLUMN_DATETIME: struct.Struct("=q").pack,
+}
+
+# The BSON types accepted by each column kind, and how to read them.
+_COLUMN_GETTERS = {
+    _COLUMN_INT32: {BSONINT: _UNPACK_INT},
+    _COLUMN_INT64: {BSONINT: _UNPACK_INT, BSONLON: _UNPACK_LONG},
+    _COLUMN_DOUBLE: {BSONNUM: _UNPACK_FLOAT, BSONINT: _UNPACK_INT,
+                     BSONLON: _UNPACK_LONG},
+    _COLUMN_BOOL: {BSONBOO: lambda data: (data != b"\x00",)},
+    _COLUMN_DATETIME: {BSONDAT: _UNPACK_LONG},
+}
+
+
+def _decode_columns(data, names, kinds):
+    """Decode concatenated BSON documents into one column per field.
+
+    Returns a list with a (values, validity mask) pair of bytes for each
+    field, holding one native value and one mask byte per document.
+    """
+    columns = dict((name, i) for i, name in enumerate(names))
+    values = [bytearray() for _ in names]
+    masks = [bytearray() for _ in names]
+    missing = [_COLUMN_PACK[kind](0) for kind in kinds]
+    position = 0
+    end = len(data)
+    try:
+        while position < end:
+            obj_size = _UNPACK_INT(data[position:position + 4])[0]
+            if obj_size < 5 or end - position < obj_size:
+                raise InvalidBSON("invalid object size")
+            obj_end = position + obj_size - 1
+            if data[obj_end:obj_end + 1] != b"\x00":
+                raise InvalidBSON("bad eoo")
+            row = [None] * len(names)
+            element = position + 4
+            while element < obj_end:
+                element_type = data[element:element + 1]
+                name_end = data.index(b"\x00", element + 1)
+                name = data[element + 1:name_end]
+                value_end = _skip_element(data, name_end + 1, obj_end,
+                                          element_type, name)
+                column = columns.get(name)
+                if column is not None:
+                    if element_type == BSONNUL:
+                        row[column] = None
+                    else:
+                        kind = kinds[column]
+                        getter = _COLUMN_GETTERS[kind].get(element_type)
+                        if getter is None:
+                            raise TypeError(
+                                "cannot decode field '%s' of BSON type %d "
+                                "into a column of type %s" % (
+                                    _utf_8_decode(name, "replace", True)[0],
+                                    ord(element_type), _COLUMN_NAMES[kind]))
+                        row[column] = _COLUMN_PACK[kind](
+                            getter(data[name_end + 1:value_end])[0])
+                element = value_end
+            if element != obj_end:
+                raise InvalidBSON("bad object or element length")
+            for column, value in enumerate(row):
+                if value is None:
+                    values[column] += missing[column]
+                    masks[column] += b"\x00"
+                else:
+                    values[column] += value
+                    masks[column] += b"\x01"
+            position += obj_size
+    except (InvalidBSON, TypeError):
+        raise
+    except Exception:
+        # Change exception type to InvalidBSON but preserve traceback.
+        _, exc_value, exc_tb = sys.exc_info()
+        reraise(InvalidBSON, exc_value, exc_tb)
+    return [(bytes(values[i]), bytes(masks[i])) for i in range(len(names))]
+if _USE_C:
+    _decode_columns = _cbson._decode_columns
+
+
+def _make_array(typecode, data):
+    """Create an array.array from native bytes."""
+    result = array.array(typecode)
+    if PY3:
+        result.frombytes(data)
+    else:
+        result.fromstring(data)
+    return result
+
+
+def decode_columns(data, schema):
+    """Decode BSON data to one array of values per field.
+
+    `data` must be a string of concatenated, valid, BSON-encoded documents,
+    like the batches returned by a
+    :class:`~pymongo.cursor.RawBatchCursor`. `schema` maps the name of each
+    top-level field to decode to its column type, one of:
+
+    - ``"int32"``: BSON int32 values, as C ints.
+    - ``"int64"``: BSON int32 and int64 values, as 64-bit integers.
+    - ``"double"``: BSON double, int32 and int64 values, as C doubles.
+    - ``"bool"``: BSON boolean values, as unsigned chars (0 or 1).
+    - ``"datetime"``: BSON datetime values, as 64-bit integer milliseconds
+      since the Unix epoch.
+
+    Returns a dict mapping each field name to a ``(values, valid)`` pair of
+    :class:`array.array` instances with one entry per document. ``valid[i]``
+    is 0 if the field is missing or null in document ``i``, in which case
+    ``values[i]`` is 0. Both arrays support the buffer protocol, so they can
+    be wrapped without copying by, for example, ``numpy.frombuffer``::
+
+      >>> data = b"".join(bson.BSON.encode({'x': i}) for i in range(3))
+      >>> data += bson.BSON.encode({'y': 1})
+      >>> values, valid = bson.decode_columns(data, {'x': 'int64'})['x']
+      >>> values.tolist(), valid.tolist()
+      ([0, 1, 2, 0], [1, 1, 1, 0])
+
+    Other top-level fields are skipped without being decoded. Raises
+    :exc:`TypeError` if a field has a BSON type that can't be stored in its
+    column.
+
+    :Parameters:
+      - `data`: BSON data
+      - `schema`: A mapping, or an iterable of pairs, of field name to
+        column type.
+
+    .. versionadded:: 3.9
+    """
+    if isinstance(schema, abc.Mapping):
+        schema = iteritems(schema)
+    names = []
+    encoded_names = []
+    kinds = []
+    typecodes = []
+    for name, column_type in schema:
+        try:
+            kind, typecode = _COLUMN_TYPES[column_type]
+        except KeyError:
+            raise ValueError("unknown column type %r for field %r, must be "
+                             "one of %s" % (column_type, name,
+                                            sorted(_COLUMN_TYPES)))
+        if not isinstance(typecode, str):
+            itemsize, typecode = typecode, _array_typecode(typecode)
+            if typecode is None:
+                raise ValueError("column type %r for field %r needs an array "
+                                 "typecode for %d byte integers, which this "
+                                 "platform does not have"
+                                 % (column_type, name, itemsize))
+        names.append(name)
+        encoded_names.append(_utf_8_encode(name)[0]
+                             if isinstance(name, text_type) else name)
+        kinds.append(kind)
+        typecodes.append(typecode)
+
+    columns = _decode_columns(data, tuple(encoded_names), tuple(kinds))
+    return dict((name, (_make_array(typecode, values),
+                        _make_array("B", valid)))
+                for name, typecode, (values, valid) in zip(
+                    names, typecodes, columns))
 
 
 def is_valid(bson):
@@ -1048,7 +2004,7 @@ class BSON(bytes):
 
         return cls(_dict_to_bson(document, check_keys, codec_options))
 
-    def decode(self, codec_options=DEFAULT_CODEC_OPTIONS):
+    def decode(self, codec_options=DEFAULT_CODEC_OPTIONS, fields=None):
         """Decode this BSON data.
 
         By default, returns a BSON document represented as a Python
@@ -1069,6 +2025,11 @@ class BSON(bytes):
         :Parameters:
           - `codec_options` (optional): An instance of
             :class:`~bson.codec_options.CodecOptions`.
+          - `fields` (optional): An iterable of the names of the top-level
+            fields to decode. See :func:`decode_all`.
+
+        .. versionchanged:: 3.9
+           Added the `fields` parameter.
 
         .. versionchanged:: 3.0
            Removed `compile_re` option: PyMongo now always represents BSON
@@ -1091,7 +2052,7 @@ class BSON(bytes):
         if not isinstance(codec_options, CodecOptions):
             raise _CODEC_OPTIONS_TYPE_ERROR
 
-        return _bson_to_dict(self, codec_options)
+        return _bson_to_dict(self, codec_options, _fields_filter(fields))
 
 
 def has_c():
@@ -53,6 +53,8 @@ struct module_state {
     PyObject* Decimal128;
     PyObject* Mapping;
     PyObject* CodecOptions;
+    PyObject* Array;
+    PyObject* DatetimeMS;
 };
 
 /* The Py_TYPE macro was introduced in CPython 2.6 */
@@ -78,6 +80,14 @@ static struct module_state _state;
 #define JAVA_LEGACY   5
 #define CSHARP_LEGACY 6
 
+/* bson.datetime_ms.DatetimeConversion, other than DATETIME. */
+#define DATETIME_CONVERSION_MS 2
+#define DATETIME_CONVERSION_INT 3
+
+/* The most types a TypeRegistry's _fallback_types dict holds before it is
+ * cleared. Keep in sync with _MAX_CACHED_TYPES in codec_options.py. */
+#define MAX_CACHED_TYPES 256
+
 #define BSON_MAX_SIZE 2147483647
 /* The smallest possible BSON document, i.e. "{}" */
 #define BSON_MIN_SIZE 5
@@ -368,7 +378,9 @@ static int _load_python_objects(PyObject* module) {
 #else
         _load_object(&state->Mapping, "collections", "Mapping") ||
 #endif
-        _load_object(&state->CodecOptions, "bson.codec_options", "CodecOptions")) {
+        _load_object(&state->CodecOptions, "bson.codec_options", "CodecOptions") ||
+        _load_object(&state->Array, "array", "array") ||
+        _load_object(&state->DatetimeMS, "bson.datetime_ms", "DatetimeMS")) {
         return 1;
     }
     /* Reload our REType hack too. */
@@ -457,6 +469,7 @@ int convert_type_registry(PyObject* registry_obj, type_registry_t* registry) {
     registry->encoder_map = NULL;
     registry->decoder_map = NULL;
     registry->fallback_encoder = NULL;
+    registry->fallback_types = NULL;
     registry->registry_obj = NULL;
 
     registry->encoder_map = PyObject_GetAttrString(registry_obj, "_encoder_map");
@@ -477,6 +490,11 @@ int convert_type_registry(PyObject* registry_obj, type_registry_t* registry) {
     }
     registry->has_fallback_encoder = (registry->fallback_encoder != Py_None);
 
+    registry->fallback_types = PyObject_GetAttrString(registry_obj, "_fallback_types");
+    if (registry->fallback_types == NULL) {
+        goto fail;
+    }
+
     registry->registry_obj = registry_obj;
     Py_INCREF(registry->registry_obj);
     return 1;
@@ -485,9 +503,67 @@ fail:
     Py_XDECREF(registry->encoder_map);
     Py_XDECREF(registry->decoder_map);
     Py_XDECREF(registry->fallback_encoder);
+    Py_XDECREF(registry->fallback_types);
     return 0;
 }
 
+static void clear_record_type(codec_options_t* options) {
+    Py_CLEAR(options->record_class);
+    Py_CLEAR(options->record_fields);
+    Py_CLEAR(options->record_keys);
+    Py_CLEAR(options->record_defaults);
+}
+
+/* Fill out the record fields of a codec_options_t* whose document_class is
+ * a bson.record.RecordType, and decode embedded documents to dict.
+ *
+ * Return 1 on success.
+ * Return 0 on failure.
+ */
+static int convert_record_type(codec_options_t* options) {
+    PyObject* record_type = options->document_class;
+    PyObject* is_tuple;
+    int truth;
+
+    if (!(options->record_class = PyObject_GetAttrString(record_type,
+                                                         "_record_class")) ||
+            !(options->record_fields = PyObject_GetAttrString(record_type,
+                                                              "_fields")) ||
+            !(options->record_keys = PyObject_GetAttrString(record_type,
+                                                            "_keys")) ||
+            !(options->record_defaults = PyObject_GetAttrString(
+                record_type, "_defaults"))) {
+        clear_record_type(options);
+        return 0;
+    }
+    if (!PyType_Check(options->record_class) ||
+            !PyTuple_Check(options->record_fields) ||
+            !PyTuple_Check(options->record_keys) ||
+            !PyTuple_Check(options->record_defaults) ||
+            PyTuple_GET_SIZE(options->record_keys) !=
+                PyTuple_GET_SIZE(options->record_fields) ||
+            PyTuple_GET_SIZE(options->record_defaults) !=
+                PyTuple_GET_SIZE(options->record_fields)) {
+        PyErr_SetString(PyExc_TypeError, "invalid RecordType");
+        clear_record_type(options);
+        return 0;
+    }
+    is_tuple = PyObject_GetAttrString(record_type, "_is_tuple");
+    if (!is_tuple) {
+        clear_record_type(options);
+        return 0;
+    }
+    truth = PyObject_IsTrue(is_tuple);
+    Py_DECREF(is_tuple);
+    if (truth < 0) {
+        clear_record_type(options);
+        return 0;
+    }
+    options->record_is_tuple = (unsigned char)truth;
+    options->document_class = (PyObject*)&PyDict_Type;
+    return 1;
+}
+
 /* Fill out a codec_options_t* from a CodecOptions object. Use with the "O&"
  * format spec in PyArg_ParseTuple.
  *
@@ -500,14 +576,22 @@ int convert_codec_options(PyObject* options_obj, void* p) {
     long type_marker;
 
     options->unicode_decode_error_handler = NULL;
+    options->key_cache = NULL;
+    options->record_class = NULL;
+    options->record_fields = NULL;
+    options->record_keys = NULL;
+    options->record_defaults = NULL;
 
-    if (!PyArg_ParseTuple(options_obj, "ObbzOO",
+    if (!PyArg_ParseTuple(options_obj, "ObbzOObbb",
                           &options->document_class,
                           &options->tz_aware,
                           &options->uuid_rep,
                           &options->unicode_decode_error_handler,
                           &options->tzinfo,
-                          &type_registry_obj))
+                          &type_registry_obj,
+                          &options->typed_arrays,
+                          &options->validate,
+                          &options->datetime_conversion))
         return 0;
 
     type_marker = _type_marker(options->document_class);
@@ -515,8 +599,13 @@ int convert_codec_options(PyObject* options_obj, void* p) {
         return 0;
     }
 
+    if (103 == type_marker && !convert_record_type(options)) {
+        return 0;
+    }
+
     if (!convert_type_registry(type_registry_obj,
                                &options->type_registry)) {
+        clear_record_type(options);
         return 0;
     }
 
@@ -550,7 +639,101 @@ int default_codec_options(struct module_state* state, codec_options_t* options)
     return convert_codec_options(options_obj, options);
 }
 
+/* Number of keys in a key cache, must be a power of 2. */
+#define KEY_CACHE_SIZE 128
+/* Longer keys are not cached. */
+#define KEY_CACHE_MAX_LENGTH 32
+
+struct key_cache_entry {
+    PyObject* name;
+    size_t length;
+    char bytes[KEY_CACHE_MAX_LENGTH];
+};
+
+/*
+ * The keys decoded by one call to decode_all or _bson_to_dict. Documents in
+ * a batch usually share their keys, so reusing the str objects saves both
+ * the UTF-8 decoding and the memory for a new str per key.
+ */
+typedef struct key_cache {
+    struct key_cache_entry entries[KEY_CACHE_SIZE];
+} key_cache_t;
+
+/* Start caching the keys decoded with 'options' in 'cache'. */
+static void init_key_cache(codec_options_t* options, key_cache_t* cache) {
+    int i;
+    for (i = 0; i < KEY_CACHE_SIZE; i++) {
+        cache->entries[i].name = NULL;
+    }
+    options->key_cache = cache;
+}
+
+static void clear_key_cache(codec_options_t* options) {
+    int i;
+    if (!options->key_cache) {
+        return;
+    }
+    for (i = 0; i < KEY_CACHE_SIZE; i++) {
+        Py_CLEAR(options->key_cache->entries[i].name);
+    }
+    options->key_cache = NULL;
+}
+
+/*
+ * Decode a document key, reusing the str from the key cache if the same
+ * key was decoded before.
+ *
+ * Returns a new reference, or NULL on error.
+ */
+static PyObject* decode_key(const char* string, size_t length,
+                            const codec_options_t* options) {
+    struct key_cache_entry* entry = NULL;
+    PyObject* name;
+
+    if (options->key_cache && length <= KEY_CACHE_MAX_LENGTH) {
+        /* FNV-1a hash of the key bytes. */
+        uint32_t hash = 2166136261U;
+        size_t i;
+        int probe;
+        for (i = 0; i < length; i++) {
+            hash ^= (unsigned char)string[i];
+            hash *= 16777619U;
+        }
+        /* Each key can live in one of two neighbouring entries. */
+        for (probe = 0; probe < 2; probe++) {
+            struct key_cache_entry* candidate = &options->key_cache->entries[
+                (hash + probe) & (KEY_CACHE_SIZE - 1)];
+            if (!candidate->name) {
+                entry = candidate;
+                break;
+            }
+            if (candidate->length == length &&
+                    !memcmp(candidate->bytes, string, length)) {
+                Py_INCREF(candidate->name);
+                return candidate->name;
+            }
+        }
+        if (!entry) {
+            entry = &options->key_cache->entries[
+                hash & (KEY_CACHE_SIZE - 1)];
+        }
+    }
+
+    name = PyUnicode_DecodeUTF8(string, length,
+                                options->unicode_decode_error_handler);
+    if (name && entry) {
+        Py_XDECREF(entry->name);
+        Py_INCREF(name);
+        entry->name = name;
+        entry->length = length;
+        memcpy(entry->bytes, string, length);
+    }
+    return name;
+}
+
 void destroy_codec_options(codec_options_t* options) {
+    clear_key_cache(options);
+    clear_record_type(options);
     Py_CLEAR(options->document_class);
     Py_CLEAR(options->tzinfo);
     Py_CLEAR(options->options_obj);
@@ -558,6 +741,7 @@ void destroy_codec_options(codec_options_t* options) {
     Py_CLEAR(options->type_registry.encoder_map);
     Py_CLEAR(options->type_registry.decoder_map);
     Py_CLEAR(options->type_registry.fallback_encoder);
+    Py_CLEAR(options->type_registry.fallback_types);
 }
 
 static int write_element_to_buffer(PyObject* self, buffer_t buffer,
@@ -773,6 +957,318 @@ static int _write_regex_to_buffer(
     return 1;
 }
 
+static int _write_element_to_buffer(PyObject* self, buffer_t buffer,
+                                    int type_byte, PyObject* value,
+                                    unsigned char check_keys,
+                                    const codec_options_t* options,
+                                    unsigned char in_fallback_call);
+
+/* The BSON type of the values of a buffer of numbers in 'format', when it
+ * is encoded as a BSON array, or 0 if it can't be. Keep in sync with
+ * _BUFFER_FORMATS in bson/__init__.py. */
+static char _buffer_element_type(const char* format) {
+    if (format == NULL) {
+        /* Unsigned bytes. */
+        return 0x10;
+    }
+    if (format[0] == '@') {
+        format++;
+    }
+    if (format[0] == '\0' || format[1] != '\0') {
+        return 0;
+    }
+    switch (format[0]) {
+    case 'f':
+    case 'd':
+        return 0x01;
+    case 'b':
+    case 'B':
+    case 'h':
+    case 'H':
+    case 'i':
+        return 0x10;
+    case 'I':
+    case 'l':
+    case 'L':
+    case 'q':
+    case 'Q':
+        return 0x12;
+    case '?':
+        return 0x08;
+    default:
+        return 0;
+    }
+}
+
+/* Change 'key', the decimal string of an array index with '*length'
+ * digits, to the next index. 'key' must have room for one more digit. */
+static void _next_array_key(char* key, int* length) {
+    int i = *length - 1;
+    while (i >= 0 && key[i] == '9') {
+        key[i] = '0';
+        i--;
+    }
+    if (i >= 0) {
+        key[i]++;
+        return;
+    }
+    /* All nines, add a digit. */
+    memmove(key + 1, key, *length + 1);
+    key[0] = '1';
+    (*length)++;
+}
+
+static void _set_int64_overflow(void) {
+    PyErr_SetString(PyExc_OverflowError,
+                    "BSON can only handle up to 8-byte ints");
+}
+
+/* Write the 'count' numbers in 'format', 'stride' bytes apart from
+ * 'data' on, as the elements of a BSON array of 'element_type' values.
+ *
+ * Returns 0 on failure. */
+static int _write_buffer_elements(buffer_t buffer, const char* data,
+                                  Py_ssize_t count, Py_ssize_t stride,
+                                  char format, char element_type) {
+    /* Enough for the digits of any Py_ssize_t and the NUL. */
+    char key[24] = "0";
+    int key_length = 1;
+    Py_ssize_t i;
+
+    for (i = 0; i < count; i++, data += stride) {
+        if (!buffer_write_bytes(buffer, &element_type, 1) ||
+            !buffer_write_bytes(buffer, key, key_length + 1)) {
+            return 0;
+        }
+        if (element_type == 0x01) {
+            double d;
+            if (format == 'f') {
+                float f;
+                memcpy(&f, data, sizeof(float));
+                d = f;
+            } else {
+                memcpy(&d, data, sizeof(double));
+            }
+            if (!buffer_write_double(buffer, d)) {
+                return 0;
+            }
+        } else if (element_type == 0x08) {
+            char b = *data ? 1 : 0;
+            if (!buffer_write_bytes(buffer, &b, 1)) {
+                return 0;
+            }
+        } else if (element_type == 0x10) {
+            int32_t i32;
+            switch (format) {
+            case 'b':
+                i32 = *(const signed char*)data;
+                break;
+            case 'B':
+                i32 = *(const unsigned char*)data;
+                break;
+            case 'h':
+                {
+                    short h;
+                    memcpy(&h, data, sizeof(short));
+                    i32 = h;
+                    break;
+                }
+            case 'H':
+                {
+                    unsigned short h;
+                    memcpy(&h, data, sizeof(unsigned short));
+                    i32 = h;
+                    break;
+                }
+            default:
+                {
+                    int n;
+                    memcpy(&n, data, sizeof(int));
+                    i32 = (int32_t)n;
+                    break;
+                }
+            }
+            if (!buffer_write_int32(buffer, i32)) {
+                return 0;
+            }
+        } else {
+            long long ll;
+            switch (format) {
+            case 'I':
+                {
+                    unsigned int n;
+                    memcpy(&n, data, sizeof(unsigned int));
+                    ll = n;
+                    break;
+                }
+            case 'l':
+                {
+                    long n;
+                    memcpy(&n, data, sizeof(long));
+                    ll = n;
+                    break;
+                }
+            case 'L':
+                {
+                    unsigned long n;
+                    memcpy(&n, data, sizeof(unsigned long));
+                    if (n > (unsigned long long)LLONG_MAX) {
+                        _set_int64_overflow();
+                        return 0;
+                    }
+                    ll = (long long)n;
+                    break;
+                }
+            case 'Q':
+                {
+                    unsigned long long n;
+                    memcpy(&n, data, sizeof(unsigned long long));
+                    if (n > (unsigned long long)LLONG_MAX) {
+                        _set_int64_overflow();
+                        return 0;
+                    }
+                    ll = (long long)n;
+                    break;
+                }
+            default:
+                memcpy(&ll, data, sizeof(long long));
+                break;
+            }
+            if (!buffer_write_int64(buffer, (int64_t)ll)) {
+                return 0;
+            }
+        }
+        _next_array_key(key, &key_length);
+    }
+    return 1;
+}
+
+/* Write the numbers of a buffer as a BSON array, without creating a
+ * Python object for each of them.
+ *
+ * Returns 1 on success, 0 on failure, or -1 without an exception if
+ * 'value' is not a one dimensional buffer of numbers. */
+static int _write_numeric_buffer(buffer_t buffer, int type_byte,
+                                 PyObject* value) {
+    Py_buffer view;
+    PyObject* bytes = NULL;
+    const char* data;
+    Py_ssize_t count, stride;
+    char format;
+    char element_type;
+    int start_position, length_location, length;
+    int result = 0;
+    char zero = 0;
+
+#if PY_MAJOR_VERSION < 3
+    /* Python 2's array.array does not support the buffer protocol. */
+    if (strcmp(Py_TYPE(value)->tp_name, "array.array") == 0) {
+        PyObject* typecode = PyObject_GetAttrString(value, "typecode");
+        PyObject* itemsize;
+        const char* typecode_str;
+        if (!typecode) {
+            return 0;
+        }
+        typecode_str = PyString_AsString(typecode);
+        if (!typecode_str) {
+            Py_DECREF(typecode);
+            return 0;
+        }
+        element_type = _buffer_element_type(typecode_str);
+        format = typecode_str[0];
+        Py_DECREF(typecode);
+        if (!element_type) {
+            return -1;
+        }
+        itemsize = PyObject_GetAttrString(value, "itemsize");
+        if (!itemsize) {
+            return 0;
+        }
+        stride = PyInt_AsSsize_t(itemsize);
+        Py_DECREF(itemsize);
+        if (stride == -1 && PyErr_Occurred()) {
+            return 0;
+        }
+        bytes = PyObject_CallMethod(value, "tostring", NULL);
+        if (!bytes) {
+            return 0;
+        }
+        data = PyString_AS_STRING(bytes);
+        count = PyString_GET_SIZE(bytes) / stride;
+    } else
+#endif
+    {
+        if (PyByteArray_Check(value) || !PyObject_CheckBuffer(value)) {
+            return -1;
+        }
+        if (PyObject_GetBuffer(value, &view,
+                               PyBUF_STRIDES | PyBUF_FORMAT) == -1) {
+            PyErr_Clear();
+            return -1;
+        }
+        element_type = _buffer_element_type(view.format);
+        if (view.ndim != 1 || !element_type) {
+            PyBuffer_Release(&view);
+            return -1;
+        }
+        format = view.format ? view.format[strlen(view.format) - 1] : 'B';
+        data = (const char*)view.buf;
+        count = view.shape[0];
+        stride = view.strides[0];
+    }
+
+    *(buffer_get_buffer(buffer) + type_byte) = 0x04;
+    start_position = buffer_get_position(buffer);
+
+    /* save space for length */
+    length_location = buffer_save_space(buffer, 4);
+    if (length_location == -1) {
+        PyErr_NoMemory();
+        goto done;
+    }
+    if (!_write_buffer_elements(buffer, data, count, stride,
+                                format, element_type)) {
+        goto done;
+    }
+
+    /* write null byte and fill in length */
+    if (!buffer_write_bytes(buffer, &zero, 1)) {
+        goto done;
+    }
+    length = buffer_get_position(buffer) - start_position;
+    buffer_write_int32_at_position(
+        buffer, length_location, (int32_t)length);
+    result = 1;
+
+done:
+    if (bytes) {
+        Py_DECREF(bytes);
+    } else {
+        PyBuffer_Release(&view);
+    }
+    return result;
+}
+
+/* Write the value returned by the fallback encoder for 'value'.
+ *
+ * returns 0 on failure */
+static int _write_fallback_to_buffer(PyObject* self, buffer_t buffer,
+                                     int type_byte, PyObject* value,
+                                     unsigned char check_keys,
+                                     const codec_options_t* options) {
+    int retval;
+    PyObject* new_value = PyObject_CallFunctionObjArgs(
+        options->type_registry.fallback_encoder, value, NULL);
+    if (new_value == NULL) {
+        // propagate any exception raised by the callback
+        return 0;
+    }
+    retval = _write_element_to_buffer(self, buffer, type_byte, new_value,
+                                      check_keys, options, 1);
+    Py_DECREF(new_value);
+    return retval;
+}
+
 /* Write a single value to the buffer (also write its type_byte, for which
  * space has already been reserved.
  *
@@ -784,15 +1280,24 @@ static int _write_element_to_buffer(PyObject* self, buffer_t buffer,
                                     unsigned char in_fallback_call) {
     struct module_state *state = GETSTATE(self);
     PyObject* mapping_type;
-    PyObject* new_value = NULL;
-    int retval;
     PyObject* uuid_type;
+    long type;
+
+    /* Types already known to need the fallback encoder skip straight to
+     * it, without the type checks below. */
+    if (!in_fallback_call && options->type_registry.has_fallback_encoder &&
+            PyDict_GetItem(options->type_registry.fallback_types,
+                           (PyObject*)Py_TYPE(value))) {
+        return _write_fallback_to_buffer(self, buffer, type_byte, value,
+                                         check_keys, options);
+    }
+
     /*
      * Don't use PyObject_IsInstance for our custom types. It causes
      * problems with python sub interpreters. Our custom types should
      * have a _type_marker attribute, which we can switch on instead.
      */
-    long type = _type_marker(value);
+    type = _type_marker(value);
     if (type < 0) {
         return 0;
     }
@@ -977,6 +1482,25 @@ static int _write_element_to_buffer(PyObject* self, buffer_t buffer,
             *(buffer_get_buffer(buffer) + type_byte) = 0x11;
             return 1;
         }
+    case 9:
+        {
+            /* DatetimeMS */
+            long long millis;
+            PyObject* millis_obj = PyObject_GetAttrString(value, "_value");
+            if (!millis_obj) {
+                return 0;
+            }
+            millis = PyLong_AsLongLong(millis_obj);
+            Py_DECREF(millis_obj);
+            if (millis == -1 && PyErr_Occurred()) {
+                return 0;
+            }
+            if (!buffer_write_int64(buffer, (int64_t)millis)) {
+                return 0;
+            }
+            *(buffer_get_buffer(buffer) + type_byte) = 0x09;
+            return 1;
+        }
     case 18:
         {
             /* Int64 */
@@ -1017,6 +1541,56 @@ static int _write_element_to_buffer(PyObject* self, buffer_t buffer,
             *(buffer_get_buffer(buffer) + type_byte) = 0x13;
             return 1;
         }
+    case 102:
+        {
+            /* PackedArray */
+            PyObject* data_obj;
+            PyObject* typecode;
+            Py_buffer view;
+            char header[2] = {0x03, 0};
+            char subtype = 9;
+            int size;
+            int is_float;
+
+            typecode = PyObject_GetAttrString(value, "typecode");
+            if (!typecode) {
+                return 0;
+            }
+#if PY_MAJOR_VERSION >= 3
+            is_float = PyUnicode_CompareWithASCIIString(typecode, "f") == 0;
+#else
+            is_float = PyString_Check(typecode) &&
+                strcmp(PyString_AS_STRING(typecode), "f") == 0;
+#endif
+            Py_DECREF(typecode);
+            if (is_float) {
+                header[0] = 0x27;
+            }
+            data_obj = PyObject_GetAttrString(value, "data");
+            if (!data_obj) {
+                return 0;
+            }
+            if (PyObject_GetBuffer(data_obj, &view, PyBUF_SIMPLE) == -1) {
+                Py_DECREF(data_obj);
+                return 0;
+            }
+            Py_DECREF(data_obj);
+            if ((size = _downcast_and_check(view.len, 2)) == -1) {
+                PyBuffer_Release(&view);
+                return 0;
+            }
+            if (!buffer_write_int32(buffer, (int32_t)size) ||
+                !buffer_write_bytes(buffer, &subtype, 1) ||
+                !buffer_write_bytes(buffer, header, 2) ||
+                !buffer_write_bytes(buffer, (const char*)view.buf,
+                                    size - 2)) {
+                PyBuffer_Release(&view);
+                return 0;
+            }
+            PyBuffer_Release(&view);
+            *(buffer_get_buffer(buffer) + type_byte) = 0x05;
+            return 1;
+        }
     case 100:
         {
             /* DBRef */
@@ -1377,21 +1951,35 @@ static int _write_element_to_buffer(PyObject* self, buffer_t buffer,
     Py_XDECREF(mapping_type);
     Py_XDECREF(uuid_type);
 
+    /* Other objects supporting the buffer protocol, like array.array,
+     * memoryview or a NumPy ndarray. */
+    {
+        int written = _write_numeric_buffer(buffer, type_byte, value);
+        if (written != -1) {
+            return written;
+        }
+    }
+
     /* Try the fallback encoder if one is provided and we have not already
      * attempted to use the fallback encoder. */
     if (!in_fallback_call && options->type_registry.has_fallback_encoder) {
-        new_value = PyObject_CallFunctionObjArgs(
-            options->type_registry.fallback_encoder, value, NULL);
-        if (new_value == NULL) {
-            // propagate any exception raised by the callback
-            return 0;
+        /* Remember the type so the checks above are skipped next time.
+         * Whether a buffer can be encoded depends on its format, not just
+         * its type. */
+        if (!PyObject_CheckBuffer(value)) {
+            PyObject* fallback_types = options->type_registry.fallback_types;
+            /* Bound the strong references to types created at runtime. */
+            if (PyDict_Size(fallback_types) >= MAX_CACHED_TYPES) {
+                PyDict_Clear(fallback_types);
+            }
+            if (PyDict_SetItem(fallback_types,
+                               (PyObject*)Py_TYPE(value), Py_True) < 0) {
+                return 0;
+            }
         }
-        retval = _write_element_to_buffer(self, buffer, type_byte, new_value,
-                                          check_keys, options, 1);
-        Py_XDECREF(new_value);
-        return retval;
+        return _write_fallback_to_buffer(self, buffer, type_byte, value,
+                                         check_keys, options);
     }
-    Py_XDECREF(new_value);
 
     /* We can't determine value's type. Fail. */
     _set_cannot_encode(value);
@@ -1598,6 +2186,77 @@ int decode_and_write_pair(PyObject* self, buffer_t buffer,
     return 1;
 }
 
+static Py_ssize_t _field_index(PyObject* fields, const char* name,
+                               size_t name_length);
+
+/* Write 'record', an instance of options->record_class, as a document of
+ * its fields. Fields that aren't set are skipped, an _id field is written
+ * first.
+ *
+ * returns the number of bytes written or 0 on failure */
+static int write_record(PyObject* self, buffer_t buffer, PyObject* record,
+                        unsigned char check_keys,
+                        const codec_options_t* options) {
+    Py_ssize_t count = PyTuple_GET_SIZE(options->record_keys);
+    Py_ssize_t id_index = _field_index(options->record_keys, "_id", 3);
+    Py_ssize_t i;
+    char zero = 0;
+    int length;
+    int length_location;
+
+    length_location = buffer_save_space(buffer, 4);
+    if (length_location == -1) {
+        PyErr_NoMemory();
+        return 0;
+    }
+
+    for (i = -1; i < count; i++) {
+        Py_ssize_t index = i;
+        PyObject* key;
+        PyObject* value;
+        int ok;
+
+        if (i == -1) {
+            if (id_index < 0) {
+                continue;
+            }
+            index = id_index;
+        } else if (i == id_index) {
+            continue;
+        }
+        key = PyTuple_GET_ITEM(options->record_keys, index);
+        if (options->record_is_tuple) {
+            value = PySequence_GetItem(record, index);
+        } else {
+            value = PyObject_GetAttr(
+                record, PyTuple_GET_ITEM(options->record_fields, index));
+            if (!value && PyErr_ExceptionMatches(PyExc_AttributeError)) {
+                PyErr_Clear();
+                continue;
+            }
+        }
+        if (!value) {
+            return 0;
+        }
+        ok = write_pair(self, buffer, PyBytes_AS_STRING(key),
+                        (int)PyBytes_GET_SIZE(key), value, check_keys,
+                        options, 1);
+        Py_DECREF(value);
+        if (!ok) {
+            return 0;
+        }
+    }
+
+    /* write null byte and fill in length */
+    if (!buffer_write_bytes(buffer, &zero, 1)) {
+        return 0;
+    }
+    length = buffer_get_position(buffer) - length_location;
+    buffer_write_int32_at_position(
+        buffer, length_location, (int32_t)length);
+    return length;
+}
+
 /* returns the number of bytes written or 0 on failure */
 int write_dict(PyObject* self, buffer_t buffer,
                PyObject* dict, unsigned char check_keys,
@@ -1608,12 +2267,22 @@ int write_dict(PyObject* self, buffer_t buffer,
     int length;
     int length_location;
     struct module_state *state = GETSTATE(self);
+    PyObject* mapping_type;
+
+    if (top_level && options->record_class) {
+        int is_record = PyObject_IsInstance(dict, options->record_class);
+        if (is_record < 0) {
+            return 0;
+        }
+        if (is_record) {
+            return write_record(self, buffer, dict, check_keys, options);
+        }
+    }
+
 #if PY_MAJOR_VERSION >= 3
-    PyObject* mapping_type = _get_object(state->Mapping,
-                                         "collections.abc", "Mapping");
+    mapping_type = _get_object(state->Mapping, "collections.abc", "Mapping");
 #else
-    PyObject* mapping_type = _get_object(state->Mapping,
-                                         "collections", "Mapping");
+    mapping_type = _get_object(state->Mapping, "collections", "Mapping");
 #endif
 
     if (mapping_type) {
@@ -1790,565 +2459,643 @@ static PyObject* _cbson_dict_to_bson(PyObject* self, PyObject* args) {
     return result;
 }
 
-static PyObject* get_value(PyObject* self, PyObject* name, const char* buffer,
-                           unsigned* position, unsigned char type,
-                           unsigned max, const codec_options_t* options) {
-    struct module_state *state = GETSTATE(self);
-
-    PyObject* value = NULL;
-    switch (type) {
-    case 1:
-        {
-            double d;
-            if (max < 8) {
-                goto invalid;
-            }
-            memcpy(&d, buffer + *position, 8);
-            value = PyFloat_FromDouble(BSON_DOUBLE_FROM_LE(d));
-            *position += 8;
-            break;
+/* Copy `size` bytes from `data` into the writable Python object `target`
+ * at `offset`. A bytearray target is grown as needed.
+ *
+ * Returns 0 on failure (with an exception set), 1 on success. */
+static int _copy_into_target(PyObject* target, Py_ssize_t offset,
+                             const char* data, Py_ssize_t size) {
+    Py_buffer view;
+
+    if (PyByteArray_Check(target)) {
+        Py_ssize_t target_size = PyByteArray_GET_SIZE(target);
+        if (offset < 0 || offset > target_size) {
+            PyErr_Format(PyExc_ValueError,
+                         "offset %zd is out of range for a buffer of "
+                         "length %zd", offset, target_size);
+            return 0;
         }
-    case 2:
-    case 14:
-        {
-            uint32_t value_length;
-            if (max < 4) {
-                goto invalid;
-            }
-            memcpy(&value_length, buffer + *position, 4);
-            value_length = BSON_UINT32_FROM_LE(value_length);
-            /* Encoded string length + string */
-            if (!value_length || max < value_length || max < 4 + value_length) {
-                goto invalid;
-            }
-            *position += 4;
-            /* Strings must end in \0 */
-            if (buffer[*position + value_length - 1]) {
-                goto invalid;
-            }
-            value = PyUnicode_DecodeUTF8(
-                buffer + *position, value_length - 1,
-                options->unicode_decode_error_handler);
-            if (!value) {
-                goto invalid;
-            }
-            *position += value_length;
-            break;
+        if (offset + size > target_size &&
+                PyByteArray_Resize(target, offset + size) < 0) {
+            return 0;
         }
-    case 3:
-        {
-            PyObject* collection;
-            uint32_t size;
+        memcpy(PyByteArray_AS_STRING(target) + offset, data, size);
+        return 1;
+    }
 
-            if (max < 4) {
-                goto invalid;
-            }
-            memcpy(&size, buffer + *position, 4);
-            size = BSON_UINT32_FROM_LE(size);
-            if (size < BSON_MIN_SIZE || max < size) {
-                goto invalid;
-            }
-            /* Check for bad eoo */
-            if (buffer[*position + size - 1]) {
-                goto invalid;
-            }
+    if (PyObject_GetBuffer(target, &view, PyBUF_WRITABLE) < 0) {
+        return 0;
+    }
+    if (offset < 0 || offset > view.len) {
+        PyErr_Format(PyExc_ValueError,
+                     "offset %zd is out of range for a buffer of "
+                     "length %zd", offset, view.len);
+        PyBuffer_Release(&view);
+        return 0;
+    }
+    if (offset + size > view.len) {
+        PyErr_Format(PyExc_ValueError,
+                     "buffer too small: %zd bytes needed at offset %zd "
+                     "but only %zd available", size, offset,
+                     view.len - offset);
+        PyBuffer_Release(&view);
+        return 0;
+    }
+    memcpy((char*)view.buf + offset, data, size);
+    PyBuffer_Release(&view);
+    return 1;
+}
 
-            if (options->is_raw_bson) {
-                value = PyObject_CallFunction(
-                    options->document_class, BYTES_FORMAT_STRING "O",
-                    buffer + *position, size, options->options_obj);
-                if (!value) {
-                    goto invalid;
-                }
-                *position += size;
-                break;
-            }
+static PyObject* _cbson_encode_into(PyObject* self, PyObject* args) {
+    PyObject* dict;
+    PyObject* target;
+    Py_ssize_t offset;
+    unsigned char check_keys;
+    codec_options_t options;
+    buffer_t buffer;
+    long type_marker;
+    int length;
 
-            value = elements_to_dict(self, buffer + *position + 4,
-                                     size - 5, options);
-            if (!value) {
-                goto invalid;
-            }
+    if (!PyArg_ParseTuple(args, "OOnbO&", &dict, &target, &offset,
+                          &check_keys, convert_codec_options, &options)) {
+        return NULL;
+    }
 
-            /* Decoding for DBRefs */
-            if (PyMapping_HasKeyString(value, "$ref")) { /* DBRef */
-                PyObject* dbref = NULL;
-                PyObject* dbref_type;
-                PyObject* id;
-                PyObject* database;
+    /* check for RawBSONDocument */
+    type_marker = _type_marker(dict);
+    if (type_marker < 0) {
+        destroy_codec_options(&options);
+        return NULL;
+    } else if (101 == type_marker) {
+        PyObject* raw;
+        char* raw_data;
+        Py_ssize_t raw_size;
+        destroy_codec_options(&options);
+        raw = PyObject_GetAttrString(dict, "raw");
+        if (NULL == raw) {
+            return NULL;
+        }
+#if PY_MAJOR_VERSION >= 3
+        if (PyBytes_AsStringAndSize(raw, &raw_data, &raw_size) < 0) {
+#else
+        if (PyString_AsStringAndSize(raw, &raw_data, &raw_size) < 0) {
+#endif
+            Py_DECREF(raw);
+            return NULL;
+        }
+        if (!_copy_into_target(target, offset, raw_data, raw_size)) {
+            Py_DECREF(raw);
+            return NULL;
+        }
+        Py_DECREF(raw);
+        return PyLong_FromSsize_t(raw_size);
+    }
 
-                collection = PyMapping_GetItemString(value, "$ref");
-                /* PyMapping_GetItemString returns NULL to indicate error. */
-                if (!collection) {
-                    goto invalid;
-                }
-                PyMapping_DelItemString(value, "$ref");
+    buffer = buffer_new();
+    if (!buffer) {
+        destroy_codec_options(&options);
+        PyErr_NoMemory();
+        return NULL;
+    }
 
-                if (PyMapping_HasKeyString(value, "$id")) {
-                    id = PyMapping_GetItemString(value, "$id");
-                    if (!id) {
-                        Py_DECREF(collection);
-                        goto invalid;
-                    }
-                    PyMapping_DelItemString(value, "$id");
-                } else {
-                    id = Py_None;
-                    Py_INCREF(id);
-                }
+    length = write_dict(self, buffer, dict, check_keys, &options, 1);
+    destroy_codec_options(&options);
+    if (!length) {
+        buffer_free(buffer);
+        return NULL;
+    }
 
-                if (PyMapping_HasKeyString(value, "$db")) {
-                    database = PyMapping_GetItemString(value, "$db");
-                    if (!database) {
-                        Py_DECREF(collection);
-                        Py_DECREF(id);
-                        goto invalid;
-                    }
-                    PyMapping_DelItemString(value, "$db");
-                } else {
-                    database = Py_None;
-                    Py_INCREF(database);
-                }
+    if (!_copy_into_target(target, offset,
+                           buffer_get_buffer(buffer), length)) {
+        buffer_free(buffer);
+        return NULL;
+    }
+    buffer_free(buffer);
+#if PY_MAJOR_VERSION >= 3
+    return PyLong_FromLong(length);
+#else
+    return PyInt_FromLong(length);
+#endif
+}
 
-                if ((dbref_type = _get_object(state->DBRef, "bson.dbref", "DBRef"))) {
-                    dbref = PyObject_CallFunctionObjArgs(dbref_type, collection, id, database, value, NULL);
-                    Py_DECREF(dbref_type);
-                }
-                Py_DECREF(value);
-                value = dbref;
+static int _dict_size(PyObject* self, buffer_t scratch, PyObject* dict,
+                      unsigned char check_keys,
+                      const codec_options_t* options,
+                      unsigned char top_level, Py_ssize_t* size);
 
-                Py_DECREF(id);
-                Py_DECREF(collection);
-                Py_DECREF(database);
+/* Add the size of the element 'name': 'value', encoded to BSON, to *size
+ * without encoding it. Values of less common types are encoded to 'scratch'
+ * to measure them.
+ *
+ * Returns 0 on failure. */
+static int _element_size(PyObject* self, buffer_t scratch,
+                         const char* name, int name_length, PyObject* value,
+                         unsigned char check_keys,
+                         const codec_options_t* options, Py_ssize_t* size) {
+    /* Type byte, name and NUL. */
+    Py_ssize_t header = name_length + 2;
+    long type;
+
+    if (!options->type_registry.is_encoder_empty &&
+            PyDict_GetItem(options->type_registry.encoder_map,
+                           (PyObject*)Py_TYPE(value))) {
+        goto encode;
+    }
+
+    if (PyBool_Check(value)) {
+        *size += header + 1;
+        return 1;
+#if PY_MAJOR_VERSION >= 3
+    } else if (PyLong_CheckExact(value)) {
+#else
+    } else if (PyInt_CheckExact(value)) {
+#endif
+        int overflow;
+        long long long_value = PyLong_AsLongLongAndOverflow(value, &overflow);
+        if (long_value == -1 && PyErr_Occurred()) {
+            return 0;
+        }
+        if (overflow) {
+            /* Let the encoder raise OverflowError. */
+            goto encode;
+        }
+        if (long_value >= INT32_MIN && long_value <= INT32_MAX) {
+            *size += header + 4;
+        } else {
+            *size += header + 8;
+        }
+        return 1;
+    } else if (PyFloat_CheckExact(value)) {
+        *size += header + 8;
+        return 1;
+    } else if (value == Py_None) {
+        *size += header;
+        return 1;
+#if PY_MAJOR_VERSION >= 3
+    } else if (PyUnicode_CheckExact(value)) {
+        Py_ssize_t length;
+        if (!PyUnicode_AsUTF8AndSize(value, &length)) {
+            return 0;
+        }
+        /* Length, UTF-8 bytes and NUL. */
+        *size += header + 4 + length + 1;
+        return 1;
+#endif
+    } else if (PyDict_CheckExact(value)) {
+        *size += header;
+        return _dict_size(self, scratch, value, check_keys, options, 0, size);
+    } else if (PyList_CheckExact(value) || PyTuple_CheckExact(value)) {
+        Py_ssize_t items = PySequence_Fast_GET_SIZE(value);
+        Py_ssize_t i;
+        char key[16];
+        int key_length = 1;
+
+        if (items > BSON_MAX_SIZE) {
+            goto encode;
+        }
+        /* Type byte, name, NUL, length and the array's NUL. */
+        *size += header + 5;
+        key[0] = '0';
+        key[1] = '\0';
+        for (i = 0; i < items; i++) {
+            if (!_element_size(self, scratch, key, key_length,
+                               PySequence_Fast_GET_ITEM(value, i),
+                               check_keys, options, size)) {
+                return 0;
             }
+            _next_array_key(key, &key_length);
+        }
+        return 1;
+    }
 
-            *position += size;
-            break;
+    type = _type_marker(value);
+    if (type < 0) {
+        return 0;
+    }
+    if (type == 7) {
+        /* ObjectId */
+        *size += header + 12;
+        return 1;
+    } else if (type == 9) {
+        /* DatetimeMS */
+        *size += header + 8;
+        return 1;
+    } else if (type == 101) {
+        /* RawBSONDocument */
+        PyObject* raw = PyObject_GetAttrString(value, "raw");
+        Py_ssize_t length;
+        if (!raw) {
+            return 0;
         }
-    case 4:
-        {
-            uint32_t size, end;
+#if PY_MAJOR_VERSION >= 3
+        length = PyBytes_Size(raw);
+#else
+        length = PyString_Size(raw);
+#endif
+        Py_DECREF(raw);
+        if (length == -1) {
+            return 0;
+        }
+        *size += header + length;
+        return 1;
+    } else if (type == 0 && PyDict_Check(value)) {
+        /* Dict subclasses, like SON. */
+        *size += header;
+        return _dict_size(self, scratch, value, check_keys, options, 0, size);
+    } else if (type == 0 && PyDateTime_Check(value)) {
+        *size += header + 8;
+        return 1;
+    }
 
-            if (max < 4) {
-                goto invalid;
-            }
-            memcpy(&size, buffer + *position, 4);
-            size = BSON_UINT32_FROM_LE(size);
-            if (size < BSON_MIN_SIZE || max < size) {
-                goto invalid;
+encode:
+    buffer_update_position(scratch, 0);
+    if (!write_pair(self, scratch, name, name_length, value,
+                    check_keys, options, 1)) {
+        return 0;
+    }
+    *size += buffer_get_position(scratch);
+    return 1;
+}
+
+/* Add the size of the element 'key': 'value' of a document to *size.
+ *
+ * Returns 0 on failure. */
+static int _pair_size(PyObject* self, buffer_t scratch, PyObject* key,
+                      PyObject* value, unsigned char check_keys,
+                      const codec_options_t* options,
+                      unsigned char top_level, Py_ssize_t* size) {
+#if PY_MAJOR_VERSION >= 3
+    if (PyUnicode_Check(key)) {
+        Py_ssize_t key_length;
+        const char* data = PyUnicode_AsUTF8AndSize(key, &key_length);
+        if (!data) {
+            return 0;
+        }
+        /* Let the encoder raise InvalidDocument for a NUL in the key. */
+        if ((Py_ssize_t)strlen(data) == key_length) {
+            /* The _id of a top level document was counted first. */
+            if (top_level && strcmp(data, "_id") == 0) {
+                return 1;
             }
-            end = *position + size - 1;
-            /* Check for bad eoo */
-            if (buffer[end]) {
-                goto invalid;
+            if (check_keys && !check_key_name(data, (int)key_length)) {
+                return 0;
             }
-            *position += 4;
+            return _element_size(self, scratch, data, (int)key_length,
+                                 value, check_keys, options, size);
+        }
+    }
+#endif
+    buffer_update_position(scratch, 0);
+    if (!decode_and_write_pair(self, scratch, key, value,
+                               check_keys, options, top_level)) {
+        return 0;
+    }
+    *size += buffer_get_position(scratch);
+    return 1;
+}
 
-            value = PyList_New(0);
-            if (!value) {
-                goto invalid;
-            }
-            while (*position < end) {
-                PyObject* to_append;
+/* Add the size of 'dict' encoded to BSON to *size.
+ *
+ * Returns 0 on failure. */
+static int _dict_size(PyObject* self, buffer_t scratch, PyObject* dict,
+                      unsigned char check_keys,
+                      const codec_options_t* options,
+                      unsigned char top_level, Py_ssize_t* size) {
+    PyObject* key;
+    PyObject* value;
+    int result = 0;
 
-                unsigned char bson_type = (unsigned char)buffer[(*position)++];
+    if (!PyDict_Check(dict)) {
+        /* Measure other mappings by encoding them. */
+        int length;
+        buffer_update_position(scratch, 0);
+        length = write_dict(self, scratch, dict, check_keys, options,
+                            top_level);
+        if (!length) {
+            return 0;
+        }
+        *size += length;
+        return 1;
+    }
 
-                size_t key_size = strlen(buffer + *position);
-                if (max < key_size) {
-                    Py_DECREF(value);
-                    goto invalid;
-                }
-                /* just skip the key, they're in order. */
-                *position += (unsigned)key_size + 1;
-                if (Py_EnterRecursiveCall(" while decoding a list value")) {
-                    Py_DECREF(value);
-                    goto invalid;
-                }
-                to_append = get_value(self, name, buffer, position, bson_type,
-                                      max - (unsigned)key_size, options);
-                Py_LeaveRecursiveCall();
-                if (!to_append) {
-                    Py_DECREF(value);
-                    goto invalid;
-                }
-                if (PyList_Append(value, to_append) < 0) {
-                    Py_DECREF(value);
-                    Py_DECREF(to_append);
-                    goto invalid;
-                }
-                Py_DECREF(to_append);
-            }
-            if (*position != end) {
-                goto invalid;
-            }
-            (*position)++;
-            break;
+    if (Py_EnterRecursiveCall(" while calculating the size of a document ")) {
+        return 0;
+    }
+
+    /* Length and NUL. */
+    *size += 5;
+    if (top_level) {
+        /* PyDict_GetItemString returns a borrowed reference. */
+        PyObject* _id = PyDict_GetItemString(dict, "_id");
+        if (_id && !_element_size(self, scratch, "_id", 3, _id,
+                                  check_keys, options, size)) {
+            goto done;
         }
-    case 5:
-        {
-            PyObject* data;
-            PyObject* st;
-            PyObject* type_to_create;
-            uint32_t length, length2;
-            unsigned char subtype;
+    }
 
-            if (max < 5) {
-                goto invalid;
+    if (PyDict_CheckExact(dict)) {
+        Py_ssize_t pos = 0;
+        while (PyDict_Next(dict, &pos, &key, &value)) {
+            if (!_pair_size(self, scratch, key, value, check_keys, options,
+                            top_level, size)) {
+                goto done;
             }
-            memcpy(&length, buffer + *position, 4);
-            length = BSON_UINT32_FROM_LE(length);
-            if (max < length) {
-                goto invalid;
+        }
+    } else {
+        /* Iterate dict subclasses, like SON, as write_dict does. */
+        PyObject* iter = PyObject_GetIter(dict);
+        if (!iter) {
+            goto done;
+        }
+        while ((key = PyIter_Next(iter)) != NULL) {
+            int ok;
+            value = PyObject_GetItem(dict, key);
+            if (!value) {
+                PyErr_SetObject(PyExc_KeyError, key);
+                Py_DECREF(key);
+                Py_DECREF(iter);
+                goto done;
             }
-
-            subtype = (unsigned char)buffer[*position + 4];
-            *position += 5;
-            if (subtype == 2) {
-                if (length < 4) {
-                    goto invalid;
-                }
-                memcpy(&length2, buffer + *position, 4);
-                length2 = BSON_UINT32_FROM_LE(length2);
-                if (length2 != length - 4) {
-                    goto invalid;
-                }
+            ok = _pair_size(self, scratch, key, value, check_keys, options,
+                            top_level, size);
+            Py_DECREF(key);
+            Py_DECREF(value);
+            if (!ok) {
+                Py_DECREF(iter);
+                goto done;
             }
+        }
+        Py_DECREF(iter);
+        if (PyErr_Occurred()) {
+            goto done;
+        }
+    }
+    result = 1;
+
+done:
+    Py_LeaveRecursiveCall();
+    return result;
+}
+
+static PyObject* _cbson_calculate_size(PyObject* self, PyObject* args) {
+    PyObject* dict;
+    unsigned char check_keys;
+    codec_options_t options;
+    buffer_t scratch;
+    unsigned char top_level = 1;
+    Py_ssize_t size = 0;
+    long type_marker;
+
+    if (!PyArg_ParseTuple(args, "ObO&|b", &dict, &check_keys,
+                          convert_codec_options, &options, &top_level)) {
+        return NULL;
+    }
+
+    /* check for RawBSONDocument */
+    type_marker = _type_marker(dict);
+    if (type_marker < 0) {
+        destroy_codec_options(&options);
+        return NULL;
+    } else if (101 == type_marker) {
+        PyObject* raw;
+        destroy_codec_options(&options);
+        raw = PyObject_GetAttrString(dict, "raw");
+        if (NULL == raw) {
+            return NULL;
+        }
 #if PY_MAJOR_VERSION >= 3
-            /* Python3 special case. Decode BSON binary subtype 0 to bytes. */
-            if (subtype == 0) {
-                value = PyBytes_FromStringAndSize(buffer + *position, length);
-                *position += length;
-                break;
-            }
-            if (subtype == 2) {
-                data = PyBytes_FromStringAndSize(buffer + *position + 4, length - 4);
-            } else {
-                data = PyBytes_FromStringAndSize(buffer + *position, length);
-            }
+        size = PyBytes_Size(raw);
 #else
-            if (subtype == 2) {
-                data = PyString_FromStringAndSize(buffer + *position + 4, length - 4);
-            } else {
-                data = PyString_FromStringAndSize(buffer + *position, length);
-            }
+        size = PyString_Size(raw);
 #endif
-            if (!data) {
-                goto invalid;
-            }
-            /* Encode as UUID, not Binary */
-            if (subtype == 3 || subtype == 4) {
-                PyObject* kwargs;
-                PyObject* args = PyTuple_New(0);
-                /* UUID should always be 16 bytes */
-                if (!args || length != 16) {
-                    Py_DECREF(data);
-                    goto invalid;
-                }
-                kwargs = PyDict_New();
-                if (!kwargs) {
-                    Py_DECREF(data);
-                    Py_DECREF(args);
-                    goto invalid;
-                }
+        Py_DECREF(raw);
+        if (size == -1) {
+            return NULL;
+        }
+        return PyLong_FromSsize_t(size);
+    }
 
-                /*
-                 * From this point, we hold refs to args, kwargs, and data.
-                 * If anything fails, goto uuiderror to clean them up.
-                 */
-                if (subtype == 3 && options->uuid_rep == CSHARP_LEGACY) {
-                    /* Legacy C# byte order */
-                    if ((PyDict_SetItemString(kwargs, "bytes_le", data)) == -1)
-                        goto uuiderror;
-                }
-                else {
-                    if (subtype == 3 && options->uuid_rep == JAVA_LEGACY) {
-                        /* Convert from legacy java byte order */
-                        char big_endian[16];
-                        _fix_java(buffer + *position, big_endian);
-                        /* Free the previously created PyString object */
-                        Py_DECREF(data);
+    scratch = buffer_new();
+    if (!scratch) {
+        destroy_codec_options(&options);
+        PyErr_NoMemory();
+        return NULL;
+    }
+    if (!_dict_size(self, scratch, dict, check_keys, &options, top_level,
+                    &size)) {
+        destroy_codec_options(&options);
+        buffer_free(scratch);
+        return NULL;
+    }
+    destroy_codec_options(&options);
+    buffer_free(scratch);
+    return PyLong_FromSsize_t(size);
+}
+
+/* Decode the values of a BSON array to an array.array, if they are all
+ * doubles, all int32 or all int64. The values start at 'buffer + position'
+ * and 'end' is the position of the array's trailing NUL.
+ *
+ * Returns a new reference, NULL without an exception if the values are not
+ * all of one of those types, or NULL with an exception on failure. */
+static PyObject* _typed_array_from_bson(PyObject* self, const char* buffer,
+                                        unsigned position, unsigned end) {
+    struct module_state *state = GETSTATE(self);
+    unsigned char element_type = (unsigned char)buffer[position];
+    const char* typecode;
+    unsigned size;
+    unsigned count = 0;
+    unsigned p;
+    char* out;
+    PyObject* values;
+    PyObject* array_type;
+    PyObject* result = NULL;
+
+    switch (element_type) {
+    case 1:
+        typecode = "d";
+        size = 8;
+        break;
+    case 16:
+        /* The same typecodes as bson._TYPED_ARRAY_TYPES. */
+        typecode = (sizeof(int) == 4) ? "i" : "l";
+        size = 4;
+        break;
+    case 18:
+        if (sizeof(long) == 8) {
+            typecode = "l";
+        } else {
 #if PY_MAJOR_VERSION >= 3
-                        data = PyBytes_FromStringAndSize(big_endian, length);
+            typecode = "q";
 #else
-                        data = PyString_FromStringAndSize(big_endian, length);
+            /* No "q" typecode before Python 3.3. */
+            return NULL;
 #endif
-                        if (data == NULL)
-                            goto uuiderror;
-                    }
-                    if ((PyDict_SetItemString(kwargs, "bytes", data)) == -1)
-                        goto uuiderror;
-
-                }
-                if ((type_to_create = _get_object(state->UUID, "uuid", "UUID"))) {
-                    value = PyObject_Call(type_to_create, args, kwargs);
-                    Py_DECREF(type_to_create);
-                }
-
-                Py_DECREF(args);
-                Py_DECREF(kwargs);
-                Py_DECREF(data);
-                if (!value) {
-                    goto invalid;
-                }
-
-                *position += length;
-                break;
+        }
+        size = 8;
+        break;
+    default:
+        return NULL;
+    }
 
-            uuiderror:
-                Py_DECREF(args);
-                Py_DECREF(kwargs);
-                Py_XDECREF(data);
-                goto invalid;
-            }
+    /* Check the types and count the values first. Anything unexpected is
+     * left to the regular decoder to report. */
+    p = position;
+    while (p < end) {
+        if ((unsigned char)buffer[p] != element_type) {
+            return NULL;
+        }
+        p += 1 + (unsigned)strlen(buffer + p + 1) + 1;
+        if (p > end || end - p < size) {
+            return NULL;
+        }
+        p += size;
+        count++;
+    }
+    if (p != end) {
+        return NULL;
+    }
 
 #if PY_MAJOR_VERSION >= 3
-            st = PyLong_FromLong(subtype);
+    values = PyBytes_FromStringAndSize(NULL, (Py_ssize_t)count * size);
 #else
-            st = PyInt_FromLong(subtype);
+    values = PyString_FromStringAndSize(NULL, (Py_ssize_t)count * size);
 #endif
-            if (!st) {
-                Py_DECREF(data);
-                goto invalid;
-            }
-            if ((type_to_create = _get_object(state->Binary, "bson.binary", "Binary"))) {
-                value = PyObject_CallFunctionObjArgs(type_to_create, data, st, NULL);
-                Py_DECREF(type_to_create);
-            }
-            Py_DECREF(st);
-            Py_DECREF(data);
-            if (!value) {
-                goto invalid;
-            }
-            *position += length;
-            break;
-        }
-    case 6:
-    case 10:
-        {
-            value = Py_None;
-            Py_INCREF(value);
-            break;
-        }
-    case 7:
-        {
-            PyObject* objectid_type;
-            if (max < 12) {
-                goto invalid;
-            }
-            if ((objectid_type = _get_object(state->ObjectId, "bson.objectid", "ObjectId"))) {
+    if (!values) {
+        return NULL;
+    }
 #if PY_MAJOR_VERSION >= 3
-                value = PyObject_CallFunction(objectid_type, "y#", buffer + *position, 12);
+    out = PyBytes_AS_STRING(values);
 #else
-                value = PyObject_CallFunction(objectid_type, "s#", buffer + *position, 12);
+    out = PyString_AS_STRING(values);
 #endif
-                Py_DECREF(objectid_type);
-            }
-            *position += 12;
-            break;
+    p = position;
+    while (p < end) {
+        p += 1 + (unsigned)strlen(buffer + p + 1) + 1;
+        if (element_type == 1) {
+            double d;
+            memcpy(&d, buffer + p, 8);
+            d = BSON_DOUBLE_FROM_LE(d);
+            memcpy(out, &d, 8);
+        } else if (element_type == 16) {
+            uint32_t i;
+            memcpy(&i, buffer + p, 4);
+            i = BSON_UINT32_FROM_LE(i);
+            memcpy(out, &i, 4);
+        } else {
+            uint64_t ll;
+            memcpy(&ll, buffer + p, 8);
+            ll = BSON_UINT64_FROM_LE(ll);
+            memcpy(out, &ll, 8);
         }
-    case 8:
-        {
-            char boolean_raw = buffer[(*position)++];
-            if (0 == boolean_raw) {
-                value = Py_False;
-            } else if (1 == boolean_raw) {
-                value = Py_True;
-            } else {
-                PyObject* InvalidBSON = _error("InvalidBSON");
-                if (InvalidBSON) {
-                    PyErr_Format(InvalidBSON, "invalid boolean value: %x", boolean_raw);
-                    Py_DECREF(InvalidBSON);
-                }
-                return NULL;
-            }
-            Py_INCREF(value);
-            break;
-        }
-    case 9:
-        {
-            PyObject* utc_type;
-            PyObject* naive;
-            PyObject* replace;
-            PyObject* args;
-            PyObject* kwargs;
-            PyObject* astimezone;
-            int64_t millis;
-            if (max < 8) {
-                goto invalid;
-            }
-            memcpy(&millis, buffer + *position, 8);
-            millis = (int64_t)BSON_UINT64_FROM_LE(millis);
-            naive = datetime_from_millis(millis);
-            *position += 8;
-            if (!options->tz_aware) { /* In the naive case, we're done here. */
-                value = naive;
-                break;
-            }
-
-            if (!naive) {
-                goto invalid;
-            }
-            replace = PyObject_GetAttrString(naive, "replace");
-            Py_DECREF(naive);
-            if (!replace) {
-                goto invalid;
-            }
-            args = PyTuple_New(0);
-            if (!args) {
-                Py_DECREF(replace);
-                goto invalid;
-            }
-            kwargs = PyDict_New();
-            if (!kwargs) {
-                Py_DECREF(replace);
-                Py_DECREF(args);
-                goto invalid;
-            }
-            utc_type = _get_object(state->UTC, "bson.tz_util", "utc");
-            if (!utc_type || PyDict_SetItemString(kwargs, "tzinfo", utc_type) == -1) {
-                Py_DECREF(replace);
-                Py_DECREF(args);
-                Py_DECREF(kwargs);
-                Py_XDECREF(utc_type);
-                goto invalid;
-            }
-            Py_XDECREF(utc_type);
-            value = PyObject_Call(replace, args, kwargs);
-            if (!value) {
-                Py_DECREF(replace);
-                Py_DECREF(args);
-                Py_DECREF(kwargs);
-                goto invalid;
-            }
+        p += size;
+        out += size;
+    }
 
-            /* convert to local time */
-            if (options->tzinfo != Py_None) {
-                astimezone = PyObject_GetAttrString(value, "astimezone");
-                Py_DECREF(value);
-                if (!astimezone) {
-                    Py_DECREF(replace);
-                    Py_DECREF(args);
-                    Py_DECREF(kwargs);
-                    goto invalid;
-                }
-                value = PyObject_CallFunctionObjArgs(astimezone, options->tzinfo, NULL);
-                Py_DECREF(astimezone);
-            }
+    if ((array_type = _get_object(state->Array, "array", "array"))) {
+        result = PyObject_CallFunction(array_type, "sO", typecode, values);
+        Py_DECREF(array_type);
+    }
+    Py_DECREF(values);
+    return result;
+}
 
-            Py_DECREF(replace);
-            Py_DECREF(args);
-            Py_DECREF(kwargs);
-            break;
-        }
-    case 11:
-        {
-            PyObject* regex_class;
-            PyObject* pattern;
-            int flags;
-            size_t flags_length, i;
-            size_t pattern_length = strlen(buffer + *position);
-            if (pattern_length > BSON_MAX_SIZE || max < pattern_length) {
-                goto invalid;
-            }
-            pattern = PyUnicode_DecodeUTF8(
-                buffer + *position, pattern_length,
-                options->unicode_decode_error_handler);
-            if (!pattern) {
-                goto invalid;
-            }
-            *position += (unsigned)pattern_length + 1;
-            flags_length = strlen(buffer + *position);
-            if (flags_length > BSON_MAX_SIZE ||
-                    (BSON_MAX_SIZE - pattern_length) < flags_length) {
-                Py_DECREF(pattern);
-                goto invalid;
-            }
-            if (max < pattern_length + flags_length) {
-                Py_DECREF(pattern);
-                goto invalid;
-            }
-            flags = 0;
-            for (i = 0; i < flags_length; i++) {
-                if (buffer[*position + i] == 'i') {
-                    flags |= 2;
-                } else if (buffer[*position + i] == 'l') {
-                    flags |= 4;
-                } else if (buffer[*position + i] == 'm') {
-                    flags |= 8;
-                } else if (buffer[*position + i] == 's') {
-                    flags |= 16;
-                } else if (buffer[*position + i] == 'u') {
-                    flags |= 32;
-                } else if (buffer[*position + i] == 'x') {
-                    flags |= 64;
-                }
-            }
-            *position += (unsigned)flags_length + 1;
+/* Decode the 'length' bytes of a packed array (binary subtype 9) at
+ * 'data' to a memoryview of its numbers, or to an array.array in Python 2.
+ *
+ * Returns a new reference, NULL without an exception if the array's type
+ * is unknown, or NULL with an exception on failure. */
+static PyObject* _packed_array_from_bson(PyObject* self, const char* data,
+                                         uint32_t length) {
+    const char* typecode;
+    unsigned size;
+    PyObject* values;
+    PyObject* result = NULL;
+
+    if (length < 2 || data[1] != 0) {
+        return NULL;
+    }
+    if (data[0] == 0x03) {
+        typecode = "b";
+        size = 1;
+    } else if (data[0] == 0x27) {
+        typecode = "f";
+        size = 4;
+    } else {
+        return NULL;
+    }
+    length -= 2;
+    if (length % size) {
+        return NULL;
+    }
 
-            regex_class = _get_object(state->Regex, "bson.regex", "Regex");
-            if (regex_class) {
-                value = PyObject_CallFunction(regex_class,
-                                              "Oi", pattern, flags);
-                Py_DECREF(regex_class);
-            }
-            Py_DECREF(pattern);
-            break;
+#if PY_MAJOR_VERSION >= 3
+    values = PyBytes_FromStringAndSize(data + 2, length);
+#else
+    values = PyString_FromStringAndSize(data + 2, length);
+#endif
+    if (!values) {
+        return NULL;
+    }
+    if (size == 4) {
+        /* Native byte order. */
+#if PY_MAJOR_VERSION >= 3
+        char* out = PyBytes_AS_STRING(values);
+#else
+        char* out = PyString_AS_STRING(values);
+#endif
+        uint32_t i;
+        uint32_t n;
+        for (i = 0; i < length; i += 4) {
+            memcpy(&n, out + i, 4);
+            n = BSON_UINT32_FROM_LE(n);
+            memcpy(out + i, &n, 4);
         }
-    case 12:
-        {
-            uint32_t coll_length;
-            PyObject* collection;
-            PyObject* id = NULL;
-            PyObject* objectid_type;
-            PyObject* dbref_type;
-
-            if (max < 4) {
-                goto invalid;
-            }
-            memcpy(&coll_length, buffer + *position, 4);
-            coll_length = BSON_UINT32_FROM_LE(coll_length);
-            /* Encoded string length + string + 12 byte ObjectId */
-            if (!coll_length || max < coll_length || max < 4 + coll_length + 12) {
-                goto invalid;
-            }
-            *position += 4;
-            /* Strings must end in \0 */
-            if (buffer[*position + coll_length - 1]) {
-                goto invalid;
-            }
-
-            collection = PyUnicode_DecodeUTF8(
-                buffer + *position, coll_length - 1,
-                options->unicode_decode_error_handler);
-            if (!collection) {
-                goto invalid;
-            }
-            *position += coll_length;
-
-            if ((objectid_type = _get_object(state->ObjectId, "bson.objectid", "ObjectId"))) {
+    }
 #if PY_MAJOR_VERSION >= 3
-                id = PyObject_CallFunction(objectid_type, "y#", buffer + *position, 12);
+    {
+        PyObject* view = PyMemoryView_FromObject(values);
+        if (view) {
+            result = PyObject_CallMethod(view, "cast", "s", typecode);
+            Py_DECREF(view);
+        }
+    }
 #else
-                id = PyObject_CallFunction(objectid_type, "s#", buffer + *position, 12);
+    {
+        struct module_state *state = GETSTATE(self);
+        PyObject* array_type = _get_object(state->Array, "array", "array");
+        if (array_type) {
+            result = PyObject_CallFunction(array_type, "sO", typecode,
+                                           values);
+            Py_DECREF(array_type);
+        }
+    }
 #endif
-                Py_DECREF(objectid_type);
-            }
-            if (!id) {
-                Py_DECREF(collection);
+    Py_DECREF(values);
+    return result;
+}
+
+static PyObject* get_value(PyObject* self, PyObject* name, const char* buffer,
+                           unsigned* position, unsigned char type,
+                           unsigned max, const codec_options_t* options) {
+    struct module_state *state = GETSTATE(self);
+
+    PyObject* value = NULL;
+    switch (type) {
+    case 1:
+        {
+            double d;
+            if (max < 8) {
                 goto invalid;
             }
-            *position += 12;
-            if ((dbref_type = _get_object(state->DBRef, "bson.dbref", "DBRef"))) {
-                value = PyObject_CallFunctionObjArgs(dbref_type, collection, id, NULL);
-                Py_DECREF(dbref_type);
-            }
-            Py_DECREF(collection);
-            Py_DECREF(id);
+            memcpy(&d, buffer + *position, 8);
+            value = PyFloat_FromDouble(BSON_DOUBLE_FROM_LE(d));
+            *position += 8;
             break;
         }
-    case 13:
+    case 2:
+    case 14:
         {
-            PyObject* code;
-            PyObject* code_type;
             uint32_t value_length;
             if (max < 4) {
                 goto invalid;
@@ -2364,677 +3111,2886 @@ static PyObject* get_value(PyObject* self, PyObject* name, const char* buffer,
             if (buffer[*position + value_length - 1]) {
                 goto invalid;
             }
-            code = PyUnicode_DecodeUTF8(
+            value = PyUnicode_DecodeUTF8(
                 buffer + *position, value_length - 1,
                 options->unicode_decode_error_handler);
-            if (!code) {
+            if (!value) {
                 goto invalid;
             }
             *position += value_length;
-            if ((code_type = _get_object(state->Code, "bson.code", "Code"))) {
-                value = PyObject_CallFunctionObjArgs(code_type, code, NULL, NULL);
-                Py_DECREF(code_type);
-            }
-            Py_DECREF(code);
             break;
         }
-    case 15:
+    case 3:
         {
-            uint32_t c_w_s_size;
-            uint32_t code_size;
-            uint32_t scope_size;
-            PyObject* code;
-            PyObject* scope;
-            PyObject* code_type;
+            PyObject* collection;
+            uint32_t size;
 
-            if (max < 8) {
+            if (max < 4) {
                 goto invalid;
             }
-
-            memcpy(&c_w_s_size, buffer + *position, 4);
-            c_w_s_size = BSON_UINT32_FROM_LE(c_w_s_size);
-            *position += 4;
-
-            if (max < c_w_s_size) {
-                goto invalid;
-            }
-
-            memcpy(&code_size, buffer + *position, 4);
-            code_size = BSON_UINT32_FROM_LE(code_size);
-            /* code_w_scope length + code length + code + scope length */
-            if (!code_size || max < code_size || max < 4 + 4 + code_size + 4) {
-                goto invalid;
-            }
-            *position += 4;
-            /* Strings must end in \0 */
-            if (buffer[*position + code_size - 1]) {
+            memcpy(&size, buffer + *position, 4);
+            size = BSON_UINT32_FROM_LE(size);
+            if (size < BSON_MIN_SIZE || max < size) {
                 goto invalid;
             }
-            code = PyUnicode_DecodeUTF8(
-                buffer + *position, code_size - 1,
-                options->unicode_decode_error_handler);
-            if (!code) {
+            /* Check for bad eoo */
+            if (buffer[*position + size - 1]) {
                 goto invalid;
             }
-            *position += code_size;
 
-            memcpy(&scope_size, buffer + *position, 4);
-            scope_size = BSON_UINT32_FROM_LE(scope_size);
-            if (scope_size < BSON_MIN_SIZE) {
-                Py_DECREF(code);
-                goto invalid;
-            }
-            /* code length + code + scope length + scope */
-            if ((4 + code_size + 4 + scope_size) != c_w_s_size) {
-                Py_DECREF(code);
-                goto invalid;
+            if (options->is_raw_bson) {
+                value = PyObject_CallFunction(
+                    options->document_class, BYTES_FORMAT_STRING "O",
+                    buffer + *position, size, options->options_obj);
+                if (!value) {
+                    goto invalid;
+                }
+                *position += size;
+                break;
             }
 
-            /* Check for bad eoo */
-            if (buffer[*position + scope_size - 1]) {
-                goto invalid;
-            }
-            scope = elements_to_dict(self, buffer + *position + 4,
-                                     scope_size - 5, options);
-            if (!scope) {
-                Py_DECREF(code);
+            value = elements_to_dict(self, buffer + *position + 4,
+                                     size - 5, options);
+            if (!value) {
                 goto invalid;
             }
-            *position += scope_size;
 
-            if ((code_type = _get_object(state->Code, "bson.code", "Code"))) {
-                value = PyObject_CallFunctionObjArgs(code_type, code, scope, NULL);
-                Py_DECREF(code_type);
+            /* Decoding for DBRefs */
+            if (PyMapping_HasKeyString(value, "$ref")) { /* DBRef */
+                PyObject* dbref = NULL;
+                PyObject* dbref_type;
+                PyObject* id;
+                PyObject* database;
+
+                collection = PyMapping_GetItemString(value, "$ref");
+                /* PyMapping_GetItemString returns NULL to indicate error. */
+                if (!collection) {
+                    goto invalid;
+                }
+                PyMapping_DelItemString(value, "$ref");
+
+                if (PyMapping_HasKeyString(value, "$id")) {
+                    id = PyMapping_GetItemString(value, "$id");
+                    if (!id) {
+                        Py_DECREF(collection);
+                        goto invalid;
+                    }
+                    PyMapping_DelItemString(value, "$id");
+                } else {
+                    id = Py_None;
+                    Py_INCREF(id);
+                }
+
+                if (PyMapping_HasKeyString(value, "$db")) {
+                    database = PyMapping_GetItemString(value, "$db");
+                    if (!database) {
+                        Py_DECREF(collection);
+                        Py_DECREF(id);
+                        goto invalid;
+                    }
+                    PyMapping_DelItemString(value, "$db");
+                } else {
+                    database = Py_None;
+                    Py_INCREF(database);
+                }
+
+                if ((dbref_type = _get_object(state->DBRef, "bson.dbref", "DBRef"))) {
+                    dbref = PyObject_CallFunctionObjArgs(dbref_type, collection, id, database, value, NULL);
+                    Py_DECREF(dbref_type);
+                }
+                Py_DECREF(value);
+                value = dbref;
+
+                Py_DECREF(id);
+                Py_DECREF(collection);
+                Py_DECREF(database);
             }
-            Py_DECREF(code);
-            Py_DECREF(scope);
+
+            *position += size;
             break;
         }
-    case 16:
+    case 4:
         {
-            int32_t i;
+            uint32_t size, end;
+
             if (max < 4) {
                 goto invalid;
             }
-            memcpy(&i, buffer + *position, 4);
-            i = (int32_t)BSON_UINT32_FROM_LE(i);
-#if PY_MAJOR_VERSION >= 3
-            value = PyLong_FromLong(i);
-#else
-            value = PyInt_FromLong(i);
-#endif
-            if (!value) {
+            memcpy(&size, buffer + *position, 4);
+            size = BSON_UINT32_FROM_LE(size);
+            if (size < BSON_MIN_SIZE || max < size) {
                 goto invalid;
             }
-            *position += 4;
-            break;
-        }
-    case 17:
-        {
-            uint32_t time, inc;
-            PyObject* timestamp_type;
-            if (max < 8) {
+            end = *position + size - 1;
+            /* Check for bad eoo */
+            if (buffer[end]) {
                 goto invalid;
             }
-            memcpy(&inc, buffer + *position, 4);
-            memcpy(&time, buffer + *position + 4, 4);
-            inc = BSON_UINT32_FROM_LE(inc);
-            time = BSON_UINT32_FROM_LE(time);
-            if ((timestamp_type = _get_object(state->Timestamp, "bson.timestamp", "Timestamp"))) {
-                value = PyObject_CallFunction(timestamp_type, "II", time, inc);
-                Py_DECREF(timestamp_type);
+            *position += 4;
+
+            if (options->typed_arrays) {
+                value = _typed_array_from_bson(self, buffer, *position, end);
+                if (value) {
+                    *position = end + 1;
+                    break;
+                }
+                if (PyErr_Occurred()) {
+                    goto invalid;
+                }
             }
-            *position += 8;
-            break;
-        }
-    case 18:
-        {
-            int64_t ll;
-            PyObject* bson_int64_type = _get_object(state->BSONInt64,
-                                                    "bson.int64", "Int64");
-            if (!bson_int64_type)
+
+            value = PyList_New(0);
+            if (!value) {
                 goto invalid;
-            if (max < 8) {
-                Py_DECREF(bson_int64_type);
+            }
+            while (*position < end) {
+                PyObject* to_append;
+
+                unsigned char bson_type = (unsigned char)buffer[(*position)++];
+
+                size_t key_size = strlen(buffer + *position);
+                if (max < key_size) {
+                    Py_DECREF(value);
+                    goto invalid;
+                }
+                /* just skip the key, they're in order. */
+                *position += (unsigned)key_size + 1;
+                if (Py_EnterRecursiveCall(" while decoding a list value")) {
+                    Py_DECREF(value);
+                    goto invalid;
+                }
+                to_append = get_value(self, name, buffer, position, bson_type,
+                                      max - (unsigned)key_size, options);
+                Py_LeaveRecursiveCall();
+                if (!to_append) {
+                    Py_DECREF(value);
+                    goto invalid;
+                }
+                if (PyList_Append(value, to_append) < 0) {
+                    Py_DECREF(value);
+                    Py_DECREF(to_append);
+                    goto invalid;
+                }
+                Py_DECREF(to_append);
+            }
+            if (*position != end) {
                 goto invalid;
             }
-            memcpy(&ll, buffer + *position, 8);
-            ll = (int64_t)BSON_UINT64_FROM_LE(ll);
-            value = PyObject_CallFunction(bson_int64_type, "L", ll);
-            *position += 8;
-            Py_DECREF(bson_int64_type);
+            (*position)++;
             break;
         }
-    case 19:
+    case 5:
         {
-            PyObject* dec128;
-            if (max < 16) {
+            PyObject* data;
+            PyObject* st;
+            PyObject* type_to_create;
+            uint32_t length, length2;
+            unsigned char subtype;
+
+            if (max < 5) {
                 goto invalid;
             }
-            if ((dec128 = _get_object(state->Decimal128,
-                                      "bson.decimal128",
-                                      "Decimal128"))) {
-                value = PyObject_CallMethod(dec128,
-                                            "from_bid",
+            memcpy(&length, buffer + *position, 4);
+            length = BSON_UINT32_FROM_LE(length);
+            if (max < length) {
+                goto invalid;
+            }
+
+            subtype = (unsigned char)buffer[*position + 4];
+            *position += 5;
+            if (subtype == 2) {
+                if (length < 4) {
+                    goto invalid;
+                }
+                memcpy(&length2, buffer + *position, 4);
+                length2 = BSON_UINT32_FROM_LE(length2);
+                if (length2 != length - 4) {
+                    goto invalid;
+                }
+            }
+            if (subtype == 9 && options->typed_arrays) {
+                value = _packed_array_from_bson(self, buffer + *position,
+                                                length);
+                if (value) {
+                    *position += length;
+                    break;
+                }
+                if (PyErr_Occurred()) {
+                    goto invalid;
+                }
+            }
 #if PY_MAJOR_VERSION >= 3
-                                            "y#",
-#else
-                                            "s#",
-#endif
-                                            buffer + *position,
-                                            16);
-                Py_DECREF(dec128);
+            /* Python3 special case. Decode BSON binary subtype 0 to bytes. */
+            if (subtype == 0) {
+                value = PyBytes_FromStringAndSize(buffer + *position, length);
+                *position += length;
+                break;
             }
-            *position += 16;
-            break;
-        }
-    case 255:
-        {
-            PyObject* minkey_type = _get_object(state->MinKey, "bson.min_key", "MinKey");
-            if (!minkey_type)
+            if (subtype == 2) {
+                data = PyBytes_FromStringAndSize(buffer + *position + 4, length - 4);
+            } else {
+                data = PyBytes_FromStringAndSize(buffer + *position, length);
+            }
+#else
+            if (subtype == 2) {
+                data = PyString_FromStringAndSize(buffer + *position + 4, length - 4);
+            } else {
+                data = PyString_FromStringAndSize(buffer + *position, length);
+            }
+#endif
+            if (!data) {
                 goto invalid;
-            value = PyObject_CallFunctionObjArgs(minkey_type, NULL);
-            Py_DECREF(minkey_type);
+            }
+            /* Encode as UUID, not Binary */
+            if (subtype == 3 || subtype == 4) {
+                PyObject* kwargs;
+                PyObject* args = PyTuple_New(0);
+                /* UUID should always be 16 bytes */
+                if (!args || length != 16) {
+                    Py_DECREF(data);
+                    goto invalid;
+                }
+                kwargs = PyDict_New();
+                if (!kwargs) {
+                    Py_DECREF(data);
+                    Py_DECREF(args);
+                    goto invalid;
+                }
+
+                /*
+                 * From this point, we hold refs to args, kwargs, and data.
+                 * If anything fails, goto uuiderror to clean them up.
+                 */
+                if (subtype == 3 && options->uuid_rep == CSHARP_LEGACY) {
+                    /* Legacy C# byte order */
+                    if ((PyDict_SetItemString(kwargs, "bytes_le", data)) == -1)
+                        goto uuiderror;
+                }
+                else {
+                    if (subtype == 3 && options->uuid_rep == JAVA_LEGACY) {
+                        /* Convert from legacy java byte order */
+                        char big_endian[16];
+                        _fix_java(buffer + *position, big_endian);
+                        /* Free the previously created PyString object */
+                        Py_DECREF(data);
+#if PY_MAJOR_VERSION >= 3
+                        data = PyBytes_FromStringAndSize(big_endian, length);
+#else
+                        data = PyString_FromStringAndSize(big_endian, length);
+#endif
+                        if (data == NULL)
+                            goto uuiderror;
+                    }
+                    if ((PyDict_SetItemString(kwargs, "bytes", data)) == -1)
+                        goto uuiderror;
+
+                }
+                if ((type_to_create = _get_object(state->UUID, "uuid", "UUID"))) {
+                    value = PyObject_Call(type_to_create, args, kwargs);
+                    Py_DECREF(type_to_create);
+                }
+
+                Py_DECREF(args);
+                Py_DECREF(kwargs);
+                Py_DECREF(data);
+                if (!value) {
+                    goto invalid;
+                }
+
+                *position += length;
+                break;
+
+            uuiderror:
+                Py_DECREF(args);
+                Py_DECREF(kwargs);
+                Py_XDECREF(data);
+                goto invalid;
+            }
+
+#if PY_MAJOR_VERSION >= 3
+            st = PyLong_FromLong(subtype);
+#else
+            st = PyInt_FromLong(subtype);
+#endif
+            if (!st) {
+                Py_DECREF(data);
+                goto invalid;
+            }
+            if ((type_to_create = _get_object(state->Binary, "bson.binary", "Binary"))) {
+                value = PyObject_CallFunctionObjArgs(type_to_create, data, st, NULL);
+                Py_DECREF(type_to_create);
+            }
+            Py_DECREF(st);
+            Py_DECREF(data);
+            if (!value) {
+                goto invalid;
+            }
+            *position += length;
             break;
         }
-    case 127:
+    case 6:
+    case 10:
         {
-            PyObject* maxkey_type = _get_object(state->MaxKey, "bson.max_key", "MaxKey");
-            if (!maxkey_type)
+            value = Py_None;
+            Py_INCREF(value);
+            break;
+        }
+    case 7:
+        {
+            PyObject* objectid_type;
+            if (max < 12) {
                 goto invalid;
-            value = PyObject_CallFunctionObjArgs(maxkey_type, NULL);
-            Py_DECREF(maxkey_type);
+            }
+            if ((objectid_type = _get_object(state->ObjectId, "bson.objectid", "ObjectId"))) {
+#if PY_MAJOR_VERSION >= 3
+                value = PyObject_CallFunction(objectid_type, "y#", buffer + *position, 12);
+#else
+                value = PyObject_CallFunction(objectid_type, "s#", buffer + *position, 12);
+#endif
+                Py_DECREF(objectid_type);
+            }
+            *position += 12;
             break;
         }
-    default:
+    case 8:
         {
-            PyObject* InvalidBSON = _error("InvalidBSON");
-            if (InvalidBSON) {
-                PyObject* bobj = PyBytes_FromFormat("%c", type);
-                if (bobj) {
-                    PyObject* repr = PyObject_Repr(bobj);
-                    Py_DECREF(bobj);
-                    /*
-                     * See http://bugs.python.org/issue22023 for why we can't
-                     * just use PyUnicode_FromFormat with %S or %R to do this
-                     * work.
-                     */
-                    if (repr) {
-                        PyObject* left = PyUnicode_FromString(
-                            "Detected unknown BSON type ");
-                        if (left) {
-                            PyObject* lmsg = PyUnicode_Concat(left, repr);
-                            Py_DECREF(left);
-                            if (lmsg) {
-                                PyObject* errmsg = PyUnicode_FromFormat(
-                                    "%U for fieldname '%U'. Are you using the "
-                                    "latest driver version?", lmsg, name);
-                                if (errmsg) {
-                                    PyErr_SetObject(InvalidBSON, errmsg);
-                                    Py_DECREF(errmsg);
-                                }
-                                Py_DECREF(lmsg);
-                            }
-                        }
-                        Py_DECREF(repr);
-                    }
+            char boolean_raw = buffer[(*position)++];
+            if (0 == boolean_raw) {
+                value = Py_False;
+            } else if (1 == boolean_raw) {
+                value = Py_True;
+            } else {
+                PyObject* InvalidBSON = _error("InvalidBSON");
+                if (InvalidBSON) {
+                    PyErr_Format(InvalidBSON, "invalid boolean value: %x", boolean_raw);
+                    Py_DECREF(InvalidBSON);
                 }
-                Py_DECREF(InvalidBSON);
+                return NULL;
+            }
+            Py_INCREF(value);
+            break;
+        }
+    case 9:
+        {
+            PyObject* utc_type;
+            PyObject* naive;
+            PyObject* replace;
+            PyObject* args;
+            PyObject* kwargs;
+            PyObject* astimezone;
+            int64_t millis;
+            if (max < 8) {
+                goto invalid;
+            }
+            memcpy(&millis, buffer + *position, 8);
+            millis = (int64_t)BSON_UINT64_FROM_LE(millis);
+            *position += 8;
+            if (options->datetime_conversion == DATETIME_CONVERSION_INT) {
+                value = PyLong_FromLongLong(millis);
+                break;
+            }
+            if (options->datetime_conversion == DATETIME_CONVERSION_MS) {
+                PyObject* datetime_ms_type = _get_object(
+                    state->DatetimeMS, "bson.datetime_ms", "DatetimeMS");
+                if (!datetime_ms_type) {
+                    goto invalid;
+                }
+                value = PyObject_CallFunction(datetime_ms_type, "L", millis);
+                Py_DECREF(datetime_ms_type);
+                break;
+            }
+            naive = datetime_from_millis(millis);
+            if (!options->tz_aware) { /* In the naive case, we're done here. */
+                value = naive;
+                break;
+            }
+
+            if (!naive) {
+                goto invalid;
+            }
+            replace = PyObject_GetAttrString(naive, "replace");
+            Py_DECREF(naive);
+            if (!replace) {
+                goto invalid;
+            }
+            args = PyTuple_New(0);
+            if (!args) {
+                Py_DECREF(replace);
+                goto invalid;
+            }
+            kwargs = PyDict_New();
+            if (!kwargs) {
+                Py_DECREF(replace);
+                Py_DECREF(args);
+                goto invalid;
+            }
+            utc_type = _get_object(state->UTC, "bson.tz_util", "utc");
+            if (!utc_type || PyDict_SetItemString(kwargs, "tzinfo", utc_type) == -1) {
+                Py_DECREF(replace);
+                Py_DECREF(args);
+                Py_DECREF(kwargs);
+                Py_XDECREF(utc_type);
+                goto invalid;
+            }
+            Py_XDECREF(utc_type);
+            value = PyObject_Call(replace, args, kwargs);
+            if (!value) {
+                Py_DECREF(replace);
+                Py_DECREF(args);
+                Py_DECREF(kwargs);
+                goto invalid;
+            }
+
+            /* convert to local time */
+            if (options->tzinfo != Py_None) {
+                astimezone = PyObject_GetAttrString(value, "astimezone");
+                Py_DECREF(value);
+                if (!astimezone) {
+                    Py_DECREF(replace);
+                    Py_DECREF(args);
+                    Py_DECREF(kwargs);
+                    goto invalid;
+                }
+                value = PyObject_CallFunctionObjArgs(astimezone, options->tzinfo, NULL);
+                Py_DECREF(astimezone);
+            }
+
+            Py_DECREF(replace);
+            Py_DECREF(args);
+            Py_DECREF(kwargs);
+            break;
+        }
+    case 11:
+        {
+            PyObject* regex_class;
+            PyObject* pattern;
+            int flags;
+            size_t flags_length, i;
+            size_t pattern_length = strlen(buffer + *position);
+            if (pattern_length > BSON_MAX_SIZE || max < pattern_length) {
+                goto invalid;
+            }
+            pattern = PyUnicode_DecodeUTF8(
+                buffer + *position, pattern_length,
+                options->unicode_decode_error_handler);
+            if (!pattern) {
+                goto invalid;
+            }
+            *position += (unsigned)pattern_length + 1;
+            flags_length = strlen(buffer + *position);
+            if (flags_length > BSON_MAX_SIZE ||
+                    (BSON_MAX_SIZE - pattern_length) < flags_length) {
+                Py_DECREF(pattern);
+                goto invalid;
+            }
+            if (max < pattern_length + flags_length) {
+                Py_DECREF(pattern);
+                goto invalid;
+            }
+            flags = 0;
+            for (i = 0; i < flags_length; i++) {
+                if (buffer[*position + i] == 'i') {
+                    flags |= 2;
+                } else if (buffer[*position + i] == 'l') {
+                    flags |= 4;
+                } else if (buffer[*position + i] == 'm') {
+                    flags |= 8;
+                } else if (buffer[*position + i] == 's') {
+                    flags |= 16;
+                } else if (buffer[*position + i] == 'u') {
+                    flags |= 32;
+                } else if (buffer[*position + i] == 'x') {
+                    flags |= 64;
+                }
+            }
+            *position += (unsigned)flags_length + 1;
+
+            regex_class = _get_object(state->Regex, "bson.regex", "Regex");
+            if (regex_class) {
+                value = PyObject_CallFunction(regex_class,
+                                              "Oi", pattern, flags);
+                Py_DECREF(regex_class);
+            }
+            Py_DECREF(pattern);
+            break;
+        }
+    case 12:
+        {
+            uint32_t coll_length;
+            PyObject* collection;
+            PyObject* id = NULL;
+            PyObject* objectid_type;
+            PyObject* dbref_type;
+
+            if (max < 4) {
+                goto invalid;
+            }
+            memcpy(&coll_length, buffer + *position, 4);
+            coll_length = BSON_UINT32_FROM_LE(coll_length);
+            /* Encoded string length + string + 12 byte ObjectId */
+            if (!coll_length || max < coll_length || max < 4 + coll_length + 12) {
+                goto invalid;
+            }
+            *position += 4;
+            /* Strings must end in \0 */
+            if (buffer[*position + coll_length - 1]) {
+                goto invalid;
+            }
+
+            collection = PyUnicode_DecodeUTF8(
+                buffer + *position, coll_length - 1,
+                options->unicode_decode_error_handler);
+            if (!collection) {
+                goto invalid;
+            }
+            *position += coll_length;
+
+            if ((objectid_type = _get_object(state->ObjectId, "bson.objectid", "ObjectId"))) {
+#if PY_MAJOR_VERSION >= 3
+                id = PyObject_CallFunction(objectid_type, "y#", buffer + *position, 12);
+#else
+                id = PyObject_CallFunction(objectid_type, "s#", buffer + *position, 12);
+#endif
+                Py_DECREF(objectid_type);
+            }
+            if (!id) {
+                Py_DECREF(collection);
+                goto invalid;
+            }
+            *position += 12;
+            if ((dbref_type = _get_object(state->DBRef, "bson.dbref", "DBRef"))) {
+                value = PyObject_CallFunctionObjArgs(dbref_type, collection, id, NULL);
+                Py_DECREF(dbref_type);
+            }
+            Py_DECREF(collection);
+            Py_DECREF(id);
+            break;
+        }
+    case 13:
+        {
+            PyObject* code;
+            PyObject* code_type;
+            uint32_t value_length;
+            if (max < 4) {
+                goto invalid;
+            }
+            memcpy(&value_length, buffer + *position, 4);
+            value_length = BSON_UINT32_FROM_LE(value_length);
+            /* Encoded string length + string */
+            if (!value_length || max < value_length || max < 4 + value_length) {
+                goto invalid;
+            }
+            *position += 4;
+            /* Strings must end in \0 */
+            if (buffer[*position + value_length - 1]) {
+                goto invalid;
+            }
+            code = PyUnicode_DecodeUTF8(
+                buffer + *position, value_length - 1,
+                options->unicode_decode_error_handler);
+            if (!code) {
+                goto invalid;
+            }
+            *position += value_length;
+            if ((code_type = _get_object(state->Code, "bson.code", "Code"))) {
+                value = PyObject_CallFunctionObjArgs(code_type, code, NULL, NULL);
+                Py_DECREF(code_type);
+            }
+            Py_DECREF(code);
+            break;
+        }
+    case 15:
+        {
+            uint32_t c_w_s_size;
+            uint32_t code_size;
+            uint32_t scope_size;
+            PyObject* code;
+            PyObject* scope;
+            PyObject* code_type;
+
+            if (max < 8) {
+                goto invalid;
+            }
+
+            memcpy(&c_w_s_size, buffer + *position, 4);
+            c_w_s_size = BSON_UINT32_FROM_LE(c_w_s_size);
+            *position += 4;
+
+            if (max < c_w_s_size) {
+                goto invalid;
+            }
+
+            memcpy(&code_size, buffer + *position, 4);
+            code_size = BSON_UINT32_FROM_LE(code_size);
+            /* code_w_scope length + code length + code + scope length */
+            if (!code_size || max < code_size || max < 4 + 4 + code_size + 4) {
+                goto invalid;
+            }
+            *position += 4;
+            /* Strings must end in \0 */
+            if (buffer[*position + code_size - 1]) {
+                goto invalid;
+            }
+            code = PyUnicode_DecodeUTF8(
+                buffer + *position, code_size - 1,
+                options->unicode_decode_error_handler);
+            if (!code) {
+                goto invalid;
+            }
+            *position += code_size;
+
+            memcpy(&scope_size, buffer + *position, 4);
+            scope_size = BSON_UINT32_FROM_LE(scope_size);
+            if (scope_size < BSON_MIN_SIZE) {
+                Py_DECREF(code);
+                goto invalid;
+            }
+            /* code length + code + scope length + scope */
+            if ((4 + code_size + 4 + scope_size) != c_w_s_size) {
+                Py_DECREF(code);
+                goto invalid;
+            }
+
+            /* Check for bad eoo */
+            if (buffer[*position + scope_size - 1]) {
+                goto invalid;
+            }
+            scope = elements_to_dict(self, buffer + *position + 4,
+                                     scope_size - 5, options);
+            if (!scope) {
+                Py_DECREF(code);
+                goto invalid;
+            }
+            *position += scope_size;
+
+            if ((code_type = _get_object(state->Code, "bson.code", "Code"))) {
+                value = PyObject_CallFunctionObjArgs(code_type, code, scope, NULL);
+                Py_DECREF(code_type);
+            }
+            Py_DECREF(code);
+            Py_DECREF(scope);
+            break;
+        }
+    case 16:
+        {
+            int32_t i;
+            if (max < 4) {
+                goto invalid;
+            }
+            memcpy(&i, buffer + *position, 4);
+            i = (int32_t)BSON_UINT32_FROM_LE(i);
+#if PY_MAJOR_VERSION >= 3
+            value = PyLong_FromLong(i);
+#else
+            value = PyInt_FromLong(i);
+#endif
+            if (!value) {
+                goto invalid;
+            }
+            *position += 4;
+            break;
+        }
+    case 17:
+        {
+            uint32_t time, inc;
+            PyObject* timestamp_type;
+            if (max < 8) {
+                goto invalid;
+            }
+            memcpy(&inc, buffer + *position, 4);
+            memcpy(&time, buffer + *position + 4, 4);
+            inc = BSON_UINT32_FROM_LE(inc);
+            time = BSON_UINT32_FROM_LE(time);
+            if ((timestamp_type = _get_object(state->Timestamp, "bson.timestamp", "Timestamp"))) {
+                value = PyObject_CallFunction(timestamp_type, "II", time, inc);
+                Py_DECREF(timestamp_type);
+            }
+            *position += 8;
+            break;
+        }
+    case 18:
+        {
+            int64_t ll;
+            PyObject* bson_int64_type = _get_object(state->BSONInt64,
+                                                    "bson.int64", "Int64");
+            if (!bson_int64_type)
+                goto invalid;
+            if (max < 8) {
+                Py_DECREF(bson_int64_type);
+                goto invalid;
+            }
+            memcpy(&ll, buffer + *position, 8);
+            ll = (int64_t)BSON_UINT64_FROM_LE(ll);
+            value = PyObject_CallFunction(bson_int64_type, "L", ll);
+            *position += 8;
+            Py_DECREF(bson_int64_type);
+            break;
+        }
+    case 19:
+        {
+            PyObject* dec128;
+            if (max < 16) {
+                goto invalid;
+            }
+            if ((dec128 = _get_object(state->Decimal128,
+                                      "bson.decimal128",
+                                      "Decimal128"))) {
+                value = PyObject_CallMethod(dec128,
+                                            "from_bid",
+#if PY_MAJOR_VERSION >= 3
+                                            "y#",
+#else
+                                            "s#",
+#endif
+                                            buffer + *position,
+                                            16);
+                Py_DECREF(dec128);
+            }
+            *position += 16;
+            break;
+        }
+    case 255:
+        {
+            PyObject* minkey_type = _get_object(state->MinKey, "bson.min_key", "MinKey");
+            if (!minkey_type)
+                goto invalid;
+            value = PyObject_CallFunctionObjArgs(minkey_type, NULL);
+            Py_DECREF(minkey_type);
+            break;
+        }
+    case 127:
+        {
+            PyObject* maxkey_type = _get_object(state->MaxKey, "bson.max_key", "MaxKey");
+            if (!maxkey_type)
+                goto invalid;
+            value = PyObject_CallFunctionObjArgs(maxkey_type, NULL);
+            Py_DECREF(maxkey_type);
+            break;
+        }
+    default:
+        {
+            PyObject* InvalidBSON = _error("InvalidBSON");
+            if (InvalidBSON) {
+                PyObject* bobj = PyBytes_FromFormat("%c", type);
+                if (bobj) {
+                    PyObject* repr = PyObject_Repr(bobj);
+                    Py_DECREF(bobj);
+                    /*
+                     * See http://bugs.python.org/issue22023 for why we can't
+                     * just use PyUnicode_FromFormat with %S or %R to do this
+                     * work.
+                     */
+                    if (repr) {
+                        PyObject* left = PyUnicode_FromString(
+                            "Detected unknown BSON type ");
+                        if (left) {
+                            PyObject* lmsg = PyUnicode_Concat(left, repr);
+                            Py_DECREF(left);
+                            if (lmsg) {
+                                PyObject* errmsg = PyUnicode_FromFormat(
+                                    "%U for fieldname '%U'. Are you using the "
+                                    "latest driver version?", lmsg, name);
+                                if (errmsg) {
+                                    PyErr_SetObject(InvalidBSON, errmsg);
+                                    Py_DECREF(errmsg);
+                                }
+                                Py_DECREF(lmsg);
+                            }
+                        }
+                        Py_DECREF(repr);
+                    }
+                }
+                Py_DECREF(InvalidBSON);
+            }
+            goto invalid;
+        }
+    }
+
+    if (value) {
+        if (!options->type_registry.is_decoder_empty) {
+            PyObject* value_type = NULL;
+            PyObject* converter = NULL;
+            value_type = PyObject_Type(value);
+            if (value_type == NULL) {
+                goto invalid;
+            }
+            converter = PyDict_GetItem(options->type_registry.decoder_map, value_type);
+            if (converter != NULL) {
+                PyObject* new_value = PyObject_CallFunctionObjArgs(converter, value, NULL);
+                Py_DECREF(value_type);
+                Py_DECREF(value);
+                return new_value;
+            } else {
+                Py_DECREF(value_type);
+                return value;
+            }
+        }
+        return value;
+    }
+
+    invalid:
+
+    /*
+     * Wrap any non-InvalidBSON errors in InvalidBSON.
+     */
+    if (PyErr_Occurred()) {
+        PyObject *etype, *evalue, *etrace;
+        PyObject *InvalidBSON;
+
+        /*
+         * Calling _error clears the error state, so fetch it first.
+         */
+        PyErr_Fetch(&etype, &evalue, &etrace);
+
+        /* Dont reraise anything but PyExc_Exceptions as InvalidBSON. */
+        if (PyErr_GivenExceptionMatches(etype, PyExc_Exception)) {
+            InvalidBSON = _error("InvalidBSON");
+            if (InvalidBSON) {
+                if (!PyErr_GivenExceptionMatches(etype, InvalidBSON)) {
+                    /*
+                     * Raise InvalidBSON(str(e)).
+                     */
+                    Py_DECREF(etype);
+                    etype = InvalidBSON;
+
+                    if (evalue) {
+                        PyObject *msg = PyObject_Str(evalue);
+                        Py_DECREF(evalue);
+                        evalue = msg;
+                    }
+                    PyErr_NormalizeException(&etype, &evalue, &etrace);
+                } else {
+                    /*
+                     * The current exception matches InvalidBSON, so we don't
+                     * need this reference after all.
+                     */
+                    Py_DECREF(InvalidBSON);
+                }
+            }
+        }
+        /* Steals references to args. */
+        PyErr_Restore(etype, evalue, etrace);
+    } else {
+        PyObject *InvalidBSON = _error("InvalidBSON");
+        if (InvalidBSON) {
+            PyErr_SetString(InvalidBSON, "invalid length or type code");
+            Py_DECREF(InvalidBSON);
+        }
+    }
+    return NULL;
+}
+
+/*
+ * Replace the current exception, such as a UnicodeDecodeError, with an
+ * InvalidBSON error carrying the same message.
+ */
+static void _reraise_as_invalid_bson(void) {
+    PyObject *etype, *evalue, *etrace;
+    PyObject *InvalidBSON;
+
+    PyErr_Fetch(&etype, &evalue, &etrace);
+    if (PyErr_GivenExceptionMatches(etype, PyExc_Exception)) {
+        InvalidBSON = _error("InvalidBSON");
+        if (InvalidBSON) {
+            Py_DECREF(etype);
+            etype = InvalidBSON;
+
+            if (evalue) {
+                PyObject *msg = PyObject_Str(evalue);
+                Py_DECREF(evalue);
+                evalue = msg;
+            }
+            PyErr_NormalizeException(&etype, &evalue, &etrace);
+        }
+    }
+    PyErr_Restore(etype, evalue, etrace);
+}
+
+/*
+ * Decode the name of an element with decode_key.
+ *
+ * Returns a new reference, or NULL with InvalidBSON set.
+ */
+static PyObject* decode_element_name(const char* string, size_t length,
+                                     const codec_options_t* options) {
+    PyObject* name = decode_key(string, length, options);
+    if (!name) {
+        /* If NULL is returned then wrap the UnicodeDecodeError
+           in an InvalidBSON error */
+        _reraise_as_invalid_bson();
+    }
+    return name;
+}
+
+/*
+ * Get the next 'name' and 'value' from a document in a string, whose position
+ * is provided.
+ *
+ * Returns the position of the next element in the document, or -1 on error.
+ */
+static int _element_to_dict(PyObject* self, const char* string,
+                            unsigned position, unsigned max,
+                            const codec_options_t* options,
+                            PyObject** name, PyObject** value) {
+    unsigned char type = (unsigned char)string[position++];
+    size_t name_length = strlen(string + position);
+    if (name_length > BSON_MAX_SIZE || position + name_length >= max) {
+        PyObject* InvalidBSON = _error("InvalidBSON");
+        if (InvalidBSON) {
+            PyErr_SetNone(InvalidBSON);
+            Py_DECREF(InvalidBSON);
+        }
+        return -1;
+    }
+    *name = decode_element_name(string + position, name_length, options);
+    if (!*name) {
+        return -1;
+    }
+    position += (unsigned)name_length + 1;
+    *value = get_value(self, *name, string, &position, type,
+                       max - position, options);
+    if (!*value) {
+        Py_DECREF(*name);
+        return -1;
+    }
+    return position;
+}
+
+static PyObject* _cbson_element_to_dict(PyObject* self, PyObject* args) {
+    char* string;
+    PyObject* bson;
+    codec_options_t options;
+    unsigned position;
+    unsigned max;
+    int new_position;
+    PyObject* name;
+    PyObject* value;
+    PyObject* result_tuple;
+
+    if (!PyArg_ParseTuple(args, "OII|O&", &bson, &position, &max,
+                          convert_codec_options, &options)) {
+        return NULL;
+    }
+    if (PyTuple_GET_SIZE(args) < 4) {
+        if (!default_codec_options(GETSTATE(self), &options)) {
+            return NULL;
+        }
+    }
+
+#if PY_MAJOR_VERSION >= 3
+    if (!PyBytes_Check(bson)) {
+        PyErr_SetString(PyExc_TypeError, "argument to _element_to_dict must be a bytes object");
+#else
+    if (!PyString_Check(bson)) {
+        PyErr_SetString(PyExc_TypeError, "argument to _element_to_dict must be a string");
+#endif
+        return NULL;
+    }
+#if PY_MAJOR_VERSION >= 3
+    string = PyBytes_AS_STRING(bson);
+#else
+    string = PyString_AS_STRING(bson);
+#endif
+
+    new_position = _element_to_dict(self, string, position, max, &options,
+                                    &name, &value);
+    if (new_position < 0) {
+        return NULL;
+    }
+
+    result_tuple = Py_BuildValue("NNi", name, value, new_position);
+    if (!result_tuple) {
+        Py_DECREF(name);
+        Py_DECREF(value);
+        return NULL;
+    }
+
+    return result_tuple;
+}
+
+static PyObject* _elements_to_dict(PyObject* self, const char* string,
+                                   unsigned max,
+                                   const codec_options_t* options) {
+    unsigned position = 0;
+    PyObject* dict = PyObject_CallObject(options->document_class, NULL);
+    if (!dict) {
+        return NULL;
+    }
+    while (position < max) {
+        PyObject* name = NULL;
+        PyObject* value = NULL;
+        int new_position;
+
+        new_position = _element_to_dict(
+            self, string, position, max, options, &name, &value);
+        if (new_position < 0) {
+            Py_DECREF(dict);
+            return NULL;
+        } else {
+            position = (unsigned)new_position;
+        }
+
+        PyObject_SetItem(dict, name, value);
+        Py_DECREF(name);
+        Py_DECREF(value);
+    }
+    return dict;
+}
+
+static PyObject* elements_to_dict(PyObject* self, const char* string,
+                                  unsigned max,
+                                  const codec_options_t* options) {
+    PyObject* result;
+    if (Py_EnterRecursiveCall(" while decoding a BSON document"))
+        return NULL;
+    result = _elements_to_dict(self, string, max, options);
+    Py_LeaveRecursiveCall();
+    return result;
+}
+
+/* Returned by _element_value_size for unknown BSON types. */
+#define UNKNOWN_TYPE -2
+
+/*
+ * Get the size of the value of an element of BSON type 'type' at 'buffer',
+ * with 'remaining' bytes left in the enclosing document. Doesn't use the
+ * Python API, so it is safe to call without holding the GIL.
+ *
+ * Returns the size, -1 if the value doesn't fit, or UNKNOWN_TYPE.
+ */
+static int _element_value_size(const char* buffer, unsigned remaining,
+                               unsigned char type) {
+    unsigned size;
+    int32_t length;
+    switch (type) {
+    case 6:
+    case 10:
+    case 127:
+    case 255:
+        size = 0;
+        break;
+    case 8:
+        size = 1;
+        break;
+    case 16:
+        size = 4;
+        break;
+    case 1:
+    case 9:
+    case 17:
+    case 18:
+        size = 8;
+        break;
+    case 7:
+        size = 12;
+        break;
+    case 19:
+        size = 16;
+        break;
+    case 11:
+        {
+            /* The pattern and the flags are both C strings. */
+            const char* pattern_end = memchr(buffer, 0, remaining);
+            const char* flags_end;
+            if (!pattern_end) {
+                return -1;
+            }
+            size = (unsigned)(pattern_end - buffer) + 1;
+            flags_end = memchr(pattern_end + 1, 0, remaining - size);
+            if (!flags_end) {
+                return -1;
+            }
+            size = (unsigned)(flags_end - buffer) + 1;
+            break;
+        }
+    case 2:
+    case 3:
+    case 4:
+    case 5:
+    case 12:
+    case 13:
+    case 14:
+    case 15:
+        if (remaining < 4) {
+            return -1;
+        }
+        memcpy(&length, buffer, 4);
+        length = (int32_t)BSON_UINT32_FROM_LE(length);
+        if (length < 0 || length > BSON_MAX_SIZE) {
+            return -1;
+        }
+        size = (unsigned)length;
+        if (type == 2 || type == 13 || type == 14) {
+            /* Length prefix. */
+            size += 4;
+        } else if (type == 5) {
+            /* Length prefix and subtype. */
+            size += 5;
+        } else if (type == 12) {
+            /* Length prefix and ObjectId. */
+            size += 16;
+        }
+        break;
+    default:
+        return UNKNOWN_TYPE;
+    }
+    if (size > remaining) {
+        return -1;
+    }
+    return (int)size;
+}
+
+/*
+ * Get the position just past the value of an element of BSON type 'type',
+ * without decoding it.
+ *
+ * Returns the position of the next element in the document, or -1 on error.
+ */
+static int _skip_element_value(const char* string, unsigned position,
+                               unsigned max, unsigned char type) {
+    int size = _element_value_size(string + position, max - position, type);
+    if (size < 0) {
+        PyObject* InvalidBSON = _error("InvalidBSON");
+        if (InvalidBSON) {
+            if (size == UNKNOWN_TYPE) {
+                PyErr_Format(InvalidBSON,
+                             "Detected unknown BSON type %d. Are you using "
+                             "the latest driver version?", (int)type);
+            } else {
+                PyErr_SetString(InvalidBSON, "invalid element length");
+            }
+            Py_DECREF(InvalidBSON);
+        }
+        return -1;
+    }
+    return (int)(position + size);
+}
+
+static void _invalid_bson(const char* message) {
+    PyObject* InvalidBSON = _error("InvalidBSON");
+    if (InvalidBSON) {
+        PyErr_SetString(InvalidBSON, message);
+        Py_DECREF(InvalidBSON);
+    }
+}
+
+/*
+ * Map the name of each element of a document to the position of its type
+ * byte, decoding only the names.
+ */
+static PyObject* _cbson_element_offsets(PyObject* self, PyObject* args) {
+    PyObject* bson;
+    PyObject* offsets = NULL;
+    codec_options_t options;
+    const char* string;
+    unsigned position;
+    unsigned max;
+
+    if (!PyArg_ParseTuple(args, "OIIO&", &bson, &position, &max,
+                          convert_codec_options, &options)) {
+        return NULL;
+    }
+#if PY_MAJOR_VERSION >= 3
+    if (!PyBytes_Check(bson)) {
+        PyErr_SetString(PyExc_TypeError, "argument to _element_offsets must be a bytes object");
+#else
+    if (!PyString_Check(bson)) {
+        PyErr_SetString(PyExc_TypeError, "argument to _element_offsets must be a string");
+#endif
+        goto done;
+    }
+    if (max >= (unsigned)PyBytes_GET_SIZE(bson)) {
+        _invalid_bson("invalid object size");
+        goto done;
+    }
+    string = PyBytes_AS_STRING(bson);
+
+    offsets = PyDict_New();
+    if (!offsets) {
+        goto done;
+    }
+    while (position + 1 < max) {
+        unsigned char type = (unsigned char)string[position];
+        const char* name = string + position + 1;
+        const char* name_end = memchr(name, 0, max - position - 1);
+        PyObject* key;
+        PyObject* offset;
+        int new_position;
+
+        if (!name_end) {
+            _invalid_bson("invalid element name");
+            Py_CLEAR(offsets);
+            goto done;
+        }
+        key = decode_element_name(name, (size_t)(name_end - name), &options);
+        if (!key) {
+            Py_CLEAR(offsets);
+            goto done;
+        }
+        new_position = _skip_element_value(
+            string, (unsigned)(name_end - string) + 1, max, type);
+#if PY_MAJOR_VERSION >= 3
+        offset = PyLong_FromLong(position);
+#else
+        offset = PyInt_FromLong(position);
+#endif
+        if (new_position < 0 || !offset ||
+                PyDict_SetItem(offsets, key, offset) < 0) {
+            Py_DECREF(key);
+            Py_XDECREF(offset);
+            Py_CLEAR(offsets);
+            goto done;
+        }
+        Py_DECREF(key);
+        Py_DECREF(offset);
+        position = (unsigned)new_position;
+    }
+    if (position != max) {
+        _invalid_bson("bad object or element length");
+        Py_CLEAR(offsets);
+    }
+done:
+    destroy_codec_options(&options);
+    return offsets;
+}
+
+/*
+ * Convert the optional 'fields' argument of _bson_to_dict and decode_all,
+ * a collection of bytes, to a tuple. Stores NULL in 'result' if 'fields' is
+ * None, meaning every field is decoded.
+ *
+ * Returns 0 on failure.
+ */
+static int _convert_fields(PyObject* fields, PyObject** result) {
+    Py_ssize_t i;
+    *result = NULL;
+    if (!fields || fields == Py_None) {
+        return 1;
+    }
+    *result = PySequence_Tuple(fields);
+    if (!*result) {
+        return 0;
+    }
+    for (i = 0; i < PyTuple_GET_SIZE(*result); i++) {
+        if (!PyBytes_Check(PyTuple_GET_ITEM(*result, i))) {
+            PyErr_SetString(PyExc_TypeError,
+                            "fields must contain only encoded key names");
+            Py_CLEAR(*result);
+            return 0;
+        }
+    }
+    return 1;
+}
+
+/*
+ * Find the key 'name' in 'fields', a tuple of bytes.
+ *
+ * Returns the index of the key in 'fields', or -1 if it is not there.
+ */
+static Py_ssize_t _field_index(PyObject* fields, const char* name,
+                               size_t name_length) {
+    Py_ssize_t i;
+    for (i = 0; i < PyTuple_GET_SIZE(fields); i++) {
+        PyObject* field = PyTuple_GET_ITEM(fields, i);
+        if ((size_t)PyBytes_GET_SIZE(field) == name_length &&
+                !memcmp(PyBytes_AS_STRING(field), name, name_length)) {
+            return i;
+        }
+    }
+    return -1;
+}
+
+/*
+ * Decode only the top-level elements named in 'fields'. The other elements
+ * are skipped by length, without decoding their names or values.
+ */
+static PyObject* selected_elements_to_dict(PyObject* self, const char* string,
+                                           unsigned max,
+                                           const codec_options_t* options,
+                                           PyObject* fields) {
+    unsigned position = 0;
+    PyObject* dict = PyObject_CallObject(options->document_class, NULL);
+    if (!dict) {
+        return NULL;
+    }
+    while (position < max) {
+        unsigned char type = (unsigned char)string[position];
+        const char* name = string + position + 1;
+        size_t name_length = strlen(name);
+        int new_position;
+
+        if (name_length > BSON_MAX_SIZE || position + 1 + name_length >= max) {
+            PyObject* InvalidBSON = _error("InvalidBSON");
+            if (InvalidBSON) {
+                PyErr_SetNone(InvalidBSON);
+                Py_DECREF(InvalidBSON);
+            }
+            Py_DECREF(dict);
+            return NULL;
+        }
+
+        if (_field_index(fields, name, name_length) >= 0) {
+            PyObject* key = NULL;
+            PyObject* value = NULL;
+            int result;
+
+            new_position = _element_to_dict(
+                self, string, position, max, options, &key, &value);
+            if (new_position < 0) {
+                Py_DECREF(dict);
+                return NULL;
+            }
+            result = PyObject_SetItem(dict, key, value);
+            Py_DECREF(key);
+            Py_DECREF(value);
+            if (result < 0) {
+                Py_DECREF(dict);
+                return NULL;
+            }
+        } else {
+            new_position = _skip_element_value(
+                string, position + 2 + (unsigned)name_length, max, type);
+            if (new_position < 0) {
+                Py_DECREF(dict);
+                return NULL;
+            }
+        }
+        position = (unsigned)new_position;
+    }
+    return dict;
+}
+
+/*
+ * Create a record of options->record_class from 'values', a tuple with an
+ * item per field that is NULL for fields missing from the document. Missing
+ * fields get their default, or raise InvalidBSON if they have none.
+ * Namedtuples are created from the values, other records with __new__ and
+ * their fields set like object.__setattr__ does.
+ *
+ * Returns a new reference, or NULL on error.
+ */
+static PyObject* _new_record(PyObject* values,
+                             const codec_options_t* options) {
+    Py_ssize_t i;
+    Py_ssize_t count = PyTuple_GET_SIZE(values);
+    PyTypeObject* record_class = (PyTypeObject*)options->record_class;
+    PyObject* record;
+
+    for (i = 0; i < count; i++) {
+        PyObject* default_factory;
+        PyObject* value;
+        if (PyTuple_GET_ITEM(values, i)) {
+            continue;
+        }
+        default_factory = PyTuple_GET_ITEM(options->record_defaults, i);
+        if (default_factory == Py_None) {
+            PyObject* InvalidBSON = _error("InvalidBSON");
+            if (InvalidBSON) {
+                PyObject* message = PyUnicode_FromFormat(
+                    "document has no field %R for %s",
+                    PyTuple_GET_ITEM(options->record_fields, i),
+                    record_class->tp_name);
+                if (message) {
+                    PyErr_SetObject(InvalidBSON, message);
+                    Py_DECREF(message);
+                }
+                Py_DECREF(InvalidBSON);
+            }
+            return NULL;
+        }
+        value = PyObject_CallObject(default_factory, NULL);
+        if (!value) {
+            return NULL;
+        }
+        PyTuple_SET_ITEM(values, i, value);
+    }
+
+    if (options->record_is_tuple) {
+        /* Like tuple.__new__(record_class, values), skipping the
+         * namedtuple's __new__. */
+        PyObject* args = PyTuple_Pack(1, values);
+        if (!args) {
+            return NULL;
+        }
+        record = PyTuple_Type.tp_new(record_class, args, NULL);
+        Py_DECREF(args);
+        return record;
+    }
+
+    record = PyObject_CallMethod((PyObject*)record_class, "__new__", "O",
+                                 (PyObject*)record_class);
+    if (!record) {
+        return NULL;
+    }
+    for (i = 0; i < count; i++) {
+        if (PyObject_GenericSetAttr(
+                record, PyTuple_GET_ITEM(options->record_fields, i),
+                PyTuple_GET_ITEM(values, i)) < 0) {
+            Py_DECREF(record);
+            return NULL;
+        }
+    }
+    return record;
+}
+
+/*
+ * Decode a document to a record of options->record_class, without an
+ * intermediate dict. Only the elements that are fields of the record, and
+ * are in 'fields' if it is not NULL, are decoded. The other elements are
+ * skipped by length.
+ */
+static PyObject* elements_to_record(PyObject* self, const char* string,
+                                    unsigned max,
+                                    const codec_options_t* options,
+                                    PyObject* fields) {
+    unsigned position = 0;
+    PyObject* values;
+    PyObject* record;
+
+    values = PyTuple_New(PyTuple_GET_SIZE(options->record_keys));
+    if (!values) {
+        return NULL;
+    }
+    while (position < max) {
+        unsigned char type = (unsigned char)string[position];
+        const char* name = string + position + 1;
+        size_t name_length = strlen(name);
+        Py_ssize_t index;
+        int new_position;
+
+        if (name_length > BSON_MAX_SIZE || position + 1 + name_length >= max) {
+            PyObject* InvalidBSON = _error("InvalidBSON");
+            if (InvalidBSON) {
+                PyErr_SetNone(InvalidBSON);
+                Py_DECREF(InvalidBSON);
+            }
+            Py_DECREF(values);
+            return NULL;
+        }
+
+        index = _field_index(options->record_keys, name, name_length);
+        if (index >= 0 &&
+                (!fields || _field_index(fields, name, name_length) >= 0)) {
+            PyObject* key = NULL;
+            PyObject* value = NULL;
+
+            new_position = _element_to_dict(
+                self, string, position, max, options, &key, &value);
+            if (new_position < 0) {
+                Py_DECREF(values);
+                return NULL;
+            }
+            Py_DECREF(key);
+            /* A repeated key replaces the earlier value. */
+            Py_XDECREF(PyTuple_GET_ITEM(values, index));
+            PyTuple_SET_ITEM(values, index, value);
+        } else {
+            new_position = _skip_element_value(
+                string, position + 2 + (unsigned)name_length, max, type);
+            if (new_position < 0) {
+                Py_DECREF(values);
+                return NULL;
+            }
+        }
+        position = (unsigned)new_position;
+    }
+    record = _new_record(values, options);
+    Py_DECREF(values);
+    return record;
+}
+
+static PyObject* _cbson_bson_to_dict(PyObject* self, PyObject* args) {
+    int32_t size;
+    Py_ssize_t total_size;
+    const char* string;
+    PyObject* bson;
+    codec_options_t options;
+    PyObject* result;
+    PyObject* options_obj;
+    PyObject* fields_obj = NULL;
+    PyObject* fields;
+    key_cache_t key_cache;
+
+    if (! (PyArg_ParseTuple(args, "OO|O", &bson, &options_obj, &fields_obj) &&
+            convert_codec_options(options_obj, &options))) {
+        return NULL;
+    }
+
+#if PY_MAJOR_VERSION >= 3
+    if (!PyBytes_Check(bson)) {
+        PyErr_SetString(PyExc_TypeError, "argument to _bson_to_dict must be a bytes object");
+#else
+    if (!PyString_Check(bson)) {
+        PyErr_SetString(PyExc_TypeError, "argument to _bson_to_dict must be a string");
+#endif
+        destroy_codec_options(&options);
+        return NULL;
+    }
+#if PY_MAJOR_VERSION >= 3
+    total_size = PyBytes_Size(bson);
+#else
+    total_size = PyString_Size(bson);
+#endif
+    if (total_size < BSON_MIN_SIZE) {
+        PyObject* InvalidBSON = _error("InvalidBSON");
+        if (InvalidBSON) {
+            PyErr_SetString(InvalidBSON,
+                            "not enough data for a BSON document");
+            Py_DECREF(InvalidBSON);
+        }
+        destroy_codec_options(&options);
+        return NULL;
+    }
+
+#if PY_MAJOR_VERSION >= 3
+    string = PyBytes_AsString(bson);
+#else
+    string = PyString_AsString(bson);
+#endif
+    if (!string) {
+        destroy_codec_options(&options);
+        return NULL;
+    }
+
+    memcpy(&size, string, 4);
+    size = (int32_t)BSON_UINT32_FROM_LE(size);
+    if (size < BSON_MIN_SIZE) {
+        PyObject* InvalidBSON = _error("InvalidBSON");
+        if (InvalidBSON) {
+            PyErr_SetString(InvalidBSON, "invalid message size");
+            Py_DECREF(InvalidBSON);
+        }
+        destroy_codec_options(&options);
+        return NULL;
+    }
+
+    if (total_size < size || total_size > BSON_MAX_SIZE) {
+        PyObject* InvalidBSON = _error("InvalidBSON");
+        if (InvalidBSON) {
+            PyErr_SetString(InvalidBSON, "objsize too large");
+            Py_DECREF(InvalidBSON);
+        }
+        destroy_codec_options(&options);
+        return NULL;
+    }
+
+    if (size != total_size || string[size - 1]) {
+        PyObject* InvalidBSON = _error("InvalidBSON");
+        if (InvalidBSON) {
+            PyErr_SetString(InvalidBSON, "bad eoo");
+            Py_DECREF(InvalidBSON);
+        }
+        destroy_codec_options(&options);
+        return NULL;
+    }
+
+    /* No need to decode fields if using RawBSONDocument */
+    if (options.is_raw_bson) {
+        return PyObject_CallFunction(
+            options.document_class, BYTES_FORMAT_STRING "O", string, size,
+            options_obj);
+    }
+
+    if (!_convert_fields(fields_obj, &fields)) {
+        destroy_codec_options(&options);
+        return NULL;
+    }
+    init_key_cache(&options, &key_cache);
+    if (options.record_class) {
+        result = elements_to_record(
+            self, string + 4, (unsigned)size - 5, &options, fields);
+        Py_XDECREF(fields);
+    } else if (fields) {
+        result = selected_elements_to_dict(
+            self, string + 4, (unsigned)size - 5, &options, fields);
+        Py_DECREF(fields);
+    } else {
+        result = elements_to_dict(
+            self, string + 4, (unsigned)size - 5, &options);
+    }
+    destroy_codec_options(&options);
+    return result;
+}
+
+/* Nesting depth checked by the scanning pass of decode_all. Deeper
+ * documents are only checked while they are decoded. */
+#define SCAN_MAX_DEPTH 100
+
+/* decode_all releases the GIL while scanning batches at least this big. */
+#define SCAN_WITHOUT_GIL_SIZE 65536
+
+/*
+ * Check the element boundaries of a document's elements, 'string[0:max]',
+ * and of any embedded documents and arrays. The byte at 'string[max]' must
+ * be the document's trailing null byte. Doesn't use the Python API, so it is
+ * safe to call without holding the GIL.
+ *
+ * UTF-8 is not validated here: invalid strings are handled according to the
+ * unicode_decode_error_handler when they are decoded. Unknown types stop the
+ * scan of a document, the decoding pass reports them.
+ *
+ * Returns NULL if the elements are valid, or an error message.
+ */
+static const char* _scan_elements(const char* string, unsigned max,
+                                  int depth) {
+    unsigned position = 0;
+    while (position < max) {
+        unsigned char type = (unsigned char)string[position];
+        size_t name_length = strlen(string + position + 1);
+        unsigned value_position;
+        int size;
+
+        if (name_length > BSON_MAX_SIZE || position + 1 + name_length >= max) {
+            return "invalid element name";
+        }
+        value_position = position + 2 + (unsigned)name_length;
+        size = _element_value_size(string + value_position,
+                                   max - value_position, type);
+        if (size == UNKNOWN_TYPE) {
+            return NULL;
+        }
+        if (size < 0) {
+            return "invalid element length";
+        }
+        switch (type) {
+        case 2:
+        case 13:
+        case 14:
+            if (size < 5 || string[value_position + size - 1]) {
+                return "invalid string length";
+            }
+            break;
+        case 3:
+        case 4:
+            if (size < BSON_MIN_SIZE || string[value_position + size - 1]) {
+                return "invalid object length";
+            }
+            if (depth < SCAN_MAX_DEPTH) {
+                const char* error = _scan_elements(
+                    string + value_position + 4, (unsigned)size - 5,
+                    depth + 1);
+                if (error) {
+                    return error;
+                }
+            }
+            break;
+        }
+        position = value_position + (unsigned)size;
+    }
+    return NULL;
+}
+
+/*
+ * Check the framing of concatenated BSON documents and, if 'check_elements'
+ * is true, the element boundaries inside each of them, and count the
+ * documents. Doesn't use the Python API, so it is safe to call without
+ * holding the GIL.
+ *
+ * Returns NULL if the documents are valid, or an error message.
+ */
+static const char* _scan_documents(const char* string, Py_ssize_t total_size,
+                                   unsigned char check_elements,
+                                   Py_ssize_t* count) {
+    *count = 0;
+    while (total_size > 0) {
+        int32_t size;
+        const char* error;
+
+        if (total_size < BSON_MIN_SIZE) {
+            return "not enough data for a BSON document";
+        }
+        memcpy(&size, string, 4);
+        size = (int32_t)BSON_UINT32_FROM_LE(size);
+        if (size < BSON_MIN_SIZE) {
+            return "invalid message size";
+        }
+        if (total_size < size) {
+            return "objsize too large";
+        }
+        if (string[size - 1]) {
+            return "bad eoo";
+        }
+        if (check_elements) {
+            error = _scan_elements(string + 4, (unsigned)size - 5, 0);
+            if (error) {
+                return error;
+            }
+        }
+        (*count)++;
+        string += size;
+        total_size -= size;
+    }
+    return NULL;
+}
+
+static PyObject* _cbson_decode_all(PyObject* self, PyObject* args) {
+    int32_t size;
+    Py_ssize_t total_size;
+    Py_ssize_t count;
+    Py_ssize_t i;
+    const char* string;
+    const char* error;
+    PyObject* bson;
+    PyObject* dict;
+    PyObject* result;
+    codec_options_t options;
+    PyObject* options_obj;
+    PyObject* fields_obj = NULL;
+    PyObject* fields;
+    key_cache_t key_cache;
+
+    if (!PyArg_ParseTuple(args, "O|OO", &bson, &options_obj, &fields_obj)) {
+        return NULL;
+    }
+    if (!_convert_fields(fields_obj, &fields)) {
+        return NULL;
+    }
+    if (PyTuple_GET_SIZE(args) < 2) {
+        if (!default_codec_options(GETSTATE(self), &options)) {
+            Py_XDECREF(fields);
+            return NULL;
+        }
+    } else if (!convert_codec_options(options_obj, &options)) {
+        Py_XDECREF(fields);
+        return NULL;
+    }
+    init_key_cache(&options, &key_cache);
+
+#if PY_MAJOR_VERSION >= 3
+    if (!PyBytes_Check(bson)) {
+        PyErr_SetString(PyExc_TypeError, "argument to decode_all must be a bytes object");
+#else
+    if (!PyString_Check(bson)) {
+        PyErr_SetString(PyExc_TypeError, "argument to decode_all must be a string");
+#endif
+        destroy_codec_options(&options);
+        Py_XDECREF(fields);
+        return NULL;
+    }
+#if PY_MAJOR_VERSION >= 3
+    total_size = PyBytes_Size(bson);
+    string = PyBytes_AsString(bson);
+#else
+    total_size = PyString_Size(bson);
+    string = PyString_AsString(bson);
+#endif
+    if (!string) {
+        destroy_codec_options(&options);
+        Py_XDECREF(fields);
+        return NULL;
+    }
+
+    /* Check the whole batch before creating any objects. The bytes object
+     * is immutable, so other threads can run while big batches are
+     * scanned. Trusted batches only have their framing checked here, the
+     * decoding pass still checks every element's bounds. */
+    if (!options.validate) {
+        error = _scan_documents(string, total_size, 0, &count);
+    } else if (total_size >= SCAN_WITHOUT_GIL_SIZE) {
+        Py_BEGIN_ALLOW_THREADS
+        error = _scan_documents(string, total_size, 1, &count);
+        Py_END_ALLOW_THREADS
+    } else {
+        error = _scan_documents(string, total_size, 1, &count);
+    }
+    if (error) {
+        PyObject* InvalidBSON = _error("InvalidBSON");
+        if (InvalidBSON) {
+            PyErr_SetString(InvalidBSON, error);
+            Py_DECREF(InvalidBSON);
+        }
+        destroy_codec_options(&options);
+        Py_XDECREF(fields);
+        return NULL;
+    }
+
+    if (!(result = PyList_New(count))) {
+        destroy_codec_options(&options);
+        Py_XDECREF(fields);
+        return NULL;
+    }
+
+    for (i = 0; i < count; i++) {
+        memcpy(&size, string, 4);
+        size = (int32_t)BSON_UINT32_FROM_LE(size);
+
+        /* No need to decode fields if using RawBSONDocument. */
+        if (options.is_raw_bson) {
+            dict = PyObject_CallFunction(
+                options.document_class, BYTES_FORMAT_STRING "O", string, size,
+                options_obj);
+        } else if (options.record_class) {
+            dict = elements_to_record(
+                self, string + 4, (unsigned)size - 5, &options, fields);
+        } else if (fields) {
+            dict = selected_elements_to_dict(
+                self, string + 4, (unsigned)size - 5, &options, fields);
+        } else {
+            dict = elements_to_dict(self, string + 4, (unsigned)size - 5, &options);
+        }
+        if (!dict) {
+            Py_DECREF(result);
+            destroy_codec_options(&options);
+            Py_XDECREF(fields);
+            return NULL;
+        }
+        PyList_SET_ITEM(result, i, dict);
+        string += size;
+    }
+
+    destroy_codec_options(&options);
+    Py_XDECREF(fields);
+    return result;
+}
+
+/* Column kinds for decode_columns, keep in sync with bson/__init__.py. */
+#define COLUMN_INT32 1
+#define COLUMN_INT64 2
+#define COLUMN_DOUBLE 3
+#define COLUMN_BOOL 4
+#define COLUMN_DATETIME 5
+
+static const char* column_names[] = {
+    NULL, "int32", "int64", "double", "bool", "datetime"};
+
+/* The value of one column in the row being decoded. */
+typedef union {
+    int32_t int32;
+    int64_t int64;
+    double number;
+    char boolean;
+} column_value_t;
+
+static int _column_item_size(int kind) {
+    switch (kind) {
+    case COLUMN_INT32:
+        return 4;
+    case COLUMN_BOOL:
+        return 1;
+    default:
+        return 8;
+    }
+}
+
+/*
+ * Convert the value of an element of BSON type 'type' at 'buffer' to the
+ * native representation of a column of kind 'kind'. The value must already
+ * have been checked to fit in the document.
+ *
+ * Returns 1 on success, 0 if the value is null, or -1 on error.
+ */
+static int _column_value(const char* buffer, unsigned char type, int kind,
+                         const char* name, column_value_t* value) {
+    int32_t int32;
+    int64_t int64;
+    double number;
+
+    if (type == 10) {
+        return 0;
+    }
+    switch (type) {
+    case 1:
+        if (kind == COLUMN_DOUBLE) {
+            memcpy(&number, buffer, 8);
+            value->number = BSON_DOUBLE_FROM_LE(number);
+            return 1;
+        }
+        break;
+    case 8:
+        if (kind == COLUMN_BOOL) {
+            value->boolean = buffer[0] ? 1 : 0;
+            return 1;
+        }
+        break;
+    case 9:
+        if (kind == COLUMN_DATETIME) {
+            memcpy(&int64, buffer, 8);
+            value->int64 = (int64_t)BSON_UINT64_FROM_LE(int64);
+            return 1;
+        }
+        break;
+    case 16:
+        memcpy(&int32, buffer, 4);
+        int32 = (int32_t)BSON_UINT32_FROM_LE(int32);
+        if (kind == COLUMN_INT32) {
+            value->int32 = int32;
+            return 1;
+        } else if (kind == COLUMN_INT64) {
+            value->int64 = int32;
+            return 1;
+        } else if (kind == COLUMN_DOUBLE) {
+            value->number = int32;
+            return 1;
+        }
+        break;
+    case 18:
+        memcpy(&int64, buffer, 8);
+        int64 = (int64_t)BSON_UINT64_FROM_LE(int64);
+        if (kind == COLUMN_INT64) {
+            value->int64 = int64;
+            return 1;
+        } else if (kind == COLUMN_DOUBLE) {
+            value->number = (double)int64;
+            return 1;
+        }
+        break;
+    }
+    PyErr_Format(PyExc_TypeError,
+                 "cannot decode field '%s' of BSON type %d into a column "
+                 "of type %s",
+                 name, (int)type, column_names[kind]);
+    return -1;
+}
+
+/*
+ * Decode concatenated BSON documents into one column per requested field.
+ *
+ * Takes the BSON data, a tuple of encoded field names and a tuple of column
+ * kinds. Returns a list with a (values, validity mask) pair of bytes objects
+ * for each field, holding one native value and one mask byte per document.
+ */
+static PyObject* _cbson_decode_columns(PyObject* self, PyObject* args) {
+    PyObject* bson;
+    PyObject* names;
+    PyObject* kinds;
+    const char* string;
+    Py_ssize_t total_size;
+    Py_ssize_t count;
+    Py_ssize_t i;
+    int* column_kinds = NULL;
+    buffer_t* values = NULL;
+    buffer_t* masks = NULL;
+    column_value_t* row = NULL;
+    char* row_valid = NULL;
+    PyObject* result = NULL;
+
+    if (!PyArg_ParseTuple(args, "OO!O!", &bson, &PyTuple_Type, &names,
+                          &PyTuple_Type, &kinds)) {
+        return NULL;
+    }
+#if PY_MAJOR_VERSION >= 3
+    if (!PyBytes_Check(bson)) {
+        PyErr_SetString(PyExc_TypeError, "argument to decode_columns must be a bytes object");
+        return NULL;
+    }
+    total_size = PyBytes_GET_SIZE(bson);
+    string = PyBytes_AS_STRING(bson);
+#else
+    if (!PyString_Check(bson)) {
+        PyErr_SetString(PyExc_TypeError, "argument to decode_columns must be a string");
+        return NULL;
+    }
+    total_size = PyString_GET_SIZE(bson);
+    string = PyString_AS_STRING(bson);
+#endif
+    count = PyTuple_GET_SIZE(names);
+    if (PyTuple_GET_SIZE(kinds) != count) {
+        PyErr_SetString(PyExc_ValueError,
+                        "decode_columns needs one kind for each field");
+        return NULL;
+    }
+
+    column_kinds = PyMem_New(int, count + 1);
+    values = PyMem_New(buffer_t, count + 1);
+    masks = PyMem_New(buffer_t, count + 1);
+    row = PyMem_New(column_value_t, count + 1);
+    row_valid = PyMem_New(char, count + 1);
+    if (values && masks) {
+        for (i = 0; i < count; i++) {
+            values[i] = masks[i] = NULL;
+        }
+    }
+    if (!column_kinds || !values || !masks || !row || !row_valid) {
+        PyErr_NoMemory();
+        goto done;
+    }
+    for (i = 0; i < count; i++) {
+        long kind = PyLong_AsLong(PyTuple_GET_ITEM(kinds, i));
+        if (kind == -1 && PyErr_Occurred()) {
+            goto done;
+        }
+        if (kind < COLUMN_INT32 || kind > COLUMN_DATETIME ||
+                !PyBytes_Check(PyTuple_GET_ITEM(names, i))) {
+            PyErr_SetString(PyExc_ValueError, "invalid column");
+            goto done;
+        }
+        column_kinds[i] = (int)kind;
+        values[i] = buffer_new();
+        masks[i] = buffer_new();
+        if (!values[i] || !masks[i]) {
+            PyErr_NoMemory();
+            goto done;
+        }
+    }
+
+    while (total_size > 0) {
+        int32_t size;
+        const char* elements;
+        unsigned position = 0;
+        unsigned max;
+
+        if (total_size < BSON_MIN_SIZE) {
+            PyObject* InvalidBSON = _error("InvalidBSON");
+            if (InvalidBSON) {
+                PyErr_SetString(InvalidBSON,
+                                "not enough data for a BSON document");
+                Py_DECREF(InvalidBSON);
+            }
+            goto done;
+        }
+        memcpy(&size, string, 4);
+        size = (int32_t)BSON_UINT32_FROM_LE(size);
+        if (size < BSON_MIN_SIZE || total_size < size || string[size - 1]) {
+            PyObject* InvalidBSON = _error("InvalidBSON");
+            if (InvalidBSON) {
+                PyErr_SetString(InvalidBSON, "invalid object size");
+                Py_DECREF(InvalidBSON);
+            }
+            goto done;
+        }
+
+        memset(row, 0, sizeof(column_value_t) * count);
+        memset(row_valid, 0, count);
+        elements = string + 4;
+        max = (unsigned)size - 5;
+        while (position < max) {
+            unsigned char type = (unsigned char)elements[position];
+            const char* name = elements + position + 1;
+            size_t name_length = strlen(name);
+            unsigned value_position;
+            int new_position;
+
+            if (name_length > BSON_MAX_SIZE ||
+                    position + 1 + name_length >= max) {
+                PyObject* InvalidBSON = _error("InvalidBSON");
+                if (InvalidBSON) {
+                    PyErr_SetNone(InvalidBSON);
+                    Py_DECREF(InvalidBSON);
+                }
+                goto done;
+            }
+            value_position = position + 2 + (unsigned)name_length;
+            new_position = _skip_element_value(elements, value_position,
+                                               max, type);
+            if (new_position < 0) {
+                goto done;
+            }
+            i = _field_index(names, name, name_length);
+            if (i >= 0) {
+                int valid = _column_value(elements + value_position, type,
+                                          column_kinds[i], name, &row[i]);
+                if (valid < 0) {
+                    goto done;
+                }
+                if (!valid) {
+                    memset(&row[i], 0, sizeof(column_value_t));
+                }
+                row_valid[i] = (char)valid;
+            }
+            position = (unsigned)new_position;
+        }
+
+        for (i = 0; i < count; i++) {
+            if (!buffer_write_bytes(values[i], (const char*)&row[i],
+                                    _column_item_size(column_kinds[i])) ||
+                    !buffer_write_bytes(masks[i], &row_valid[i], 1)) {
+                goto done;
             }
-            goto invalid;
         }
+        string += size;
+        total_size -= size;
     }
 
-    if (value) {
-        if (!options->type_registry.is_decoder_empty) {
-            PyObject* value_type = NULL;
-            PyObject* converter = NULL;
-            value_type = PyObject_Type(value);
-            if (value_type == NULL) {
-                goto invalid;
+    if (!(result = PyList_New(count))) {
+        goto done;
+    }
+    for (i = 0; i < count; i++) {
+        PyObject* column = PyTuple_New(2);
+        if (!column) {
+            Py_CLEAR(result);
+            goto done;
+        }
+        PyList_SET_ITEM(result, i, column);
+        PyTuple_SET_ITEM(column, 0, PyBytes_FromStringAndSize(
+            buffer_get_buffer(values[i]), buffer_get_position(values[i])));
+        PyTuple_SET_ITEM(column, 1, PyBytes_FromStringAndSize(
+            buffer_get_buffer(masks[i]), buffer_get_position(masks[i])));
+        if (!PyTuple_GET_ITEM(column, 0) || !PyTuple_GET_ITEM(column, 1)) {
+            Py_CLEAR(result);
+            goto done;
+        }
+    }
+
+done:
+    if (values && masks) {
+        for (i = 0; i < count; i++) {
+            if (values[i]) {
+                buffer_free(values[i]);
             }
-            converter = PyDict_GetItem(options->type_registry.decoder_map, value_type);
-            if (converter != NULL) {
-                PyObject* new_value = PyObject_CallFunctionObjArgs(converter, value, NULL);
-                Py_DECREF(value_type);
-                Py_DECREF(value);
-                return new_value;
-            } else {
-                Py_DECREF(value_type);
-                return value;
+            if (masks[i]) {
+                buffer_free(masks[i]);
             }
         }
-        return value;
     }
+    PyMem_Free(column_kinds);
+    PyMem_Free(values);
+    PyMem_Free(masks);
+    PyMem_Free(row);
+    PyMem_Free(row_valid);
+    return result;
+}
 
-    invalid:
-
-    /*
-     * Wrap any non-InvalidBSON errors in InvalidBSON.
-     */
-    if (PyErr_Occurred()) {
-        PyObject *etype, *evalue, *etrace;
-        PyObject *InvalidBSON;
+/* The modes of bson.json_util.JSONMode. */
+#define JSON_MODE_LEGACY 0
+#define JSON_MODE_RELAXED 1
+#define JSON_MODE_CANONICAL 2
+
+/* The representations of bson.json_util.DatetimeRepresentation. */
+#define JSON_DATETIME_LEGACY 0
+#define JSON_DATETIME_NUMBERLONG 1
+#define JSON_DATETIME_ISO8601 2
+
+/* Milliseconds since the epoch of the first and last instants datetime can
+ * represent, 0001-01-01T00:00:00Z and 9999-12-31T23:59:59.999Z. */
+#define JSON_MIN_DATETIME_MILLIS -62135596800000LL
+#define JSON_MAX_DATETIME_MILLIS 253402300799999LL
+
+typedef struct json_options_t {
+    PyObject* json_options;
+    PyObject* value_to_json;
+    long json_mode;
+    long datetime_representation;
+    int strict_number_long;
+    /* The decoded datetimes would be in UTC. */
+    int utc;
+} json_options_t;
+
+static int _read_long_attribute(PyObject* object, const char* name,
+                                long* result) {
+    PyObject* value = PyObject_GetAttrString(object, name);
+    if (!value) {
+        return 0;
+    }
+#if PY_MAJOR_VERSION >= 3
+    *result = PyLong_AsLong(value);
+#else
+    *result = PyInt_AsLong(value);
+#endif
+    Py_DECREF(value);
+    return !(*result == -1 && PyErr_Occurred());
+}
 
-        /*
-         * Calling _error clears the error state, so fetch it first.
-         */
-        PyErr_Fetch(&etype, &evalue, &etrace);
+static int _write_json_literal(buffer_t buffer, const char* literal) {
+    return buffer_write_bytes(buffer, literal, (int)strlen(literal));
+}
 
-        /* Dont reraise anything but PyExc_Exceptions as InvalidBSON. */
-        if (PyErr_GivenExceptionMatches(etype, PyExc_Exception)) {
-            InvalidBSON = _error("InvalidBSON");
-            if (InvalidBSON) {
-                if (!PyErr_GivenExceptionMatches(etype, InvalidBSON)) {
-                    /*
-                     * Raise InvalidBSON(str(e)).
-                     */
-                    Py_DECREF(etype);
-                    etype = InvalidBSON;
+/* Write a code point as json.dumps does with ensure_ascii. */
+static int _write_json_char(buffer_t buffer, unsigned long c) {
+    char escaped[13];
+    int length;
+    switch (c) {
+    case '"':
+        return buffer_write_bytes(buffer, "\\\"", 2);
+    case '\\':
+        return buffer_write_bytes(buffer, "\\\\", 2);
+    case '\n':
+        return buffer_write_bytes(buffer, "\\n", 2);
+    case '\r':
+        return buffer_write_bytes(buffer, "\\r", 2);
+    case '\t':
+        return buffer_write_bytes(buffer, "\\t", 2);
+    case '\b':
+        return buffer_write_bytes(buffer, "\\b", 2);
+    case '\f':
+        return buffer_write_bytes(buffer, "\\f", 2);
+    }
+    if (c >= 0x20 && c < 0x7f) {
+        char ascii = (char)c;
+        return buffer_write_bytes(buffer, &ascii, 1);
+    }
+    if (c >= 0x10000) {
+        /* Surrogate pair. */
+        c -= 0x10000;
+        length = PyOS_snprintf(escaped, sizeof(escaped), "\\u%04lx\\u%04lx",
+                               0xd800 | ((c >> 10) & 0x3ff),
+                               0xdc00 | (c & 0x3ff));
+    } else {
+        length = PyOS_snprintf(escaped, sizeof(escaped), "\\u%04lx", c);
+    }
+    return buffer_write_bytes(buffer, escaped, length);
+}
 
-                    if (evalue) {
-                        PyObject *msg = PyObject_Str(evalue);
-                        Py_DECREF(evalue);
-                        evalue = msg;
-                    }
-                    PyErr_NormalizeException(&etype, &evalue, &etrace);
-                } else {
-                    /*
-                     * The current exception matches InvalidBSON, so we don't
-                     * need this reference after all.
-                     */
-                    Py_DECREF(InvalidBSON);
-                }
-            }
+/* Write 'length' bytes of UTF-8 as a quoted, ASCII only JSON string. */
+static int _write_json_string(buffer_t buffer, const char* string,
+                              size_t length, const codec_options_t* options) {
+    PyObject* unicode;
+    Py_ssize_t i;
+    size_t plain = 0;
+    int result = 1;
+
+    /* Printable ASCII without quotes or backslashes is copied as is. */
+    while (plain < length) {
+        unsigned char c = (unsigned char)string[plain];
+        if (c < 0x20 || c >= 0x7f || c == '"' || c == '\\') {
+            break;
         }
-        /* Steals references to args. */
-        PyErr_Restore(etype, evalue, etrace);
-    } else {
-        PyObject *InvalidBSON = _error("InvalidBSON");
-        if (InvalidBSON) {
-            PyErr_SetString(InvalidBSON, "invalid length or type code");
-            Py_DECREF(InvalidBSON);
+        plain++;
+    }
+    if (length > BSON_MAX_SIZE) {
+        _invalid_bson("invalid string length");
+        return 0;
+    }
+    if (!buffer_write_bytes(buffer, "\"", 1) ||
+            !buffer_write_bytes(buffer, string, (int)plain)) {
+        return 0;
+    }
+    if (plain < length) {
+        unicode = PyUnicode_DecodeUTF8(string + plain,
+                                       (Py_ssize_t)(length - plain),
+                                       options->unicode_decode_error_handler);
+        if (!unicode) {
+            _reraise_as_invalid_bson();
+            return 0;
+        }
+#if PY_MAJOR_VERSION >= 3
+        for (i = 0; result && i < PyUnicode_GET_LENGTH(unicode); i++) {
+            result = _write_json_char(buffer, PyUnicode_READ_CHAR(unicode, i));
+        }
+#else
+        for (i = 0; result && i < PyUnicode_GET_SIZE(unicode); i++) {
+            result = _write_json_char(
+                buffer, PyUnicode_AS_UNICODE(unicode)[i]);
+        }
+#endif
+        Py_DECREF(unicode);
+        if (!result) {
+            return 0;
         }
     }
-    return NULL;
+    return buffer_write_bytes(buffer, "\"", 1);
 }
 
-/*
- * Get the next 'name' and 'value' from a document in a string, whose position
- * is provided.
- *
- * Returns the position of the next element in the document, or -1 on error.
- */
-static int _element_to_dict(PyObject* self, const char* string,
-                            unsigned position, unsigned max,
-                            const codec_options_t* options,
-                            PyObject** name, PyObject** value) {
-    unsigned char type = (unsigned char)string[position++];
-    size_t name_length = strlen(string + position);
-    if (name_length > BSON_MAX_SIZE || position + name_length >= max) {
-        PyObject* InvalidBSON = _error("InvalidBSON");
-        if (InvalidBSON) {
-            PyErr_SetNone(InvalidBSON);
-            Py_DECREF(InvalidBSON);
+/* Write a JSON number with repr() of 'value', as json.dumps does. */
+static int _write_json_double(buffer_t buffer, double value, int quoted) {
+    int result;
+    char* repr = PyOS_double_to_string(value, 'r', 0, Py_DTSF_ADD_DOT_0,
+                                       NULL);
+    if (!repr) {
+        return 0;
+    }
+    if (quoted) {
+        result = (buffer_write_bytes(buffer, "\"", 1) &&
+                  _write_json_literal(buffer, repr) &&
+                  buffer_write_bytes(buffer, "\"", 1));
+    } else {
+        result = _write_json_literal(buffer, repr);
+    }
+    PyMem_Free(repr);
+    return result;
+}
+
+static int _write_json_int64(buffer_t buffer, long long value, int quoted) {
+    char digits[24];
+    int length = PyOS_snprintf(digits, sizeof(digits),
+                               quoted ? "\"%lld\"" : "%lld", value);
+    return buffer_write_bytes(buffer, digits, length);
+}
+
+static int _write_json_base64(buffer_t buffer, const unsigned char* data,
+                              unsigned length) {
+    static const char alphabet[] =
+        "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/";
+    char encoded[4];
+    unsigned i;
+    for (i = 0; i + 2 < length; i += 3) {
+        encoded[0] = alphabet[data[i] >> 2];
+        encoded[1] = alphabet[((data[i] & 0x03) << 4) | (data[i + 1] >> 4)];
+        encoded[2] = alphabet[((data[i + 1] & 0x0f) << 2) | (data[i + 2] >> 6)];
+        encoded[3] = alphabet[data[i + 2] & 0x3f];
+        if (!buffer_write_bytes(buffer, encoded, 4)) {
+            return 0;
         }
-        return -1;
     }
-    *name = PyUnicode_DecodeUTF8(
-        string + position, name_length,
-        options->unicode_decode_error_handler);
-    if (!*name) {
-        /* If NULL is returned then wrap the UnicodeDecodeError
-           in an InvalidBSON error */
-        PyObject *etype, *evalue, *etrace;
-        PyObject *InvalidBSON;
+    if (i < length) {
+        encoded[0] = alphabet[data[i] >> 2];
+        if (i + 1 < length) {
+            encoded[1] = alphabet[((data[i] & 0x03) << 4) | (data[i + 1] >> 4)];
+            encoded[2] = alphabet[(data[i + 1] & 0x0f) << 2];
+        } else {
+            encoded[1] = alphabet[(data[i] & 0x03) << 4];
+            encoded[2] = '=';
+        }
+        encoded[3] = '=';
+        if (!buffer_write_bytes(buffer, encoded, 4)) {
+            return 0;
+        }
+    }
+    return 1;
+}
 
-        PyErr_Fetch(&etype, &evalue, &etrace);
-        if (PyErr_GivenExceptionMatches(etype, PyExc_Exception)) {
-            InvalidBSON = _error("InvalidBSON");
-            if (InvalidBSON) {
-                Py_DECREF(etype);
-                etype = InvalidBSON;
+/* Write an ISO-8601 UTC date, as json_util.default does for datetimes at or
+ * after the epoch. */
+static int _write_json_iso8601(buffer_t buffer, long long millis) {
+    char formatted[32];
+    int length;
+    Time64_T seconds = (Time64_T)(millis / 1000);
+    int fraction = (int)(millis % 1000);
+    struct TM timeinfo;
+    gmtime64_r(&seconds, &timeinfo);
+    length = PyOS_snprintf(formatted, sizeof(formatted),
+                           "\"%04d-%02d-%02dT%02d:%02d:%02d",
+                           (int)timeinfo.tm_year + 1900, timeinfo.tm_mon + 1,
+                           timeinfo.tm_mday, timeinfo.tm_hour,
+                           timeinfo.tm_min, timeinfo.tm_sec);
+    if (fraction) {
+        length += PyOS_snprintf(formatted + length,
+                                sizeof(formatted) - length, ".%03d",
+                                fraction);
+    }
+    length += PyOS_snprintf(formatted + length, sizeof(formatted) - length,
+                            "Z\"");
+    return buffer_write_bytes(buffer, formatted, length);
+}
 
-                if (evalue) {
-                    PyObject *msg = PyObject_Str(evalue);
-                    Py_DECREF(evalue);
-                    evalue = msg;
-                }
-                PyErr_NormalizeException(&etype, &evalue, &etrace);
-            }
+/* Does the embedded document at 'string' have a "$ref" field, which makes
+ * it decode to a DBRef? */
+static int _has_dbref_key(const char* string, unsigned size) {
+    unsigned position = 4;
+    unsigned max = size - 1;
+    while (position + 1 < max) {
+        unsigned char type = (unsigned char)string[position];
+        const char* name = string + position + 1;
+        size_t name_length = strnlen(name, max - position - 1);
+        int value_size;
+        if (name_length == 4 && !memcmp(name, "$ref", 4)) {
+            return 1;
         }
-        PyErr_Restore(etype, evalue, etrace);
+        position += (unsigned)name_length + 2;
+        if (position > max) {
+            return 0;
+        }
+        value_size = _element_value_size(string + position, max - position,
+                                         type);
+        if (value_size < 0) {
+            /* Leave it to the decoder to report. */
+            return 1;
+        }
+        position += (unsigned)value_size;
+    }
+    return 0;
+}
+
+/* Decode the element at 'position' and write the JSON text that
+ * json_util._value_to_json returns for its value. Used for the types that
+ * are rare or that depend on Python objects to be rendered.
+ *
+ * Returns the position of the next element, or -1 on error. */
+static int _write_json_fallback(PyObject* self, buffer_t buffer,
+                                const char* string, unsigned position,
+                                unsigned max, const codec_options_t* options,
+                                json_options_t* json) {
+    PyObject* name;
+    PyObject* value;
+    PyObject* text;
+    PyObject* encoded;
+    int new_position = _element_to_dict(self, string, position, max, options,
+                                        &name, &value);
+    if (new_position < 0) {
         return -1;
     }
-    position += (unsigned)name_length + 1;
-    *value = get_value(self, *name, string, &position, type,
-                       max - position, options);
-    if (!*value) {
-        Py_DECREF(*name);
+    Py_DECREF(name);
+    if (!json->value_to_json) {
+        PyObject* json_util = PyImport_ImportModule("bson.json_util");
+        if (!json_util) {
+            Py_DECREF(value);
+            return -1;
+        }
+        json->value_to_json = PyObject_GetAttrString(json_util,
+                                                     "_value_to_json");
+        Py_DECREF(json_util);
+        if (!json->value_to_json) {
+            Py_DECREF(value);
+            return -1;
+        }
+    }
+    text = PyObject_CallFunctionObjArgs(json->value_to_json, value,
+                                        json->json_options, NULL);
+    Py_DECREF(value);
+    if (!text) {
         return -1;
     }
-    return position;
+#if PY_MAJOR_VERSION >= 3
+    encoded = PyUnicode_AsASCIIString(text);
+    Py_DECREF(text);
+#else
+    encoded = text;
+#endif
+    if (!encoded) {
+        return -1;
+    }
+    if (!buffer_write_bytes(buffer, PyBytes_AS_STRING(encoded),
+                            (int)PyBytes_GET_SIZE(encoded))) {
+        new_position = -1;
+    }
+    Py_DECREF(encoded);
+    return new_position;
 }
 
-static PyObject* _cbson_element_to_dict(PyObject* self, PyObject* args) {
-    char* string;
-    PyObject* bson;
-    codec_options_t options;
-    unsigned position;
-    unsigned max;
-    int new_position;
-    PyObject* name;
-    PyObject* value;
-    PyObject* result_tuple;
+static int _write_json_document(PyObject* self, buffer_t buffer,
+                                const char* string, unsigned size,
+                                const codec_options_t* options,
+                                json_options_t* json, int is_array);
 
-    if (!PyArg_ParseTuple(args, "OII|O&", &bson, &position, &max,
-                          convert_codec_options, &options)) {
-        return NULL;
+/* Write the value of the element of BSON type 'type' whose type byte is at
+ * 'element' and whose value is at 'position'.
+ *
+ * Returns the position of the next element, or -1 on error. */
+static int _write_json_value(PyObject* self, buffer_t buffer,
+                             const char* string, unsigned element,
+                             unsigned position, unsigned max,
+                             unsigned char type,
+                             const codec_options_t* options,
+                             json_options_t* json) {
+    const char* value = string + position;
+    int size = _element_value_size(value, max - position, type);
+    int canonical = json->json_mode == JSON_MODE_CANONICAL;
+    int ok;
+
+    if (size == UNKNOWN_TYPE) {
+        return _write_json_fallback(self, buffer, string, element, max,
+                                    options, json);
     }
-    if (PyTuple_GET_SIZE(args) < 4) {
-        if (!default_codec_options(GETSTATE(self), &options)) {
-            return NULL;
+    if (size < 0) {
+        return _skip_element_value(string, position, max, type);
+    }
+    switch (type) {
+    case 1:
+        {
+            double d;
+            memcpy(&d, value, 8);
+            d = BSON_DOUBLE_FROM_LE(d);
+            if (Py_IS_NAN(d) || Py_IS_INFINITY(d)) {
+                const char* special = Py_IS_NAN(d) ? "NaN" :
+                    (d > 0 ? "Infinity" : "-Infinity");
+                if (json->json_mode == JSON_MODE_LEGACY) {
+                    ok = _write_json_literal(buffer, special);
+                } else {
+                    ok = (_write_json_literal(buffer, "{\"$numberDouble\": \"") &&
+                          _write_json_literal(buffer, special) &&
+                          _write_json_literal(buffer, "\"}"));
+                }
+            } else if (canonical) {
+                ok = (_write_json_literal(buffer, "{\"$numberDouble\": ") &&
+                      _write_json_double(buffer, d, 1) &&
+                      _write_json_literal(buffer, "}"));
+            } else {
+                ok = _write_json_double(buffer, d, 0);
+            }
+            break;
+        }
+    case 2:
+    case 14:
+        if (size < 5 || value[size - 1]) {
+            _invalid_bson("invalid string length");
+            return -1;
+        }
+        ok = _write_json_string(buffer, value + 4, (size_t)size - 5, options);
+        break;
+    case 3:
+    case 4:
+        if (size < 5 || value[size - 1]) {
+            _invalid_bson("invalid object length");
+            return -1;
+        }
+        if (type == 3 && _has_dbref_key(value, (unsigned)size)) {
+            return _write_json_fallback(self, buffer, string, element, max,
+                                        options, json);
+        }
+        ok = _write_json_document(self, buffer, value, (unsigned)size,
+                                  options, json, type == 4);
+        break;
+    case 5:
+        {
+            unsigned char subtype = (unsigned char)value[4];
+            if (subtype == 2 || subtype == 3 || subtype == 4) {
+                /* Old binary and UUIDs depend on the uuid_representation. */
+                return _write_json_fallback(self, buffer, string, element,
+                                            max, options, json);
+            }
+            if (json->json_mode == JSON_MODE_LEGACY) {
+                ok = _write_json_literal(buffer, "{\"$binary\": \"");
+            } else {
+                ok = _write_json_literal(
+                    buffer, "{\"$binary\": {\"base64\": \"");
+            }
+            if (ok) {
+                char type_string[32];
+                PyOS_snprintf(type_string, sizeof(type_string),
+                              json->json_mode == JSON_MODE_LEGACY ?
+                              "\", \"$type\": \"%02x\"}" :
+                              "\", \"subType\": \"%02x\"}}",
+                              (unsigned)subtype);
+                ok = (_write_json_base64(
+                          buffer, (const unsigned char*)value + 5,
+                          (unsigned)size - 5) &&
+                      _write_json_literal(buffer, type_string));
+            }
+            break;
+        }
+    case 6:
+    case 10:
+        ok = _write_json_literal(buffer, "null");
+        break;
+    case 7:
+        {
+            static const char hex[] = "0123456789abcdef";
+            char oid[38] = "{\"$oid\": \"";
+            int i;
+            for (i = 0; i < 12; i++) {
+                oid[10 + 2 * i] = hex[(unsigned char)value[i] >> 4];
+                oid[11 + 2 * i] = hex[(unsigned char)value[i] & 0x0f];
+            }
+            oid[34] = '"';
+            oid[35] = '}';
+            ok = buffer_write_bytes(buffer, oid, 36);
+            break;
+        }
+    case 8:
+        if (value[0] != 0 && value[0] != 1) {
+            PyObject* InvalidBSON = _error("InvalidBSON");
+            if (InvalidBSON) {
+                PyErr_Format(InvalidBSON, "invalid boolean value: %x",
+                             value[0]);
+                Py_DECREF(InvalidBSON);
+            }
+            return -1;
+        }
+        ok = _write_json_literal(buffer, value[0] ? "true" : "false");
+        break;
+    case 9:
+        {
+            int64_t millis;
+            memcpy(&millis, value, 8);
+            millis = (int64_t)BSON_UINT64_FROM_LE(millis);
+            if (millis < JSON_MIN_DATETIME_MILLIS ||
+                    millis > JSON_MAX_DATETIME_MILLIS) {
+                /* Let the decoder report the datetime out of range. */
+                return _write_json_fallback(self, buffer, string, element,
+                                            max, options, json);
+            }
+            if (json->datetime_representation == JSON_DATETIME_ISO8601 &&
+                    millis >= 0) {
+                if (!json->utc) {
+                    return _write_json_fallback(self, buffer, string,
+                                                element, max, options, json);
+                }
+                ok = (_write_json_literal(buffer, "{\"$date\": ") &&
+                      _write_json_iso8601(buffer, millis) &&
+                      _write_json_literal(buffer, "}"));
+            } else if (json->datetime_representation ==
+                       JSON_DATETIME_LEGACY) {
+                ok = (_write_json_literal(buffer, "{\"$date\": ") &&
+                      _write_json_int64(buffer, millis, 0) &&
+                      _write_json_literal(buffer, "}"));
+            } else {
+                ok = (_write_json_literal(
+                          buffer, "{\"$date\": {\"$numberLong\": ") &&
+                      _write_json_int64(buffer, millis, 1) &&
+                      _write_json_literal(buffer, "}}"));
+            }
+            break;
+        }
+    case 16:
+        {
+            int32_t i;
+            memcpy(&i, value, 4);
+            i = (int32_t)BSON_UINT32_FROM_LE(i);
+            if (canonical) {
+                ok = (_write_json_literal(buffer, "{\"$numberInt\": ") &&
+                      _write_json_int64(buffer, i, 1) &&
+                      _write_json_literal(buffer, "}"));
+            } else {
+                ok = _write_json_int64(buffer, i, 0);
+            }
+            break;
+        }
+    case 17:
+        {
+            uint32_t inc, time;
+            char timestamp[64];
+            memcpy(&inc, value, 4);
+            memcpy(&time, value + 4, 4);
+            PyOS_snprintf(timestamp, sizeof(timestamp),
+                          "{\"$timestamp\": {\"t\": %lu, \"i\": %lu}}",
+                          (unsigned long)BSON_UINT32_FROM_LE(time),
+                          (unsigned long)BSON_UINT32_FROM_LE(inc));
+            ok = _write_json_literal(buffer, timestamp);
+            break;
+        }
+    case 18:
+        {
+            int64_t ll;
+            memcpy(&ll, value, 8);
+            ll = (int64_t)BSON_UINT64_FROM_LE(ll);
+            if (json->strict_number_long) {
+                ok = (_write_json_literal(buffer, "{\"$numberLong\": ") &&
+                      _write_json_int64(buffer, ll, 1) &&
+                      _write_json_literal(buffer, "}"));
+            } else {
+                ok = _write_json_int64(buffer, ll, 0);
+            }
+            break;
         }
+    case 127:
+        ok = _write_json_literal(buffer, "{\"$maxKey\": 1}");
+        break;
+    case 255:
+        ok = _write_json_literal(buffer, "{\"$minKey\": 1}");
+        break;
+    default:
+        /* Regex, DBPointer, Code, Code with scope and Decimal128. */
+        return _write_json_fallback(self, buffer, string, element, max,
+                                    options, json);
     }
-
-#if PY_MAJOR_VERSION >= 3
-    if (!PyBytes_Check(bson)) {
-        PyErr_SetString(PyExc_TypeError, "argument to _element_to_dict must be a bytes object");
-#else
-    if (!PyString_Check(bson)) {
-        PyErr_SetString(PyExc_TypeError, "argument to _element_to_dict must be a string");
-#endif
-        return NULL;
+    if (!ok) {
+        return -1;
     }
-#if PY_MAJOR_VERSION >= 3
-    string = PyBytes_AS_STRING(bson);
-#else
-    string = PyString_AS_STRING(bson);
-#endif
+    return (int)position + size;
+}
 
-    new_position = _element_to_dict(self, string, position, max, &options,
-                                    &name, &value);
-    if (new_position < 0) {
-        return NULL;
-    }
+/* Write the document or array of 'size' bytes at 'string' as JSON. */
+static int _write_json_document(PyObject* self, buffer_t buffer,
+                                const char* string, unsigned size,
+                                const codec_options_t* options,
+                                json_options_t* json, int is_array) {
+    unsigned position = 4;
+    unsigned max = size - 1;
+    int result = 0;
 
-    result_tuple = Py_BuildValue("NNi", name, value, new_position);
-    if (!result_tuple) {
-        Py_DECREF(name);
-        Py_DECREF(value);
-        return NULL;
+    if (Py_EnterRecursiveCall(" while encoding a BSON document to JSON")) {
+        return 0;
     }
-
-    return result_tuple;
-}
-
-static PyObject* _elements_to_dict(PyObject* self, const char* string,
-                                   unsigned max,
-                                   const codec_options_t* options) {
-    unsigned position = 0;
-    PyObject* dict = PyObject_CallObject(options->document_class, NULL);
-    if (!dict) {
-        return NULL;
+    if (!buffer_write_bytes(buffer, is_array ? "[" : "{", 1)) {
+        goto done;
     }
     while (position < max) {
-        PyObject* name = NULL;
-        PyObject* value = NULL;
+        unsigned char type = (unsigned char)string[position];
+        const char* name = string + position + 1;
+        const char* name_end = NULL;
         int new_position;
 
-        new_position = _element_to_dict(
-            self, string, position, max, options, &name, &value);
+        if (position + 1 < max) {
+            name_end = memchr(name, 0, max - position - 1);
+        }
+        if (!name_end) {
+            _invalid_bson("invalid element name");
+            goto done;
+        }
+        if (position != 4 && !buffer_write_bytes(buffer, ", ", 2)) {
+            goto done;
+        }
+        if (!is_array &&
+                (!_write_json_string(buffer, name, (size_t)(name_end - name),
+                                     options) ||
+                 !buffer_write_bytes(buffer, ": ", 2))) {
+            goto done;
+        }
+        new_position = _write_json_value(
+            self, buffer, string, position,
+            (unsigned)(name_end - string) + 1, max, type, options, json);
         if (new_position < 0) {
-            Py_DECREF(dict);
-            return NULL;
-        } else {
-            position = (unsigned)new_position;
+            goto done;
         }
-
-        PyObject_SetItem(dict, name, value);
-        Py_DECREF(name);
-        Py_DECREF(value);
+        position = (unsigned)new_position;
     }
-    return dict;
-}
-
-static PyObject* elements_to_dict(PyObject* self, const char* string,
-                                  unsigned max,
-                                  const codec_options_t* options) {
-    PyObject* result;
-    if (Py_EnterRecursiveCall(" while decoding a BSON document"))
-        return NULL;
-    result = _elements_to_dict(self, string, max, options);
+    if (position != max) {
+        _invalid_bson("bad object or element length");
+        goto done;
+    }
+    result = buffer_write_bytes(buffer, is_array ? "]" : "}", 1);
+done:
     Py_LeaveRecursiveCall();
     return result;
 }
 
-static PyObject* _cbson_bson_to_dict(PyObject* self, PyObject* args) {
-    int32_t size;
-    Py_ssize_t total_size;
-    const char* string;
+static PyObject* _cbson_bson_to_json(PyObject* self, PyObject* args) {
+    struct module_state *state = GETSTATE(self);
     PyObject* bson;
+    PyObject* result = NULL;
     codec_options_t options;
-    PyObject* result;
-    PyObject* options_obj;
+    json_options_t json;
+    buffer_t buffer = NULL;
+    const char* string;
+    Py_ssize_t total_size;
+    int32_t size;
+    long strict_number_long;
 
-    if (! (PyArg_ParseTuple(args, "OO", &bson, &options_obj) &&
-            convert_codec_options(options_obj, &options))) {
+    if (!PyArg_ParseTuple(args, "OO&O", &bson, convert_codec_options,
+                          &options, &json.json_options)) {
         return NULL;
     }
+    json.value_to_json = NULL;
 
 #if PY_MAJOR_VERSION >= 3
     if (!PyBytes_Check(bson)) {
-        PyErr_SetString(PyExc_TypeError, "argument to _bson_to_dict must be a bytes object");
+        PyErr_SetString(PyExc_TypeError, "argument to _bson_to_json must be a bytes object");
 #else
     if (!PyString_Check(bson)) {
-        PyErr_SetString(PyExc_TypeError, "argument to _bson_to_dict must be a string");
+        PyErr_SetString(PyExc_TypeError, "argument to _bson_to_json must be a string");
 #endif
-        destroy_codec_options(&options);
-        return NULL;
+        goto done;
     }
-#if PY_MAJOR_VERSION >= 3
-    total_size = PyBytes_Size(bson);
-#else
-    total_size = PyString_Size(bson);
-#endif
-    if (total_size < BSON_MIN_SIZE) {
-        PyObject* InvalidBSON = _error("InvalidBSON");
-        if (InvalidBSON) {
-            PyErr_SetString(InvalidBSON,
-                            "not enough data for a BSON document");
-            Py_DECREF(InvalidBSON);
-        }
-        destroy_codec_options(&options);
-        return NULL;
+    if (!_read_long_attribute(json.json_options, "json_mode",
+                              &json.json_mode) ||
+            !_read_long_attribute(json.json_options,
+                                  "datetime_representation",
+                                  &json.datetime_representation) ||
+            !_read_long_attribute(json.json_options, "strict_number_long",
+                                  &strict_number_long)) {
+        goto done;
     }
+    json.strict_number_long = strict_number_long != 0;
+    json.utc = (!options.tz_aware || options.tzinfo == Py_None ||
+                options.tzinfo == state->UTC);
 
-#if PY_MAJOR_VERSION >= 3
-    string = PyBytes_AsString(bson);
-#else
-    string = PyString_AsString(bson);
-#endif
-    if (!string) {
-        destroy_codec_options(&options);
-        return NULL;
+    string = PyBytes_AS_STRING(bson);
+    total_size = PyBytes_GET_SIZE(bson);
+    if (total_size < BSON_MIN_SIZE) {
+        _invalid_bson("not enough data for a BSON document");
+        goto done;
     }
-
     memcpy(&size, string, 4);
     size = (int32_t)BSON_UINT32_FROM_LE(size);
-    if (size < BSON_MIN_SIZE) {
-        PyObject* InvalidBSON = _error("InvalidBSON");
-        if (InvalidBSON) {
-            PyErr_SetString(InvalidBSON, "invalid message size");
-            Py_DECREF(InvalidBSON);
-        }
-        destroy_codec_options(&options);
-        return NULL;
+    if (size < BSON_MIN_SIZE || total_size != size) {
+        _invalid_bson("invalid object size");
+        goto done;
     }
-
-    if (total_size < size || total_size > BSON_MAX_SIZE) {
-        PyObject* InvalidBSON = _error("InvalidBSON");
-        if (InvalidBSON) {
-            PyErr_SetString(InvalidBSON, "objsize too large");
-            Py_DECREF(InvalidBSON);
-        }
-        destroy_codec_options(&options);
-        return NULL;
+    if (string[size - 1]) {
+        _invalid_bson("bad eoo");
+        goto done;
     }
 
-    if (size != total_size || string[size - 1]) {
-        PyObject* InvalidBSON = _error("InvalidBSON");
-        if (InvalidBSON) {
-            PyErr_SetString(InvalidBSON, "bad eoo");
-            Py_DECREF(InvalidBSON);
-        }
-        destroy_codec_options(&options);
-        return NULL;
+    buffer = buffer_new();
+    if (!buffer) {
+        PyErr_NoMemory();
+        goto done;
     }
-
-    /* No need to decode fields if using RawBSONDocument */
-    if (options.is_raw_bson) {
-        return PyObject_CallFunction(
-            options.document_class, BYTES_FORMAT_STRING "O", string, size,
-            options_obj);
+    if (_write_json_document(self, buffer, string, (unsigned)size, &options,
+                             &json, 0)) {
+#if PY_MAJOR_VERSION >= 3
+        result = PyUnicode_DecodeASCII(buffer_get_buffer(buffer),
+                                       buffer_get_position(buffer), NULL);
+#else
+        result = PyString_FromStringAndSize(buffer_get_buffer(buffer),
+                                            buffer_get_position(buffer));
+#endif
     }
-
-    result = elements_to_dict(self, string + 4, (unsigned)size - 5, &options);
+done:
+    if (buffer) {
+        buffer_free(buffer);
+    }
+    Py_XDECREF(json.value_to_json);
     destroy_codec_options(&options);
     return result;
 }
 
-static PyObject* _cbson_decode_all(PyObject* self, PyObject* args) {
-    int32_t size;
-    Py_ssize_t total_size;
-    const char* string;
-    PyObject* bson;
-    PyObject* dict;
+/* Generate ObjectIds of class 'object_id_class' that share the 9 byte
+ * 'prefix' (the time and the process's random value), taking one value of
+ * the itertools.count 'counter' for each. The GIL is held throughout, so
+ * the counter values are reserved as one contiguous run. */
+static PyObject* _cbson_generate_object_ids(PyObject* self, PyObject* args) {
+    PyObject* object_id_class;
+    PyObject* counter;
+    PyObject* prefix;
     PyObject* result;
-    codec_options_t options;
-    PyObject* options_obj;
+    Py_ssize_t count;
+    Py_ssize_t i;
+    char oid[12];
 
-    if (!PyArg_ParseTuple(args, "O|O", &bson, &options_obj)) {
-        return NULL;
-    }
-    if (PyTuple_GET_SIZE(args) < 2) {
-        if (!default_codec_options(GETSTATE(self), &options)) {
-            return NULL;
-        }
-    } else if (!convert_codec_options(options_obj, &options)) {
+    if (!PyArg_ParseTuple(args, "OnOO", &object_id_class, &count, &counter,
+                          &prefix)) {
         return NULL;
     }
-
-#if PY_MAJOR_VERSION >= 3
-    if (!PyBytes_Check(bson)) {
-        PyErr_SetString(PyExc_TypeError, "argument to decode_all must be a bytes object");
-#else
-    if (!PyString_Check(bson)) {
-        PyErr_SetString(PyExc_TypeError, "argument to decode_all must be a string");
-#endif
-        destroy_codec_options(&options);
+    if (!PyBytes_Check(prefix) || PyBytes_GET_SIZE(prefix) != 9) {
+        PyErr_SetString(PyExc_ValueError, "prefix must be 9 bytes");
         return NULL;
     }
-#if PY_MAJOR_VERSION >= 3
-    total_size = PyBytes_Size(bson);
-    string = PyBytes_AsString(bson);
-#else
-    total_size = PyString_Size(bson);
-    string = PyString_AsString(bson);
-#endif
-    if (!string) {
-        destroy_codec_options(&options);
+    if (count < 0) {
+        PyErr_SetString(PyExc_ValueError,
+                        "count must be a non-negative integer");
         return NULL;
     }
+    memcpy(oid, PyBytes_AS_STRING(prefix), 9);
 
-    if (!(result = PyList_New(0))) {
-        destroy_codec_options(&options);
+    result = PyList_New(count);
+    if (!result) {
         return NULL;
     }
-
-    while (total_size > 0) {
-        if (total_size < BSON_MIN_SIZE) {
-            PyObject* InvalidBSON = _error("InvalidBSON");
-            if (InvalidBSON) {
-                PyErr_SetString(InvalidBSON,
-                                "not enough data for a BSON document");
-                Py_DECREF(InvalidBSON);
-            }
-            destroy_codec_options(&options);
-            Py_DECREF(result);
-            return NULL;
-        }
-
-        memcpy(&size, string, 4);
-        size = (int32_t)BSON_UINT32_FROM_LE(size);
-        if (size < BSON_MIN_SIZE) {
-            PyObject* InvalidBSON = _error("InvalidBSON");
-            if (InvalidBSON) {
-                PyErr_SetString(InvalidBSON, "invalid message size");
-                Py_DECREF(InvalidBSON);
-            }
-            destroy_codec_options(&options);
-            Py_DECREF(result);
-            return NULL;
-        }
-
-        if (total_size < size) {
-            PyObject* InvalidBSON = _error("InvalidBSON");
-            if (InvalidBSON) {
-                PyErr_SetString(InvalidBSON, "objsize too large");
-                Py_DECREF(InvalidBSON);
+    for (i = 0; i < count; i++) {
+        PyObject* next = PyIter_Next(counter);
+        PyObject* binary;
+        PyObject* object_id;
+        unsigned long inc;
+        if (!next) {
+            if (!PyErr_Occurred()) {
+                PyErr_SetString(PyExc_RuntimeError,
+                                "ObjectId counter is exhausted");
             }
-            destroy_codec_options(&options);
             Py_DECREF(result);
             return NULL;
         }
-
-        if (string[size - 1]) {
-            PyObject* InvalidBSON = _error("InvalidBSON");
-            if (InvalidBSON) {
-                PyErr_SetString(InvalidBSON, "bad eoo");
-                Py_DECREF(InvalidBSON);
-            }
-            destroy_codec_options(&options);
+        /* Only the low 24 bits are used, so ignore overflow. */
+#if PY_MAJOR_VERSION >= 3
+        inc = PyLong_AsUnsignedLongMask(next);
+#else
+        inc = PyInt_AsUnsignedLongMask(next);
+#endif
+        Py_DECREF(next);
+        if (inc == (unsigned long)-1 && PyErr_Occurred()) {
             Py_DECREF(result);
             return NULL;
         }
-
-        /* No need to decode fields if using RawBSONDocument. */
-        if (options.is_raw_bson) {
-            dict = PyObject_CallFunction(
-                options.document_class, BYTES_FORMAT_STRING "O", string, size,
-                options_obj);
-        } else {
-            dict = elements_to_dict(self, string + 4, (unsigned)size - 5, &options);
-        }
-        if (!dict) {
+        oid[9] = (char)((inc >> 16) & 0xff);
+        oid[10] = (char)((inc >> 8) & 0xff);
+        oid[11] = (char)(inc & 0xff);
+        binary = PyBytes_FromStringAndSize(oid, 12);
+        if (!binary) {
             Py_DECREF(result);
-            destroy_codec_options(&options);
             return NULL;
         }
-        if (PyList_Append(result, dict) < 0) {
-            Py_DECREF(dict);
+        object_id = PyObject_CallFunctionObjArgs(object_id_class, binary,
+                                                 NULL);
+        Py_DECREF(binary);
+        if (!object_id) {
             Py_DECREF(result);
-            destroy_codec_options(&options);
             return NULL;
         }
-        Py_DECREF(dict);
-        string += size;
-        total_size -= size;
+        PyList_SET_ITEM(result, i, object_id);
     }
-
-    destroy_codec_options(&options);
     return result;
 }
 
 static PyMethodDef _CBSONMethods[] = {
     {"_dict_to_bson", _cbson_dict_to_bson, METH_VARARGS,
      "convert a dictionary to a string containing its BSON representation."},
+    {"_encode_into", _cbson_encode_into, METH_VARARGS,
+     "encode a dictionary into a writable buffer at the given offset."},
+    {"_calculate_size", _cbson_calculate_size, METH_VARARGS,
+     "calculate the size of a dictionary encoded to BSON."},
     {"_bson_to_dict", _cbson_bson_to_dict, METH_VARARGS,
      "convert a BSON string to a SON object."},
     {"decode_all", _cbson_decode_all, METH_VARARGS,
      "convert binary data to a sequence of documents."},
     {"_element_to_dict", _cbson_element_to_dict, METH_VARARGS,
      "Decode a single key, value pair."},
+    {"_element_offsets", _cbson_element_offsets, METH_VARARGS,
+     "Map the name of each element of a document to its position."},
+    {"_decode_columns", _cbson_decode_columns, METH_VARARGS,
+     "decode BSON documents into one array of values per field."},
+    {"_bson_to_json", _cbson_bson_to_json, METH_VARARGS,
+     "convert a BSON string to its Extended JSON representation."},
+    {"_generate_object_ids", _cbson_generate_object_ids, METH_VARARGS,
+     "generate a list of new ObjectIds."},
     {NULL, NULL, 0, NULL}
 };
 
@@ -3052,6 +6008,8 @@ static int _cbson_traverse(PyObject *m, visitproc visit, void *arg) {
     Py_VISIT(GETSTATE(m)->MaxKey);
     Py_VISIT(GETSTATE(m)->UTC);
     Py_VISIT(GETSTATE(m)->REType);
+    Py_VISIT(GETSTATE(m)->Array);
+    Py_VISIT(GETSTATE(m)->DatetimeMS);
     return 0;
 }
 
@@ -3067,6 +6025,8 @@ static int _cbson_clear(PyObject *m) {
     Py_CLEAR(GETSTATE(m)->MaxKey);
     Py_CLEAR(GETSTATE(m)->UTC);
     Py_CLEAR(GETSTATE(m)->REType);
+    Py_CLEAR(GETSTATE(m)->Array);
+    Py_CLEAR(GETSTATE(m)->DatetimeMS);
     return 0;
 }
 
@@ -55,6 +55,7 @@ typedef struct type_registry_t {
     PyObject* encoder_map;
     PyObject* decoder_map;
     PyObject* fallback_encoder;
+    PyObject* fallback_types;
     PyObject* registry_obj;
     unsigned char is_encoder_empty;
     unsigned char is_decoder_empty;
@@ -70,6 +71,19 @@ typedef struct codec_options_t {
     type_registry_t type_registry;
     PyObject* options_obj;
     unsigned char is_raw_bson;
+    unsigned char typed_arrays;
+    unsigned char validate;
+    unsigned char datetime_conversion;
+    /* The fields of a bson.record.RecordType document_class, NULL for other
+     * document classes. document_class is then dict, for embedded
+     * documents. */
+    PyObject* record_class;
+    PyObject* record_fields;
+    PyObject* record_keys;
+    PyObject* record_defaults;
+    unsigned char record_is_tuple;
+    /* Decoded keys, reused while decoding a batch. NULL when not decoding. */
+    struct key_cache* key_cache;
 } codec_options_t;
 
 /* C API functions */
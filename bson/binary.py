@@ -12,6 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import array
+import sys
+
 from uuid import UUID
 
 from bson.py3compat import PY3
@@ -112,6 +115,33 @@ MD5_SUBTYPE = 5
 """BSON binary subtype for an MD5 hash.
 """
 
+VECTOR_SUBTYPE = 9
+"""BSON binary subtype for a packed array of numbers.
+
+The data starts with a byte for the type of the numbers
+(:data:`PACKED_INT8` or :data:`PACKED_FLOAT32`) and a padding byte, which is
+always 0, followed by the numbers in little endian byte order.
+:class:`PackedArray` instances are encoded with this subtype.
+
+.. versionadded:: 3.9
+"""
+
+PACKED_INT8 = 0x03
+"""The type byte of a :data:`VECTOR_SUBTYPE` array of 8-bit integers.
+
+.. versionadded:: 3.9
+"""
+
+PACKED_FLOAT32 = 0x27
+"""The type byte of a :data:`VECTOR_SUBTYPE` array of 32-bit floats.
+
+.. versionadded:: 3.9
+"""
+
+# The type byte of packed arrays for each array typecode, and back.
+_PACKED_TYPES = {"b": PACKED_INT8, "f": PACKED_FLOAT32}
+_PACKED_TYPECODES = dict((v, k) for k, v in _PACKED_TYPES.items())
+
 USER_DEFINED_SUBTYPE = 128
 """BSON binary subtype for any user defined structure.
 """
@@ -241,3 +271,93 @@ class UUIDLegacy(Binary):
 
     def __repr__(self):
         return "UUIDLegacy('%s')" % self.__uuid
+
+
+class PackedArray(object):
+    """A buffer of numbers to store as BSON binary :data:`VECTOR_SUBTYPE`.
+
+    `data` can be an :class:`array.array`, a :class:`memoryview`, a NumPy
+    ndarray or any other one dimensional object supporting the buffer
+    protocol, of 8-bit integers (typecode ``'b'``) or 32-bit floats
+    (typecode ``'f'``). The numbers are not copied: they are encoded
+    straight from `data`, so `data` must not be changed until the
+    :class:`PackedArray` has been encoded. On big endian platforms, and for
+    data that is not contiguous, a little endian copy is made instead.
+
+      >>> import array
+      >>> from bson import BSON
+      >>> from bson.binary import PackedArray
+      >>> from bson.codec_options import CodecOptions
+      >>> data = BSON.encode({'v': PackedArray(array.array('f', [0.5, 2]))})
+      >>> BSON(data).decode(CodecOptions(typed_arrays=True))['v'].tolist()
+      [0.5, 2.0]
+
+    Raises TypeError if `data` is not a buffer of 8-bit integers or 32-bit
+    floats.
+
+    :Parameters:
+      - `data`: the numbers to store
+
+    .. versionadded:: 3.9
+    """
+
+    __slots__ = ('__data', '__typecode', '__length')
+
+    _type_marker = 102
+
+    def __init__(self, data):
+        if not PY3 and isinstance(data, array.array):
+            # Python 2's array.array does not support the buffer protocol.
+            typecode = data.typecode
+            contiguous = False
+        else:
+            try:
+                view = memoryview(data)
+            except TypeError:
+                raise TypeError("data must support the buffer protocol")
+            if view.ndim != 1:
+                raise TypeError("data must be one dimensional")
+            typecode = view.format.lstrip("@")
+            # Python 2's memoryview has no c_contiguous.
+            contiguous = getattr(view, "c_contiguous", False)
+        if typecode not in _PACKED_TYPES:
+            raise TypeError("data must contain 8-bit integers ('b') or "
+                            "32-bit floats ('f'), not %r" % (typecode,))
+        if contiguous and sys.byteorder == "little":
+            self.__data = view
+        else:
+            copy = array.array(typecode, data)
+            if sys.byteorder == "big":
+                copy.byteswap()
+            self.__data = memoryview(copy if PY3 else copy.tostring())
+        self.__typecode = typecode
+        self.__length = len(data)
+
+    @property
+    def typecode(self):
+        """The array typecode of the numbers, ``'b'`` or ``'f'``."""
+        return self.__typecode
+
+    @property
+    def data(self):
+        """A :class:`memoryview` of the numbers, in little endian byte order.
+        """
+        return self.__data
+
+    def __len__(self):
+        return self.__length
+
+    def __eq__(self, other):
+        if isinstance(other, PackedArray):
+            return ((self.__typecode, self.__data.tobytes()) ==
+                    (other.typecode, other.data.tobytes()))
+        return NotImplemented
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        values = array.array(self.__typecode, self.__data.tobytes())
+        if sys.byteorder == "big":
+            values.byteswap()
+        return "PackedArray(%r)" % (values,)
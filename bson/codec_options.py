@@ -23,10 +23,19 @@ from bson.py3compat import ABC, abc, abstractproperty, string_type
 from bson.binary import (ALL_UUID_REPRESENTATIONS,
                          PYTHON_LEGACY,
                          UUID_REPRESENTATION_NAMES)
+from bson.datetime_ms import (ALL_DATETIME_CONVERSIONS,
+                              DATETIME_CONVERSION_NAMES,
+                              DatetimeConversion)
+from bson.record import RecordType
 
 
 _RAW_BSON_DOCUMENT_MARKER = 101
 
+# The most types a TypeRegistry's encoder caches hold before they are
+# cleared, so types created at runtime are not kept alive forever. The C
+# extension has its own copy, MAX_CACHED_TYPES.
+_MAX_CACHED_TYPES = 256
+
 
 def _raw_document_class(document_class):
     """Determine if a document_class is a RawBSONDocument class."""
@@ -34,6 +43,22 @@ def _raw_document_class(document_class):
     return marker == _RAW_BSON_DOCUMENT_MARKER
 
 
+def _record_type(document_class):
+    """Determine if a document_class is a RecordType."""
+    return isinstance(document_class, RecordType)
+
+
+def _without_record_type(codec_options):
+    """Decode documents to dict instead of a RecordType.
+
+    For the internal cursors whose documents come from the server rather
+    than from the user's collection.
+    """
+    if _record_type(codec_options.document_class):
+        return codec_options.with_options(document_class=dict)
+    return codec_options
+
+
 class TypeEncoder(ABC):
     """Base class for defining type codec classes which describe how a
     custom type can be transformed to one of the types BSON understands.
@@ -109,6 +134,12 @@ class TypeRegistry(object):
         self._fallback_encoder = fallback_encoder
         self._encoder_map = {}
         self._decoder_map = {}
+        # How values of each python type are encoded with this registry,
+        # resolved by the bson module the first time a type is encoded.
+        self._encoder_cache = {}
+        # Types the C extension found it can only encode with the fallback
+        # encoder.
+        self._fallback_types = {}
 
         if self._fallback_encoder is not None:
             if not callable(fallback_encoder):
@@ -145,7 +176,8 @@ class TypeRegistry(object):
 _options_base = namedtuple(
     'CodecOptions',
     ('document_class', 'tz_aware', 'uuid_representation',
-     'unicode_decode_error_handler', 'tzinfo', 'type_registry'))
+     'unicode_decode_error_handler', 'tzinfo', 'type_registry',
+     'typed_arrays', 'validate', 'datetime_conversion'))
 
 
 class CodecOptions(_options_base):
@@ -165,7 +197,9 @@ class CodecOptions(_options_base):
       '\\x16\\x00\\x00\\x00\\x07_id\\x00[0\\x165\\x91\\x10\\xea\\x14\\xe8\\xc5\\x8b\\x93\\x00'
 
     The document class can be any type that inherits from
-    :class:`~collections.MutableMapping`::
+    :class:`~collections.MutableMapping`, or a
+    :class:`~bson.record.RecordType` to decode documents directly to
+    namedtuples, dataclasses, or classes with ``__slots__``::
 
       >>> class AttributeDict(dict):
       ...     # A dict that supports attribute access.
@@ -189,7 +223,9 @@ class CodecOptions(_options_base):
     :Parameters:
       - `document_class`: BSON documents returned in queries will be decoded
         to an instance of this class. Must be a subclass of
-        :class:`~collections.MutableMapping`. Defaults to :class:`dict`.
+        :class:`~collections.MutableMapping`, or a
+        :class:`~bson.record.RecordType` to decode top-level documents to
+        records. Defaults to :class:`dict`.
       - `tz_aware`: If ``True``, BSON datetimes will be decoded to timezone
         aware instances of :class:`~datetime.datetime`. Otherwise they will be
         naive. Defaults to ``False``.
@@ -205,22 +241,52 @@ class CodecOptions(_options_base):
         encoded/decoded.
       - `type_registry`: Instance of :class:`TypeRegistry` used to customize
         encoding and decoding behavior.
+      - `typed_arrays`: If ``True``, BSON arrays whose values are all doubles,
+        all 32-bit integers or all 64-bit integers are decoded to an
+        :class:`array.array` instead of a :class:`list`, and packed arrays
+        (BSON binary subtype :data:`~bson.binary.VECTOR_SUBTYPE`) are decoded
+        to a :class:`memoryview` of their numbers instead of a
+        :class:`~bson.binary.Binary`. Defaults to ``False``.
+      - `validate`: If ``False``, trust that the BSON being decoded is well
+        formed, like the replies from the server read by a cursor. The C
+        extension's :func:`~bson.decode_all` then checks only the size of
+        each document up front, rather than every element of the batch, and
+        the pure Python decoder skips its checks of string terminators.
+        Malformed BSON may then raise a less descriptive :exc:`~bson.errors.InvalidBSON`
+        or, in pure Python, be decoded to wrong values. Strings are always
+        decoded as UTF-8 according to `unicode_decode_error_handler`.
+        Defaults to ``True``.
+      - `datetime_conversion`: How BSON datetimes are decoded, one of the
+        constants of :class:`~bson.datetime_ms.DatetimeConversion`.
+        :attr:`~bson.datetime_ms.DatetimeConversion.DATETIME_MS` and
+        :attr:`~bson.datetime_ms.DatetimeConversion.INT` skip the creation of
+        a :class:`~datetime.datetime` and can decode any BSON datetime.
+        Defaults to :attr:`~bson.datetime_ms.DatetimeConversion.DATETIME`.
 
     .. warning:: Care must be taken when changing
        `unicode_decode_error_handler` from its default value ('strict').
        The 'replace' and 'ignore' modes should not be used when documents
        retrieved from the server will be modified in the client application
        and stored back to the server.
+
+    .. versionchanged:: 3.9
+       Added the `typed_arrays`, `validate` and `datetime_conversion`
+       options. `document_class` can be a :class:`~bson.record.RecordType`.
     """
 
     def __new__(cls, document_class=dict,
                 tz_aware=False, uuid_representation=PYTHON_LEGACY,
                 unicode_decode_error_handler="strict",
-                tzinfo=None, type_registry=None):
-        if not (issubclass(document_class, abc.MutableMapping) or
+                tzinfo=None, type_registry=None, typed_arrays=False,
+                validate=True,
+                datetime_conversion=DatetimeConversion.DATETIME):
+        if not (_record_type(document_class) or
+                isinstance(document_class, type) and
+                issubclass(document_class, abc.MutableMapping) or
                 _raw_document_class(document_class)):
             raise TypeError("document_class must be dict, bson.son.SON, "
-                            "bson.raw_bson.RawBSONDocument, or a "
+                            "bson.raw_bson.RawBSONDocument, "
+                            "bson.record.RecordType, or a "
                             "sublass of collections.MutableMapping")
         if not isinstance(tz_aware, bool):
             raise TypeError("tz_aware must be True or False")
@@ -243,9 +309,20 @@ class CodecOptions(_options_base):
         if not isinstance(type_registry, TypeRegistry):
             raise TypeError("type_registry must be an instance of TypeRegistry")
 
+        if not isinstance(typed_arrays, bool):
+            raise TypeError("typed_arrays must be True or False")
+
+        if not isinstance(validate, bool):
+            raise TypeError("validate must be True or False")
+
+        if datetime_conversion not in ALL_DATETIME_CONVERSIONS:
+            raise ValueError("datetime_conversion must be a value from "
+                             "bson.datetime_ms.DatetimeConversion")
+
         return tuple.__new__(
             cls, (document_class, tz_aware, uuid_representation,
-                  unicode_decode_error_handler, tzinfo, type_registry))
+                  unicode_decode_error_handler, tzinfo, type_registry,
+                  typed_arrays, validate, datetime_conversion))
 
     def _arguments_repr(self):
         """Representation of the arguments used to create this object."""
@@ -258,10 +335,13 @@ class CodecOptions(_options_base):
 
         return ('document_class=%s, tz_aware=%r, uuid_representation=%s, '
                 'unicode_decode_error_handler=%r, tzinfo=%r, '
-                'type_registry=%r' %
+                'type_registry=%r, typed_arrays=%r, validate=%r, '
+                'datetime_conversion=%s' %
                 (document_class_repr, self.tz_aware, uuid_rep_repr,
                  self.unicode_decode_error_handler, self.tzinfo,
-                 self.type_registry))
+                 self.type_registry, self.typed_arrays, self.validate,
+                 DATETIME_CONVERSION_NAMES.get(self.datetime_conversion,
+                                               self.datetime_conversion)))
 
     def __repr__(self):
         return '%s(%s)' % (self.__class__.__name__, self._arguments_repr())
@@ -285,7 +365,10 @@ class CodecOptions(_options_base):
             kwargs.get('unicode_decode_error_handler',
                        self.unicode_decode_error_handler),
             kwargs.get('tzinfo', self.tzinfo),
-            kwargs.get('type_registry', self.type_registry)
+            kwargs.get('type_registry', self.type_registry),
+            kwargs.get('typed_arrays', self.typed_arrays),
+            kwargs.get('validate', self.validate),
+            kwargs.get('datetime_conversion', self.datetime_conversion)
         )
 
 
@@ -306,4 +389,9 @@ def _parse_codec_options(options):
             DEFAULT_CODEC_OPTIONS.unicode_decode_error_handler),
         tzinfo=options.get('tzinfo', DEFAULT_CODEC_OPTIONS.tzinfo),
         type_registry=options.get(
-            'type_registry', DEFAULT_CODEC_OPTIONS.type_registry))
+            'type_registry', DEFAULT_CODEC_OPTIONS.type_registry),
+        typed_arrays=options.get(
+            'typed_arrays', DEFAULT_CODEC_OPTIONS.typed_arrays),
+        validate=options.get('validate', DEFAULT_CODEC_OPTIONS.validate),
+        datetime_conversion=options.get(
+            'datetime_conversion', DEFAULT_CODEC_OPTIONS.datetime_conversion))
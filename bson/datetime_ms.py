@@ -0,0 +1,161 @@
+# Copyright 2019-present MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tools for decoding BSON datetimes to milliseconds since the Unix epoch.
+
+.. versionadded:: 3.9
+"""
+
+import datetime
+
+from bson.py3compat import integer_types
+
+
+class DatetimeConversion:
+    DATETIME = 1
+    """Decode BSON datetimes to :class:`datetime.datetime`, the default.
+
+    The `tz_aware` and `tzinfo` options of
+    :class:`~bson.codec_options.CodecOptions` apply. BSON datetimes outside
+    the range of :class:`datetime.datetime` cannot be decoded.
+
+    .. versionadded:: 3.9
+    """
+
+    DATETIME_MS = 2
+    """Decode BSON datetimes to :class:`DatetimeMS`.
+
+    .. versionadded:: 3.9
+    """
+
+    INT = 3
+    """Decode BSON datetimes to an :class:`int` of milliseconds since the
+    Unix epoch.
+
+    The decoded value is encoded back to BSON as an integer, not a datetime.
+    Use :class:`DatetimeMS` to encode it as a datetime.
+
+    .. versionadded:: 3.9
+    """
+
+
+ALL_DATETIME_CONVERSIONS = (DatetimeConversion.DATETIME,
+                            DatetimeConversion.DATETIME_MS,
+                            DatetimeConversion.INT)
+DATETIME_CONVERSION_NAMES = {
+    DatetimeConversion.DATETIME: 'DATETIME',
+    DatetimeConversion.DATETIME_MS: 'DATETIME_MS',
+    DatetimeConversion.INT: 'INT'}
+
+
+class DatetimeMS(object):
+    """A BSON datetime as milliseconds since the Unix epoch UTC.
+
+    Creating a :class:`DatetimeMS` is much cheaper than creating a
+    :class:`datetime.datetime`, and it can represent any BSON datetime,
+    including those outside the range of :class:`datetime.datetime`.
+    :class:`DatetimeMS` instances are encoded to BSON datetimes::
+
+      >>> from bson import BSON
+      >>> from bson.codec_options import CodecOptions
+      >>> from bson.datetime_ms import DatetimeConversion, DatetimeMS
+      >>> data = BSON.encode({'t': DatetimeMS(1560000000000)})
+      >>> conversion = DatetimeConversion.DATETIME_MS
+      >>> BSON(data).decode(CodecOptions(datetime_conversion=conversion))
+      {'t': DatetimeMS(1560000000000)}
+      >>> BSON(data).decode()['t']
+      datetime.datetime(2019, 6, 8, 13, 20)
+
+    Raises :class:`TypeError` if `value` is not an integer or a
+    :class:`datetime.datetime`, and :class:`OverflowError` if it does not fit
+    in a 64-bit signed integer.
+
+    :Parameters:
+      - `value`: milliseconds since the Unix epoch UTC, or a
+        :class:`datetime.datetime` to convert
+
+    .. versionadded:: 3.9
+    """
+
+    __slots__ = ('_value',)
+
+    _type_marker = 9
+
+    def __init__(self, value):
+        if isinstance(value, datetime.datetime):
+            from bson import _datetime_to_millis
+            value = _datetime_to_millis(value)
+        elif not isinstance(value, integer_types):
+            raise TypeError("value must be an integer or a datetime.datetime, "
+                            "not %s" % (type(value),))
+        if not -2 ** 63 <= value < 2 ** 63:
+            raise OverflowError("BSON datetimes are 8-byte ints")
+        self._value = int(value)
+
+    def as_datetime(self, codec_options=None):
+        """Convert to a :class:`datetime.datetime`.
+
+        Raises :class:`OverflowError` if this datetime is outside the range
+        of :class:`datetime.datetime`.
+
+        :Parameters:
+          - `codec_options` (optional): An instance of
+            :class:`~bson.codec_options.CodecOptions`. Its `tz_aware` and
+            `tzinfo` options apply.
+        """
+        from bson import _millis_to_datetime, DEFAULT_CODEC_OPTIONS
+        return _millis_to_datetime(self._value,
+                                   codec_options or DEFAULT_CODEC_OPTIONS)
+
+    def __int__(self):
+        return self._value
+
+    def __hash__(self):
+        return hash(self._value)
+
+    def __eq__(self, other):
+        if isinstance(other, DatetimeMS):
+            return self._value == other._value
+        return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, DatetimeMS):
+            return self._value != other._value
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, DatetimeMS):
+            return self._value < other._value
+        return NotImplemented
+
+    def __le__(self, other):
+        if isinstance(other, DatetimeMS):
+            return self._value <= other._value
+        return NotImplemented
+
+    def __gt__(self, other):
+        if isinstance(other, DatetimeMS):
+            return self._value > other._value
+        return NotImplemented
+
+    def __ge__(self, other):
+        if isinstance(other, DatetimeMS):
+            return self._value >= other._value
+        return NotImplemented
+
+    def __reduce__(self):
+        return DatetimeMS, (self._value,)
+
+    def __repr__(self):
+        return "DatetimeMS(%d)" % (self._value,)
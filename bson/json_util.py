@@ -116,23 +116,34 @@ import uuid
 from pymongo.errors import ConfigurationError
 
 import bson
-from bson import EPOCH_AWARE, EPOCH_NAIVE, RE_TYPE, SON
+from bson import EPOCH_AWARE, EPOCH_NAIVE, RE_TYPE, SON, _UNPACK_INT
 from bson.binary import (Binary, JAVA_LEGACY, CSHARP_LEGACY, OLD_UUID_SUBTYPE,
                          UUID_SUBTYPE)
 from bson.code import Code
 from bson.codec_options import CodecOptions
+from bson.datetime_ms import DatetimeConversion, DatetimeMS
 from bson.dbref import DBRef
 from bson.decimal128 import Decimal128
 from bson.int64 import Int64
 from bson.max_key import MaxKey
 from bson.min_key import MinKey
 from bson.objectid import ObjectId
-from bson.py3compat import (PY3, iteritems, integer_types, string_type,
+from bson.py3compat import (PY3, abc, iteritems, integer_types, string_type,
                             text_type)
+from bson.raw_bson import RawBSONDocument
 from bson.regex import Regex
 from bson.timestamp import Timestamp
 from bson.tz_util import utc
 
+try:
+    from bson import _cbson
+    _USE_C = True
+except ImportError:
+    _USE_C = False
+
+# Plain dicts keep their insertion order from Python 3.7.
+_DICT_IS_ORDERED = sys.version_info[:2] >= (3, 7)
+
 
 _RE_OPT_TABLE = {
     "i": re.I,
@@ -143,6 +154,9 @@ _RE_OPT_TABLE = {
     "x": re.X,
 }
 
+# datetime.datetime.max in milliseconds since the Unix epoch.
+_MAX_DATETIME_MILLIS = 253402300799999
+
 # Dollar-prefixed keys which may appear in DBRefs.
 _DBREF_KEYS = frozenset(['$id', '$ref', '$db'])
 
@@ -410,6 +424,161 @@ def loads(s, *args, **kwargs):
     return json.loads(s, *args, **kwargs)
 
 
+def loads_raw(s, json_options=DEFAULT_JSON_OPTIONS):
+    """Parse a MongoDB Extended JSON object straight to a
+    :class:`~bson.raw_bson.RawBSONDocument`.
+
+    The document is encoded to BSON once, as it is parsed, so it can be
+    inserted without being encoded again. Fields keep the order they have in
+    the JSON text.
+
+    Raises ``TypeError`` or ``ValueError`` on invalid MongoDB Extended JSON,
+    like :func:`loads`, and ``TypeError`` when `s` is not a JSON object.
+
+    :Parameters:
+      - `s`: A string or bytes containing one JSON object.
+      - `json_options`: A :class:`JSONOptions` instance used to modify the
+        decoding of MongoDB Extended JSON types. Defaults to
+        :const:`DEFAULT_JSON_OPTIONS`.
+
+    .. versionadded:: 3.9
+    """
+    return _raw_loader(json_options)(s)
+
+
+def loads_raw_iter(lines, json_options=DEFAULT_JSON_OPTIONS):
+    """Parse newline-delimited MongoDB Extended JSON as a generator of
+    :class:`~bson.raw_bson.RawBSONDocument`.
+
+    Blank lines are skipped. The documents can be passed to
+    :meth:`~pymongo.collection.Collection.insert_many`, which sends their
+    BSON as is::
+
+      >>> with open('fixtures.jsonl', 'rb') as jsonl:
+      ...     db.test.insert_many(loads_raw_iter(jsonl))
+
+    See :func:`loads_raw`.
+
+    :Parameters:
+      - `lines`: An iterable of strings or bytes, such as a file object,
+        each containing one JSON object.
+      - `json_options`: A :class:`JSONOptions` instance used to modify the
+        decoding of MongoDB Extended JSON types. Defaults to
+        :const:`DEFAULT_JSON_OPTIONS`.
+
+    .. versionadded:: 3.9
+    """
+    load = _raw_loader(json_options)
+    for line in lines:
+        if line.strip():
+            yield load(line)
+
+
+def _raw_loader(json_options):
+    """Return a function that parses one Extended JSON object to a
+    RawBSONDocument.
+    """
+    codec_options = json_options.with_options(document_class=RawBSONDocument)
+
+    if _DICT_IS_ORDERED:
+        decode = json.JSONDecoder(
+            object_hook=lambda dct: object_hook(dct, json_options)).decode
+    else:
+        decode = json.JSONDecoder(
+            object_pairs_hook=lambda pairs: object_hook(SON(pairs),
+                                                        json_options)).decode
+
+    def load(s):
+        if isinstance(s, bytes):
+            s = s.decode("utf-8")
+        doc = decode(s)
+        if isinstance(doc, DBRef):
+            doc = doc.as_doc()
+        if not isinstance(doc, abc.Mapping):
+            raise TypeError("expected a JSON object, not %s"
+                            % (type(doc).__name__,))
+        return RawBSONDocument(
+            bson._dict_to_bson(doc, False, codec_options, False),
+            codec_options)
+
+    return load
+
+
+def bson_to_json(data, json_options=DEFAULT_JSON_OPTIONS):
+    """Convert a BSON document to MongoDB Extended JSON.
+
+    Produces the same string as ``dumps(BSON(data).decode(...))`` without
+    creating a Python object for every value in the document when the C
+    extension is available. This is useful for exporting documents read
+    with :class:`~bson.raw_bson.RawBSONDocument`::
+
+      >>> coll = db.get_collection(
+      ...     'test', codec_options=CodecOptions(document_class=RawBSONDocument))
+      >>> for doc in coll.find():
+      ...     print(bson_to_json(doc, json_options=RELAXED_JSON_OPTIONS))
+
+    :Parameters:
+      - `data`: The BSON bytes of a document, or a
+        :class:`~bson.raw_bson.RawBSONDocument`.
+      - `json_options`: A :class:`JSONOptions` instance used to modify the
+        encoding of MongoDB Extended JSON types. Defaults to
+        :const:`DEFAULT_JSON_OPTIONS`.
+
+    .. versionadded:: 3.9
+    """
+    if isinstance(data, RawBSONDocument):
+        data = data.raw
+    return _bson_to_json(
+        data, _json_codec_options(json_options), json_options)
+
+
+def bson_to_json_iter(data, json_options=DEFAULT_JSON_OPTIONS):
+    """Convert concatenated BSON documents to MongoDB Extended JSON, as a
+    generator of strings.
+
+    See :func:`bson_to_json`.
+
+    :Parameters:
+      - `data`: The concatenated BSON bytes of the documents, like those of a
+        ``.bson`` file or a raw batch of a
+        :class:`~pymongo.cursor.RawBatchCursor`.
+      - `json_options`: A :class:`JSONOptions` instance used to modify the
+        encoding of MongoDB Extended JSON types. Defaults to
+        :const:`DEFAULT_JSON_OPTIONS`.
+
+    .. versionadded:: 3.9
+    """
+    codec_options = _json_codec_options(json_options)
+    position = 0
+    end = len(data) - 1
+    while position < end:
+        obj_size = _UNPACK_INT(data[position:position + 4])[0]
+        yield _bson_to_json(data[position:position + obj_size],
+                            codec_options, json_options)
+        position += obj_size
+
+
+def _json_codec_options(json_options):
+    """The CodecOptions to decode the values that are converted to JSON."""
+    return json_options.with_options(document_class=SON, type_registry=None)
+
+
+def _bson_to_json(data, codec_options, json_options):
+    """Convert the BSON document `data` to Extended JSON."""
+    return json.dumps(_json_convert(bson._bson_to_dict(data, codec_options),
+                                    json_options))
+if _USE_C:
+    _bson_to_json = _cbson._bson_to_json
+
+
+def _value_to_json(value, json_options):
+    """Convert a single decoded value to Extended JSON.
+
+    Used by the C extension for the types it does not convert itself.
+    """
+    return json.dumps(_json_convert(value, json_options))
+
+
 def _json_convert(obj, json_options=DEFAULT_JSON_OPTIONS):
     """Recursive helper method that converts BSON types so they can be
     converted into json.
@@ -430,50 +599,16 @@ def object_pairs_hook(pairs, json_options=DEFAULT_JSON_OPTIONS):
 
 
 def object_hook(dct, json_options=DEFAULT_JSON_OPTIONS):
-    if "$oid" in dct:
-        return _parse_canonical_oid(dct)
-    if "$ref" in dct:
-        return _parse_canonical_dbref(dct)
-    if "$date" in dct:
-        return _parse_canonical_datetime(dct, json_options)
-    if "$regex" in dct:
-        return _parse_legacy_regex(dct)
-    if "$minKey" in dct:
-        return _parse_canonical_minkey(dct)
-    if "$maxKey" in dct:
-        return _parse_canonical_maxkey(dct)
-    if "$binary" in dct:
-        if "$type" in dct:
-            return _parse_legacy_binary(dct, json_options)
-        else:
-            return _parse_canonical_binary(dct, json_options)
-    if "$code" in dct:
-        return _parse_canonical_code(dct)
-    if "$uuid" in dct:
-        return _parse_legacy_uuid(dct)
-    if "$undefined" in dct:
-        return None
-    if "$numberLong" in dct:
-        return _parse_canonical_int64(dct)
-    if "$timestamp" in dct:
-        tsp = dct["$timestamp"]
-        return Timestamp(tsp["t"], tsp["i"])
-    if "$numberDecimal" in dct:
-        return _parse_canonical_decimal128(dct)
-    if "$dbPointer" in dct:
-        return _parse_canonical_dbpointer(dct)
-    if "$regularExpression" in dct:
-        return _parse_canonical_regex(dct)
-    if "$symbol" in dct:
-        return _parse_canonical_symbol(dct)
-    if "$numberInt" in dct:
-        return _parse_canonical_int32(dct)
-    if "$numberDouble" in dct:
-        return _parse_canonical_double(dct)
-    return dct
-
-
-def _parse_legacy_regex(doc):
+    if _PARSER_KEYS.isdisjoint(dct):
+        return dct
+    keys = _PARSER_KEYS.intersection(dct)
+    if len(keys) > 1:
+        # The first key in priority order, not in dct's order, decides.
+        keys = [key for key in _PARSERS if key in keys]
+    return _PARSERS[next(iter(keys))](dct, json_options)
+
+
+def _parse_legacy_regex(doc, dummy0):
     pattern = doc["$regex"]
     # Check if this is the $regex query operator.
     if isinstance(pattern, Regex):
@@ -485,7 +620,7 @@ def _parse_legacy_regex(doc):
     return Regex(pattern, flags)
 
 
-def _parse_legacy_uuid(doc):
+def _parse_legacy_uuid(doc, dummy0):
     """Decode a JSON legacy $uuid to Python UUID."""
     if len(doc) != 1:
         raise TypeError('Bad $uuid, extra field(s): %s' % (doc,))
@@ -584,23 +719,27 @@ def _parse_canonical_datetime(doc, json_options):
                 secs *= -1
             aware = aware - datetime.timedelta(seconds=secs)
 
+        if (json_options.datetime_conversion !=
+                DatetimeConversion.DATETIME):
+            return bson._millis_to_date(bson._datetime_to_millis(aware),
+                                        json_options)
         if json_options.tz_aware:
             if json_options.tzinfo:
                 aware = aware.astimezone(json_options.tzinfo)
             return aware
         else:
             return aware.replace(tzinfo=None)
-    return bson._millis_to_datetime(int(dtm), json_options)
+    return bson._millis_to_date(int(dtm), json_options)
 
 
-def _parse_canonical_oid(doc):
+def _parse_canonical_oid(doc, dummy0):
     """Decode a JSON ObjectId to bson.objectid.ObjectId."""
     if len(doc) != 1:
         raise TypeError('Bad $oid, extra field(s): %s' % (doc,))
     return ObjectId(doc['$oid'])
 
 
-def _parse_canonical_symbol(doc):
+def _parse_canonical_symbol(doc, dummy0):
     """Decode a JSON symbol to Python string."""
     symbol = doc['$symbol']
     if len(doc) != 1:
@@ -608,7 +747,7 @@ def _parse_canonical_symbol(doc):
     return text_type(symbol)
 
 
-def _parse_canonical_code(doc):
+def _parse_canonical_code(doc, dummy0):
     """Decode a JSON code to bson.code.Code."""
     for key in doc:
         if key not in ('$code', '$scope'):
@@ -616,7 +755,7 @@ def _parse_canonical_code(doc):
     return Code(doc['$code'], scope=doc.get('$scope'))
 
 
-def _parse_canonical_regex(doc):
+def _parse_canonical_regex(doc, dummy0):
     """Decode a JSON regex to bson.regex.Regex."""
     regex = doc['$regularExpression']
     if len(doc) != 1:
@@ -627,7 +766,7 @@ def _parse_canonical_regex(doc):
     return Regex(regex['pattern'], regex['options'])
 
 
-def _parse_canonical_dbref(doc):
+def _parse_canonical_dbref(doc, dummy0):
     """Decode a JSON DBRef to bson.dbref.DBRef."""
     for key in doc:
         if key.startswith('$') and key not in _DBREF_KEYS:
@@ -637,7 +776,7 @@ def _parse_canonical_dbref(doc):
                  database=doc.pop('$db', None), **doc)
 
 
-def _parse_canonical_dbpointer(doc):
+def _parse_canonical_dbpointer(doc, dummy0):
     """Decode a JSON (deprecated) DBPointer to bson.dbref.DBRef."""
     dbref = doc['$dbPointer']
     if len(doc) != 1:
@@ -659,7 +798,7 @@ def _parse_canonical_dbpointer(doc):
         raise TypeError('Bad $dbPointer, expected a DBRef: %s' % (doc,))
 
 
-def _parse_canonical_int32(doc):
+def _parse_canonical_int32(doc, dummy0):
     """Decode a JSON int32 to python int."""
     i_str = doc['$numberInt']
     if len(doc) != 1:
@@ -669,7 +808,7 @@ def _parse_canonical_int32(doc):
     return int(i_str)
 
 
-def _parse_canonical_int64(doc):
+def _parse_canonical_int64(doc, dummy0):
     """Decode a JSON int64 to bson.int64.Int64."""
     l_str = doc['$numberLong']
     if len(doc) != 1:
@@ -677,7 +816,7 @@ def _parse_canonical_int64(doc):
     return Int64(l_str)
 
 
-def _parse_canonical_double(doc):
+def _parse_canonical_double(doc, dummy0):
     """Decode a JSON double to python float."""
     d_str = doc['$numberDouble']
     if len(doc) != 1:
@@ -687,7 +826,7 @@ def _parse_canonical_double(doc):
     return float(d_str)
 
 
-def _parse_canonical_decimal128(doc):
+def _parse_canonical_decimal128(doc, dummy0):
     """Decode a JSON decimal128 to bson.decimal128.Decimal128."""
     d_str = doc['$numberDecimal']
     if len(doc) != 1:
@@ -697,7 +836,7 @@ def _parse_canonical_decimal128(doc):
     return Decimal128(d_str)
 
 
-def _parse_canonical_minkey(doc):
+def _parse_canonical_minkey(doc, dummy0):
     """Decode a JSON MinKey to bson.min_key.MinKey."""
     if doc['$minKey'] is not 1:
         raise TypeError('$minKey value must be 1: %s' % (doc,))
@@ -706,7 +845,7 @@ def _parse_canonical_minkey(doc):
     return MinKey()
 
 
-def _parse_canonical_maxkey(doc):
+def _parse_canonical_maxkey(doc, dummy0):
     """Decode a JSON MaxKey to bson.max_key.MaxKey."""
     if doc['$maxKey'] is not 1:
         raise TypeError('$maxKey value must be 1: %s', (doc,))
@@ -715,6 +854,49 @@ def _parse_canonical_maxkey(doc):
     return MaxKey()
 
 
+def _parse_binary(doc, json_options):
+    """Decode a JSON binary in the legacy or canonical format."""
+    if "$type" in doc:
+        return _parse_legacy_binary(doc, json_options)
+    return _parse_canonical_binary(doc, json_options)
+
+
+def _parse_canonical_timestamp(doc, dummy0):
+    """Decode a JSON timestamp to bson.timestamp.Timestamp."""
+    tsp = doc["$timestamp"]
+    return Timestamp(tsp["t"], tsp["i"])
+
+
+def _parse_undefined(dummy0, dummy1):
+    """Decode a JSON undefined to None."""
+    return None
+
+
+# Map each key that marks a JSON object as an Extended JSON type to the
+# function that decodes it, in the order the keys are checked.
+_PARSERS = SON([
+    ("$oid", _parse_canonical_oid),
+    ("$ref", _parse_canonical_dbref),
+    ("$date", _parse_canonical_datetime),
+    ("$regex", _parse_legacy_regex),
+    ("$minKey", _parse_canonical_minkey),
+    ("$maxKey", _parse_canonical_maxkey),
+    ("$binary", _parse_binary),
+    ("$code", _parse_canonical_code),
+    ("$uuid", _parse_legacy_uuid),
+    ("$undefined", _parse_undefined),
+    ("$numberLong", _parse_canonical_int64),
+    ("$timestamp", _parse_canonical_timestamp),
+    ("$numberDecimal", _parse_canonical_decimal128),
+    ("$dbPointer", _parse_canonical_dbpointer),
+    ("$regularExpression", _parse_canonical_regex),
+    ("$symbol", _parse_canonical_symbol),
+    ("$numberInt", _parse_canonical_int32),
+    ("$numberDouble", _parse_canonical_double),
+])
+_PARSER_KEYS = frozenset(_PARSERS)
+
+
 def _encode_binary(data, subtype, json_options):
     if json_options.json_mode == JSONMode.LEGACY:
         return SON([
@@ -753,6 +935,16 @@ def default(obj, json_options=DEFAULT_JSON_OPTIONS):
                 DatetimeRepresentation.LEGACY):
             return {"$date": millis}
         return {"$date": {"$numberLong": str(millis)}}
+    if isinstance(obj, DatetimeMS):
+        millis = int(obj)
+        if (json_options.datetime_representation ==
+                DatetimeRepresentation.ISO8601 and
+                0 <= millis <= _MAX_DATETIME_MILLIS):
+            return default(obj.as_datetime(), json_options)
+        if (json_options.datetime_representation ==
+                DatetimeRepresentation.LEGACY):
+            return {"$date": millis}
+        return {"$date": {"$numberLong": str(millis)}}
     if json_options.strict_number_long and isinstance(obj, Int64):
         return {"$numberLong": str(obj)}
     if isinstance(obj, (RE_TYPE, Regex)):
@@ -0,0 +1,332 @@
+# Copyright 2019-present MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Random access to files of concatenated BSON documents.
+
+The files written by ``mongodump``, or by writing the output of
+:func:`bson.BSON.encode` one document after the other, can be opened with
+:class:`MappedBSONFile`. The file is memory mapped and its documents are
+returned as :class:`~bson.raw_bson.RawBSONDocument` instances backed by the
+mapping, so no bytes are copied until a document is decoded::
+
+  >>> from bson.mmap_file import MappedBSONFile
+  >>> with MappedBSONFile("coll.bson") as dump:
+  ...     print(len(dump))
+  ...     print(dump[-1]["_id"])
+  ...
+  3
+  5c8a4c1e2e0d3a9c1a4a6b2f
+
+.. versionadded:: 3.9
+"""
+
+import array
+import mmap
+import os
+import struct
+
+from bson import _array_typecode
+from bson.errors import InvalidBSON
+from bson.py3compat import integer_types, PY3
+from bson.raw_bson import DEFAULT_RAW_BSON_OPTIONS, RawBSONDocument
+
+
+_UNPACK_INT_FROM = struct.Struct("<i").unpack_from
+
+# Header of a persisted index: magic, size, modification time in
+# nanoseconds and inode of the indexed data file, and number of offsets that
+# follow.
+_INDEX_MAGIC = b"BSONIDX2"
+_INDEX_HEADER = struct.Struct("<8sqqQq")
+_BIG_ENDIAN = struct.pack("=i", 1) != struct.pack("<i", 1)
+
+
+def _offsets_array():
+    """Return an empty array of 64-bit signed integers."""
+    typecode = _array_typecode(8)
+    if typecode is None:
+        raise RuntimeError("no 64-bit array type available")
+    return array.array(typecode)
+
+
+def _file_identity(stat):
+    """Return the size, modification time in nanoseconds and inode of a
+    stat result, which identify the version of a file an index was built
+    for.
+    """
+    mtime_ns = getattr(stat, "st_mtime_ns", None)
+    if mtime_ns is None:
+        # Python 2.
+        mtime_ns = int(stat.st_mtime * 1e9)
+    return stat.st_size, mtime_ns, stat.st_ino
+
+
+def _build_index(data, size):
+    """Scan the document sizes in `data` and return their start offsets."""
+    offsets = _offsets_array()
+    position = 0
+    while position < size:
+        if size - position < 5:
+            raise InvalidBSON("cut off in middle of objsize at offset %d"
+                              % (position,))
+        obj_size = _UNPACK_INT_FROM(data, position)[0]
+        if obj_size < 5 or obj_size > size - position:
+            raise InvalidBSON("invalid object size %d at offset %d"
+                              % (obj_size, position))
+        if data[position + obj_size - 1:position + obj_size] != b"\x00":
+            raise InvalidBSON("bad eoo at offset %d" % (position,))
+        offsets.append(position)
+        position += obj_size
+    return offsets
+
+
+def _load_index(index_path, identity, data):
+    """Return the offsets persisted at `index_path`, or None.
+
+    None is returned when the index file is missing, was built for a data
+    file of a different size, modification time or inode, or its first and
+    last offsets are not the bounds of documents in `data`.
+    """
+    try:
+        with open(index_path, "rb") as index_file:
+            header = index_file.read(_INDEX_HEADER.size)
+            if len(header) != _INDEX_HEADER.size:
+                return None
+            fields = _INDEX_HEADER.unpack(header)
+            if fields[0] != _INDEX_MAGIC or fields[1:4] != identity:
+                return None
+            count = fields[4]
+            offsets = _offsets_array()
+            index_data = index_file.read(count * offsets.itemsize)
+            if PY3:
+                offsets.frombytes(index_data)
+            else:
+                offsets.fromstring(index_data)
+    except (IOError, OSError, EOFError, ValueError):
+        return None
+    if len(offsets) != count:
+        return None
+    if _BIG_ENDIAN:
+        offsets.byteswap()
+    if not _check_offsets(data, identity[0], offsets):
+        return None
+    return offsets
+
+
+def _check_offsets(data, size, offsets):
+    """Check that `offsets` start at 0 and that the last document they point
+    to ends at the end of `data`.
+    """
+    if not offsets:
+        return size == 0
+    last = offsets[-1]
+    if offsets[0] != 0 or not 0 <= last <= size - 5:
+        return False
+    return last + _UNPACK_INT_FROM(data, last)[0] == size
+
+
+def _save_index(index_path, identity, offsets):
+    """Write the `offsets` of the data file with `identity`, as returned by
+    :func:`_file_identity`, to `index_path`.
+    """
+    if _BIG_ENDIAN:
+        offsets = array.array(offsets.typecode, offsets)
+        offsets.byteswap()
+    with open(index_path, "wb") as index_file:
+        index_file.write(
+            _INDEX_HEADER.pack(_INDEX_MAGIC, *(identity + (len(offsets),))))
+        if PY3:
+            index_file.write(offsets.tobytes())
+        else:
+            index_file.write(offsets.tostring())
+
+
+class MappedBSONFile(object):
+    """A read-only, memory mapped file of concatenated BSON documents.
+
+    The document boundaries are found in one pass over the file when it is
+    opened. Only the 4 byte size of each document is read, the documents
+    themselves are not validated until they are decoded.
+
+    Instances support :func:`len`, indexing with negative indexes and
+    slicing. Indexing returns a :class:`~bson.raw_bson.RawBSONDocument` whose
+    :attr:`~bson.raw_bson.RawBSONDocument.raw` bytes are copied out of the
+    mapping when they are first needed. Slicing returns a list of documents.
+
+    To process the file from several threads or processes, split it with
+    :meth:`partitions` and iterate over each part with :meth:`iter_range`.
+
+    :Parameters:
+      - `path`: The path of the file to open.
+      - `codec_options` (optional): An instance of
+        :class:`~bson.codec_options.CodecOptions` whose `document_class` is
+        :class:`~bson.raw_bson.RawBSONDocument`. Defaults to
+        :data:`~bson.raw_bson.DEFAULT_RAW_BSON_OPTIONS`.
+      - `index_path` (optional): The path of a file caching the document
+        offsets. If it holds an index built for this file it is loaded
+        instead of scanning the file, otherwise the file is scanned and the
+        index is written to `index_path`. An index is only loaded for the
+        file with the size, modification time and inode it was built for.
+
+    .. versionadded:: 3.9
+    """
+
+    def __init__(self, path, codec_options=DEFAULT_RAW_BSON_OPTIONS,
+                 index_path=None):
+        if codec_options.document_class is not RawBSONDocument:
+            raise TypeError(
+                "MappedBSONFile cannot use CodecOptions with document "
+                "class %s" % (codec_options.document_class, ))
+        self.__codec_options = codec_options
+        self.__path = path
+        self.__map = None
+        self.__view = None
+        self.__closed = False
+        with open(path, "rb") as data_file:
+            self.__identity = _file_identity(os.fstat(data_file.fileno()))
+            self.__size = self.__identity[0]
+            if self.__size:
+                # The mapping holds its own duplicate of the descriptor.
+                self.__map = mmap.mmap(
+                    data_file.fileno(), 0, access=mmap.ACCESS_READ)
+                if PY3:
+                    self.__view = memoryview(self.__map)
+        offsets = None
+        if index_path is not None:
+            offsets = _load_index(index_path, self.__identity, self.__map)
+        if offsets is None:
+            offsets = _build_index(self.__map, self.__size)
+            if index_path is not None:
+                _save_index(index_path, self.__identity, offsets)
+        self.__offsets = offsets
+
+    @property
+    def path(self):
+        """The path of the mapped file."""
+        return self.__path
+
+    @property
+    def codec_options(self):
+        """The codec options of the returned documents."""
+        return self.__codec_options
+
+    @property
+    def offsets(self):
+        """An :class:`array.array` of the byte offset of each document."""
+        return self.__offsets
+
+    def save_index(self, index_path):
+        """Write the document offsets of this file to `index_path`.
+
+        The index can be passed as `index_path` when the same file is opened
+        again to skip scanning it.
+        """
+        _save_index(index_path, self.__identity, self.__offsets)
+
+    def __document(self, index):
+        start = self.__offsets[index]
+        end = start + _UNPACK_INT_FROM(self.__map, start)[0]
+        if self.__view is None:
+            # Python 2's mmap does not export the buffer protocol.
+            return RawBSONDocument(self.__map[start:end], self.__codec_options)
+        return RawBSONDocument(self.__view[start:end], self.__codec_options)
+
+    def __check_open(self):
+        if self.__closed:
+            raise ValueError("I/O operation on closed file")
+
+    def __len__(self):
+        return len(self.__offsets)
+
+    def __getitem__(self, index):
+        self.__check_open()
+        if isinstance(index, slice):
+            return [self.__document(i)
+                    for i in range(*index.indices(len(self.__offsets)))]
+        if not isinstance(index, integer_types):
+            raise TypeError("MappedBSONFile indices must be integers or "
+                            "slices, not %s" % (type(index).__name__,))
+        if index < 0:
+            index += len(self.__offsets)
+        if not 0 <= index < len(self.__offsets):
+            raise IndexError("MappedBSONFile index out of range")
+        return self.__document(index)
+
+    def __iter__(self):
+        return self.iter_range(0, len(self.__offsets))
+
+    def iter_range(self, start, stop):
+        """Iterate over the documents with indexes from `start` up to, but
+        not including, `stop`.
+
+        :Parameters:
+          - `start`: The index of the first document.
+          - `stop`: The index after the last document.
+        """
+        self.__check_open()
+        start, stop, _ = slice(start, stop).indices(len(self.__offsets))
+        for index in range(start, stop):
+            yield self.__document(index)
+
+    def partitions(self, count):
+        """Split the documents into at most `count` contiguous ranges.
+
+        Returns a list of ``(start, stop)`` tuples of about the same number
+        of documents, suitable for :meth:`iter_range`.
+
+        :Parameters:
+          - `count`: The number of ranges to split the documents into.
+        """
+        if not isinstance(count, integer_types) or count < 1:
+            raise ValueError("count must be a positive integer")
+        total = len(self.__offsets)
+        count = min(count, total)
+        ranges = []
+        for part in range(count):
+            ranges.append((total * part // count,
+                           total * (part + 1) // count))
+        return ranges
+
+    def close(self):
+        """Unmap the file.
+
+        Documents returned by this file keep the mapping alive until their
+        :attr:`~bson.raw_bson.RawBSONDocument.raw` bytes have been copied
+        out of it or they are garbage collected.
+        """
+        if self.__closed:
+            return
+        self.__closed = True
+        view, self.__view = self.__view, None
+        mapping, self.__map = self.__map, None
+        if view is not None:
+            view.release()
+        if mapping is None:
+            return
+        try:
+            mapping.close()
+        except BufferError:
+            # Still exported to documents, it is unmapped when the last one
+            # is released.
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return "MappedBSONFile(%r, codec_options=%r)" % (
+            self.__path, self.__codec_options)
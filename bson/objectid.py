@@ -19,9 +19,9 @@
 import binascii
 import calendar
 import datetime
+import itertools
 import os
 import struct
-import threading
 import time
 
 from random import SystemRandom
@@ -33,6 +33,8 @@ from bson.tz_util import utc
 
 _MAX_COUNTER_VALUE = 0xFFFFFF
 
+_PACK_UINT = struct.Struct(">I").pack
+
 
 def _raise_invalid_id(oid):
     raise InvalidId(
@@ -51,8 +53,8 @@ class ObjectId(object):
 
     _pid = os.getpid()
 
-    _inc = SystemRandom().randint(0, _MAX_COUNTER_VALUE)
-    _inc_lock = threading.Lock()
+    # next() on an itertools.count is atomic, so the counter needs no lock.
+    _inc = itertools.count(SystemRandom().randint(0, _MAX_COUNTER_VALUE))
 
     __random = _random_bytes()
 
@@ -144,6 +146,34 @@ class ObjectId(object):
             ">I", int(timestamp)) + b"\x00\x00\x00\x00\x00\x00\x00\x00"
         return cls(oid)
 
+    @classmethod
+    def generate_many(cls, count):
+        """Generate a list of `count` new ObjectIds.
+
+        Equivalent to ``[ObjectId() for _ in range(count)]``, but the clock
+        is read once for the whole list and the counter values are taken
+        together, which is much faster for large batches::
+
+          >>> docs = [{'x': i} for i in range(1000)]
+          >>> for doc, oid in zip(docs, ObjectId.generate_many(len(docs))):
+          ...     doc['_id'] = oid
+
+        :Parameters:
+          - `count`: the number of ObjectIds to generate.
+
+        .. versionadded:: 3.9
+        """
+        if count < 0:
+            raise ValueError("count must be a non-negative integer")
+        prefix = _PACK_UINT(int(time.time())) + ObjectId._random()
+        if _USE_C:
+            return _cbson._generate_object_ids(cls, count, ObjectId._inc,
+                                               prefix)
+        counter = ObjectId._inc
+        return [cls(prefix + _PACK_UINT(next(counter) &
+                                        _MAX_COUNTER_VALUE)[1:4])
+                for _ in range(count)]
+
     @classmethod
     def is_valid(cls, oid):
         """Checks if a `oid` string is valid or not.
@@ -177,15 +207,13 @@ class ObjectId(object):
         """
 
         # 4 bytes current time
-        oid = struct.pack(">I", int(time.time()))
+        oid = _PACK_UINT(int(time.time()))
 
         # 5 bytes random
         oid += ObjectId._random()
 
         # 3 bytes inc
-        with ObjectId._inc_lock:
-            oid += struct.pack(">I", ObjectId._inc)[1:4]
-            ObjectId._inc = (ObjectId._inc + 1) % (_MAX_COUNTER_VALUE + 1)
+        oid += _PACK_UINT(next(ObjectId._inc) & _MAX_COUNTER_VALUE)[1:4]
 
         self.__id = oid
 
@@ -297,3 +325,12 @@ class ObjectId(object):
     def __hash__(self):
         """Get a hash value for this :class:`ObjectId`."""
         return hash(self.__id)
+
+
+# The C extension loads ObjectId when it is imported, so it can only be
+# imported once the class is defined.
+try:
+    from bson import _cbson
+    _USE_C = True
+except ImportError:
+    _USE_C = False
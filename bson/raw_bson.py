@@ -15,38 +15,70 @@
 """Tools for representing raw BSON documents.
 """
 
-from bson import _UNPACK_INT, _iterate_elements
-from bson.py3compat import abc, iteritems
+import sys
+
+from bson import (_PACK_INT,
+                  _UNPACK_INT,
+                  _dict_to_bson,
+                  _element_offsets,
+                  _element_to_dict,
+                  _skip_element)
+from bson.py3compat import abc, iteritems, reraise
 from bson.codec_options import (
     DEFAULT_CODEC_OPTIONS as DEFAULT, _RAW_BSON_DOCUMENT_MARKER)
 from bson.errors import InvalidBSON
 
 
+def _element_ranges(data, offsets):
+    """Yield the key, start and end position of the elements in `offsets`,
+    in document order.
+    """
+    obj_end = len(data) - 1
+    for start, key in sorted((position, key)
+                             for key, position in iteritems(offsets)):
+        name_end = data.index(b"\x00", start + 1)
+        end = _skip_element(data, name_end + 1, obj_end,
+                            data[start:start + 1], data[start + 1:name_end])
+        yield key, start, end
+
+
 class RawBSONDocument(abc.Mapping):
     """Representation for a MongoDB document that provides access to the raw
     BSON bytes that compose it.
 
     Only when a field is accessed or modified within the document does
-    RawBSONDocument decode its bytes.
+    RawBSONDocument decode its bytes. The first access scans the names of the
+    fields and records where each one starts, after that only the accessed
+    fields are decoded. Embedded documents, including those within arrays,
+    are themselves returned as RawBSONDocument instances.
+
+    .. versionchanged:: 3.9
+       Fields are decoded individually on access, rather than decoding the
+       whole document on the first access.
     """
 
-    __slots__ = ('__raw', '__inflated_doc', '__codec_options')
+    __slots__ = ('__raw', '__offsets_index', '__values', '__codec_options')
     _type_marker = _RAW_BSON_DOCUMENT_MARKER
 
     def __init__(self, bson_bytes, codec_options=None):
         """Create a new :class:`RawBSONDocument`.
 
         :Parameters:
-          - `bson_bytes`: the BSON bytes that compose this document
+          - `bson_bytes`: the BSON bytes that compose this document, or a
+            :class:`memoryview` of them
           - `codec_options` (optional): An instance of
             :class:`~bson.codec_options.CodecOptions`.
 
+        .. versionchanged:: 3.9
+          `bson_bytes` can be a :class:`memoryview`.
+
         .. versionchanged:: 3.5
           If a :class:`~bson.codec_options.CodecOptions` is passed in, its
           `document_class` must be :class:`RawBSONDocument`.
         """
         self.__raw = bson_bytes
-        self.__inflated_doc = None
+        self.__offsets_index = None
+        self.__values = None
         # Can't default codec_options to DEFAULT_RAW_BSON_OPTIONS in signature,
         # it refers to this class RawBSONDocument.
         if codec_options is None:
@@ -59,41 +91,137 @@ class RawBSONDocument(abc.Mapping):
 
     @property
     def raw(self):
-        """The raw BSON bytes composing this document."""
+        """The raw BSON bytes composing this document.
+
+        If this document was created from a :class:`memoryview`, its bytes
+        are copied out of the view the first time they are accessed.
+        """
+        if isinstance(self.__raw, memoryview):
+            self.__raw = self.__raw.tobytes()
         return self.__raw
 
     def items(self):
         """Lazily decode and iterate elements in this document."""
-        return iteritems(self.__inflated)
+        for key in self.__offsets:
+            yield key, self[key]
 
     @property
-    def __inflated(self):
-        if self.__inflated_doc is None:
+    def __offsets(self):
+        if self.__offsets_index is None:
             # We already validated the object's size when this document was
             # created, so no need to do that again. We still need to check the
             # size of all the elements and compare to the document size.
-            object_size = _UNPACK_INT(self.__raw[:4])[0] - 1
-            position = 0
-            self.__inflated_doc = {}
-            for key, value, position in _iterate_elements(
-                    self.__raw, 4, object_size, self.__codec_options):
-                self.__inflated_doc[key] = value
-            if position != object_size:
-                raise InvalidBSON('bad object or element length')
-        return self.__inflated_doc
+            raw = self.raw
+            object_size = _UNPACK_INT(raw[:4])[0] - 1
+            try:
+                self.__offsets_index = _element_offsets(
+                    raw, 4, object_size, self.__codec_options)
+            except InvalidBSON:
+                raise
+            except Exception:
+                # Change exception type to InvalidBSON but preserve traceback.
+                _, exc_value, exc_tb = sys.exc_info()
+                reraise(InvalidBSON, exc_value, exc_tb)
+        return self.__offsets_index
 
     def __getitem__(self, item):
-        return self.__inflated[item]
+        values = self.__values
+        if values is None:
+            # Most raw documents are never read, only create the cache of
+            # decoded values on first access.
+            values = self.__values = {}
+        else:
+            try:
+                return values[item]
+            except KeyError:
+                pass
+        # Raises KeyError for a missing field.
+        position = self.__offsets[item]
+        raw = self.raw
+        try:
+            _, value, _ = _element_to_dict(
+                raw, position, len(raw) - 1, self.__codec_options)
+        except InvalidBSON:
+            raise
+        except Exception:
+            _, exc_value, exc_tb = sys.exc_info()
+            reraise(InvalidBSON, exc_value, exc_tb)
+        values[item] = value
+        return value
+
+    def with_changes(self, changes=None, remove=()):
+        """Return a copy of this document with top-level fields set or
+        removed.
+
+        The new document is built by splicing the BSON bytes of this one:
+        only the values in `changes` are encoded, and the fields that are not
+        changed are copied as they are, without being decoded. Fields that
+        already exist keep their position, new fields are appended in the
+        iteration order of `changes`::
+
+          >>> doc = RawBSONDocument(BSON.encode({'_id': 1, 'a': 1, 'b': 2}))
+          >>> new_doc = doc.with_changes({'a': 5, 'c': 3}, remove=['b'])
+          >>> list(new_doc.items())
+          [('_id', 1), ('a', 5), ('c', 3)]
+          >>> collection.replace_one({'_id': 1}, new_doc)
+
+        :Parameters:
+          - `changes` (optional): A mapping of field names to their new
+            values.
+          - `remove` (optional): An iterable of the names of the fields to
+            remove. Names that are not in the document are ignored.
+
+        .. versionadded:: 3.9
+        """
+        changes = changes or {}
+        remove = frozenset(remove)
+        conflicts = remove.intersection(changes)
+        if conflicts:
+            raise ValueError("cannot both change and remove fields %r"
+                             % (sorted(conflicts),))
+        raw = self.raw
+        offsets = self.__offsets
+        # Encode all the changed values at once and cut the encoded document
+        # into elements, so C encoding is used when available.
+        encoded = _dict_to_bson(changes, False, self.__codec_options)
+        new_offsets = _element_offsets(
+            encoded, 4, len(encoded) - 1, self.__codec_options)
+        new_elements = [(key, encoded[start:end]) for key, start, end
+                        in _element_ranges(encoded, new_offsets)]
+        replaced = dict(new_elements)
+
+        parts = []
+        run_start = run_end = 4
+        for key, start, end in _element_ranges(raw, offsets):
+            if start != run_end or key in remove or key in replaced:
+                # Flush the unchanged elements copied so far.
+                parts.append(raw[run_start:run_end])
+                run_start = start
+                if key in remove or key in replaced:
+                    parts.append(replaced.pop(key, b""))
+                    run_start = end
+            run_end = end
+        parts.append(raw[run_start:run_end])
+        parts.extend(element for key, element in new_elements
+                     if key in replaced)
+
+        elements = b"".join(parts)
+        return RawBSONDocument(
+            _PACK_INT(len(elements) + 5) + elements + b"\x00",
+            self.__codec_options)
+
+    def __contains__(self, item):
+        return item in self.__offsets
 
     def __iter__(self):
-        return iter(self.__inflated)
+        return iter(self.__offsets)
 
     def __len__(self):
-        return len(self.__inflated)
+        return len(self.__offsets)
 
     def __eq__(self, other):
         if isinstance(other, RawBSONDocument):
-            return self.__raw == other.raw
+            return self.raw == other.raw
         return NotImplemented
 
     def __repr__(self):
@@ -0,0 +1,207 @@
+# Copyright 2019-present MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tools for decoding BSON documents directly to record classes.
+
+.. versionadded:: 3.9
+"""
+
+from bson.errors import InvalidBSON
+from bson.py3compat import string_type
+
+
+def _constant(value):
+    """A default factory returning `value`."""
+    return lambda: value
+
+
+def _dataclass_fields(record_class):
+    """The field names and default factories of a dataclass."""
+    import dataclasses
+    names = []
+    defaults = []
+    for field in dataclasses.fields(record_class):
+        names.append(field.name)
+        if field.default is not dataclasses.MISSING:
+            defaults.append(_constant(field.default))
+        elif field.default_factory is not dataclasses.MISSING:
+            defaults.append(field.default_factory)
+        else:
+            defaults.append(None)
+    return names, defaults
+
+
+def _slots(record_class):
+    """The names of the slots declared by `record_class` and its bases."""
+    names = []
+    for klass in reversed(record_class.__mro__):
+        slots = klass.__dict__.get('__slots__', ())
+        if isinstance(slots, string_type):
+            slots = (slots,)
+        for name in slots:
+            if name not in ('__dict__', '__weakref__') and name not in names:
+                names.append(name)
+    return names
+
+
+class RecordType(object):
+    """Decode BSON documents directly to instances of `record_class`.
+
+    Pass a :class:`RecordType` as the `document_class` of
+    :class:`~bson.codec_options.CodecOptions` to decode top-level documents
+    to a :func:`~collections.namedtuple`, a :mod:`dataclass <dataclasses>`,
+    or a class with ``__slots__``, without creating a :class:`dict` for
+    each document::
+
+      >>> import collections
+      >>> from bson import BSON
+      >>> from bson.codec_options import CodecOptions
+      >>> from bson.record import RecordType
+      >>> Point = collections.namedtuple('Point', ['x', 'y'])
+      >>> options = CodecOptions(document_class=RecordType(Point))
+      >>> BSON.encode({'_id': 1, 'x': 1, 'y': 2}).decode(options)
+      Point(x=1, y=2)
+
+    Each field of the record is filled from the document element of the
+    same name, other elements are skipped without being decoded. Fields
+    missing from the document take their default value, if the record
+    class declares one, or else decoding raises
+    :class:`~bson.errors.InvalidBSON`. Namedtuples are created as if by
+    ``Point._make``, other records are created with ``__new__`` and their
+    fields are set directly, bypassing ``__init__``, ``__post_init__``, and
+    the ``__setattr__`` of frozen dataclasses. Embedded documents are
+    decoded to :class:`dict`.
+
+    When encoding with these options, instances of `record_class` are
+    encoded as documents whose elements are the record's fields, in order,
+    skipping fields that are not set. An ``_id`` field is encoded first.
+
+    :Parameters:
+      - `record_class`: a namedtuple, a dataclass, or a class with
+        ``__slots__``.
+      - `fields` (optional): the names of the fields to decode and encode.
+        Defaults to the fields declared by `record_class`, required for
+        classes that declare none. The fields of a namedtuple can't be
+        changed.
+
+    .. versionadded:: 3.9
+    """
+
+    __slots__ = ('_record_class', '_fields', '_keys', '_defaults',
+                 '_is_tuple')
+
+    _type_marker = 103
+
+    def __init__(self, record_class, fields=None):
+        if not isinstance(record_class, type):
+            raise TypeError("record_class must be a class, not %r" % (
+                record_class,))
+        is_tuple = issubclass(record_class, tuple)
+        if is_tuple:
+            if not hasattr(record_class, '_fields'):
+                raise TypeError("record_class must be a namedtuple, not "
+                                "a tuple subclass")
+            declared = list(record_class._fields)
+            field_defaults = getattr(record_class, '_field_defaults', {})
+            defaults = [_constant(field_defaults[name])
+                        if name in field_defaults else None
+                        for name in declared]
+        elif hasattr(record_class, '__dataclass_fields__'):
+            declared, defaults = _dataclass_fields(record_class)
+        else:
+            declared = _slots(record_class)
+            defaults = [None] * len(declared)
+
+        if fields is None:
+            if not declared:
+                raise TypeError("%r declares no fields, pass the field "
+                                "names as fields" % (record_class,))
+            fields = declared
+        else:
+            if isinstance(fields, string_type):
+                raise TypeError("fields must be a list of field names")
+            fields = list(fields)
+            for name in fields:
+                if not isinstance(name, string_type):
+                    raise TypeError("field names must be instances of %s, "
+                                    "not %r" % (string_type.__name__, name))
+            if is_tuple and fields != declared:
+                raise ValueError("fields must be %r for %r" % (
+                    declared, record_class))
+            if len(set(fields)) != len(fields):
+                raise ValueError("fields must not contain duplicates")
+            declared_defaults = dict(zip(declared, defaults))
+            defaults = [declared_defaults.get(name) for name in fields]
+
+        self._record_class = record_class
+        self._fields = tuple(fields)
+        self._keys = tuple(name.encode('utf-8') for name in fields)
+        self._defaults = tuple(defaults)
+        self._is_tuple = is_tuple
+
+    @property
+    def record_class(self):
+        """The class of the decoded records."""
+        return self._record_class
+
+    @property
+    def fields(self):
+        """The names of the fields of the records, in order."""
+        return self._fields
+
+    def _new(self, values):
+        """Create a record from `values`, a list with an item per field
+        which is `_MISSING` for fields that were not decoded.
+        """
+        for i, value in enumerate(values):
+            if value is _MISSING:
+                default = self._defaults[i]
+                if default is None:
+                    raise InvalidBSON("document has no field %r for %s" % (
+                        self._fields[i], self._record_class.__name__))
+                values[i] = default()
+        if self._is_tuple:
+            return tuple.__new__(self._record_class, values)
+        record = self._record_class.__new__(self._record_class)
+        for name, value in zip(self._fields, values):
+            object.__setattr__(record, name, value)
+        return record
+
+    def _items(self, record):
+        """The (name, value) pairs of the fields of `record` that are set.
+        """
+        if self._is_tuple:
+            return zip(self._fields, record)
+        return [(name, getattr(record, name)) for name in self._fields
+                if hasattr(record, name)]
+
+    def __eq__(self, other):
+        if isinstance(other, RecordType):
+            return (self._record_class == other.record_class and
+                    self._fields == other.fields)
+        return NotImplemented
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self._record_class, self._fields))
+
+    def __repr__(self):
+        return "RecordType(%s.%s, fields=%r)" % (
+            self._record_class.__module__, self._record_class.__name__,
+            list(self._fields))
+
+
+_MISSING = object()
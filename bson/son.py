@@ -20,6 +20,9 @@ dictionary."""
 
 import copy
 import re
+import sys
+
+from collections import OrderedDict
 
 from bson.py3compat import abc, iteritems
 
@@ -28,6 +31,10 @@ from bson.py3compat import abc, iteritems
 # This is essentially the same as re._pattern_type
 RE_TYPE = type(re.compile(""))
 
+# Dicts keep insertion order from Python 3.7. SON then uses the order of the
+# dict itself, otherwise it keeps the order of its keys in an OrderedDict.
+_DICT_IS_ORDERED = sys.version_info[:2] >= (3, 7)
+
 
 class SON(dict):
     """SON data.
@@ -38,53 +45,107 @@ class SON(dict):
     """
 
     def __init__(self, data=None, **kwargs):
-        self.__keys = []
         dict.__init__(self)
         self.update(data)
         self.update(kwargs)
 
-    def __new__(cls, *args, **kwargs):
-        instance = super(SON, cls).__new__(cls, *args, **kwargs)
-        instance.__keys = []
-        return instance
-
     def __repr__(self):
         result = []
-        for key in self.__keys:
-            result.append("(%r, %r)" % (key, self[key]))
+        for key, value in self.iteritems():
+            result.append("(%r, %r)" % (key, value))
         return "SON([%s])" % ", ".join(result)
 
-    def __setitem__(self, key, value):
-        if key not in self.__keys:
-            self.__keys.append(key)
-        dict.__setitem__(self, key, value)
-
-    def __delitem__(self, key):
-        self.__keys.remove(key)
-        dict.__delitem__(self, key)
-
-    def keys(self):
-        return list(self.__keys)
+    if _DICT_IS_ORDERED:
+        def keys(self):
+            return list(dict.keys(self))
+
+        def iteritems(self):
+            return iter(dict.items(self))
+
+        def items(self):
+            return list(dict.items(self))
+
+        def popitem(self):
+            try:
+                key = next(iter(self))
+            except StopIteration:
+                raise KeyError('container is empty')
+            return (key, dict.pop(self, key))
+
+        def _restore_order(self, keys):
+            """Put the items in the order of `keys`."""
+            # copy.copy restores the state before adding the items.
+            keys = list(keys)
+            if len(self) == len(keys) and list(self) != keys:
+                items = [(k, dict.__getitem__(self, k)) for k in keys]
+                dict.clear(self)
+                dict.update(self, items)
+    else:
+        def __new__(cls, *args, **kwargs):
+            instance = super(SON, cls).__new__(cls, *args, **kwargs)
+            instance.__keys = OrderedDict()
+            return instance
+
+        def __setitem__(self, key, value):
+            if key not in self.__keys:
+                self.__keys[key] = None
+            dict.__setitem__(self, key, value)
+
+        def __delitem__(self, key):
+            dict.__delitem__(self, key)
+            del self.__keys[key]
+
+        def keys(self):
+            return list(self.__keys)
+
+        def __iter__(self):
+            return iter(self.__keys)
+
+        def iteritems(self):
+            for k in self.__keys:
+                yield (k, dict.__getitem__(self, k))
+
+        def items(self):
+            return list(self.iteritems())
+
+        def clear(self):
+            self.__keys.clear()
+            dict.clear(self)
+
+        def popitem(self):
+            try:
+                key = self.__keys.popitem(last=False)[0]
+            except KeyError:
+                raise KeyError('container is empty')
+            return (key, dict.pop(self, key))
+
+        def _restore_order(self, keys):
+            """Put the items in the order of `keys`."""
+            self.__keys = OrderedDict.fromkeys(keys)
+
+    def __getstate__(self):
+        # Record the order of the keys, for earlier versions and for Python
+        # versions before 3.7.
+        state = self.__dict__.copy()
+        state['_SON__keys'] = self.keys()
+        return state
+
+    def __setstate__(self, state):
+        # SON objects pickled by earlier versions, or on Python versions
+        # before 3.7, record the order of their keys in the state.
+        state = dict(state)
+        keys = state.pop('_SON__keys', None)
+        self.__dict__.update(state)
+        if keys is not None:
+            self._restore_order(keys)
 
     def copy(self):
         other = SON()
         other.update(self)
         return other
 
-    # TODO this is all from UserDict.DictMixin. it could probably be made more
-    # efficient.
-    # second level definitions support higher levels
-    def __iter__(self):
-        for k in self.__keys:
-            yield k
-
     def has_key(self, key):
-        return key in self.__keys
-
-    # third level takes advantage of second level definitions
-    def iteritems(self):
-        for k in self:
-            yield (k, self[k])
+        return key in self
 
     def iterkeys(self):
         return self.__iter__()
@@ -97,13 +158,6 @@ class SON(dict):
     def values(self):
         return [v for _, v in self.iteritems()]
 
-    def items(self):
-        return [(key, self[key]) for key in self]
-
-    def clear(self):
-        self.__keys = []
-        super(SON, self).clear()
-
     def setdefault(self, key, default=None):
         try:
             return self[key]
@@ -124,18 +178,15 @@ class SON(dict):
         del self[key]
         return value
 
-    def popitem(self):
-        try:
-            k, v = next(self.iteritems())
-        except StopIteration:
-            raise KeyError('container is empty')
-        del self[k]
-        return (k, v)
-
     def update(self, other=None, **kwargs):
         # Make progressively weaker assumptions about "other"
         if other is None:
             pass
+        elif (_DICT_IS_ORDERED and
+              type(self).__setitem__ is dict.__setitem__ and
+              isinstance(other, (dict, list, tuple))):
+            # The dict is all there is to update.
+            dict.update(self, other)
         elif hasattr(other, 'iteritems'):  # iteritems saves memory and lookups
             for k, v in other.iteritems():
                 self[k] = v
@@ -159,15 +210,13 @@ class SON(dict):
         regular dictionary is order-insensitive.
         """
         if isinstance(other, SON):
-            return len(self) == len(other) and self.items() == other.items()
+            return (dict.__eq__(self, other) is True and
+                    self.keys() == other.keys())
         return self.to_dict() == other
 
     def __ne__(self, other):
         return not self == other
 
-    def __len__(self):
-        return len(self.__keys)
-
     def to_dict(self):
         """Convert a SON document to a normal Python dictionary instance.
 
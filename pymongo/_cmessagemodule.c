@@ -785,6 +785,172 @@ _set_document_too_large(int size, long max) {
     }
 }
 
+/* Generates the _id of inserted documents that have none, like
+ * bson.objectid.ObjectId.generate_many: the time and the process's random
+ * value are read once for each batch. */
+typedef struct id_generator_t {
+    PyObject* object_id_class;
+    PyObject* counter;
+    char oid[12];
+} id_generator_t;
+
+/* Read ctx.generate_ids and, if it is true, initialize 'generator'.
+ *
+ * Returns 1 if ids should be generated, 0 if not, or -1 on failure.
+ * _destroy_id_generator must be called in all cases. */
+static int _init_id_generator(PyObject* ctx, id_generator_t* generator) {
+    PyObject* generate_ids_obj;
+    PyObject* objectid_module;
+    PyObject* random;
+    int generate_ids;
+    uint32_t now;
+
+    generator->object_id_class = NULL;
+    generator->counter = NULL;
+
+    generate_ids_obj = PyObject_GetAttrString(ctx, "generate_ids");
+    if (!generate_ids_obj) {
+        return -1;
+    }
+    generate_ids = PyObject_IsTrue(generate_ids_obj);
+    Py_DECREF(generate_ids_obj);
+    if (generate_ids != 1) {
+        return generate_ids;
+    }
+
+    objectid_module = PyImport_ImportModule("bson.objectid");
+    if (!objectid_module) {
+        return -1;
+    }
+    generator->object_id_class = PyObject_GetAttrString(objectid_module,
+                                                        "ObjectId");
+    Py_DECREF(objectid_module);
+    if (!generator->object_id_class) {
+        return -1;
+    }
+    generator->counter = PyObject_GetAttrString(generator->object_id_class,
+                                                "_inc");
+    if (!generator->counter) {
+        return -1;
+    }
+    random = PyObject_CallMethod(generator->object_id_class, "_random", NULL);
+    if (!random) {
+        return -1;
+    }
+    if (!PyBytes_Check(random) || PyBytes_GET_SIZE(random) != 5) {
+        Py_DECREF(random);
+        PyErr_SetString(PyExc_ValueError,
+                        "ObjectId random value must be 5 bytes");
+        return -1;
+    }
+    /* 4 bytes big endian time, then the 5 bytes random value. */
+    now = (uint32_t)time(NULL);
+    generator->oid[0] = (char)((now >> 24) & 0xff);
+    generator->oid[1] = (char)((now >> 16) & 0xff);
+    generator->oid[2] = (char)((now >> 8) & 0xff);
+    generator->oid[3] = (char)(now & 0xff);
+    memcpy(generator->oid + 4, PyBytes_AS_STRING(random), 5);
+    Py_DECREF(random);
+    return 1;
+}
+
+static void _destroy_id_generator(id_generator_t* generator) {
+    Py_CLEAR(generator->object_id_class);
+    Py_CLEAR(generator->counter);
+}
+
+/* Give the insert document 'doc' a new ObjectId _id if it has none.
+ *
+ * Returns 0 on failure. */
+static int _add_missing_id(id_generator_t* generator, PyObject* doc) {
+    PyObject* key;
+    PyObject* next;
+    PyObject* binary;
+    PyObject* object_id;
+    unsigned long inc;
+    int result;
+
+    if (PyDict_Check(doc)) {
+        if (PyDict_GetItemString(doc, "_id")) {
+            return 1;
+        }
+    } else {
+        int has_id;
+        /* A RawBSONDocument can't be changed, the server gives it an _id. */
+        if (PyObject_HasAttrString(doc, "_type_marker")) {
+            PyObject* type_marker = PyObject_GetAttrString(doc,
+                                                           "_type_marker");
+            long marker;
+            if (!type_marker) {
+                return 0;
+            }
+#if PY_MAJOR_VERSION >= 3
+            marker = PyLong_Check(type_marker) ?
+                PyLong_AsLong(type_marker) : 0;
+#else
+            marker = PyInt_Check(type_marker) ?
+                PyInt_AsLong(type_marker) : 0;
+#endif
+            Py_DECREF(type_marker);
+            if (marker == 101) {
+                return 1;
+            }
+        }
+#if PY_MAJOR_VERSION >= 3
+        key = PyUnicode_FromString("_id");
+#else
+        key = PyString_FromString("_id");
+#endif
+        if (!key) {
+            return 0;
+        }
+        has_id = PySequence_Contains(doc, key);
+        Py_DECREF(key);
+        if (has_id) {
+            return has_id == 1;
+        }
+    }
+
+    next = PyIter_Next(generator->counter);
+    if (!next) {
+        if (!PyErr_Occurred()) {
+            PyErr_SetString(PyExc_RuntimeError,
+                            "ObjectId counter is exhausted");
+        }
+        return 0;
+    }
+    /* Only the low 24 bits are used, so ignore overflow. */
+#if PY_MAJOR_VERSION >= 3
+    inc = PyLong_AsUnsignedLongMask(next);
+#else
+    inc = PyInt_AsUnsignedLongMask(next);
+#endif
+    Py_DECREF(next);
+    if (inc == (unsigned long)-1 && PyErr_Occurred()) {
+        return 0;
+    }
+    generator->oid[9] = (char)((inc >> 16) & 0xff);
+    generator->oid[10] = (char)((inc >> 8) & 0xff);
+    generator->oid[11] = (char)(inc & 0xff);
+    binary = PyBytes_FromStringAndSize(generator->oid, 12);
+    if (!binary) {
+        return 0;
+    }
+    object_id = PyObject_CallFunctionObjArgs(generator->object_id_class,
+                                             binary, NULL);
+    Py_DECREF(binary);
+    if (!object_id) {
+        return 0;
+    }
+    if (PyDict_Check(doc)) {
+        result = PyDict_SetItemString(doc, "_id", object_id);
+    } else {
+        result = PyMapping_SetItemString(doc, "_id", object_id);
+    }
+    Py_DECREF(object_id);
+    return result == 0;
+}
+
 static PyObject*
 _send_insert(PyObject* self, PyObject* ctx,
              PyObject* gle_args, buffer_t buffer,
@@ -819,6 +985,7 @@ static PyObject* _cbson_do_batched_insert(PyObject* self, PyObject* args) {
     int length_location, message_length;
     int collection_name_length;
     int compress;
+    int generate_ids;
     char* collection_name = NULL;
     PyObject* docs;
     PyObject* doc;
@@ -838,6 +1005,7 @@ static PyObject* _cbson_do_batched_insert(PyObject* self, PyObject* args) {
     long max_bson_size;
     long max_message_size;
     buffer_t buffer;
+    id_generator_t ids = {NULL, NULL};
     PyObject *exc_type = NULL, *exc_value = NULL, *exc_trace = NULL;
 
     if (!PyArg_ParseTuple(args, "et#ObbObO&O",
@@ -918,6 +1086,11 @@ static PyObject* _cbson_do_batched_insert(PyObject* self, PyObject* args) {
         goto insertfail;
     }
 
+    generate_ids = _init_id_generator(ctx, &ids);
+    if (generate_ids == -1) {
+        goto insertfail;
+    }
+
     iterator = PyObject_GetIter(docs);
     if (iterator == NULL) {
         PyObject* InvalidOperation = _error("InvalidOperation");
@@ -930,6 +1103,9 @@ static PyObject* _cbson_do_batched_insert(PyObject* self, PyObject* args) {
     while ((doc = PyIter_Next(iterator)) != NULL) {
         int before = buffer_get_position(buffer);
         int cur_size;
+        if (generate_ids && !_add_missing_id(&ids, doc)) {
+            goto iterfail;
+        }
         if (!write_dict(state->_cbson, buffer, doc, check_keys,
                         &options, 1)) {
             goto iterfail;
@@ -1026,6 +1202,7 @@ static PyObject* _cbson_do_batched_insert(PyObject* self, PyObject* args) {
                                 Py_DECREF(to_publish);
                                 Py_DECREF(iterator);
                                 Py_DECREF(doc);
+                                _destroy_id_generator(&ids);
                                 buffer_free(buffer);
                                 PyMem_Free(collection_name);
                                 Py_RETURN_NONE;
@@ -1062,6 +1239,7 @@ static PyObject* _cbson_do_batched_insert(PyObject* self, PyObject* args) {
         Py_CLEAR(doc);
     }
     Py_DECREF(iterator);
+    _destroy_id_generator(&ids);
 
     if (PyErr_Occurred()) {
         goto insertfail;
@@ -1113,6 +1291,7 @@ iterfail:
     Py_XDECREF(doc);
     Py_DECREF(iterator);
 insertfail:
+    _destroy_id_generator(&ids);
     Py_XDECREF(exc_type);
     Py_XDECREF(exc_value);
     Py_XDECREF(exc_trace);
@@ -1147,6 +1326,8 @@ _batched_op_msg(
     PyObject* max_message_size_obj;
     PyObject* doc;
     PyObject* iterator;
+    int generate_ids = 0;
+    id_generator_t ids = {NULL, NULL};
     char* flags = ack ? "\x00\x00\x00\x00" : "\x02\x00\x00\x00";
 
     max_bson_size_obj = PyObject_GetAttrString(ctx, "max_bson_size");
@@ -1248,11 +1429,21 @@ _batched_op_msg(
         }
         return 0;
     }
+    if (op == _INSERT) {
+        generate_ids = _init_id_generator(ctx, &ids);
+        if (generate_ids == -1) {
+            Py_DECREF(iterator);
+            goto cmdfail;
+        }
+    }
     while ((doc = PyIter_Next(iterator)) != NULL) {
         int cur_doc_begin = buffer_get_position(buffer);
         int cur_size;
         int doc_too_large = 0;
         int unacked_doc_too_large = 0;
+        if (generate_ids && !_add_missing_id(&ids, doc)) {
+            goto cmditerfail;
+        }
         if (!write_dict(state->_cbson, buffer, doc, check_keys,
                         &options, 1)) {
             goto cmditerfail;
@@ -1307,6 +1498,7 @@ _batched_op_msg(
         }
     }
     Py_DECREF(iterator);
+    _destroy_id_generator(&ids);
 
     if (PyErr_Occurred()) {
         goto cmdfail;
@@ -1321,6 +1513,7 @@ cmditerfail:
     Py_XDECREF(doc);
     Py_DECREF(iterator);
 cmdfail:
+    _destroy_id_generator(&ids);
     return 0;
 }
 
@@ -1470,6 +1663,8 @@ _batched_write_command(
     PyObject* max_write_batch_size_obj;
     PyObject* doc;
     PyObject* iterator;
+    int generate_ids = 0;
+    id_generator_t ids = {NULL, NULL};
 
     max_bson_size_obj = PyObject_GetAttrString(ctx, "max_bson_size");
 #if PY_MAJOR_VERSION >= 3
@@ -1570,6 +1765,13 @@ _batched_write_command(
         }
         return 0;
     }
+    if (op == _INSERT) {
+        generate_ids = _init_id_generator(ctx, &ids);
+        if (generate_ids == -1) {
+            Py_DECREF(iterator);
+            goto cmdfail;
+        }
+    }
     while ((doc = PyIter_Next(iterator)) != NULL) {
         int sub_doc_begin = buffer_get_position(buffer);
         int cur_doc_begin;
@@ -1583,6 +1785,9 @@ _batched_write_command(
             goto cmditerfail;
         }
         cur_doc_begin = buffer_get_position(buffer);
+        if (generate_ids && !_add_missing_id(&ids, doc)) {
+            goto cmditerfail;
+        }
         if (!write_dict(state->_cbson, buffer, doc,
                         check_keys, &options, 1)) {
             goto cmditerfail;
@@ -1630,6 +1835,7 @@ _batched_write_command(
         idx += 1;
     }
     Py_DECREF(iterator);
+    _destroy_id_generator(&ids);
 
     if (PyErr_Occurred()) {
         goto cmdfail;
@@ -1650,6 +1856,7 @@ cmditerfail:
     Py_XDECREF(doc);
     Py_DECREF(iterator);
 cmdfail:
+    _destroy_id_generator(&ids);
     return 0;
 }
 
@@ -163,6 +163,9 @@ class _Bulk(object):
         self.started_retryable_write = False
         # Extra state so that we know where to pick up on a retry attempt.
         self.current_run = None
+        # Add missing _ids to insert documents while encoding them, rather
+        # than in add_insert.
+        self.generate_ids = False
 
     def add_insert(self, document):
         """Add an insert document to the list of ops.
@@ -272,7 +275,7 @@ class _Bulk(object):
             if self.bypass_doc_val and sock_info.max_wire_version >= 4:
                 cmd['bypassDocumentValidation'] = True
             bwc = _BulkWriteContext(db_name, cmd, sock_info, op_id,
-                                    listeners, session)
+                                    listeners, session, self.generate_ids)
 
             while run.idx_offset < len(run.ops):
                 if session:
@@ -361,7 +364,7 @@ class _Bulk(object):
         db = self.collection.database
         bwc = _BulkWriteContext(
             db.name, command, sock_info, op_id, db.client._event_listeners,
-            session=None)
+            session=None, generate_ids=self.generate_ids)
         # Legacy batched OP_INSERT.
         _do_batched_insert(
             self.collection.full_name, run.ops, True, acknowledged, concern,
@@ -384,7 +387,7 @@ class _Bulk(object):
                        ('ordered', False),
                        ('writeConcern', {'w': 0})])
             bwc = _BulkWriteContext(db_name, cmd, sock_info, op_id,
-                                    listeners, None)
+                                    listeners, None, self.generate_ids)
 
             while run.idx_offset < len(run.ops):
                 check_keys = run.op_type == _INSERT
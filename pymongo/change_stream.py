@@ -16,6 +16,7 @@
 
 import copy
 
+from bson.codec_options import _without_record_type
 from bson.son import SON
 
 from pymongo import common
@@ -106,6 +107,8 @@ class ChangeStream(object):
         the corresponding CommandCursor.
         """
         read_preference = self._target._read_preference_for(session)
+        # Change events are not the user's documents, decode them to dict.
+        codec_options = _without_record_type(self._target.codec_options)
         client = self._database.client
         with client._socket_for_reads(
                 read_preference, session) as (sock_info, slave_ok):
@@ -119,7 +122,7 @@ class ChangeStream(object):
                 cmd,
                 slave_ok,
                 read_preference,
-                self._target.codec_options,
+                codec_options,
                 parse_write_concern_error=True,
                 read_concern=self._target.read_concern,
                 collation=self._collation,
@@ -137,7 +140,7 @@ class ChangeStream(object):
             ns = cursor["ns"]
             _, collname = ns.split(".", 1)
             aggregation_collection = self._database.get_collection(
-                collname, codec_options=self._target.codec_options,
+                collname, codec_options=codec_options,
                 read_preference=read_preference,
                 write_concern=self._target.write_concern,
                 read_concern=self._target.read_concern
@@ -125,7 +125,13 @@ def _parse_pool_options(options):
     driver = options.get('driver')
     compression_settings = CompressionSettings(
         options.get('compressors', []),
-        options.get('zlibcompressionlevel', -1))
+        options.get('zlibcompressionlevel', -1),
+        options.get('zstdcompressionlevel', 3),
+        options.get('compressionminsize', 0),
+        options.get('compression_rules'),
+        options.get('adaptivecompression', False))
+    max_requests_per_connection = options.get(
+        'maxrequestsperconnection', common.MAX_REQUESTS_PER_CONNECTION)
     ssl_context, ssl_match_hostname = _parse_ssl_options(options)
     return PoolOptions(max_pool_size,
                        min_pool_size,
@@ -136,7 +142,8 @@ def _parse_pool_options(options):
                        _EventListeners(event_listeners),
                        appname,
                        driver,
-                       compression_settings)
+                       compression_settings,
+                       max_requests_per_connection)
 
 
 class ClientOptions(object):
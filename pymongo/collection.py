@@ -737,21 +737,27 @@ class Collection(common.BaseObject):
         """
         if not isinstance(documents, abc.Iterable) or not documents:
             raise TypeError("documents must be a non-empty list")
-        inserted_ids = []
-        def gen():
-            """A generator that validates documents and handles _ids."""
-            for document in documents:
-                common.validate_is_document_type("document", document)
-                if not isinstance(document, RawBSONDocument):
-                    if "_id" not in document:
-                        document["_id"] = ObjectId()
-                    inserted_ids.append(document["_id"])
-                yield (message._INSERT, document)
-
         write_concern = self._write_concern_for(session)
         blk = _Bulk(self, ordered, bypass_document_validation)
-        blk.ops = [doc for doc in gen()]
-        blk.execute(write_concern, session=session)
+        # The documents without an _id get one as they are encoded.
+        blk.generate_ids = True
+        for document in documents:
+            common.validate_is_document_type("document", document)
+            blk.ops.append((message._INSERT, document))
+        try:
+            blk.execute(write_concern, session=session)
+        finally:
+            # The documents after an error were never encoded. Give them an
+            # _id too, like every document had before they were sent.
+            missing_ids = [
+                document for _, document in blk.ops
+                if not (isinstance(document, RawBSONDocument) or
+                        "_id" in document)]
+            for document, _id in zip(
+                    missing_ids, ObjectId.generate_many(len(missing_ids))):
+                document["_id"] = _id
+        inserted_ids = [document["_id"] for _, document in blk.ops
+                        if not isinstance(document, RawBSONDocument)]
         return InsertManyResult(inserted_ids, write_concern.acknowledged)
 
     def _update(self, sock_info, criteria, document, upsert=False,
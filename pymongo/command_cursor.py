@@ -18,6 +18,7 @@ import datetime
 
 from collections import deque
 
+from bson import _fields_filter
 from bson.py3compat import integer_types
 from pymongo import helpers
 from pymongo.errors import (AutoReconnect,
@@ -49,6 +50,7 @@ class CommandCursor(object):
         self.__max_await_time_ms = max_await_time_ms
         self.__session = session
         self.__explicit_session = explicit_session
+        self.__decode_fields = None
         self.__killed = (self.__id == 0)
         if self.__killed:
             self.__end_session(True)
@@ -119,6 +121,23 @@ class CommandCursor(object):
         self.__batch_size = batch_size == 1 and 2 or batch_size
         return self
 
+    def decode_fields(self, fields):
+        """Only decode some of the top-level fields of the result documents.
+
+        Works like :meth:`Cursor.decode_fields`, but only applies to the
+        batches fetched from the server after it is called. The first batch
+        is returned by the command that created this cursor and has already
+        been decoded in full.
+
+        :Parameters:
+          - `fields`: An iterable of the names of the top-level fields to
+            decode, or ``None`` to decode every field.
+
+        .. versionadded:: 3.9
+        """
+        self.__decode_fields = _fields_filter(fields)
+        return self
+
     def __send_message(self, operation):
         """Send a getmore message and handle the response.
         """
@@ -152,7 +171,9 @@ class CommandCursor(object):
             with client._reset_on_error(self.__address, self.__session):
                 docs = self._unpack_response(reply,
                                              self.__id,
-                                             self.__collection.codec_options)
+                                             self.__collection.codec_options,
+                                             self.__decode_fields,
+                                             not from_command)
                 if from_command:
                     first = docs[0]
                     client._process_response(first, self.__session)
@@ -208,8 +229,10 @@ class CommandCursor(object):
             kill()
         self.__data = deque(documents)
 
-    def _unpack_response(self, response, cursor_id, codec_options):
-        return response.unpack_response(cursor_id, codec_options)
+    def _unpack_response(self, response, cursor_id, codec_options,
+                         user_fields=None, legacy_response=False):
+        return response.unpack_response(cursor_id, codec_options, user_fields,
+                                        legacy_response)
 
     def _refresh(self):
         """Refreshes the cursor with more data from the server.
@@ -321,7 +344,8 @@ class RawBatchCommandCursor(CommandCursor):
             collection, cursor_info, address, retrieved, batch_size,
             max_await_time_ms, session, explicit_session)
 
-    def _unpack_response(self, response, cursor_id, codec_options):
+    def _unpack_response(self, response, cursor_id, codec_options,
+                         user_fields=None, legacy_response=False):
         return response.raw_response(cursor_id)
 
     def __getitem__(self, index):
@@ -22,11 +22,15 @@ from bson import SON
 from bson.binary import (STANDARD, PYTHON_LEGACY,
                          JAVA_LEGACY, CSHARP_LEGACY)
 from bson.codec_options import CodecOptions, TypeRegistry
+from bson.datetime_ms import ALL_DATETIME_CONVERSIONS
 from bson.py3compat import abc, integer_types, iteritems, string_type
 from bson.raw_bson import RawBSONDocument
+from bson.record import RecordType
 from pymongo.auth import MECHANISMS
-from pymongo.compression_support import (validate_compressors,
-                                         validate_zlib_compression_level)
+from pymongo.compression_support import (validate_compression_rules,
+                                         validate_compressors,
+                                         validate_zlib_compression_level,
+                                         validate_zstd_compression_level)
 from pymongo.driver_info import DriverInfo
 from pymongo.errors import ConfigurationError
 from pymongo.monitoring import _validate_event_listeners
@@ -85,6 +89,9 @@ MIN_POOL_SIZE = 0
 # Default value for maxIdleTimeMS.
 MAX_IDLE_TIME_MS = None
 
+# Default value for maxRequestsPerConnection.
+MAX_REQUESTS_PER_CONNECTION = 1
+
 # Default value for localThresholdMS.
 LOCAL_THRESHOLD_MS = 15
 
@@ -416,9 +423,12 @@ def validate_auth_mechanism_properties(option, value):
 
 def validate_document_class(option, value):
     """Validate the document_class option."""
-    if not issubclass(value, (abc.MutableMapping, RawBSONDocument)):
+    if not (isinstance(value, RecordType) or
+            isinstance(value, type) and
+            issubclass(value, (abc.MutableMapping, RawBSONDocument))):
         raise TypeError("%s must be dict, bson.son.SON, "
-                        "bson.raw_bson.RawBSONDocument, or a "
+                        "bson.raw_bson.RawBSONDocument, "
+                        "bson.record.RecordType, or a "
                         "sublass of collections.MutableMapping" % (option,))
     return value
 
@@ -533,6 +543,14 @@ def validate_tzinfo(dummy, value):
     return value
 
 
+def validate_datetime_conversion(option, value):
+    """Validate the datetime_conversion option."""
+    if value not in ALL_DATETIME_CONVERSIONS:
+        raise ValueError("%s must be a value from "
+                         "bson.datetime_ms.DatetimeConversion" % (option,))
+    return value
+
+
 # Dictionary where keys are the names of public URI options, and values
 # are lists of aliases for that option. Aliases of option names are assumed
 # to have been deprecated.
@@ -590,9 +608,12 @@ URI_OPTIONS_VALIDATOR_MAP = {
 # Dictionary where keys are the names of URI options specific to pymongo,
 # and values are functions that validate user-input values for those options.
 NONSPEC_OPTIONS_VALIDATOR_MAP = {
+    'adaptivecompression': validate_boolean_or_string,
+    'compressionminsize': validate_non_negative_integer,
     'connect': validate_boolean_or_string,
     'driver': validate_driver_or_none,
     'fsync': validate_boolean_or_string,
+    'maxrequestsperconnection': validate_positive_integer,
     'minpoolsize': validate_non_negative_integer,
     'socketkeepalive': validate_boolean_or_string,
     'tlscrlfile': validate_readable,
@@ -601,17 +622,22 @@ NONSPEC_OPTIONS_VALIDATOR_MAP = {
     'uuidrepresentation': validate_uuid_representation,
     'waitqueuemultiple': validate_non_negative_integer_or_none,
     'waitqueuetimeoutms': validate_timeout_or_none,
+    'zstdcompressionlevel': validate_zstd_compression_level,
 }
 
 # Dictionary where keys are the names of keyword-only options for the
 # MongoClient constructor, and values are functions that validate user-input
 # values for those options.
 KW_VALIDATORS = {
+    'compression_rules': validate_compression_rules,
     'document_class': validate_document_class,
     'type_registry': validate_type_registry,
     'read_preference': validate_read_preference,
     'event_listeners': _validate_event_listeners,
     'tzinfo': validate_tzinfo,
+    'typed_arrays': validate_boolean,
+    'validate': validate_boolean,
+    'datetime_conversion': validate_datetime_conversion,
     'username': validate_string_or_none,
     'password': validate_string_or_none,
     'server_selector': validate_is_callable_or_none,
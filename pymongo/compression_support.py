@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
 import warnings
 
 try:
@@ -28,9 +29,17 @@ except ImportError:
     # Python built without zlib support.
     _HAVE_ZLIB = False
 
+try:
+    import zstandard
+    _HAVE_ZSTD = True
+except ImportError:
+    # zstandard isn't available.
+    _HAVE_ZSTD = False
+
+from bson.py3compat import abc, string_type
 from pymongo.monitoring import _SENSITIVE_COMMANDS
 
-_SUPPORTED_COMPRESSORS = set(["snappy", "zlib"])
+_SUPPORTED_COMPRESSORS = set(["snappy", "zlib", "zstd"])
 _NO_COMPRESSION = set(['ismaster'])
 _NO_COMPRESSION.update(_SENSITIVE_COMMANDS)
 
@@ -57,6 +66,11 @@ def validate_compressors(dummy, value):
             warnings.warn(
                 "Wire protocol compression with zlib is not available. "
                 "The zlib module is not available.")
+        elif compressor == "zstd" and not _HAVE_ZSTD:
+            compressors.remove(compressor)
+            warnings.warn(
+                "Wire protocol compression with zstandard is not available. "
+                "You must install the zstandard module for zstandard support.")
     return compressors
 
 
@@ -71,18 +85,144 @@ def validate_zlib_compression_level(option, value):
     return level
 
 
+def validate_zstd_compression_level(option, value):
+    try:
+        level = int(value)
+    except:
+        raise TypeError("%s must be an integer, not %r." % (option, value))
+    if level < 1 or level > 22:
+        raise ValueError(
+            "%s must be between 1 and 22, not %d." % (option, level))
+    return level
+
+
+def validate_compression_rules(option, value):
+    """Validate a mapping of command names to booleans."""
+    if value is None:
+        return {}
+    if not isinstance(value, abc.Mapping):
+        raise TypeError("%s must be a mapping of command names to True or "
+                        "False, not %r." % (option, value))
+    for name, compress in value.items():
+        if not isinstance(name, string_type):
+            raise TypeError("%s keys must be command names, not %r." % (
+                option, name))
+        if not isinstance(compress, bool):
+            raise TypeError("%s values must be True or False, not %r." % (
+                option, compress))
+    return dict(value)
+
+
+# With adaptive compression, a message that compresses to more than this
+# fraction of its size didn't compress.
+_ADAPTIVE_MAX_RATIO = 0.9
+# The most messages of one command sent uncompressed after a message that
+# didn't compress.
+_ADAPTIVE_MAX_BACKOFF = 64
+
+
+class _CompressionPolicy(object):
+    """Decides which messages to compress and counts the results.
+
+    Shared by the compression contexts of all of a client's connections.
+    """
+
+    def __init__(self, min_size=0, rules=None, adaptive=False):
+        self.min_size = min_size
+        self.rules = rules or {}
+        self.adaptive = adaptive
+        self._lock = threading.Lock()
+        # Maps command names to the number of messages still to send
+        # uncompressed and the number to skip after the next message that
+        # doesn't compress.
+        self._backoff = {}
+        # Maps compressor names to [messages, skipped, bytes_in, bytes_out,
+        # time].
+        self._counters = {}
+
+    def _get_counters(self, compressor):
+        try:
+            return self._counters[compressor]
+        except KeyError:
+            counters = self._counters[compressor] = [0, 0, 0, 0, 0.0]
+            return counters
+
+    def should_compress(self, ctx, name, size):
+        """Whether to compress a message of `size` bytes for command `name`
+        with `ctx`.
+        """
+        compress = self.rules.get(name)
+        if compress is None:
+            compress = size >= self.min_size
+            if compress and self.adaptive:
+                with self._lock:
+                    backoff = self._backoff.get(name)
+                    if backoff is not None and backoff[0]:
+                        backoff[0] -= 1
+                        compress = False
+        if not compress:
+            with self._lock:
+                self._get_counters(ctx.name)[1] += 1
+        return compress
+
+    def record(self, ctx, name, size, compressed_size, duration):
+        """Record the compression of a message of `size` bytes."""
+        with self._lock:
+            counters = self._get_counters(ctx.name)
+            counters[0] += 1
+            counters[2] += size
+            counters[3] += compressed_size
+            counters[4] += duration
+            if self.adaptive and name not in self.rules:
+                backoff = self._backoff.get(name)
+                if compressed_size > size * _ADAPTIVE_MAX_RATIO:
+                    # Skip the next messages for this command, twice as
+                    # many each time it still doesn't compress.
+                    if backoff is None:
+                        backoff = self._backoff[name] = [0, 1]
+                    backoff[0] = backoff[1]
+                    backoff[1] = min(backoff[1] * 2, _ADAPTIVE_MAX_BACKOFF)
+                elif backoff is not None:
+                    del self._backoff[name]
+
+    def statistics(self):
+        """A dict mapping compressor names to their counters."""
+        with self._lock:
+            return dict(
+                (compressor, {"messages": counters[0],
+                              "skipped": counters[1],
+                              "bytes_in": counters[2],
+                              "bytes_out": counters[3],
+                              "time": counters[4]})
+                for compressor, counters in self._counters.items())
+
+
 class CompressionSettings(object):
-    def __init__(self, compressors, zlib_compression_level):
+    def __init__(self, compressors, zlib_compression_level,
+                 zstd_compression_level=3, min_size=0, rules=None,
+                 adaptive=False):
         self.compressors = compressors
         self.zlib_compression_level = zlib_compression_level
+        self.zstd_compression_level = zstd_compression_level
+        self.policy = _CompressionPolicy(min_size, rules, adaptive)
 
     def get_compression_context(self, compressors):
         if compressors:
             chosen = compressors[0]
             if chosen == "snappy":
-                return SnappyContext()
+                ctx = SnappyContext()
             elif chosen == "zlib":
-                return ZlibContext(self.zlib_compression_level)
+                ctx = ZlibContext(self.zlib_compression_level)
+            elif chosen == "zstd":
+                ctx = ZstdContext(self.zstd_compression_level)
+            else:
+                return None
+            ctx.policy = self.policy
+            return ctx
+
+    def statistics(self):
+        """Counters for the messages sent with each compressor."""
+        return self.policy.statistics()
 
 
 def _zlib_no_compress(data):
@@ -93,6 +233,8 @@ def _zlib_no_compress(data):
 
 class SnappyContext(object):
     compressor_id = 1
+    name = "snappy"
+    policy = None
 
     @staticmethod
     def compress(data):
@@ -101,6 +243,8 @@ class SnappyContext(object):
 
 class ZlibContext(object):
     compressor_id = 2
+    name = "zlib"
+    policy = None
 
     def __init__(self, level):
         # Jython zlib.compress doesn't support -1
@@ -113,6 +257,48 @@ class ZlibContext(object):
             self.compress = lambda data: zlib.compress(data, level)
 
 
+# zstandard compressors and decompressors keep their zstd contexts between
+# calls, but they can't be used by two threads at once. Each thread reuses
+# its own.
+_zstd_local = threading.local()
+
+
+def _zstd_compressor(level):
+    """The zstandard compressor for `level` of the current thread."""
+    try:
+        compressors = _zstd_local.compressors
+    except AttributeError:
+        compressors = _zstd_local.compressors = {}
+    try:
+        return compressors[level]
+    except KeyError:
+        compressor = compressors[level] = zstandard.ZstdCompressor(
+            level=level)
+        return compressor
+
+
+def _zstd_decompressor():
+    """The zstandard decompressor of the current thread."""
+    try:
+        return _zstd_local.decompressor
+    except AttributeError:
+        decompressor = _zstd_local.decompressor = (
+            zstandard.ZstdDecompressor())
+        return decompressor
+
+
+class ZstdContext(object):
+    compressor_id = 3
+    name = "zstd"
+    policy = None
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        return _zstd_compressor(self.level).compress(data)
+
+
 def decompress(data, compressor_id):
     if compressor_id == SnappyContext.compressor_id:
         # python-snappy doesn't support the buffer interface.
@@ -126,5 +312,8 @@ def decompress(data, compressor_id):
         return snappy.uncompress(bytes(data))
     elif compressor_id == ZlibContext.compressor_id:
         return zlib.decompress(data)
+    elif compressor_id == ZstdContext.compressor_id:
+        # The server writes the content size in each frame.
+        return _zstd_decompressor().decompress(data)
     else:
         raise ValueError("Unknown compressorId %d" % (compressor_id,))
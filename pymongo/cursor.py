@@ -20,9 +20,10 @@ import warnings
 
 from collections import deque
 
-from bson import RE_TYPE
+from bson import RE_TYPE, _fields_filter, decode_columns
 from bson.code import Code
-from bson.py3compat import (iteritems,
+from bson.py3compat import (abc,
+                            iteritems,
                             integer_types,
                             string_type)
 from bson.son import SON
@@ -187,6 +188,7 @@ class Cursor(object):
         self.__return_key = return_key
         self.__show_record_id = show_record_id
         self.__snapshot = snapshot
+        self.__decode_fields = None
         self.__set_hint(hint)
 
         # Exhaust cursor support
@@ -278,7 +280,8 @@ class Cursor(object):
                            "max_time_ms", "max_await_time_ms", "comment",
                            "max", "min", "ordering", "explain", "hint",
                            "batch_size", "max_scan", "manipulate",
-                           "query_flags", "modifiers", "collation")
+                           "query_flags", "modifiers", "collation",
+                           "decode_fields")
         data = dict((k, v) for k, v in iteritems(self.__dict__)
                     if k.startswith('_Cursor__') and k[9:] in values_to_clone)
         if deepcopy:
@@ -916,6 +919,62 @@ class Cursor(object):
         self.__collation = validate_collation_or_none(collation)
         return self
 
+    def decode_fields(self, fields):
+        """Only decode some of the top-level fields of the result documents.
+
+        The other fields are still sent by the server, but are skipped over
+        without being decoded, see :func:`bson.decode_all`. Unlike a
+        `projection`, this lets documents be fetched once and read by several
+        consumers that each need only a few fields. Pass ``None`` to decode
+        every field again.
+
+        Raises :exc:`~pymongo.errors.InvalidOperation` if this
+        :class:`Cursor` has already been used. Only the last
+        :meth:`decode_fields` applied to this cursor has any effect.
+
+        :Parameters:
+          - `fields`: An iterable of the names of the top-level fields to
+            decode, or ``None``.
+
+        .. versionadded:: 3.9
+        """
+        self.__check_okay_to_chain()
+        self.__decode_fields = _fields_filter(fields)
+        return self
+
+    def to_columns(self, schema):
+        """Decode all the results of this query into one array per field.
+
+        The results are fetched as raw batches of BSON and each batch is
+        decoded with :func:`bson.decode_columns`, without creating a Python
+        object per document. Returns a dict mapping each field in `schema`
+        to a ``(values, valid)`` pair of :class:`array.array` instances with
+        one entry per result document.
+
+        Raises :exc:`~pymongo.errors.InvalidOperation` if this
+        :class:`Cursor` has already been used.
+
+        :Parameters:
+          - `schema`: A mapping, or an iterable of pairs, of field name to
+            column type. See :func:`bson.decode_columns`.
+
+        .. versionadded:: 3.9
+        """
+        self.__check_okay_to_chain()
+        if not isinstance(schema, abc.Mapping):
+            schema = list(schema)
+        session = self.__session if self.__explicit_session else None
+        raw_cursor = self._clone(
+            True, RawBatchCursor(self.__collection, session=session))
+        raw_cursor.__manipulate = False
+        columns = decode_columns(b"", schema)
+        for batch in raw_cursor:
+            for name, (values, valid) in iteritems(
+                    decode_columns(batch, schema)):
+                columns[name][0].extend(values)
+                columns[name][1].extend(valid)
+        return columns
+
     def __send_message(self, operation):
         """Send a query or getmore operation and handles the response.
 
@@ -982,9 +1041,15 @@ class Cursor(object):
 
         try:
             with client._reset_on_error(self.__address, self.__session):
+                if self.__explain:
+                    user_fields = None
+                else:
+                    user_fields = self.__decode_fields
                 docs = self._unpack_response(reply,
                                              self.__id,
-                                             self.__collection.codec_options)
+                                             self.__collection.codec_options,
+                                             user_fields,
+                                             not from_command)
                 if from_command:
                     first = docs[0]
                     client._process_response(first, self.__session)
@@ -1071,8 +1136,10 @@ class Cursor(object):
         if self.__limit and self.__id and self.__limit <= self.__retrieved:
             self.__die()
 
-    def _unpack_response(self, response, cursor_id, codec_options):
-        return response.unpack_response(cursor_id, codec_options)
+    def _unpack_response(self, response, cursor_id, codec_options,
+                         user_fields=None, legacy_response=False):
+        return response.unpack_response(cursor_id, codec_options, user_fields,
+                                        legacy_response)
 
     def _read_preference(self):
         if self.__read_preference is None:
@@ -1283,7 +1350,8 @@ class RawBatchCursor(Cursor):
             raise InvalidOperation(
                 "Cannot use RawBatchCursor with manipulate=True")
 
-    def _unpack_response(self, response, cursor_id, codec_options):
+    def _unpack_response(self, response, cursor_id, codec_options,
+                         user_fields=None, legacy_response=False):
         return response.raw_response(cursor_id)
 
     def explain(self):
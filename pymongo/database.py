@@ -17,7 +17,7 @@
 import warnings
 
 from bson.code import Code
-from bson.codec_options import DEFAULT_CODEC_OPTIONS
+from bson.codec_options import DEFAULT_CODEC_OPTIONS, _without_record_type
 from bson.dbref import DBRef
 from bson.py3compat import iteritems, string_type, _unicode
 from bson.son import SON
@@ -619,7 +619,8 @@ class Database(common.BaseObject):
         """Internal listCollections helper."""
 
         coll = self.get_collection(
-            "$cmd", read_preference=read_preference)
+            "$cmd", _without_record_type(self.codec_options),
+            read_preference=read_preference)
         if sock_info.max_wire_version > 2:
             cmd = SON([("listCollections", 1),
                        ("cursor", {})])
@@ -26,10 +26,15 @@ import struct
 
 import bson
 from bson import (CodecOptions,
+                  _bson_to_dict,
                   _dict_to_bson,
+                  _encode_into,
+                  _fields_filter,
                   _make_c_string)
-from bson.codec_options import DEFAULT_CODEC_OPTIONS
-from bson.py3compat import b, StringIO
+from bson.codec_options import DEFAULT_CODEC_OPTIONS, _record_type
+from bson.objectid import ObjectId
+from bson.py3compat import b, PY3
+from bson.raw_bson import RawBSONDocument
 from bson.son import SON
 
 try:
@@ -45,6 +50,7 @@ from pymongo.errors import (ConfigurationError,
                             NotMasterError,
                             OperationFailure,
                             ProtocolError)
+from pymongo.monotonic import time as _time
 from pymongo.read_concern import DEFAULT_READ_CONCERN
 from pymongo.read_preferences import ReadPreference
 
@@ -83,6 +89,15 @@ _UNICODE_REPLACE_CODEC_OPTIONS = CodecOptions(
     unicode_decode_error_handler='replace')
 
 
+if PY3:
+    _join_sections = _EMPTY.join
+else:
+    def _join_sections(sections):
+        """Join message buffers, some of them bytearrays, into bytes."""
+        # Python 2 can't join a bytearray into bytes.
+        return bytes(bytearray().join(sections))
+
+
 def _randint():
     """Generate a pseudo random 32 bit integer."""
     return random.randint(MIN_INT32, MAX_INT32)
@@ -459,9 +474,23 @@ class _CursorAddress(tuple):
 _pack_compression_header = struct.Struct("<iiiiiiB").pack
 _COMPRESSION_HEADER_SIZE = 25
 
-def _compress(operation, data, ctx):
-    """Takes message data, compresses it, and adds an OP_COMPRESSED header."""
-    compressed = ctx.compress(data)
+def _compress(operation, data, ctx, name=None):
+    """Takes message data, compresses it, and adds an OP_COMPRESSED header.
+
+    Returns the request id and a list of buffers, the header and the
+    compressed data. If the compression policy of `ctx` skips messages
+    like this one, for command `name`, returns the request id and the
+    uncompressed message instead.
+    """
+    policy = ctx.policy
+    if policy is None:
+        compressed = ctx.compress(data)
+    elif policy.should_compress(ctx, name, len(data)):
+        start = _time()
+        compressed = ctx.compress(data)
+        policy.record(ctx, name, len(data), len(compressed), _time() - start)
+    else:
+        return __pack_message(operation, data)
     request_id = _randint()
 
     header = _pack_compression_header(
@@ -472,7 +501,7 @@ def _compress(operation, data, ctx):
         operation, # original operation id
         len(data), # uncompressed message length
         ctx.compressor_id) # compressor id
-    return request_id, header + compressed
+    return request_id, [header, compressed]
 
 
 def __last_error(namespace, args):
@@ -525,7 +554,7 @@ def _insert_compressed(
     """Internal compressed unacknowledged insert message helper."""
     op_insert, max_bson_size = _insert(
         collection_name, docs, check_keys, continue_on_error, opts)
-    rid, msg = _compress(2002, op_insert, ctx)
+    rid, msg = _compress(2002, op_insert, ctx, "insert")
     return rid, msg, max_bson_size
 
 
@@ -575,7 +604,7 @@ def _update_compressed(
     """Internal compressed unacknowledged update message helper."""
     op_update, max_bson_size = _update(
         collection_name, upsert, multi, spec, doc, check_keys, opts)
-    rid, msg = _compress(2001, op_update, ctx)
+    rid, msg = _compress(2001, op_update, ctx, "update")
     return rid, msg, max_bson_size
 
 
@@ -613,42 +642,49 @@ def _op_msg_no_header(flags, command, identifier, docs, check_keys, opts):
     Note: this method handles multiple documents in a type one payload but
     it does not perform batch splitting and the total message size is
     only checked *after* generating the entire message.
+
+    Returns a list of buffers, the flags and the type zero section followed
+    by the type one section, if any, so they can be sent without joining.
     """
+    buf = bytearray(_pack_op_msg_flags_type(flags, 0))
     # Encode the command document in payload 0 without checking keys.
-    encoded = _dict_to_bson(command, False, opts)
-    flags_type = _pack_op_msg_flags_type(flags, 0)
-    total_size = len(encoded)
+    total_size = _encode_into(command, buf, len(buf), False, opts)
     max_doc_size = 0
+    sections = [buf]
     if identifier:
-        type_one = _pack_byte(1)
-        cstring = _make_c_string(identifier)
-        encoded_docs = [_dict_to_bson(doc, check_keys, opts) for doc in docs]
-        size = len(cstring) + sum(len(doc) for doc in encoded_docs) + 4
-        encoded_size = _pack_int(size)
+        section = bytearray(_pack_byte(1))
+        # Save space for size
+        section += _ZERO_32
+        section += _make_c_string(identifier)
+        for doc in docs:
+            doc_size = _encode_into(
+                doc, section, len(section), check_keys, opts)
+            max_doc_size = max(max_doc_size, doc_size)
+        size = len(section) - 1
+        section[1:5] = _pack_int(size)
         total_size += size
-        max_doc_size = max(len(doc) for doc in encoded_docs)
-        data = ([flags_type, encoded, type_one, encoded_size, cstring] +
-                encoded_docs)
-    else:
-        data = [flags_type, encoded]
-    return b''.join(data), total_size, max_doc_size
+        sections.append(section)
+    return sections, total_size, max_doc_size
 
 
 def _op_msg_compressed(flags, command, identifier, docs, check_keys, opts,
                        ctx):
-    """Internal OP_MSG message helper."""
-    msg, total_size, max_bson_size = _op_msg_no_header(
+    """Internal compressed OP_MSG message helper."""
+    sections, total_size, max_bson_size = _op_msg_no_header(
         flags, command, identifier, docs, check_keys, opts)
-    rid, msg = _compress(2013, msg, ctx)
+    rid, msg = _compress(
+        2013, _join_sections(sections), ctx, next(iter(command)))
     return rid, msg, total_size, max_bson_size
 
 
 def _op_msg_uncompressed(flags, command, identifier, docs, check_keys, opts):
-    """Internal compressed OP_MSG message helper."""
-    data, total_size, max_bson_size = _op_msg_no_header(
+    """Internal OP_MSG message helper."""
+    sections, total_size, max_bson_size = _op_msg_no_header(
         flags, command, identifier, docs, check_keys, opts)
-    request_id, op_message = __pack_message(2013, data)
-    return request_id, op_message, total_size, max_bson_size
+    request_id = _randint()
+    header = _pack_header(
+        16 + sum(len(section) for section in sections), request_id, 0, 2013)
+    return request_id, [header] + sections, total_size, max_bson_size
 if _use_c:
     _op_msg_uncompressed = _cmessage._op_msg
 
@@ -713,7 +749,11 @@ def _query_compressed(options, collection_name, num_to_skip,
         field_selector,
         opts,
         check_keys)
-    rid, msg = _compress(2004, op_query, ctx)
+    if collection_name.endswith(".$cmd"):
+        name = next(iter(query.get("$query", query)), None)
+    else:
+        name = "find"
+    rid, msg = _compress(2004, op_query, ctx, name)
     return rid, msg, max_bson_size
 
 
@@ -762,7 +802,8 @@ def _get_more(collection_name, num_to_return, cursor_id):
 def _get_more_compressed(collection_name, num_to_return, cursor_id, ctx):
     """Internal compressed getMore message helper."""
     return _compress(
-        2005, _get_more(collection_name, num_to_return, cursor_id), ctx)
+        2005, _get_more(collection_name, num_to_return, cursor_id), ctx,
+        "getMore")
 
 
 def _get_more_uncompressed(collection_name, num_to_return, cursor_id):
@@ -794,7 +835,7 @@ def _delete(collection_name, spec, opts, flags):
 def _delete_compressed(collection_name, spec, opts, flags, ctx):
     """Internal compressed unacknowledged delete message helper."""
     op_delete, max_bson_size = _delete(collection_name, spec, opts, flags)
-    rid, msg = _compress(2006, op_delete, ctx)
+    rid, msg = _compress(2006, op_delete, ctx, "delete")
     return rid, msg, max_bson_size
 
 
@@ -838,10 +879,10 @@ class _BulkWriteContext(object):
 
     __slots__ = ('db_name', 'command', 'sock_info', 'op_id',
                  'name', 'field', 'publish', 'start_time', 'listeners',
-                 'session', 'compress')
+                 'session', 'compress', 'generate_ids')
 
     def __init__(self, database_name, command, sock_info, operation_id,
-                 listeners, session):
+                 listeners, session, generate_ids=False):
         self.db_name = database_name
         self.command = command
         self.sock_info = sock_info
@@ -853,6 +894,9 @@ class _BulkWriteContext(object):
         self.start_time = datetime.datetime.now() if self.publish else None
         self.session = session
         self.compress = True if sock_info.compression_context else False
+        # Give inserted documents that have no _id a new ObjectId as they
+        # are encoded.
+        self.generate_ids = generate_ids
 
     @property
     def max_bson_size(self):
@@ -873,7 +917,7 @@ class _BulkWriteContext(object):
             self, request_id, msg, max_doc_size, acknowledged, docs, compress):
         if compress:
             request_id, msg = _compress(
-                2002, msg, self.sock_info.compression_context)
+                2002, msg, self.sock_info.compression_context, self.name)
         return self.legacy_write(
             request_id, msg, max_doc_size, acknowledged, docs)
 
@@ -964,6 +1008,12 @@ def _raise_document_too_large(operation, doc_size, max_size):
         raise DocumentTooLarge("%r command document too large" % (operation,))
 
 
+def _add_missing_id(doc):
+    """Give an insert document that has no _id a new ObjectId."""
+    if not (isinstance(doc, RawBSONDocument) or "_id" in doc):
+        doc["_id"] = ObjectId()
+
+
 def _do_batched_insert(collection_name, docs, check_keys,
                        safe, last_error_args, continue_on_error, opts,
                        ctx):
@@ -981,33 +1031,39 @@ def _do_batched_insert(collection_name, docs, check_keys,
 
     send_safe = safe or not continue_on_error
     last_error = None
-    data = StringIO()
-    data.write(struct.pack("<i", int(continue_on_error)))
-    data.write(_make_c_string(collection_name))
-    message_length = begin_loc = data.tell()
+    data = bytearray(struct.pack("<i", int(continue_on_error)))
+    data += _make_c_string(collection_name)
+    message_length = begin_loc = len(data)
     has_docs = False
     to_send = []
-    encode = _dict_to_bson  # Make local
+    encode_into = _encode_into  # Make local
     compress = ctx.compress and not (safe or send_safe)
+    generate_ids = ctx.generate_ids
     for doc in docs:
-        encoded = encode(doc, check_keys, opts)
-        encoded_length = len(encoded)
+        if generate_ids:
+            _add_missing_id(doc)
+        # Encode straight into the pending message.
+        doc_start = len(data)
+        encoded_length = encode_into(doc, data, doc_start, check_keys, opts)
         too_large = (encoded_length > ctx.max_bson_size)
 
         message_length += encoded_length
         if message_length < ctx.max_message_size and not too_large:
-            data.write(encoded)
             to_send.append(doc)
             has_docs = True
             continue
 
+        # This document starts the next message.
+        encoded = bytes(data[doc_start:])
+        del data[doc_start:]
+
         if has_docs:
             # We have enough data, send this message.
             try:
                 if compress:
-                    rid, msg = None, data.getvalue()
+                    rid, msg = None, bytes(data)
                 else:
-                    rid, msg = _insert_message(data.getvalue(), send_safe)
+                    rid, msg = _insert_message(bytes(data), send_safe)
                 ctx.legacy_bulk_insert(
                     rid, msg, 0, send_safe, to_send, compress)
             # Exception type could be OperationFailure or a subtype
@@ -1029,18 +1085,17 @@ def _do_batched_insert(collection_name, docs, check_keys,
                 "insert", encoded_length, ctx.max_bson_size)
 
         message_length = begin_loc + encoded_length
-        data.seek(begin_loc)
-        data.truncate()
-        data.write(encoded)
+        del data[begin_loc:]
+        data += encoded
         to_send = [doc]
 
     if not has_docs:
         raise InvalidOperation("cannot do an empty bulk insert")
 
     if compress:
-        request_id, msg = None, data.getvalue()
+        request_id, msg = None, bytes(data)
     else:
-        request_id, msg = _insert_message(data.getvalue(), safe)
+        request_id, msg = _insert_message(bytes(data), safe)
     ctx.legacy_bulk_insert(request_id, msg, 0, safe, to_send, compress)
 
     # Re-raise any exception stored due to continue_on_error
@@ -1068,32 +1123,35 @@ def _batched_op_msg_impl(
 
     flags = b"\x00\x00\x00\x00" if ack else b"\x02\x00\x00\x00"
     # Flags
-    buf.write(flags)
+    buf += flags
 
     # Type 0 Section
-    buf.write(b"\x00")
-    buf.write(_dict_to_bson(command, False, opts))
+    buf += b"\x00"
+    _encode_into(command, buf, len(buf), False, opts)
 
     # Type 1 Section
-    buf.write(b"\x01")
-    size_location = buf.tell()
+    buf += b"\x01"
+    size_location = len(buf)
     # Save space for size
-    buf.write(b"\x00\x00\x00\x00")
+    buf += _ZERO_32
     try:
-        buf.write(_OP_MSG_MAP[operation])
+        buf += _OP_MSG_MAP[operation]
     except KeyError:
         raise InvalidOperation('Unknown command')
 
     if operation in (_UPDATE, _DELETE):
         check_keys = False
 
+    generate_ids = operation == _INSERT and ctx.generate_ids
     to_send = []
     idx = 0
     for doc in docs:
-        # Encode the current operation
-        value = _dict_to_bson(doc, check_keys, opts)
-        doc_length = len(value)
-        new_message_size = buf.tell() + doc_length
+        if generate_ids:
+            _add_missing_id(doc)
+        # Encode the current operation straight into the message.
+        doc_start = len(buf)
+        doc_length = _encode_into(doc, buf, doc_start, check_keys, opts)
+        new_message_size = doc_start + doc_length
         # Does first document exceed max_message_size?
         doc_too_large = (idx == 0 and (new_message_size > max_message_size))
         # When OP_MSG is used unacknowleged we have to check
@@ -1105,11 +1163,12 @@ def _batched_op_msg_impl(
         if doc_too_large or unacked_doc_too_large:
             write_op = list(_FIELD_MAP.keys())[operation]
             _raise_document_too_large(
-                write_op, len(value), max_bson_size)
+                write_op, doc_length, max_bson_size)
         # We have enough data, return this batch.
         if new_message_size > max_message_size:
+            # This document will start the next batch.
+            del buf[doc_start:]
             break
-        buf.write(value)
         to_send.append(doc)
         idx += 1
         # We have enough documents, return this batch.
@@ -1117,9 +1176,8 @@ def _batched_op_msg_impl(
             break
 
     # Write type 1 section size
-    length = buf.tell()
-    buf.seek(size_location)
-    buf.write(_pack_int(length - size_location))
+    length = len(buf)
+    buf[size_location:size_location + 4] = _pack_int(length - size_location)
 
     return to_send, length
 
@@ -1129,11 +1187,11 @@ def _encode_batched_op_msg(
     """Encode the next batched insert, update, or delete operation
     as OP_MSG.
     """
-    buf = StringIO()
+    buf = bytearray()
 
     to_send, _ = _batched_op_msg_impl(
         operation, command, docs, check_keys, ack, opts, ctx, buf)
-    return buf.getvalue(), to_send
+    return bytes(buf), to_send
 if _use_c:
     _encode_batched_op_msg = _cmessage._encode_batched_op_msg
 
@@ -1149,31 +1207,28 @@ def _batched_op_msg_compressed(
     request_id, msg = _compress(
         2013,
         data,
-        ctx.sock_info.compression_context)
+        ctx.sock_info.compression_context,
+        ctx.name)
     return request_id, msg, to_send
 
 
 def _batched_op_msg(
         operation, command, docs, check_keys, ack, opts, ctx):
     """OP_MSG implementation entry point."""
-    buf = StringIO()
-
     # Save space for message length and request id
-    buf.write(_ZERO_64)
+    buf = bytearray(_ZERO_64)
     # responseTo, opCode
-    buf.write(b"\x00\x00\x00\x00\xdd\x07\x00\x00")
+    buf += b"\x00\x00\x00\x00\xdd\x07\x00\x00"
 
     to_send, length = _batched_op_msg_impl(
         operation, command, docs, check_keys, ack, opts, ctx, buf)
 
     # Header - request id and message length
-    buf.seek(4)
     request_id = _randint()
-    buf.write(_pack_int(request_id))
-    buf.seek(0)
-    buf.write(_pack_int(length))
+    buf[0:8] = _pack_int(length) + _pack_int(request_id)
 
-    return request_id, buf.getvalue(), to_send
+    # Send the buffer the documents were encoded into, without copying it.
+    return request_id, buf, to_send
 if _use_c:
     _batched_op_msg = _cmessage._batched_op_msg
 
@@ -1208,7 +1263,8 @@ def _batched_write_command_compressed(
     request_id, msg = _compress(
         2004,
         data,
-        ctx.sock_info.compression_context)
+        ctx.sock_info.compression_context,
+        ctx.name)
     return request_id, msg, to_send
 
 
@@ -1216,11 +1272,11 @@ def _encode_batched_write_command(
         namespace, operation, command, docs, check_keys, opts, ctx):
     """Encode the next batched insert, update, or delete command.
     """
-    buf = StringIO()
+    buf = bytearray()
 
     to_send, _ = _batched_write_command_impl(
         namespace, operation, command, docs, check_keys, opts, ctx, buf)
-    return buf.getvalue(), to_send
+    return bytes(buf), to_send
 if _use_c:
     _encode_batched_write_command = _cmessage._encode_batched_write_command
 
@@ -1229,25 +1285,20 @@ def _batched_write_command(
         namespace, operation, command, docs, check_keys, opts, ctx):
     """Create the next batched insert, update, or delete command.
     """
-    buf = StringIO()
-
     # Save space for message length and request id
-    buf.write(_ZERO_64)
+    buf = bytearray(_ZERO_64)
     # responseTo, opCode
-    buf.write(b"\x00\x00\x00\x00\xd4\x07\x00\x00")
+    buf += b"\x00\x00\x00\x00\xd4\x07\x00\x00"
 
     # Write OP_QUERY write command
     to_send, length = _batched_write_command_impl(
         namespace, operation, command, docs, check_keys, opts, ctx, buf)
 
     # Header - request id and message length
-    buf.seek(4)
     request_id = _randint()
-    buf.write(_pack_int(request_id))
-    buf.seek(0)
-    buf.write(_pack_int(length))
+    buf[0:8] = _pack_int(length) + _pack_int(request_id)
 
-    return request_id, buf.getvalue(), to_send
+    return request_id, buf, to_send
 if _use_c:
     _batched_write_command = _cmessage._batched_write_command
 
@@ -1282,23 +1333,21 @@ def _batched_write_command_impl(
     max_cmd_size = max_bson_size + _COMMAND_OVERHEAD
 
     # No options
-    buf.write(_ZERO_32)
+    buf += _ZERO_32
     # Namespace as C string
-    buf.write(b(namespace))
-    buf.write(_ZERO_8)
+    buf += b(namespace)
+    buf += _ZERO_8
     # Skip: 0, Limit: -1
-    buf.write(_SKIPLIM)
+    buf += _SKIPLIM
 
     # Where to write command document length
-    command_start = buf.tell()
-    buf.write(bson.BSON.encode(command))
+    command_start = len(buf)
+    _encode_into(command, buf, command_start, False, DEFAULT_CODEC_OPTIONS)
 
     # Start of payload
-    buf.seek(-1, 2)
-    # Work around some Jython weirdness.
-    buf.truncate()
+    del buf[-1:]
     try:
-        buf.write(_OP_MAP[operation])
+        buf += _OP_MAP[operation]
     except KeyError:
         raise InvalidOperation('Unknown command')
 
@@ -1306,44 +1355,87 @@ def _batched_write_command_impl(
         check_keys = False
 
     # Where to write list document length
-    list_start = buf.tell() - 4
+    list_start = len(buf) - 4
+    generate_ids = operation == _INSERT and ctx.generate_ids
     to_send = []
     idx = 0
     for doc in docs:
-        # Encode the current operation
+        if generate_ids:
+            _add_missing_id(doc)
+        # Encode the current operation straight into the message.
         key = b(str(idx))
-        value = bson.BSON.encode(doc, check_keys, opts)
+        element_start = len(buf)
+        buf += _BSONOBJ
+        buf += key
+        buf += _ZERO_8
+        value_length = _encode_into(doc, buf, len(buf), check_keys, opts)
         # Is there enough room to add this document? max_cmd_size accounts for
         # the two trailing null bytes.
-        enough_data = (buf.tell() + len(key) + len(value)) >= max_cmd_size
+        enough_data = (
+            element_start + len(key) + value_length) >= max_cmd_size
         enough_documents = (idx >= max_write_batch_size)
         if enough_data or enough_documents:
             if not idx:
                 write_op = list(_FIELD_MAP.keys())[operation]
                 _raise_document_too_large(
-                    write_op, len(value), max_bson_size)
+                    write_op, value_length, max_bson_size)
+            # This document will start the next batch.
+            del buf[element_start:]
             break
-        buf.write(_BSONOBJ)
-        buf.write(key)
-        buf.write(_ZERO_8)
-        buf.write(value)
         to_send.append(doc)
         idx += 1
 
     # Finalize the current OP_QUERY message.
     # Close list and command documents
-    buf.write(_ZERO_16)
+    buf += _ZERO_16
 
     # Write document lengths and request id
-    length = buf.tell()
-    buf.seek(list_start)
-    buf.write(_pack_int(length - list_start - 1))
-    buf.seek(command_start)
-    buf.write(_pack_int(length - command_start))
+    length = len(buf)
+    buf[list_start:list_start + 4] = _pack_int(length - list_start - 1)
+    buf[command_start:command_start + 4] = _pack_int(length - command_start)
 
     return to_send, length
 
 
+def _decode_other_fields(raw_doc, codec_options, name):
+    """Decode every top-level field of a RawBSONDocument except `name`."""
+    return _bson_to_dict(raw_doc.raw, codec_options,
+                         _fields_filter(key for key in raw_doc if key != name))
+
+
+def _decode_selected_batch(data, codec_options, fields):
+    """Decode cursor command replies, decoding only the top-level `fields` of
+    the documents in the firstBatch or nextBatch of each reply, or all of
+    their fields if `fields` is None.
+
+    When the document_class is a RecordType only the documents in the batch
+    are decoded to records, the rest of the reply is decoded to dicts.
+    """
+    raw_options = codec_options.with_options(document_class=RawBSONDocument)
+    if _record_type(codec_options.document_class):
+        reply_options = codec_options.with_options(document_class=dict)
+    else:
+        reply_options = codec_options
+    docs = []
+    for raw_reply in bson.decode_all(data, raw_options):
+        reply = _decode_other_fields(raw_reply, reply_options, "cursor")
+        cursor = raw_reply.get("cursor")
+        if isinstance(cursor, RawBSONDocument):
+            if "firstBatch" in cursor:
+                batch_name = "firstBatch"
+            else:
+                batch_name = "nextBatch"
+            cursor_doc = _decode_other_fields(
+                cursor, reply_options, batch_name)
+            if batch_name in cursor:
+                cursor_doc[batch_name] = [
+                    _bson_to_dict(doc.raw, codec_options, fields)
+                    for doc in cursor[batch_name]]
+            reply["cursor"] = cursor_doc
+        docs.append(reply)
+    return docs
+
+
 class _OpReply(object):
     """A MongoDB OP_REPLY response message."""
 
@@ -1398,7 +1490,8 @@ class _OpReply(object):
         return [self.documents]
 
     def unpack_response(self, cursor_id=None,
-                        codec_options=_UNICODE_REPLACE_CODEC_OPTIONS):
+                        codec_options=_UNICODE_REPLACE_CODEC_OPTIONS,
+                        user_fields=None, legacy_response=False):
         """Unpack a response from the database and decode the BSON document(s).
 
         Check the response for errors and unpack, returning a dictionary
@@ -1413,9 +1506,22 @@ class _OpReply(object):
             valid at server response
           - `codec_options` (optional): an instance of
             :class:`~bson.codec_options.CodecOptions`
+          - `user_fields` (optional): the encoded names of the top-level
+            fields to decode in the user's documents, or None to decode them
+            in full.
+          - `legacy_response` (optional): True if this is the reply to a
+            legacy OP_QUERY or OP_GET_MORE, whose documents are the user's
+            documents rather than a command reply.
         """
         self.raw_response(cursor_id)
-        return bson.decode_all(self.documents, codec_options)
+        if user_fields is None and not _record_type(
+                codec_options.document_class):
+            return bson.decode_all(self.documents, codec_options)
+        if legacy_response:
+            return bson._decode_all(self.documents, codec_options,
+                                    user_fields)
+        return _decode_selected_batch(self.documents, codec_options,
+                                      user_fields)
 
     def command_response(self):
         """Unpack a command response."""
@@ -1451,15 +1557,25 @@ class _OpMsg(object):
         raise NotImplementedError
 
     def unpack_response(self, cursor_id=None,
-                        codec_options=_UNICODE_REPLACE_CODEC_OPTIONS):
+                        codec_options=_UNICODE_REPLACE_CODEC_OPTIONS,
+                        user_fields=None, legacy_response=False):
         """Unpack a OP_MSG command response.
 
         :Parameters:
           - `cursor_id` (optional): Ignored, for compatibility with _OpReply.
           - `codec_options` (optional): an instance of
             :class:`~bson.codec_options.CodecOptions`
+          - `user_fields` (optional): the encoded names of the top-level
+            fields to decode in the documents of the cursor's batch, or None
+            to decode them in full.
+          - `legacy_response` (optional): Ignored, for compatibility with
+            _OpReply.
         """
-        return bson.decode_all(self.payload_document, codec_options)
+        if user_fields is None and not _record_type(
+                codec_options.document_class):
+            return bson.decode_all(self.payload_document, codec_options)
+        return _decode_selected_batch(self.payload_document, codec_options,
+                                      user_fields)
 
     def command_response(self):
         """Unpack a command response."""
@@ -42,6 +42,7 @@ from collections import defaultdict
 from bson.codec_options import DEFAULT_CODEC_OPTIONS, TypeRegistry
 from bson.py3compat import (integer_types,
                             string_type)
+from bson.record import RecordType
 from bson.son import SON
 from pymongo import (common,
                      database,
@@ -194,6 +195,17 @@ class MongoClient(common.BaseObject):
           - `type_registry` (optional): instance of
             :class:`~bson.codec_options.TypeRegistry` to enable encoding
             and decoding of custom types.
+          - `typed_arrays` (optional): if ``True``, BSON arrays of numbers
+            and packed arrays are decoded to :class:`array.array` and
+            :class:`memoryview`. See :class:`~bson.codec_options.CodecOptions`.
+            Defaults to ``False``.
+          - `validate` (optional): if ``False``, trust that the BSON being
+            decoded is well formed and skip some of its checks. See
+            :class:`~bson.codec_options.CodecOptions`. Defaults to ``True``.
+          - `datetime_conversion` (optional): how BSON datetimes are
+            decoded, one of the constants of
+            :class:`~bson.datetime_ms.DatetimeConversion`. Defaults to
+            :attr:`~bson.datetime_ms.DatetimeConversion.DATETIME`.
           - `tz_aware` (optional): if ``True``,
             :class:`~datetime.datetime` instances returned as values
             in a document by this :class:`MongoClient` will be timezone
@@ -214,6 +226,16 @@ class MongoClient(common.BaseObject):
           - `maxIdleTimeMS` (optional): The maximum number of milliseconds that
             a connection can remain idle in the pool before being removed and
             replaced. Defaults to `None` (no limit).
+          - `maxRequestsPerConnection` (optional): The maximum number of
+            operations that share one connection at once. Greater than 1
+            multiplexes operations on MongoDB 3.6+: operations send their
+            requests on a connection that other operations are already
+            using, while it has room, and each reply is returned to its
+            operation by its ``responseTo``. The server still runs
+            the requests on a connection one at a time, and a network error
+            or `socketTimeoutMS` timeout fails every operation on the
+            connection. Exhaust cursors never share a connection. Defaults
+            to 1 (no multiplexing).
           - `socketTimeoutMS`: (integer or None) Controls how long (in
             milliseconds) the driver will wait for a response after sending an
             ordinary (non-monitoring) database operation before concluding that
@@ -282,18 +304,37 @@ class MongoClient(common.BaseObject):
             https://docs.mongodb.com/manual/faq/diagnostics/#does-tcp-keepalive-time-affect-mongodb-deployments",
           - `compressors`: Comma separated list of compressors for wire
             protocol compression. The list is used to negotiate a compressor
-            with the server. Currently supported options are "snappy" and
-            "zlib". Support for snappy requires the
+            with the server. Currently supported options are "snappy", "zlib"
+            and "zstd". Support for snappy requires the
             `python-snappy <https://pypi.org/project/python-snappy/>`_ package.
             zlib support requires the Python standard library zlib module.
+            zstd support requires the
+            `zstandard <https://pypi.org/project/zstandard/>`_ package.
             By default no compression is used. Compression support must also be
             enabled on the server. MongoDB 3.4+ supports snappy compression.
-            MongoDB 3.6+ supports snappy and zlib.
+            MongoDB 3.6+ supports snappy and zlib. MongoDB 4.2+ supports
+            zstd.
           - `zlibCompressionLevel`: (int) The zlib compression level to use
             when zlib is used as the wire protocol compressor. Supported values
             are -1 through 9. -1 tells the zlib library to use its default
             compression level (usually 6). 0 means no compression. 1 is best
             speed. 9 is best compression. Defaults to -1.
+          - `zstdCompressionLevel`: (int) The zstd compression level to use
+            when zstd is used as the wire protocol compressor. Supported values
+            are 1 through 22. 1 is best speed. 22 is best compression.
+            Defaults to 3.
+          - `compressionMinSize`: (int) Messages smaller than this many bytes
+            are sent uncompressed. Defaults to 0.
+          - `compression_rules`: (dict) Maps command names, like ``"find"``
+            or ``"insert"``, to ``True`` to always compress their messages or
+            ``False`` to never compress them, overriding
+            `compressionMinSize` and `adaptiveCompression`. Commands that
+            are never compressed, like authentication commands, stay
+            uncompressed.
+          - `adaptiveCompression`: (boolean) If ``True``, a command whose
+            message doesn't compress to at most 90% of its size sends its
+            next messages uncompressed, twice as many each time up to 64,
+            until one compresses well again. Defaults to ``False``.
 
           | **Write Concern options:**
           | (Only set if passed. No default values.)
@@ -455,6 +496,8 @@ class MongoClient(common.BaseObject):
 
         .. versionchanged:: 3.9
            ``retryWrites`` now defaults to ``True``.
+           Added the ``typed_arrays``, ``validate`` and
+           ``datetime_conversion`` keyword arguments.
 
         .. versionchanged:: 3.8
            Added the ``server_selector`` keyword argument.
@@ -965,6 +1008,21 @@ class MongoClient(common.BaseObject):
             return None
         return 1000 * seconds
 
+    @property
+    def compression_statistics(self):
+        """Counters for the wire protocol compression of the messages this
+        client sent.
+
+        A dict mapping the name of each compressor used to a dict with the
+        number of ``messages`` it compressed, the number of messages the
+        compression options ``skipped``, the ``bytes_in`` and ``bytes_out``
+        of the compressed messages, and the ``time`` spent compressing them
+        in seconds.
+
+        .. versionadded:: 3.9
+        """
+        return self.__options.pool_options.compression_settings.statistics()
+
     @property
     def nodes(self):
         """Set of all currently connected servers.
@@ -1363,6 +1421,8 @@ class MongoClient(common.BaseObject):
             if option == 'document_class':
                 if value is dict:
                     return 'document_class=dict'
+                elif isinstance(value, RecordType):
+                    return 'document_class=%r' % (value,)
                 else:
                     return 'document_class=%s.%s' % (value.__module__,
                                                      value.__name__)
@@ -16,7 +16,9 @@
 
 import datetime
 import errno
+import os
 import select
+import socket
 import struct
 import threading
 
@@ -34,6 +36,20 @@ try:
 except ImportError:
     _SELECT_ERROR = OSError
 
+# socket.sendmsg is only available on Python 3 and POSIX systems.
+_HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')
+try:
+    from ssl import SSLSocket as _SSLSocket
+except ImportError:
+    _SSLSocket = ()
+# The maximum number of buffers passed to a single sendmsg call.
+try:
+    _IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    _IOV_MAX = 16
+if _IOV_MAX <= 0:
+    _IOV_MAX = 16
+
 from bson.py3compat import PY3
 
 from pymongo import helpers, message
@@ -58,7 +74,9 @@ def command(sock, dbname, spec, slave_ok, is_mongos,
             collation=None,
             compression_ctx=None,
             use_op_msg=False,
-            unacknowledged=False):
+            unacknowledged=False,
+            receive_buffer=None,
+            multiplexer=None):
     """Execute a command over the socket, or raise socket.error.
 
     :Parameters:
@@ -81,6 +99,9 @@ def command(sock, dbname, spec, slave_ok, is_mongos,
       - `parse_write_concern_error`: Whether to parse the ``writeConcernError``
         field in the command response.
       - `collation`: The collation for this command.
+      - `receive_buffer`: The :class:`_ReceiveBuffer` of `sock`, if any.
+      - `multiplexer`: The :class:`_Multiplexer` sharing `sock` between
+        threads, if any.
     """
     name = next(iter(spec))
     ns = dbname + '.$cmd'
@@ -133,12 +154,19 @@ def command(sock, dbname, spec, slave_ok, is_mongos,
         start = datetime.datetime.now()
 
     try:
-        sock.sendall(msg)
+        if multiplexer is None:
+            sendall(sock, msg)
+        else:
+            multiplexer.sendall(sock, msg)
         if use_op_msg and unacknowledged:
             # Unacknowledged, fake a successful command response.
             response_doc = {"ok": 1}
         else:
-            reply = receive_message(sock, request_id)
+            if multiplexer is None:
+                reply = receive_message(sock, request_id,
+                                        receive_buffer=receive_buffer)
+            else:
+                reply = multiplexer.receive_message(sock, request_id)
             unpacked_docs = reply.unpack_response(codec_options=codec_options)
 
             response_doc = unpacked_docs[0]
@@ -166,16 +194,33 @@ def command(sock, dbname, spec, slave_ok, is_mongos,
 
 _UNPACK_COMPRESSION_HEADER = struct.Struct("<iiB").unpack
 
-def receive_message(sock, request_id, max_message_size=MAX_MESSAGE_SIZE):
-    """Receive a raw BSON message or raise socket.error."""
-    # Ignore the response's request id.
-    length, _, response_to, op_code = _UNPACK_HEADER(
-        _receive_data_on_socket(sock, 16))
+def receive_message(sock, request_id, max_message_size=MAX_MESSAGE_SIZE,
+                    receive_buffer=None):
+    """Receive a raw BSON message or raise socket.error.
+
+    Reads through `receive_buffer`, the :class:`_ReceiveBuffer` of `sock`,
+    if it is given.
+    """
+    response_to, reply = _receive_reply(sock, max_message_size,
+                                        receive_buffer)
     # No request_id for exhaust cursor "getMore".
     if request_id is not None:
         if request_id != response_to:
             raise ProtocolError("Got response id %r but expected "
                                 "%r" % (response_to, request_id))
+    return reply
+
+
+def _receive_reply(sock, max_message_size, receive_buffer):
+    """Receive the next reply on `sock`, returning its responseTo and
+    the unpacked reply.
+    """
+    if receive_buffer is None:
+        receive = _receive_data_on_socket
+    else:
+        receive = receive_buffer.receive
+    # Ignore the response's request id.
+    length, _, response_to, op_code = _UNPACK_HEADER(receive(sock, 16))
     if length <= 16:
         raise ProtocolError("Message length (%r) not longer than standard "
                             "message header size (16)" % (length,))
@@ -184,18 +229,82 @@ def receive_message(sock, request_id, max_message_size=MAX_MESSAGE_SIZE):
                             "message size (%r)" % (length, max_message_size))
     if op_code == 2012:
         op_code, _, compressor_id = _UNPACK_COMPRESSION_HEADER(
-            _receive_data_on_socket(sock, 9))
-        data = decompress(
-            _receive_data_on_socket(sock, length - 25), compressor_id)
+            receive(sock, 9))
+        data = decompress(receive(sock, length - 25), compressor_id)
     else:
-        data = _receive_data_on_socket(sock, length - 16)
+        data = receive(sock, length - 16)
 
     try:
         unpack_reply = _UNPACK_REPLY[op_code]
     except KeyError:
         raise ProtocolError("Got opcode %r but expected "
                             "%r" % (op_code, _UNPACK_REPLY.keys()))
-    return unpack_reply(data)
+    return response_to, unpack_reply(data)
+
+
+class _Multiplexer(object):
+    """Shares one socket between requests from several threads.
+
+    Each request is written whole while holding a lock. The threads
+    waiting for replies take turns reading: one of them reads replies from
+    the socket and hands each one to the thread waiting for its
+    responseTo, until its own reply arrives and another waiting thread
+    takes over.
+
+    If reading fails, the socket can't be used for any other request:
+    the threads still waiting raise socket.error.
+    """
+
+    __slots__ = ('_receive_buffer', '_send_lock', '_condition', '_replies',
+                 '_reading', '_error')
+
+    def __init__(self, receive_buffer=None):
+        self._receive_buffer = receive_buffer
+        self._send_lock = threading.Lock()
+        self._condition = threading.Condition(threading.Lock())
+        # Maps the request id of each request to its reply.
+        self._replies = {}
+        self._reading = False
+        self._error = None
+
+    def sendall(self, sock, data):
+        """Send a whole message on `sock`, or raise socket.error."""
+        with self._send_lock:
+            sendall(sock, data)
+
+    def receive_message(self, sock, request_id,
+                        max_message_size=MAX_MESSAGE_SIZE):
+        """Receive the reply to `request_id`, or raise socket.error."""
+        with self._condition:
+            while True:
+                if request_id in self._replies:
+                    return self._replies.pop(request_id)
+                if self._error is not None:
+                    raise socket.error(
+                        "connection failed while reading the reply to "
+                        "another request: %s" % (self._error,))
+                if not self._reading:
+                    self._reading = True
+                    break
+                self._condition.wait()
+
+        try:
+            while True:
+                response_to, reply = _receive_reply(
+                    sock, max_message_size, self._receive_buffer)
+                if response_to == request_id:
+                    return reply
+                with self._condition:
+                    self._replies[response_to] = reply
+                    self._condition.notify_all()
+        except BaseException as exc:
+            with self._condition:
+                self._error = exc
+            raise
+        finally:
+            with self._condition:
+                self._reading = False
+                self._condition.notify_all()
 
 
 # memoryview was introduced in Python 2.7 but we only use it on Python 3
@@ -242,6 +351,161 @@ else:
         return mv
 
 
+# The size of the buffer that each socket reads replies into.
+_RECEIVE_BUFFER_SIZE = 64 * 1024
+# A receive buffer that grew for a large reply is reused for later replies
+# up to this size, until the socket is returned to its pool. Bigger buffers
+# are dropped after each reply.
+_MAX_RETAINED_BUFFER_SIZE = 4 * 1024 * 1024
+
+
+if not PY3:
+    class _ReceiveBuffer(object):
+        """Reads each part of a message with its own recv calls, as
+        _receive_data_on_socket does.
+        """
+
+        __slots__ = ()
+
+        def receive(self, sock, length):
+            return _receive_data_on_socket(sock, length)
+
+        def shrink(self):
+            pass
+else:
+    class _ReceiveBuffer(object):
+        """A buffer for reading the replies from one socket.
+
+        Each recv_into call reads as much as the socket has available, up to
+        the free space in the buffer, so the header and the body of a reply
+        usually take a single call. Data read ahead is kept for the next
+        call to :meth:`receive`. The buffer grows for large replies and is
+        reused for them, up to _MAX_RETAINED_BUFFER_SIZE, until
+        :meth:`shrink` is called.
+        """
+
+        __slots__ = ('_buf', '_view', '_start', '_end')
+
+        def __init__(self, size=_RECEIVE_BUFFER_SIZE):
+            self._buf = bytearray(size)
+            self._view = memoryview(self._buf)
+            self._start = 0
+            self._end = 0
+
+        def receive(self, sock, length):
+            """Receive `length` bytes from `sock`.
+
+            Returns a memoryview into the buffer, which is only valid until
+            the next call to receive.
+            """
+            start = self._start
+            if self._end - start < length:
+                start = self._fill(sock, length)
+            self._start = start + length
+            return self._view[start:start + length]
+
+        def shrink(self):
+            """Go back to a buffer of _RECEIVE_BUFFER_SIZE, unless it holds
+            data read ahead.
+
+            Called when the socket is returned to its pool, so idle sockets
+            don't keep the memory of the large replies they read.
+            """
+            if (len(self._buf) > _RECEIVE_BUFFER_SIZE and
+                    self._start == self._end):
+                # Replace it, earlier replies may still be viewing it.
+                self._buf = bytearray(_RECEIVE_BUFFER_SIZE)
+                self._view = memoryview(self._buf)
+                self._start = self._end = 0
+
+        def _fill(self, sock, length):
+            """Read from `sock` until `length` bytes are buffered and return
+            the position of the first one.
+            """
+            start = self._start
+            end = self._end
+            pending = end - start
+            if not pending:
+                start = end = 0
+            capacity = len(self._buf)
+            if length > capacity:
+                if length > _MAX_RETAINED_BUFFER_SIZE:
+                    size = length
+                else:
+                    size = min(max(length, 2 * capacity),
+                               _MAX_RETAINED_BUFFER_SIZE)
+            elif capacity > _MAX_RETAINED_BUFFER_SIZE:
+                size = max(length, _RECEIVE_BUFFER_SIZE)
+            else:
+                size = 0
+            if size:
+                # The bytearray can't be resized while memoryviews of it
+                # exist, replace it instead.
+                buf = bytearray(size)
+                buf[:pending] = self._view[start:end]
+                self._buf = buf
+                self._view = memoryview(buf)
+                start, end = 0, pending
+            elif length > capacity - start:
+                # Move the pending data to the front.
+                self._buf[:pending] = self._buf[start:end]
+                start, end = 0, pending
+
+            view = self._view
+            while end - start < length:
+                try:
+                    chunk_length = sock.recv_into(view[end:])
+                except (IOError, OSError) as exc:
+                    if _errno_from_exception(exc) == errno.EINTR:
+                        continue
+                    raise
+                if chunk_length == 0:
+                    raise AutoReconnect("connection closed")
+                end += chunk_length
+
+            self._start = start
+            self._end = end
+            return start
+
+
+def sendall(sock, data):
+    """Send `data`, a bytes-like object or a list of them, or raise
+    socket.error.
+
+    The buffers in a list are sent with scatter-gather sendmsg calls when
+    `sock` supports them, without joining them first. SSL sockets don't,
+    the buffers are joined and sent with sendall.
+    """
+    if not isinstance(data, list):
+        sock.sendall(data)
+    elif _HAS_SENDMSG and not isinstance(sock, _SSLSocket):
+        _sendmsg_all(sock, data)
+    else:
+        sock.sendall(message._join_sections(data))
+
+
+def _sendmsg_all(sock, buffers):
+    """Send all of `buffers` with sendmsg, handling partial sends."""
+    views = [memoryview(buf) for buf in buffers if len(buf)]
+    i = 0
+    while i < len(views):
+        try:
+            sent = sock.sendmsg(views[i:i + _IOV_MAX])
+        except (IOError, OSError) as exc:
+            if _errno_from_exception(exc) == errno.EINTR:
+                continue
+            raise
+        # Skip the buffers that were sent and slice the first one that
+        # was sent partially.
+        while sent:
+            length = len(views[i])
+            if sent < length:
+                views[i] = views[i][sent:]
+                break
+            sent -= length
+            i += 1
+
+
 def _errno_from_exception(exc):
     if hasattr(exc, 'errno'):
         return exc.errno
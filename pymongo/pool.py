@@ -59,7 +59,10 @@ from pymongo.ismaster import IsMaster
 from pymongo.monotonic import time as _time
 from pymongo.network import (command,
                              receive_message,
-                             SocketChecker)
+                             sendall,
+                             SocketChecker,
+                             _Multiplexer,
+                             _ReceiveBuffer)
 from pymongo.read_preferences import ReadPreference
 from pymongo.server_type import SERVER_TYPE
 # Always use our backport so we always have support for IP address matching
@@ -291,7 +294,7 @@ class PoolOptions(object):
                  '__wait_queue_timeout', '__wait_queue_multiple',
                  '__ssl_context', '__ssl_match_hostname', '__socket_keepalive',
                  '__event_listeners', '__appname', '__driver', '__metadata',
-                 '__compression_settings')
+                 '__compression_settings', '__max_requests_per_connection')
 
     def __init__(self, max_pool_size=100, min_pool_size=0,
                  max_idle_time_seconds=None, connect_timeout=None,
@@ -299,7 +302,7 @@ class PoolOptions(object):
                  wait_queue_multiple=None, ssl_context=None,
                  ssl_match_hostname=True, socket_keepalive=True,
                  event_listeners=None, appname=None, driver=None,
-                 compression_settings=None):
+                 compression_settings=None, max_requests_per_connection=1):
 
         self.__max_pool_size = max_pool_size
         self.__min_pool_size = min_pool_size
@@ -315,6 +318,7 @@ class PoolOptions(object):
         self.__appname = appname
         self.__driver = driver
         self.__compression_settings = compression_settings
+        self.__max_requests_per_connection = max_requests_per_connection
         self.__metadata = copy.deepcopy(_METADATA)
         if appname:
             self.__metadata['application'] = {'name': appname}
@@ -435,6 +439,13 @@ class PoolOptions(object):
     def compression_settings(self):
         return self.__compression_settings
 
+    @property
+    def max_requests_per_connection(self):
+        """The maximum number of operations that share one connection at
+        once. Defaults to 1, each operation uses a connection of its own.
+        """
+        return self.__max_requests_per_connection
+
     @property
     def metadata(self):
         """A dict of metadata about the application, driver, os, and platform.
@@ -452,6 +463,7 @@ class SocketInfo(object):
     """
     def __init__(self, sock, pool, address):
         self.sock = sock
+        self.receive_buffer = _ReceiveBuffer()
         self.address = address
         self.authset = set()
         self.closed = False
@@ -468,6 +480,11 @@ class SocketInfo(object):
         self.listeners = pool.opts.event_listeners
         self.compression_settings = pool.opts.compression_settings
         self.compression_context = None
+        # A _Multiplexer if the pool shares this socket between operations.
+        self.multiplexer = None
+        # Whether the socket is shared, and how many operations share it.
+        self.shared = False
+        self.checkouts = 0
 
         # The pool's pool_id changes with each reset() so we can close sockets
         # created before the last reset.
@@ -576,7 +593,9 @@ class SocketInfo(object):
                            collation=collation,
                            compression_ctx=self.compression_context,
                            use_op_msg=self.op_msg_enabled,
-                           unacknowledged=unacknowledged)
+                           unacknowledged=unacknowledged,
+                           receive_buffer=self.receive_buffer,
+                           multiplexer=self.multiplexer)
         except OperationFailure:
             raise
         # Catch socket.error, KeyboardInterrupt, etc. and close ourselves.
@@ -586,6 +605,8 @@ class SocketInfo(object):
     def send_message(self, message, max_doc_size):
         """Send a raw BSON message or raise ConnectionFailure.
 
+        The message is a bytes-like object or a list of them.
+
         If a network exception is raised, the socket is closed.
         """
         if (self.max_bson_size is not None
@@ -596,7 +617,10 @@ class SocketInfo(object):
                 (max_doc_size, self.max_bson_size))
 
         try:
-            self.sock.sendall(message)
+            if self.multiplexer is None:
+                sendall(self.sock, message)
+            else:
+                self.multiplexer.sendall(self.sock, message)
         except BaseException as error:
             self._raise_connection_failure(error)
 
@@ -606,8 +630,14 @@ class SocketInfo(object):
         If any exception is raised, the socket is closed.
         """
         try:
+            # Exhaust cursors read replies without a request id, on a
+            # socket that is never shared.
+            if self.multiplexer is not None and request_id is not None:
+                return self.multiplexer.receive_message(
+                    self.sock, request_id, self.max_message_size)
             return receive_message(self.sock, request_id,
-                                   self.max_message_size)
+                                   self.max_message_size,
+                                   self.receive_buffer)
         except BaseException as error:
             self._raise_connection_failure(error)
 
@@ -900,6 +930,8 @@ class Pool:
         self.sockets = collections.deque()
         self.lock = threading.Lock()
         self.active_sockets = 0
+        # Checked out sockets that other operations can share.
+        self.shared_sockets = []
 
         # Keep track of resets, so we notice sockets created before the most
         # recent reset and close them.
@@ -926,6 +958,7 @@ class Pool:
             self.pid = os.getpid()
             sockets, self.sockets = self.sockets, collections.deque()
             self.active_sockets = 0
+            self.shared_sockets = []
 
         for sock_info in sockets:
             sock_info.close()
@@ -972,6 +1005,8 @@ class Pool:
             _raise_connection_failure(self.address, error)
 
         sock_info = SocketInfo(sock, self, self.address)
+        if self.opts.max_requests_per_connection > 1:
+            sock_info.multiplexer = _Multiplexer(sock_info.receive_buffer)
         if self.handshake:
             sock_info.ismaster(self.opts.metadata, None)
         return sock_info
@@ -995,15 +1030,27 @@ class Pool:
 
         Can raise ConnectionFailure or OperationFailure.
 
+        When the pool's ``max_requests_per_connection`` is greater than 1,
+        the socket may be shared with other threads, unless `checkout` is
+        True.
+
         :Parameters:
           - `all_credentials`: dict, maps auth source to MongoCredential.
           - `checkout` (optional): keep socket checked out.
         """
-        # First get a socket, then attempt authentication. Simplifies
-        # semaphore management in the face of network errors during auth.
-        sock_info = self._get_socket_no_auth()
+        share = self.opts.max_requests_per_connection > 1 and not checkout
+        sock_info = None
+        if share:
+            sock_info = self._get_shared_socket(all_credentials)
+        if sock_info is None:
+            # First get a socket, then attempt authentication. Simplifies
+            # semaphore management in the face of network errors during
+            # auth.
+            sock_info = self._get_socket_no_auth()
         try:
             sock_info.check_auth(all_credentials)
+            if share:
+                self._share(sock_info)
             yield sock_info
         except:
             # Exception in caller. Decrement semaphore.
@@ -1050,8 +1097,51 @@ class Pool:
 
         return sock_info
 
+    def _get_shared_socket(self, all_credentials):
+        """Get a shared socket with room for another operation, or None."""
+        if self.pid != os.getpid():
+            return None
+        authset = set(itervalues(all_credentials))
+        with self.lock:
+            for sock_info in self.shared_sockets:
+                if (not sock_info.closed and
+                        sock_info.checkouts <
+                        self.opts.max_requests_per_connection and
+                        sock_info.authset == authset):
+                    sock_info.checkouts += 1
+                    return sock_info
+        return None
+
+    def _share(self, sock_info):
+        """Let other operations share a socket checked out by this one."""
+        # Only OP_MSG requests are multiplexed.
+        if not sock_info.op_msg_enabled or sock_info.multiplexer is None:
+            return
+        with self.lock:
+            if not sock_info.shared and sock_info.pool_id == self.pool_id:
+                sock_info.shared = True
+                sock_info.checkouts = 1
+                self.shared_sockets.append(sock_info)
+
+    def _unshare(self, sock_info):
+        """Release one operation's share of a socket.
+
+        Returns True if it was the last operation using the socket.
+        """
+        with self.lock:
+            sock_info.checkouts -= 1
+            if sock_info.checkouts:
+                return False
+            sock_info.shared = False
+            if sock_info in self.shared_sockets:
+                self.shared_sockets.remove(sock_info)
+        return True
+
     def return_socket(self, sock_info):
         """Return the socket to the pool, or if it's closed discard it."""
+        if sock_info.shared and not self._unshare(sock_info):
+            # Other operations are still using the socket.
+            return
         if self.pid != os.getpid():
             self.reset()
         else:
@@ -1059,6 +1149,7 @@ class Pool:
                 sock_info.close()
             elif not sock_info.closed:
                 sock_info.update_last_checkin_time()
+                sock_info.receive_buffer.shrink()
                 with self.lock:
                     self.sockets.appendleft(sock_info)
 
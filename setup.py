@@ -317,7 +317,7 @@ ext_modules = [Extension('bson._cbson',
                          sources=['pymongo/_cmessagemodule.c',
                                   'bson/buffer.c'])]
 
-extras_require = {'snappy': ["python-snappy"]}
+extras_require = {'snappy': ["python-snappy"], 'zstd': ["zstandard"]}
 vi = sys.version_info
 if vi[0] == 2:
     extras_require.update(
@@ -14,10 +14,12 @@
 
 """Tests for the MongoDB Driver Performance Benchmarking Spec."""
 
+import copy
 import multiprocessing as mp
 import os
 import sys
 import tempfile
+import threading
 import warnings
 
 try:
@@ -25,10 +27,16 @@ try:
 except ImportError:
     import json
 
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
 sys.path[0:0] = [""]
 
-from bson import BSON
+from bson import BSON, decode_all
 from bson.json_util import loads
+from bson.son import SON
 from gridfs import GridFSBucket
 from pymongo import MongoClient
 from pymongo.monotonic import time
@@ -179,6 +187,96 @@ class TestFullDecoding(BsonDecodingTest, unittest.TestCase):
     data_size = 57340000
 
 
+class TestSharedKeysBatchDecoding(PerformanceTest, unittest.TestCase):
+    """Decode a batch of documents that all have the same 30 keys.
+
+    Also records the peak memory used to decode the batch, which includes
+    the decoded documents and so shows the effect of sharing key strings.
+    """
+    def setUp(self):
+        document = dict(('field_%02d' % i, i) for i in range(30))
+        self.batch = BSON.encode(document) * NUM_DOCS
+        self.data_size = len(self.batch)
+
+    def do_task(self):
+        decode_all(self.batch)
+
+    def tearDown(self):
+        super(TestSharedKeysBatchDecoding, self).tearDown()
+        if tracemalloc is not None:
+            tracemalloc.start()
+            docs = decode_all(self.batch)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del docs
+            print('Running %s. PEAK_MEMORY=%s' % (self.__class__.__name__,
+                                                  peak))
+            result_data[-1]['results']['1']['peak_memory_bytes'] = peak
+
+
+class TestThreadedBatchDecoding(PerformanceTest, unittest.TestCase):
+    """Decode the same batch of documents in several threads at once."""
+    num_threads = 4
+
+    def setUp(self):
+        document = dict(('field_%02d' % i, 'x' * i) for i in range(30))
+        self.batch = BSON.encode(document) * NUM_DOCS
+        self.data_size = len(self.batch) * self.num_threads
+
+    def do_task(self):
+        threads = [threading.Thread(target=decode_all, args=(self.batch,))
+                   for _ in range(self.num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+
+# SON MICRO-BENCHMARKS
+class TestSONBuildCommand(PerformanceTest, unittest.TestCase):
+    """Build, update and iterate a small SON, like a command document."""
+    def setUp(self):
+        self.data_size = 5 * NUM_DOCS
+
+    def do_task(self):
+        for i in range(NUM_DOCS):
+            command = SON([('find', 'perftest'), ('filter', {'_id': i})])
+            command['limit'] = 1
+            command.update([('singleBatch', True), ('$db', 'perftest')])
+            for _ in command.items():
+                pass
+
+
+class TestSONDelete(PerformanceTest, unittest.TestCase):
+    """Pop and delete every key of a large SON."""
+    def setUp(self):
+        self.items = [('field_%05d' % i, i) for i in range(NUM_DOCS)]
+        self.data_size = NUM_DOCS
+
+    def before(self):
+        self.son = SON(self.items)
+
+    def do_task(self):
+        son = self.son
+        for i in range(0, NUM_DOCS, 2):
+            del son['field_%05d' % i]
+        while son:
+            son.popitem()
+
+
+class TestSONCopy(PerformanceTest, unittest.TestCase):
+    """Copy and deepcopy a SON with nested SON values."""
+    def setUp(self):
+        self.son = SON([('field_%02d' % i, SON([('a', i), ('b', [i])]))
+                        for i in range(30)])
+        self.data_size = 30 * 1000
+
+    def do_task(self):
+        for _ in range(1000):
+            self.son.copy()
+            copy.deepcopy(self.son)
+
+
 # SINGLE-DOC BENCHMARKS
 class TestRunCommand(PerformanceTest, unittest.TestCase):
     data_size = 160000
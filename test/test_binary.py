@@ -14,6 +14,7 @@
 
 """Tests for the Binary wrapper."""
 
+import array
 import base64
 import copy
 import pickle
@@ -356,6 +357,39 @@ class TestBinary(unittest.TestCase):
         for proto in range(pickle.HIGHEST_PROTOCOL + 1):
             self.assertEqual(uul, pickle.loads(pickle.dumps(uul, proto)))
 
+    def test_packed_array(self):
+        floats = PackedArray(array.array("f", [0.5, -2.0]))
+        self.assertEqual("f", floats.typecode)
+        self.assertEqual(2, len(floats))
+        self.assertEqual("PackedArray(array('f', [0.5, -2.0]))", repr(floats))
+        ints = array.array("b", [1, -1])
+        # Python 2's array.array doesn't support memoryview.
+        if PY3:
+            ints = memoryview(ints)
+        ints = PackedArray(ints)
+        self.assertEqual("b", ints.typecode)
+        self.assertNotEqual(floats, ints)
+        self.assertRaises(TypeError, PackedArray, array.array("d", [1.0]))
+        self.assertRaises(TypeError, PackedArray, [1, 2])
+
+        data = bson.BSON.encode({"f": floats, "i": ints})
+        self.assertEqual(
+            {"f": Binary(b"\x27\x00\x00\x00\x00\x3f\x00\x00\x00\xc0",
+                         VECTOR_SUBTYPE),
+             "i": Binary(b"\x03\x00\x01\xff", VECTOR_SUBTYPE)},
+            bson.BSON(data).decode())
+        decoded = bson.BSON(data).decode(CodecOptions(typed_arrays=True))
+        self.assertEqual([0.5, -2.0], decoded["f"].tolist())
+        self.assertEqual([1, -1], decoded["i"].tolist())
+        self.assertEqual(floats, PackedArray(decoded["f"]))
+
+        # Unknown or truncated packed arrays are decoded to Binary.
+        opts = CodecOptions(typed_arrays=True)
+        for value in (b"\x27\x00\x00\x00\x00", b"\x27", b"\x10\x00\x01"):
+            binary = Binary(value, VECTOR_SUBTYPE)
+            self.assertEqual(binary, bson.BSON.encode(
+                {"b": binary}).decode(opts)["b"])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -16,6 +16,7 @@
 
 """Test the bson module."""
 
+import array
 import collections
 import datetime
 import re
@@ -34,11 +35,12 @@ from bson import (BSON,
                   Regex)
 from bson.binary import Binary, UUIDLegacy
 from bson.code import Code
-from bson.codec_options import CodecOptions
+from bson.codec_options import CodecOptions, TypeEncoder, TypeRegistry
 from bson.int64 import Int64
 from bson.objectid import ObjectId
 from bson.dbref import DBRef
 from bson.py3compat import abc, iteritems, PY3, StringIO, text_type
+from bson.raw_bson import RawBSONDocument
 from bson.son import SON
 from bson.timestamp import Timestamp
 from bson.errors import (InvalidBSON,
@@ -904,6 +906,275 @@ class TestBSON(unittest.TestCase):
                           {"_id": {'$oid': "52d0b971b3ba219fdeb4170e"}}, True)
         BSON.encode({"_id": {'$oid': "52d0b971b3ba219fdeb4170e"}})
 
+    def test_encode_into(self):
+        first = {"_id": 1, "a": u"foo", "b": [1, 2.5, None]}
+        second = SON([("x", {"y": True})])
+        buf = bytearray(b"\x00\x01")
+        length = bson.encode_into(first, buf, 2)
+        self.assertEqual(len(BSON.encode(first)), length)
+        self.assertEqual(2 + length, len(buf))
+        self.assertEqual(length + len(BSON.encode(second)),
+                         bson.encode_into(second, buf, 2 + length) + length)
+        self.assertEqual(b"\x00\x01" + BSON.encode(first) + BSON.encode(second),
+                         bytes(buf))
+
+        # Overwrite existing data without growing.
+        bson.encode_into(second, buf, 2)
+        self.assertEqual(BSON.encode(second), bytes(buf[2:2 + len(BSON.encode(
+            second))]))
+
+        # Fixed size buffers.
+        view = memoryview(bytearray(32))
+        self.assertEqual(12, bson.encode_into({"a": 1}, view, 20))
+        self.assertEqual(BSON.encode({"a": 1}), view[20:].tobytes())
+        self.assertRaises(ValueError, bson.encode_into, {"a": 1}, view, 21)
+        self.assertRaises(ValueError, bson.encode_into, {"a": 1},
+                          bytearray(), 1)
+        self.assertRaises(TypeError, bson.encode_into, {"a": 1}, buf,
+                          codec_options={})
+        self.assertRaises(InvalidDocument, bson.encode_into,
+                          {"$a": 1}, buf, 0, True)
+
+    def test_calculate_size(self):
+        docs = [{},
+                {"_id": ObjectId(), "a": 1, "b": 2 ** 40, "c": 1.5,
+                 "d": None, "e": u"h\u00e9llo", "f": True,
+                 "g": datetime.datetime(2019, 1, 1)},
+                {"x": {"y": [1, u"a", SON([("z", (1, 2))])]},
+                 "l": list(range(1100))},
+                SON([("z", 1), ("_id", 5)]),
+                {"bin": Binary(b"123", 128), "uuid": uuid.uuid4(),
+                 "code": Code("f", {"a": 1}), "long": Int64(7),
+                 "regex": Regex("a*b", "i"), "ref": DBRef("coll", 5),
+                 "raw": RawBSONDocument(BSON.encode({"a": 1}))},
+                RawBSONDocument(BSON.encode({"a": [1]}))]
+        for doc in docs:
+            self.assertEqual(len(BSON.encode(doc)), bson.calculate_size(doc))
+
+        # Values transformed by a type encoder.
+        class MyInt(int):
+            pass
+
+        class MyIntCodec(TypeEncoder):
+            python_type = MyInt
+
+            def transform_python(self, value):
+                return str(value)
+
+        opts = CodecOptions(type_registry=TypeRegistry([MyIntCodec()]))
+        doc = {"a": MyInt(12345)}
+        self.assertEqual(len(BSON.encode(doc, codec_options=opts)),
+                         bson.calculate_size(doc, codec_options=opts))
+        self.assertEqual(len(BSON.encode(doc, codec_options=opts)),
+                         bson.calculate_size(doc, opts))
+
+        self.assertRaises(InvalidDocument, bson.calculate_size,
+                          {"x": {"$a": 1}}, check_keys=True)
+        self.assertRaises(TypeError, bson.calculate_size, {}, check_keys=1)
+        self.assertRaises(InvalidDocument, bson.calculate_size, {1: 2})
+        self.assertRaises(InvalidDocument, bson.calculate_size,
+                          {"a": object()})
+        self.assertRaises(OverflowError, bson.calculate_size,
+                          {"a": 2 ** 70})
+        self.assertRaises(TypeError, bson.calculate_size, [])
+        self.assertRaises(TypeError, bson.calculate_size, {},
+                          codec_options={})
+
+    def test_decode_fields(self):
+        doc = SON([("num", 1.5),
+                   ("str", u"foo"),
+                   ("obj", {"x": [1, {"y": None}]}),
+                   ("bin", Binary(b"", 128)),
+                   ("oid", ObjectId()),
+                   ("regex", Regex("a*b", "i")),
+                   ("ref", DBRef("coll", 5)),
+                   ("code", Code("f", {"a": 1})),
+                   ("ts", Timestamp(1, 2)),
+                   ("long", Int64(7)),
+                   ("min", MinKey()),
+                   ("max", MaxKey()),
+                   (u"é", 2)])
+        data = BSON.encode(doc)
+        opts = CodecOptions(document_class=SON)
+        self.assertEqual(SON([("obj", doc["obj"]), (u"é", 2)]),
+                         BSON(data).decode(opts, fields=[u"é", "obj"]))
+        for name in doc:
+            self.assertEqual({name: doc[name]},
+                             BSON(data).decode(fields=[name]))
+        self.assertEqual({}, BSON(data).decode(fields=[]))
+        self.assertEqual({}, BSON(data).decode(fields=["missing"]))
+        self.assertEqual([{"long": 7}] * 2,
+                         decode_all(data * 2, fields=["long"]))
+        self.assertEqual([{"str": "foo"}] * 2,
+                         list(decode_iter(data * 2, fields=("str",))))
+        self.assertEqual(
+            [{"ts": Timestamp(1, 2)}],
+            list(decode_file_iter(StringIO(data), fields=set(["ts"]))))
+        self.assertRaises(TypeError, decode_all, data, fields="str")
+
+        # Skipped elements are still checked against the document length.
+        bad = BSON.encode(SON([("a", 1), ("b", u"foo")]))
+        bad = bad[:14] + b"\xff" + bad[15:]
+        self.assertRaises(InvalidBSON, decode_all, bad, fields=["a"])
+        self.assertRaises(InvalidBSON, BSON(bad).decode, fields=["a"])
+
+    def test_stream_decoder(self):
+        docs = [{"_id": i, "s": u"x" * i, "a": [i] * i} for i in range(50)]
+        data = b"".join(BSON.encode(doc) for doc in docs)
+        for chunk_size in (1, 7, 64, len(data)):
+            decoder = bson.StreamDecoder(buffer_size=16)
+            decoded = []
+            for i in range(0, len(data), chunk_size):
+                decoded.extend(decoder.feed(data[i:i + chunk_size]))
+            self.assertEqual(docs, decoded)
+            self.assertEqual(0, decoder.pending)
+            decoder.close()
+
+        decoder = bson.StreamDecoder(CodecOptions(document_class=SON))
+        self.assertEqual([], decoder.feed(bytearray(data[:10])))
+        self.assertEqual(10, decoder.pending)
+        self.assertRaises(InvalidBSON, decoder.close)
+        result = decoder.feed(memoryview(data[10:]))
+        self.assertEqual(docs, result)
+        self.assertIsInstance(result[0], SON)
+
+        self.assertRaises(InvalidBSON, bson.StreamDecoder().feed,
+                          b"\x01\x00\x00\x00")
+        self.assertRaises(TypeError, bson.StreamDecoder, {})
+        # A malformed document doesn't consume the valid ones before it.
+        decoder = bson.StreamDecoder()
+        good = b"".join(BSON.encode(doc) for doc in docs[:2])
+        bad = BSON.encode({"s": u"foo"}).replace(b"foo\x00", b"foo\x01")
+        self.assertRaises(InvalidBSON, decoder.feed, good + bad)
+        self.assertEqual(len(good + bad), decoder.pending)
+        self.assertRaises(InvalidBSON, decoder.feed, b"")
+        self.assertEqual(len(good + bad), decoder.pending)
+        decoder = bson.StreamDecoder(buffer_size=long(16))
+        self.assertEqual(docs, decoder.feed(data))
+        self.assertRaises(ValueError, bson.StreamDecoder, buffer_size=0)
+        self.assertRaises(ValueError, bson.StreamDecoder, buffer_size=1.5)
+
+    def test_decode_all_checks_whole_batch(self):
+        good = BSON.encode({"a": {"b": [1, u"x"]}})
+        # The embedded array claims to extend past the end of its document.
+        bad = good[:14] + b"\xff" + good[15:]
+        for data in (bad, good + bad, good * 1000 + bad):
+            self.assertRaises(InvalidBSON, decode_all, data)
+        self.assertEqual(1001, len(decode_all(good * 1001)))
+
+    def test_decode_reuses_keys(self):
+        data = BSON.encode(SON([("first", 1), (u"\u00e9", {"first": 2})]))
+        docs = decode_all(data * 3)
+        self.assertEqual([{"first": 1, u"\u00e9": {"first": 2}}] * 3, docs)
+        keys = [list(doc) for doc in docs]
+        for key, other in zip(keys[0], keys[2]):
+            self.assertIs(key, other)
+
+        # Invalid keys still decode according to each error handler.
+        invalid = b"\x0c\x00\x00\x00\x10\xe9\x00\x01\x00\x00\x00\x00"
+        replace = CodecOptions(unicode_decode_error_handler="replace")
+        self.assertEqual([{u"\ufffd": 1}] * 2,
+                         decode_all(invalid * 2, replace))
+        self.assertRaises(InvalidBSON, decode_all, invalid)
+
+    def test_decode_columns(self):
+        docs = [SON([("i", i),
+                     ("l", Int64(i << 40)),
+                     ("d", i / 2.0),
+                     ("b", bool(i % 2)),
+                     ("t", datetime.datetime(2000, 1, 1, 0, 0, i)),
+                     ("skipped", [u"x", {"y": 1}])]) for i in range(3)]
+        docs.append({"i": None, "l": 5, "d": Int64(7), "other": 1})
+        data = b"".join(BSON.encode(doc) for doc in docs)
+        columns = bson.decode_columns(data, {"i": "int32",
+                                             "l": "int64",
+                                             "d": "double",
+                                             "b": "bool",
+                                             "t": "datetime"})
+        self.assertEqual(set(["i", "l", "d", "b", "t"]), set(columns))
+        expected = {
+            "i": ([0, 1, 2, 0], [1, 1, 1, 0]),
+            "l": ([0, 1 << 40, 2 << 40, 5], [1, 1, 1, 1]),
+            "d": ([0.0, 0.5, 1.0, 7.0], [1, 1, 1, 1]),
+            "b": ([0, 1, 0, 0], [1, 1, 1, 0]),
+            "t": ([946684800000, 946684801000, 946684802000, 0],
+                  [1, 1, 1, 0])}
+        for name, (values, valid) in iteritems(columns):
+            self.assertEqual(expected[name],
+                             (values.tolist(), valid.tolist()))
+            self.assertEqual(len(docs), len(values))
+
+        self.assertEqual({}, bson.decode_columns(data, []))
+        values, valid = bson.decode_columns(b"", [("i", "int32")])["i"]
+        self.assertEqual(([], []), (values.tolist(), valid.tolist()))
+        self.assertRaises(ValueError, bson.decode_columns, data,
+                          {"i": "string"})
+        self.assertRaises(TypeError, bson.decode_columns, data,
+                          {"d": "int64"})
+        self.assertRaises(TypeError, bson.decode_columns, data,
+                          {"skipped": "int32"})
+        self.assertRaises(InvalidBSON, bson.decode_columns, data[:-1],
+                          {"i": "int32"})
+
+    def test_encode_numeric_buffers(self):
+        doubles = array.array("d", [1.5, -2.0])
+        ints = array.array("i", range(1500))
+        expected = {"d": [1.5, -2.0], "i": list(range(1500)), "e": []}
+        doc = {"d": doubles, "i": ints, "e": array.array("i")}
+        # Python 2's array.array doesn't support memoryview.
+        if PY3:
+            expected["v"] = [1.5, -2.0]
+            doc["v"] = memoryview(doubles)
+        data = BSON.encode(doc)
+        self.assertEqual(data, BSON.encode(expected))
+        self.assertEqual(expected, BSON(data).decode())
+
+        # Integers that don't fit in an int64 can't be encoded.
+        if PY3:
+            self.assertRaises(OverflowError, BSON.encode,
+                              {"u": array.array("Q", [2 ** 63])})
+
+        # Numeric buffers don't go to the fallback encoder.
+        def fallback_encoder(value):
+            raise AssertionError("fallback encoder called")
+        opts = CodecOptions(
+            type_registry=TypeRegistry(fallback_encoder=fallback_encoder))
+        self.assertEqual(data, BSON.encode(expected, codec_options=opts))
+
+    def test_decode_typed_arrays(self):
+        opts = CodecOptions(typed_arrays=True)
+        doc = {"d": [1.5, -2.0], "i": list(range(1500)),
+               "l": [Int64(1), 2 ** 40], "mixed": [1, 2.5], "e": [],
+               "s": ["a"]}
+        decoded = BSON.encode(doc).decode(opts)
+        self.assertEqual(array.array("d", [1.5, -2.0]), decoded["d"])
+        self.assertIsInstance(decoded["i"], array.array)
+        self.assertEqual(list(range(1500)), decoded["i"].tolist())
+        if bson._array_typecode(8) is not None:
+            self.assertIsInstance(decoded["l"], array.array)
+            self.assertEqual(8, decoded["l"].itemsize)
+        self.assertEqual([1, 2 ** 40], list(decoded["l"]))
+        self.assertEqual([1, 2.5], decoded["mixed"])
+        self.assertEqual([], decoded["e"])
+        self.assertEqual(["a"], decoded["s"])
+
+    def test_no_int64_typecode(self):
+        # Python 2 on Windows and 32-bit platforms has no array typecode
+        # for 8 byte integers.
+        self.addCleanup(bson._ARRAY_TYPECODES.clear)
+        bson._ARRAY_TYPECODES[8] = None
+        data = BSON.encode({"i": 1, "l": [Int64(1)]})
+        self.assertEqual([1], bson.decode_columns(
+            data, {"i": "int32"})["i"][0].tolist())
+        self.assertRaises(ValueError, bson.decode_columns, data,
+                          {"l": "int64"})
+        self.assertRaises(ValueError, bson.decode_columns, data,
+                          {"l": "datetime"})
+        if not bson.has_c():
+            # Decoded to a list instead, like the C extension does.
+            self.assertEqual([1], BSON(data).decode(
+                CodecOptions(typed_arrays=True))["l"])
+
 
 class TestCodecOptions(unittest.TestCase):
     def test_document_class(self):
@@ -931,7 +1202,8 @@ class TestCodecOptions(unittest.TestCase):
              "uuid_representation=PYTHON_LEGACY, "
              "unicode_decode_error_handler='strict', "
              "tzinfo=None, type_registry=TypeRegistry(type_codecs=[], "
-             "fallback_encoder=None))")
+             "fallback_encoder=None), typed_arrays=False, validate=True, "
+             "datetime_conversion=DATETIME)")
         self.assertEqual(r, repr(CodecOptions()))
 
     def test_decode_all_defaults(self):
@@ -948,6 +1220,32 @@ class TestCodecOptions(unittest.TestCase):
         self.assertEqual(decoded['uuid'], doc['uuid'])
         self.assertIsNone(decoded['dt'].tzinfo)
 
+    def test_validate(self):
+        self.assertRaises(TypeError, CodecOptions, validate=1)
+        self.assertTrue(CodecOptions().validate)
+        self.assertFalse(
+            CodecOptions().with_options(validate=False).validate)
+        trusted = CodecOptions(validate=False)
+        docs = [{"s": u"foo", "e": u"", "u": u"h\u00e9llo",
+                 "sub": {"a": [u"b", {"c": u"d"}]}}] * 3
+        data = b"".join([BSON.encode(doc) for doc in docs])
+        self.assertEqual(docs, decode_all(data, trusted))
+        self.assertEqual(docs[0], BSON(data[:len(data) // 3]).decode(trusted))
+
+        # Documents must still be framed correctly.
+        self.assertRaises(InvalidBSON, decode_all, data[:-1], trusted)
+        # A string length past the end of its document.
+        bad = BSON.encode({"s": u"foo"}).replace(b"\x04\x00\x00\x00",
+                                                 b"\x40\x00\x00\x00")
+        self.assertRaises(InvalidBSON, decode_all, bad)
+        # Trusted or not, bad string lengths can't move backwards or past
+        # the end of the document.
+        negative = BSON.encode({"s": u"foo"}).replace(b"\x04\x00\x00\x00",
+                                                      b"\xf9\xff\xff\xff")
+        for data in (bad, negative):
+            self.assertRaises(InvalidBSON, decode_all, data, trusted)
+            self.assertRaises(InvalidBSON, BSON(data).decode, trusted)
+
     def test_unicode_decode_error_handler(self):
         enc = BSON.encode({"keystr": "foobar"})
 
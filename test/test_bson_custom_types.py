@@ -29,8 +29,9 @@ from bson import (BSON,
                   _dict_to_bson,
                   _bson_to_dict)
 from bson.codec_options import (CodecOptions, TypeCodec, TypeDecoder,
-                                TypeEncoder, TypeRegistry)
+                                TypeEncoder, TypeRegistry, _MAX_CACHED_TYPES)
 from bson.errors import InvalidDocument
+from bson.son import SON
 
 from test import unittest
 
@@ -166,6 +167,40 @@ class TestFallbackEncoder(unittest.TestCase):
         with self.assertRaises(InvalidDocument):
             BSON().encode(document, codec_options=codecopts)
 
+    def test_repeated_types(self):
+        # Encoding resolved once per type must give the same results for
+        # every value of the type, and for subtypes of built-in types.
+        class MyInt(int):
+            pass
+
+        codecopts = self._get_codec_options(lambda x: Decimal128(x))
+        document = SON([('a', Decimal('1.5')), ('b', MyInt(2)),
+                        ('c', [Decimal('2.5'), MyInt(3), Decimal('3.5')])])
+        exp_bsonbytes = BSON.encode(SON([
+            ('a', Decimal128('1.5')), ('b', 2),
+            ('c', [Decimal128('2.5'), 3, Decimal128('3.5')])]))
+        for _ in range(2):
+            self.assertEqual(
+                exp_bsonbytes, BSON.encode(document, codec_options=codecopts))
+
+        # Resolution is not shared with registries without a fallback.
+        with self.assertRaises(InvalidDocument):
+            BSON.encode(document)
+        self.assertEqual(
+            exp_bsonbytes, BSON.encode(document, codec_options=codecopts))
+
+    def test_cached_types_bounded(self):
+        # Types created at runtime don't grow the caches without bound.
+        codecopts = self._get_codec_options(lambda x: 'fallback')
+        registry = codecopts.type_registry
+        for i in range(_MAX_CACHED_TYPES + 10):
+            value = type('Type%d' % (i,), (object,), {})()
+            self.assertEqual(
+                BSON.encode({'a': 'fallback'}),
+                BSON.encode({'a': value}, codec_options=codecopts))
+        self.assertLessEqual(len(registry._encoder_cache), _MAX_CACHED_TYPES)
+        self.assertLessEqual(len(registry._fallback_types), _MAX_CACHED_TYPES)
+
     def test_type_unencodable_by_fallback_encoder(self):
         def fallback_encoder(value):
             try:
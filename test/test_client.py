@@ -30,13 +30,16 @@ sys.path[0:0] = [""]
 
 from bson import BSON
 from bson.codec_options import CodecOptions, TypeEncoder, TypeRegistry
+from bson.datetime_ms import DatetimeConversion
 from bson.py3compat import thread
 from bson.son import SON
 from bson.tz_util import utc
 from pymongo import auth, message
 from pymongo.common import _UUID_REPRESENTATIONS
 from pymongo.command_cursor import CommandCursor
-from pymongo.compression_support import _HAVE_SNAPPY
+from pymongo.compression_support import (_HAVE_SNAPPY,
+                                         _HAVE_ZSTD,
+                                         decompress)
 from pymongo.cursor import CursorType
 from pymongo.database import Database
 from pymongo.errors import (AutoReconnect,
@@ -123,6 +126,17 @@ class ClientUnitTest(unittest.TestCase):
         self.assertEqual(ReadPreference.PRIMARY, client.read_preference)
         self.assertAlmostEqual(12, client.server_selection_timeout)
 
+    def test_max_requests_per_connection(self):
+        client = MongoClient(connect=False)
+        pool_opts = client._MongoClient__options.pool_options
+        self.assertEqual(1, pool_opts.max_requests_per_connection)
+        client = MongoClient(
+            'mongodb://localhost/?maxRequestsPerConnection=8', connect=False)
+        pool_opts = client._MongoClient__options.pool_options
+        self.assertEqual(8, pool_opts.max_requests_per_connection)
+        self.assertRaises(ValueError, MongoClient,
+                          maxRequestsPerConnection=0, connect=False)
+
     def test_types(self):
         self.assertRaises(TypeError, MongoClient, 1)
         self.assertRaises(TypeError, MongoClient, 1.14)
@@ -303,6 +317,9 @@ class ClientUnitTest(unittest.TestCase):
             uuidrepresentation=uuid_representation_label,
             unicode_decode_error_handler=unicode_decode_error_handler,
             tzinfo=tzinfo,
+            typed_arrays=True,
+            validate=False,
+            datetime_conversion=DatetimeConversion.INT,
             connect=False
         )
 
@@ -316,6 +333,12 @@ class ClientUnitTest(unittest.TestCase):
             c.codec_options.unicode_decode_error_handler,
             unicode_decode_error_handler)
         self.assertEqual(c.codec_options.tzinfo, tzinfo)
+        self.assertTrue(c.codec_options.typed_arrays)
+        self.assertFalse(c.codec_options.validate)
+        self.assertEqual(DatetimeConversion.INT,
+                         c.codec_options.datetime_conversion)
+        self.assertRaises(ValueError, MongoClient, datetime_conversion=0,
+                          connect=False)
 
     def test_uri_codec_options(self):
         # Ensure codec options are passed in correctly
@@ -1333,6 +1356,32 @@ class TestClient(IntegrationTest):
             opts = compression_settings(client)
             self.assertEqual(opts.compressors, ['snappy', 'zlib'])
 
+        if not _HAVE_ZSTD:
+            uri = "mongodb://localhost:27017/?compressors=zstd"
+            client = MongoClient(uri, connect=False)
+            opts = compression_settings(client)
+            self.assertEqual(opts.compressors, [])
+        else:
+            uri = "mongodb://localhost:27017/?compressors=zstd,zlib"
+            client = MongoClient(uri, connect=False)
+            opts = compression_settings(client)
+            self.assertEqual(opts.compressors, ['zstd', 'zlib'])
+            self.assertEqual(opts.zstd_compression_level, 3)
+            uri = "mongodb://localhost:27017/?compressors=zstd&zstdCompressionLevel=19"
+            client = MongoClient(uri, connect=False)
+            opts = compression_settings(client)
+            self.assertEqual(opts.zstd_compression_level, 19)
+            ctx = opts.get_compression_context(['zstd'])
+            data = b"zstd" * 1000
+            for _ in range(2):
+                self.assertEqual(data, decompress(ctx.compress(data),
+                                                  ctx.compressor_id))
+            uri = "mongodb://localhost:27017/?compressors=zstd&zstdCompressionLevel=23"
+            client = MongoClient(uri, connect=False)
+            opts = compression_settings(client)
+            self.assertEqual(opts.compressors, ['zstd'])
+            self.assertEqual(opts.zstd_compression_level, 3)
+
         options = client_context.default_client_options
         if "compressors" in options and "zlib" in options["compressors"]:
             for level in range(-1, 10):
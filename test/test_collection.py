@@ -50,6 +50,7 @@ from pymongo.errors import (ConfigurationError,
                             InvalidName,
                             InvalidOperation,
                             OperationFailure,
+                            ServerSelectionTimeoutError,
                             WriteConcernError)
 from pymongo.message import _COMMAND_OVERHEAD, _gen_find_command
 from pymongo.mongo_client import MongoClient
@@ -120,6 +121,18 @@ class TestCollectionNoConnect(unittest.TestCase):
     def test_iteration(self):
         self.assertRaises(TypeError, next, self.db)
 
+    def test_insert_many_error_assigns_ids(self):
+        client = MongoClient("localhost:1", serverSelectionTimeoutMS=10,
+                             connect=False)
+        self.addCleanup(client.close)
+        docs = [{} for _ in range(3)] + [{"_id": 1}]
+        self.assertRaises(ServerSelectionTimeoutError,
+                          client.pymongo_test.test.insert_many, docs)
+        # The documents get an _id even though none of them were sent.
+        for doc in docs[:3]:
+            self.assertIsInstance(doc["_id"], ObjectId)
+        self.assertEqual(1, docs[3]["_id"])
+
 
 class TestCollection(IntegrationTest):
 
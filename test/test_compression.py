@@ -0,0 +1,109 @@
+# Copyright 2019-present MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the policies for compressing wire protocol messages."""
+
+import os
+import struct
+import sys
+
+sys.path[0:0] = [""]
+
+from bson.codec_options import DEFAULT_CODEC_OPTIONS
+from bson.son import SON
+from pymongo import message
+from pymongo.compression_support import (CompressionSettings,
+                                         ZlibContext,
+                                         decompress)
+from pymongo.read_preferences import ReadPreference
+from test import unittest
+
+
+def _op_code(msg):
+    """The opCode of a message returned by _compress."""
+    if isinstance(msg, list):
+        msg = msg[0]
+    return struct.unpack("<iiii", msg[:16])[3]
+
+
+class TestCompressionPolicy(unittest.TestCase):
+    def compress(self, ctx, data, name="find"):
+        return _op_code(message._compress(2013, data, ctx, name)[1])
+
+    def test_no_policy(self):
+        ctx = ZlibContext(-1)
+        _, msg = message._compress(2013, b"x", ctx)
+        self.assertEqual(2012, _op_code(msg))
+        self.assertEqual(b"x", decompress(msg[1], ctx.compressor_id))
+
+    def test_min_size(self):
+        settings = CompressionSettings(["zlib"], -1, min_size=100)
+        ctx = settings.get_compression_context(["zlib"])
+        self.assertEqual(2013, self.compress(ctx, b"x" * 99))
+        _, msg = message._compress(2013, b"x" * 99, ctx, "find")
+        self.assertEqual(b"x" * 99, msg[16:])
+        self.assertEqual(2012, self.compress(ctx, b"x" * 100))
+
+        stats = settings.statistics()["zlib"]
+        self.assertEqual(1, stats["messages"])
+        self.assertEqual(2, stats["skipped"])
+        self.assertEqual(100, stats["bytes_in"])
+        self.assertEqual(len(ctx.compress(b"x" * 100)), stats["bytes_out"])
+        self.assertGreaterEqual(stats["time"], 0)
+
+    def test_rules(self):
+        settings = CompressionSettings(
+            ["zlib"], -1, min_size=100, rules={"find": False, "insert": True})
+        ctx = settings.get_compression_context(["zlib"])
+        self.assertEqual(2013, self.compress(ctx, b"x" * 1000, "find"))
+        self.assertEqual(2012, self.compress(ctx, b"x", "insert"))
+        self.assertEqual(2012, self.compress(ctx, b"x" * 100, "update"))
+
+        # The command name of OP_MSG and OP_QUERY commands.
+        cmd = SON([("find", "coll"), ("filter", {"x": "y" * 1000})])
+        _, msg, _, _ = message._op_msg(
+            0, cmd, "db", ReadPreference.PRIMARY, False, False,
+            DEFAULT_CODEC_OPTIONS, ctx=ctx)
+        self.assertEqual(2013, _op_code(msg))
+        _, msg, _ = message.query(
+            0, "db.$cmd", 0, -1, cmd, None, DEFAULT_CODEC_OPTIONS, ctx=ctx)
+        self.assertEqual(2004, _op_code(msg))
+        cmd = SON([("count", "coll"), ("query", {"x": "y" * 1000})])
+        _, msg, _ = message.query(
+            0, "db.$cmd", 0, -1, cmd, None, DEFAULT_CODEC_OPTIONS, ctx=ctx)
+        self.assertEqual(2012, _op_code(msg))
+
+    def test_adaptive(self):
+        settings = CompressionSettings(["zlib"], -1, adaptive=True)
+        ctx = settings.get_compression_context(["zlib"])
+        random_data = os.urandom(1000)
+        # Messages that don't compress skip 1, 2, 4... following messages.
+        results = [self.compress(ctx, random_data) for _ in range(10)]
+        self.assertEqual(
+            [2012, 2013, 2012, 2013, 2013, 2012, 2013, 2013, 2013, 2013],
+            results)
+        # Other commands are unaffected.
+        self.assertEqual(2012, self.compress(ctx, random_data, "insert"))
+        self.assertEqual(2012, self.compress(ctx, b"x" * 1000))
+        # A message that compresses well ends the back off.
+        self.assertEqual(2012, self.compress(ctx, b"x" * 1000))
+        self.assertEqual(2012, self.compress(ctx, b"x" * 1000))
+
+        stats = settings.statistics()["zlib"]
+        self.assertEqual(7, stats["messages"])
+        self.assertEqual(7, stats["skipped"])
+
+
+if __name__ == "__main__":
+    unittest.main()
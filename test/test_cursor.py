@@ -963,6 +963,40 @@ class TestCursor(IntegrationTest):
         self.db.test.insert_one({"x": 1})
         self.assertEqual(1, self.db.test.find({}, ["a"]).count())
 
+    def test_decode_fields(self):
+        self.db.test.drop()
+        self.db.test.insert_many([{"x": i, "y": [i] * 10, "z": str(i)}
+                                  for i in range(10)])
+        cursor = self.db.test.find().sort("x").batch_size(3)
+        self.assertIs(cursor, cursor.decode_fields(["x", "z"]))
+        expected = [{"x": i, "z": str(i)} for i in range(10)]
+        self.assertEqual(expected, list(cursor.clone()))
+        self.assertEqual(expected, list(cursor))
+        self.assertRaises(InvalidOperation, cursor.decode_fields, ["x"])
+
+        # Explain output is never filtered.
+        self.assertTrue(self.db.test.find().decode_fields(["x"]).explain())
+
+        # Only batches fetched after decode_fields are filtered.
+        cursor = self.db.test.aggregate([{"$sort": {"x": 1}}], batchSize=2)
+        cursor.decode_fields(["x"])
+        docs = list(cursor)
+        self.assertEqual(set(["_id", "x", "y", "z"]), set(docs[0]))
+        self.assertEqual([{"x": i} for i in range(2, 10)], docs[2:])
+
+    def test_to_columns(self):
+        self.db.test.drop()
+        self.db.test.insert_many([{"x": i, "y": i / 2.0} for i in range(10)])
+        self.db.test.insert_one({"x": None})
+        cursor = self.db.test.find().sort("_id").batch_size(3)
+        columns = cursor.to_columns({"x": "int64", "y": "double"})
+        self.assertEqual((list(range(10)) + [0], [1] * 10 + [0]),
+                         (columns["x"][0].tolist(), columns["x"][1].tolist()))
+        self.assertEqual([i / 2.0 for i in range(10)] + [0.0],
+                         columns["y"][0].tolist())
+        self.assertEqual(columns, cursor.to_columns(
+            [("x", "int64"), ("y", "double")]))
+
     def test_bad_getitem(self):
         self.assertRaises(TypeError, lambda x: self.db.test.find()[x], "hello")
         self.assertRaises(TypeError, lambda x: self.db.test.find()[x], 5.5)
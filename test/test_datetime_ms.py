@@ -0,0 +1,103 @@
+# Copyright 2019-present MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the DatetimeMS class and the datetime_conversion option."""
+
+import copy
+import datetime
+import pickle
+import sys
+sys.path[0:0] = [""]
+
+from bson import BSON, decode_all
+from bson.codec_options import CodecOptions
+from bson.datetime_ms import DatetimeConversion, DatetimeMS
+from bson.raw_bson import RawBSONDocument
+from bson.tz_util import FixedOffset, utc
+from test import unittest
+
+
+class TestDatetimeMS(unittest.TestCase):
+    def test_datetime_ms(self):
+        self.assertEqual(5, int(DatetimeMS(5)))
+        self.assertEqual(DatetimeMS(5), DatetimeMS(5))
+        self.assertNotEqual(DatetimeMS(5), DatetimeMS(6))
+        self.assertNotEqual(DatetimeMS(5), 5)
+        self.assertTrue(DatetimeMS(5) < DatetimeMS(6))
+        self.assertEqual(hash(DatetimeMS(5)), hash(DatetimeMS(5)))
+        self.assertEqual("DatetimeMS(-5)", repr(DatetimeMS(-5)))
+        self.assertRaises(TypeError, DatetimeMS, 1.5)
+        self.assertRaises(TypeError, DatetimeMS, "1")
+        self.assertRaises(OverflowError, DatetimeMS, 2 ** 63)
+
+    def test_datetime(self):
+        dt = datetime.datetime(2019, 6, 8, 13, 20, tzinfo=utc)
+        self.assertEqual(1560000000000, int(DatetimeMS(dt)))
+        self.assertEqual(dt.replace(tzinfo=None),
+                         DatetimeMS(1560000000000).as_datetime())
+        eastern = FixedOffset(-300, "EST")
+        opts = CodecOptions(tz_aware=True, tzinfo=eastern)
+        aware = DatetimeMS(dt).as_datetime(opts)
+        self.assertEqual(dt, aware)
+        self.assertEqual(eastern, aware.tzinfo)
+        self.assertRaises(OverflowError, DatetimeMS(2 ** 62).as_datetime)
+
+    def test_copy_and_pickle(self):
+        dtm = DatetimeMS(1560000000000)
+        self.assertEqual(dtm, copy.copy(dtm))
+        self.assertEqual(dtm, copy.deepcopy(dtm))
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            self.assertEqual(dtm, pickle.loads(pickle.dumps(dtm, protocol)))
+
+    def test_encode(self):
+        dt = datetime.datetime(2019, 6, 8, 13, 20)
+        self.assertEqual(BSON.encode({"t": dt}),
+                         BSON.encode({"t": DatetimeMS(1560000000000)}))
+        # Outside the range of datetime.datetime.
+        data = BSON.encode({"t": DatetimeMS(-2 ** 63)})
+        opts = CodecOptions(datetime_conversion=DatetimeConversion.INT)
+        self.assertEqual({"t": -2 ** 63}, BSON(data).decode(opts))
+
+    def test_decode(self):
+        dt = datetime.datetime(2019, 6, 8, 13, 20)
+        doc = {"t": dt, "nested": [{"t": dt}]}
+        data = BSON.encode(doc)
+        self.assertRaises(ValueError, CodecOptions, datetime_conversion=4)
+
+        opts = CodecOptions(
+            datetime_conversion=DatetimeConversion.DATETIME_MS)
+        dtm = DatetimeMS(1560000000000)
+        self.assertEqual({"t": dtm, "nested": [{"t": dtm}]},
+                         BSON(data).decode(opts))
+        self.assertEqual([{"t": dtm, "nested": [{"t": dtm}]}] * 2,
+                         decode_all(data * 2, opts))
+        self.assertEqual(data, BSON.encode(BSON(data).decode(opts)))
+
+        opts = opts.with_options(datetime_conversion=DatetimeConversion.INT)
+        millis = 1560000000000
+        self.assertEqual({"t": millis, "nested": [{"t": millis}]},
+                         BSON(data).decode(opts))
+        raw = RawBSONDocument(data, opts.with_options(
+            document_class=RawBSONDocument,
+            datetime_conversion=DatetimeConversion.DATETIME_MS))
+        self.assertEqual(dtm, raw["t"])
+
+        # The default is unchanged.
+        self.assertEqual(doc, BSON(data).decode())
+        opts = CodecOptions(tz_aware=True)
+        self.assertEqual(dt.replace(tzinfo=utc), BSON(data).decode(opts)["t"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -24,18 +24,22 @@ sys.path[0:0] = [""]
 
 from pymongo.errors import ConfigurationError
 
-from bson import json_util, EPOCH_AWARE, EPOCH_NAIVE, SON
+from bson import BSON, json_util, EPOCH_AWARE, EPOCH_NAIVE, SON
 from bson.json_util import (DatetimeRepresentation,
                             STRICT_JSON_OPTIONS)
 from bson.binary import (ALL_UUID_REPRESENTATIONS, Binary, MD5_SUBTYPE,
                          USER_DEFINED_SUBTYPE, JAVA_LEGACY, CSHARP_LEGACY,
                          STANDARD)
 from bson.code import Code
+from bson.codec_options import CodecOptions
 from bson.dbref import DBRef
+from bson.decimal128 import Decimal128
+from bson.errors import InvalidBSON
 from bson.int64 import Int64
 from bson.max_key import MaxKey
 from bson.min_key import MinKey
 from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
 from bson.regex import Regex
 from bson.timestamp import Timestamp
 from bson.tz_util import FixedOffset, utc
@@ -368,6 +372,95 @@ class TestJsonUtil(unittest.TestCase):
             '{"foo": "bar", "b": 1}',
             json_options=json_util.JSONOptions(document_class=SON)))
 
+    def test_bson_to_json(self):
+        doc = SON([
+            ("_id", ObjectId()),
+            ("str", u"caf\u00e9 \"\\\n\x01 \U0001f600"),
+            (u"k\u00e9y", [1, 2.5, float("nan"), float("inf"),
+                            -float("inf"), True, False, None]),
+            ("int64", Int64(1 << 40)),
+            ("sub", SON([("a", SON([("b", [])])), ("c", {})])),
+            ("dbref", DBRef("coll", 1, "db", extra=2)),
+            ("dates", [datetime.datetime(2018, 5, 12, 8, 3, 1, 123000),
+                       datetime.datetime(1960, 1, 1),
+                       datetime.datetime(1970, 1, 1)]),
+            ("bin", [Binary(b"", 0), Binary(b"\x01", 0),
+                     Binary(b"\x01\x02", 5), Binary(b"\x01\x02\x03", 128),
+                     Binary(b"\x01" * 16, 3)]),
+            ("uuid", uuid.uuid4()),
+            ("ts", Timestamp(2 ** 32 - 1, 2 ** 31)),
+            ("regex", Regex("a*b", re.IGNORECASE)),
+            ("code", [Code("x"), Code("y", {"z": 1})]),
+            ("dec", Decimal128("1.5")),
+            ("keys", [MinKey(), MaxKey()]),
+        ])
+        data = BSON.encode(doc)
+        for json_options in (json_util.DEFAULT_JSON_OPTIONS,
+                             json_util.RELAXED_JSON_OPTIONS,
+                             json_util.CANONICAL_JSON_OPTIONS,
+                             json_util.JSONOptions(
+                                 tz_aware=True,
+                                 tzinfo=FixedOffset(-60, "test"),
+                                 datetime_representation=
+                                 DatetimeRepresentation.ISO8601)):
+            decoded = BSON(data).decode(CodecOptions(
+                document_class=SON, tz_aware=json_options.tz_aware,
+                tzinfo=json_options.tzinfo,
+                uuid_representation=json_options.uuid_representation))
+            expected = json_util.dumps(decoded, json_options=json_options)
+            self.assertEqual(expected,
+                             json_util.bson_to_json(data, json_options))
+            self.assertEqual(expected, json_util.bson_to_json(
+                RawBSONDocument(data), json_options))
+
+        self.assertEqual(
+            ['{"a": 1}', '{"b": [true]}'],
+            list(json_util.bson_to_json_iter(
+                BSON.encode({"a": 1}) + BSON.encode({"b": [True]}))))
+        self.assertEqual([], list(json_util.bson_to_json_iter(b"")))
+
+        self.assertRaises(InvalidBSON, json_util.bson_to_json, data[:-1])
+        self.assertRaises(InvalidBSON, json_util.bson_to_json,
+                          BSON.encode({"s": "x"})[:-3] + b"\xff\x00\x00")
+
+    def test_parser_priority(self):
+        # The type is chosen by a fixed order of keys, not by the JSON's.
+        self.assertEqual({"$date": 1, "$ref": "x"},
+                         json_util.loads('{"$date": 1, "$ref": "x"}'))
+        self.assertRaises(TypeError, json_util.loads,
+                          '{"$numberInt": "1", "$oid": "%s"}' % ("a" * 24,))
+
+    def test_loads_raw(self):
+        json_options = json_util.JSONOptions(tz_aware=False)
+        jsn = ('{"b": {"$oid": "5a1b2c3d4e5f60718293a4b5"}, "_id": 1, '
+               '"sub": {"z": {"$numberLong": "5"}, "a": [{"$date": 0}]}, '
+               '"ref": {"$ref": "coll", "$id": 2}, '
+               '"query": {"$regex": {"$regex": "a"}}}')
+        doc = json_util.loads_raw(jsn, json_options)
+        self.assertIsInstance(doc, RawBSONDocument)
+        # Fields keep the order of the JSON text. Check the BSON itself,
+        # RawBSONDocument iterates over a dict on Python 2.
+        decoded = BSON(doc.raw).decode(CodecOptions(document_class=SON))
+        self.assertEqual(["b", "_id", "sub", "ref", "query"], list(decoded))
+        self.assertEqual(["z", "a"], list(decoded["sub"]))
+        self.assertEqual(
+            json_util.loads(jsn, json_options=json_options), decoded)
+        self.assertEqual(doc, json_util.loads_raw(jsn.encode(), json_options))
+
+        lines = ['{"a": 1}\n', '\n', '  \n', '{"a": {"$numberInt": "2"}}']
+        self.assertEqual(
+            [BSON.encode({"a": 1}), BSON.encode({"a": 2})],
+            [raw.raw for raw in json_util.loads_raw_iter(lines)])
+        self.assertEqual([], list(json_util.loads_raw_iter([])))
+
+        self.assertEqual(BSON.encode(SON([("$ref", "c"), ("$id", 1)])),
+                         json_util.loads_raw('{"$ref": "c", "$id": 1}').raw)
+        self.assertRaises(TypeError, json_util.loads_raw, '[{"a": 1}]')
+        self.assertRaises(TypeError, json_util.loads_raw, '{"$oid": 1}')
+        self.assertRaises(TypeError, json_util.loads_raw,
+                          '{"$oid": "5a1b2c3d4e5f60718293a4b5"}')
+        self.assertRaises(ValueError, json_util.loads_raw, '{"a": ')
+
 
 class TestJsonUtilRoundtrip(IntegrationTest):
     def test_cursor(self):
@@ -0,0 +1,156 @@
+# Copyright 2019-present MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the mmap_file module."""
+
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path[0:0] = [""]
+
+from bson import BSON, decode_all
+from bson.codec_options import CodecOptions
+from bson.errors import InvalidBSON
+from bson.mmap_file import MappedBSONFile
+from bson.raw_bson import RawBSONDocument
+from bson.son import SON
+from test import unittest
+
+
+class TestMappedBSONFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "coll.bson")
+        self.docs = [SON([("_id", i), ("s", "x" * i)]) for i in range(10)]
+        self.dicts = [dict(doc) for doc in self.docs]
+        self.write(b"".join(BSON.encode(doc) for doc in self.docs))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, data):
+        with open(self.path, "wb") as data_file:
+            data_file.write(data)
+
+    def assertDocsEqual(self, expected, docs):
+        for doc in docs:
+            self.assertIsInstance(doc, RawBSONDocument)
+        self.assertEqual(expected, [dict(doc) for doc in docs])
+
+    def test_len_and_indexing(self):
+        with MappedBSONFile(self.path) as dump:
+            self.assertEqual(10, len(dump))
+            self.assertDocsEqual(self.dicts[3:4], [dump[3]])
+            self.assertDocsEqual(self.dicts[9:], [dump[-1]])
+            self.assertEqual(BSON.encode(self.docs[5]), dump[5].raw)
+            self.assertRaises(IndexError, lambda: dump[10])
+            self.assertRaises(IndexError, lambda: dump[-11])
+            self.assertRaises(TypeError, lambda: dump["0"])
+            self.assertDocsEqual(self.dicts[2:8:3], dump[2:8:3])
+            self.assertDocsEqual(self.dicts[::-1], dump[::-1])
+            self.assertDocsEqual(self.dicts, list(dump))
+
+    def test_offsets(self):
+        with MappedBSONFile(self.path) as dump:
+            position = 0
+            for doc, offset in zip(self.docs, dump.offsets):
+                self.assertEqual(position, offset)
+                position += len(BSON.encode(doc))
+
+    def test_iter_range_and_partitions(self):
+        with MappedBSONFile(self.path) as dump:
+            self.assertDocsEqual(self.dicts[3:7], list(dump.iter_range(3, 7)))
+            self.assertDocsEqual(self.dicts[8:],
+                                 list(dump.iter_range(8, 100)))
+            parts = dump.partitions(3)
+            self.assertEqual([(0, 3), (3, 6), (6, 10)], parts)
+            docs = []
+            for start, stop in parts:
+                docs.extend(dump.iter_range(start, stop))
+            self.assertDocsEqual(self.dicts, docs)
+            self.assertEqual(10, len(dump.partitions(100)))
+            self.assertRaises(ValueError, dump.partitions, 0)
+
+    def test_persisted_index(self):
+        index_path = os.path.join(self.tmpdir, "coll.idx")
+        with MappedBSONFile(self.path, index_path=index_path) as dump:
+            offsets = list(dump.offsets)
+        self.assertTrue(os.path.exists(index_path))
+
+        # A stale index is detected by the size of the data file and rebuilt.
+        self.write(b"".join(BSON.encode(doc) for doc in self.docs[:4]))
+        with MappedBSONFile(self.path, index_path=index_path) as dump:
+            self.assertEqual(4, len(dump))
+            self.assertEqual(offsets[:4], list(dump.offsets))
+
+        # Rewriting the file with the same size changes its modification time.
+        stat = os.stat(self.path)
+        self.write(b"".join(BSON.encode(doc) for doc in self.docs[3::-1]))
+        os.utime(self.path, (stat.st_atime, stat.st_mtime + 10))
+        with MappedBSONFile(self.path, index_path=index_path) as dump:
+            self.assertDocsEqual(self.dicts[3::-1], list(dump))
+
+        # Offsets that don't match the documents are rebuilt, even when the
+        # modification time is restored.
+        stat = os.stat(self.path)
+        self.write(b"".join(BSON.encode(doc) for doc in self.docs[:4]))
+        if hasattr(stat, "st_mtime_ns"):
+            os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        else:
+            os.utime(self.path, (stat.st_atime, stat.st_mtime))
+        with MappedBSONFile(self.path, index_path=index_path) as dump:
+            self.assertDocsEqual(self.dicts[:4], list(dump))
+
+        # An index saved explicitly is loaded instead of scanning the file.
+        other = os.path.join(self.tmpdir, "other.idx")
+        with MappedBSONFile(self.path) as dump:
+            dump.save_index(other)
+        with MappedBSONFile(self.path, index_path=other) as dump:
+            self.assertDocsEqual(self.dicts[:4], list(dump))
+
+    def test_empty_file(self):
+        self.write(b"")
+        with MappedBSONFile(self.path) as dump:
+            self.assertEqual(0, len(dump))
+            self.assertEqual([], list(dump))
+            self.assertEqual([], dump.partitions(4))
+
+    def test_invalid_file(self):
+        data = b"".join(BSON.encode(doc) for doc in self.docs)
+        self.write(data[:-1])
+        self.assertRaises(InvalidBSON, MappedBSONFile, self.path)
+        self.write(data + b"\x05\x00")
+        self.assertRaises(InvalidBSON, MappedBSONFile, self.path)
+        self.write(b"\x06\x00\x00\x00\x00\x01")
+        self.assertRaises(InvalidBSON, MappedBSONFile, self.path)
+        self.assertRaises(TypeError, MappedBSONFile, self.path,
+                          CodecOptions(document_class=dict))
+
+    def test_close(self):
+        dump = MappedBSONFile(self.path)
+        doc = dump[1]
+        dump.close()
+        self.assertRaises(ValueError, lambda: dump[0])
+        self.assertRaises(ValueError, list, dump)
+        # Documents still alive keep their bytes readable.
+        self.assertDocsEqual(self.dicts[1:2], [doc])
+        self.assertEqual(self.docs[1], decode_all(doc.raw)[0])
+        dump.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,357 @@
+# Copyright 2019-present MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the network module's sending of messages and reading of replies."""
+
+import socket
+import struct
+import sys
+import threading
+
+sys.path[0:0] = [""]
+
+from bson import BSON
+from bson.codec_options import DEFAULT_CODEC_OPTIONS
+from bson.py3compat import PY3
+from bson.son import SON
+from pymongo import message, network
+from pymongo.errors import AutoReconnect, ProtocolError
+from pymongo.network import (_Multiplexer,
+                             _ReceiveBuffer,
+                             receive_message,
+                             sendall)
+from pymongo.pool import Pool, PoolOptions
+from pymongo.read_preferences import ReadPreference
+from test import unittest
+
+
+def _op_msg(response_to, doc):
+    body = struct.pack("<IB", 0, 0) + BSON.encode(doc)
+    return struct.pack("<iiii", 16 + len(body), 0, response_to, 2013) + body
+
+
+class CountingSocket(object):
+    """Wrap a socket, counting the calls to recv_into."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.calls = 0
+
+    def recv_into(self, buf, *args):
+        self.calls += 1
+        return self.sock.recv_into(buf, *args)
+
+    def recv(self, *args):
+        self.calls += 1
+        return self.sock.recv(*args)
+
+
+class TestReceiveMessage(unittest.TestCase):
+    def setUp(self):
+        self.server, client = socket.socketpair()
+        self.sock = CountingSocket(client)
+        self.addCleanup(self.server.close)
+        self.addCleanup(client.close)
+
+    def receive(self, request_id, receive_buffer):
+        reply = receive_message(self.sock, request_id,
+                                receive_buffer=receive_buffer)
+        return reply.command_response()
+
+    def test_receive_message(self):
+        for receive_buffer in (None, _ReceiveBuffer()):
+            self.server.sendall(_op_msg(1, {"ok": 1, "n": 1}) +
+                                _op_msg(2, {"ok": 1, "n": 2}))
+            self.assertEqual({"ok": 1, "n": 1},
+                             self.receive(1, receive_buffer))
+            self.assertEqual({"ok": 1, "n": 2},
+                             self.receive(2, receive_buffer))
+
+        self.server.sendall(_op_msg(3, {"ok": 1}))
+        self.assertRaises(ProtocolError, self.receive, 4, _ReceiveBuffer())
+
+    @unittest.skipUnless(PY3, "Python 2 doesn't buffer replies")
+    def test_read_ahead(self):
+        receive_buffer = _ReceiveBuffer()
+        self.server.sendall(_op_msg(1, {"ok": 1}) + _op_msg(2, {"ok": 1}))
+        self.receive(1, receive_buffer)
+        self.assertEqual(1, self.sock.calls)
+        # The second reply was read ahead.
+        self.receive(2, receive_buffer)
+        self.assertEqual(1, self.sock.calls)
+
+    @unittest.skipUnless(PY3, "Python 2 doesn't buffer replies")
+    def test_large_replies(self):
+        receive_buffer = _ReceiveBuffer(64)
+        docs = [{"ok": 1, "s": "x" * size} for size in (100, 200, 1000, 10)]
+        for i, doc in enumerate(docs):
+            self.server.sendall(_op_msg(i, doc))
+            self.assertEqual(doc, self.receive(i, receive_buffer))
+        # The buffer grew for the large replies and is reused.
+        self.assertGreaterEqual(len(receive_buffer._buf), 1000)
+
+        retained = network._MAX_RETAINED_BUFFER_SIZE
+        network._MAX_RETAINED_BUFFER_SIZE = 512
+        self.addCleanup(setattr, network, "_MAX_RETAINED_BUFFER_SIZE",
+                        retained)
+        receive_buffer = _ReceiveBuffer(64)
+        for i, doc in enumerate(docs):
+            self.server.sendall(_op_msg(i, doc))
+            self.assertEqual(doc, self.receive(i, receive_buffer))
+        # The buffer that grew past the limit was dropped.
+        self.assertEqual(network._RECEIVE_BUFFER_SIZE,
+                         len(receive_buffer._buf))
+
+    @unittest.skipUnless(PY3, "Python 2 doesn't buffer replies")
+    def test_shrink(self):
+        receive_buffer = _ReceiveBuffer()
+        size = network._RECEIVE_BUFFER_SIZE
+        self.server.sendall(_op_msg(1, {"ok": 1, "s": "x" * size}) +
+                            _op_msg(2, {"ok": 1}))
+        self.receive(1, receive_buffer)
+        self.assertGreater(len(receive_buffer._buf), size)
+        # Data read ahead is kept.
+        receive_buffer.shrink()
+        self.assertGreater(len(receive_buffer._buf), size)
+        self.assertEqual({"ok": 1}, self.receive(2, receive_buffer))
+        receive_buffer.shrink()
+        self.assertEqual(network._RECEIVE_BUFFER_SIZE,
+                         len(receive_buffer._buf))
+
+    def test_connection_closed(self):
+        data = _op_msg(1, {"ok": 1})
+        self.server.sendall(data[:20])
+        self.server.close()
+        self.assertRaises(AutoReconnect, self.receive, 1, _ReceiveBuffer())
+
+
+class SendingSocket(object):
+    """Wrap a socket, sending at most `limit` bytes with each sendmsg call.
+    """
+
+    def __init__(self, sock, limit):
+        self.sock = sock
+        self.limit = limit
+        self.sendmsg_calls = 0
+        self.sendall_calls = 0
+
+    def sendmsg(self, buffers):
+        self.sendmsg_calls += 1
+        data = b"".join(bytes(buf) for buf in buffers)[:self.limit]
+        return self.sock.send(data)
+
+    def sendall(self, data):
+        self.sendall_calls += 1
+        return self.sock.sendall(data)
+
+
+class TestSendall(unittest.TestCase):
+    def setUp(self):
+        self.server, self.client = socket.socketpair()
+        self.addCleanup(self.server.close)
+        self.addCleanup(self.client.close)
+
+    def receive(self, length):
+        return network._receive_data_on_socket(self.server, length)
+
+    def test_sendall(self):
+        sendall(self.client, b"abc")
+        sendall(self.client, bytearray(b"def"))
+        sendall(self.client, [b"gh", bytearray(b""), bytearray(b"ij")])
+        self.assertEqual(b"abcdefghij", bytes(self.receive(10)))
+
+    @unittest.skipUnless(network._HAS_SENDMSG, "sendmsg is not available")
+    def test_partial_sends(self):
+        sock = SendingSocket(self.client, 3)
+        buffers = [b"ab", bytearray(b"cdefg"), b"", b"h", b"ijklmnopq"]
+        sendall(sock, buffers)
+        self.assertEqual(6, sock.sendmsg_calls)
+        self.assertEqual(0, sock.sendall_calls)
+        self.assertEqual(b"abcdefghijklmnopq", bytes(self.receive(17)))
+
+        # SSL sockets join the buffers instead.
+        ssl_socket = network._SSLSocket
+        network._SSLSocket = SendingSocket
+        self.addCleanup(setattr, network, "_SSLSocket", ssl_socket)
+        sock = SendingSocket(self.client, 3)
+        sendall(sock, buffers)
+        self.assertEqual(0, sock.sendmsg_calls)
+        self.assertEqual(1, sock.sendall_calls)
+        self.assertEqual(b"abcdefghijklmnopq", bytes(self.receive(17)))
+
+    def test_op_msg(self):
+        docs = [{"_id": i} for i in range(3)]
+        cmd = SON([("insert", "coll"), ("documents", docs)])
+        request_id, msg, size, max_doc_size = message._op_msg(
+            0, cmd, "db", ReadPreference.PRIMARY, False, False,
+            DEFAULT_CODEC_OPTIONS)
+        self.assertEqual(docs, cmd["documents"])
+        self.assertEqual(len(BSON.encode(docs[0])), max_doc_size)
+        sendall(self.client, msg)
+
+        length, rid, _, op_code = struct.unpack("<iiii", self.receive(16))
+        self.assertEqual((request_id, 2013), (rid, op_code))
+        data = bytes(self.receive(length - 16))
+        flags, payload_type = struct.unpack("<IB", data[:5])
+        self.assertEqual((0, 0), (flags, payload_type))
+        command_size = struct.unpack("<i", data[5:9])[0]
+        self.assertEqual(
+            SON([("insert", "coll"), ("$db", "db"),
+                 ("$readPreference", {"mode": "primary"})]),
+            BSON(data[5:5 + command_size]).decode(
+                DEFAULT_CODEC_OPTIONS.with_options(document_class=SON)))
+        section = data[5 + command_size:]
+        self.assertEqual(1, ord(section[:1]))
+        self.assertEqual(len(section) - 1,
+                         struct.unpack("<i", section[1:5])[0])
+        self.assertEqual(b"documents\x00", section[5:15])
+        self.assertEqual(b"".join(BSON.encode(doc) for doc in docs),
+                         section[15:])
+
+
+class TestMultiplexer(unittest.TestCase):
+    def setUp(self):
+        self.server, self.client = socket.socketpair()
+        self.addCleanup(self.server.close)
+        self.addCleanup(self.client.close)
+
+    def start(self, target, count):
+        threads = [threading.Thread(target=target, args=(i,))
+                   for i in range(1, count + 1)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def test_replies_out_of_order(self):
+        multiplexer = _Multiplexer(_ReceiveBuffer())
+        replies = {}
+
+        def request(i):
+            multiplexer.sendall(self.client, _op_msg(0, {"n": i}))
+            reply = multiplexer.receive_message(self.client, i)
+            replies[i] = reply.command_response()
+
+        threads = self.start(request, 5)
+        # Each request was written whole.
+        received = []
+        for _ in range(5):
+            length = struct.unpack(
+                "<i", network._receive_data_on_socket(self.server, 4))[0]
+            data = network._receive_data_on_socket(self.server, length - 4)
+            received.append(BSON(bytes(data[17:])).decode()["n"])
+        self.assertEqual([1, 2, 3, 4, 5], sorted(received))
+
+        for i in range(5, 0, -1):
+            self.server.sendall(_op_msg(i, {"ok": 1, "n": i}))
+        for thread in threads:
+            thread.join()
+        self.assertEqual(
+            dict((i, {"ok": 1, "n": i}) for i in range(1, 6)), replies)
+
+    def test_connection_closed(self):
+        multiplexer = _Multiplexer()
+        errors = []
+
+        def request(i):
+            try:
+                multiplexer.receive_message(self.client, i)
+            except (AutoReconnect, socket.error) as exc:
+                errors.append(exc)
+
+        threads = self.start(request, 3)
+        self.server.sendall(_op_msg(4, {"ok": 1})[:10])
+        self.server.close()
+        for thread in threads:
+            thread.join()
+        # The thread reading the socket and the threads waiting for it fail.
+        self.assertEqual(3, len(errors))
+
+
+class _OpMsgPool(Pool):
+    """A Pool whose sockets use OP_MSG without a handshake."""
+
+    def connect(self):
+        sock_info = Pool.connect(self)
+        sock_info.op_msg_enabled = True
+        return sock_info
+
+
+class TestSharedSockets(unittest.TestCase):
+    def setUp(self):
+        self.listener = socket.socket()
+        self.addCleanup(self.listener.close)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(10)
+        self.address = self.listener.getsockname()
+
+    def create_pool(self, max_requests_per_connection):
+        pool = _OpMsgPool(self.address, PoolOptions(
+            max_requests_per_connection=max_requests_per_connection),
+            handshake=False)
+        self.addCleanup(pool.reset)
+        return pool
+
+    def test_not_shared(self):
+        pool = self.create_pool(1)
+        with pool.get_socket({}) as first:
+            with pool.get_socket({}) as second:
+                self.assertIsNot(first, second)
+                self.assertIsNone(first.multiplexer)
+                self.assertFalse(first.shared)
+        self.assertEqual(2, len(pool.sockets))
+
+    def test_shared(self):
+        pool = self.create_pool(2)
+        with pool.get_socket({}) as first:
+            self.assertTrue(first.shared)
+            with pool.get_socket({}) as second:
+                self.assertIs(first, second)
+                self.assertEqual(2, first.checkouts)
+                with pool.get_socket({}) as third:
+                    self.assertIsNot(first, third)
+                    self.assertEqual(1, third.checkouts)
+            self.assertEqual(1, first.checkouts)
+            # Exhaust cursors check out a socket of their own.
+            with pool.get_socket({}, checkout=True) as exhaust:
+                self.assertIsNot(first, exhaust)
+                self.assertFalse(exhaust.shared)
+                with pool.get_socket({}) as second:
+                    self.assertIs(first, second)
+            pool.return_socket(exhaust)
+            self.assertEqual(1, pool.active_sockets)
+
+        self.assertFalse(first.shared)
+        self.assertEqual([], pool.shared_sockets)
+        self.assertEqual(0, pool.active_sockets)
+        self.assertEqual(2, len(pool.sockets))
+
+        # Closed sockets aren't shared.
+        with pool.get_socket({}) as first:
+            first.close()
+            with pool.get_socket({}) as second:
+                self.assertIsNot(first, second)
+        self.assertEqual([second], list(pool.sockets))
+
+    @unittest.skipUnless(PY3, "Python 2 doesn't buffer replies")
+    def test_return_shrinks_receive_buffer(self):
+        pool = self.create_pool(1)
+        with pool.get_socket({}) as sock_info:
+            sock_info.receive_buffer = _ReceiveBuffer(
+                4 * network._RECEIVE_BUFFER_SIZE)
+        self.assertEqual(network._RECEIVE_BUFFER_SIZE,
+                         len(sock_info.receive_buffer._buf))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -15,6 +15,7 @@
 """Tests for the objectid module."""
 
 import datetime
+import itertools
 import pickle
 import struct
 import sys
@@ -168,9 +169,29 @@ class TestObjectId(unittest.TestCase):
 
     def test_counter_overflow(self):
         # Spec-test to check counter overflows from max value to 0.
-        ObjectId._inc = _MAX_COUNTER_VALUE
-        ObjectId()
-        self.assertEqual(ObjectId._inc, 0)
+        ObjectId._inc = itertools.count(_MAX_COUNTER_VALUE)
+        self.assertEqual(b"\xff\xff\xff", ObjectId().binary[9:])
+        self.assertEqual(b"\x00\x00\x00", ObjectId().binary[9:])
+
+    def test_generate_many(self):
+        ObjectId._inc = itertools.count(_MAX_COUNTER_VALUE - 1)
+        oids = ObjectId.generate_many(3)
+        self.assertEqual(3, len(oids))
+        self.assertEqual([b"\xff\xff\xfe", b"\xff\xff\xff", b"\x00\x00\x00"],
+                         [oid.binary[9:] for oid in oids])
+        # All share the time and random value of the first ObjectId.
+        self.assertEqual(set([oids[0].binary[:9]]),
+                         set(oid.binary[:9] for oid in oids))
+        self.assertEqual(b"\x00\x00\x01", ObjectId().binary[9:])
+        self.assertTrue(oid_generated_on_process(oids[0]))
+
+        self.assertEqual([], ObjectId.generate_many(0))
+        self.assertEqual(1000, len(set(ObjectId.generate_many(1000))))
+        self.assertRaises(ValueError, ObjectId.generate_many, -1)
+
+        class MyObjectId(ObjectId):
+            pass
+        self.assertIsInstance(MyObjectId.generate_many(1)[0], MyObjectId)
 
     def test_timestamp_values(self):
         # Spec-test to check timestamp field is interpreted correctly.
@@ -18,7 +18,9 @@ import uuid
 from bson import BSON
 from bson.binary import JAVA_LEGACY
 from bson.codec_options import CodecOptions
+from bson.errors import InvalidBSON
 from bson.raw_bson import RawBSONDocument
+from bson.son import SON
 from test import client_context, unittest
 
 
@@ -51,6 +53,57 @@ class TestRawBSONDocument(unittest.TestCase):
     def test_raw(self):
         self.assertEqual(self.bson_string, self.document.raw)
 
+    def test_decode_fields_lazily(self):
+        # {u'a': 1, u'bad': <invalid UTF-8>, u'c': {u'd': 2}}
+        bson_string = (
+            b"'\x00\x00\x00\x10a\x00\x01\x00\x00\x00\x02bad\x00\x03\x00\x00"
+            b"\x00\xff\xfe\x00\x03c\x00\x0c\x00\x00\x00\x10d\x00\x02\x00\x00"
+            b"\x00\x00\x00"
+        )
+        document = RawBSONDocument(bson_string)
+        self.assertEqual(3, len(document))
+        self.assertEqual(['a', 'bad', 'c'], list(document))
+        self.assertIn('bad', document)
+        self.assertNotIn('missing', document)
+        # Fields that are not accessed are never decoded.
+        self.assertEqual(1, document['a'])
+        self.assertIsInstance(document['c'], RawBSONDocument)
+        self.assertEqual(2, document['c']['d'])
+        self.assertIs(document['c'], document['c'])
+        self.assertRaises(InvalidBSON, lambda: document['bad'])
+        self.assertRaises(KeyError, lambda: document['missing'])
+
+        # Element sizes are still checked when fields are first accessed.
+        bad_length = RawBSONDocument(
+            bson_string.replace(b'\x0c\x00\x00\x00', b'\x7f\x00\x00\x00'))
+        self.assertRaises(InvalidBSON, lambda: bad_length['a'])
+
+    def test_with_changes(self):
+        document = RawBSONDocument(BSON.encode(
+            SON([('_id', 1), ('a', 1), ('b', [1, 2]), ('c', {'d': 3})])))
+        changed = document.with_changes(
+            SON([('new', 'x'), ('a', 2)]), remove=['b', 'missing'])
+        self.assertIsInstance(changed, RawBSONDocument)
+        self.assertEqual(
+            BSON.encode(SON([('_id', 1), ('a', 2), ('c', {'d': 3}),
+                             ('new', 'x')])),
+            changed.raw)
+        # The original document is unchanged.
+        self.assertEqual([1, 2], document['b'])
+        self.assertEqual(document.raw, document.with_changes().raw)
+        self.assertEqual(
+            BSON.encode({'c': {'d': 3}}),
+            document.with_changes(remove=['_id', 'a', 'b']).raw)
+        self.assertRaises(ValueError, document.with_changes, {'a': 2},
+                          remove=['a'])
+
+        # Only the last of duplicate keys is kept, as when decoding.
+        duplicates = RawBSONDocument(
+            b'\x13\x00\x00\x00\x10a\x00\x01\x00\x00\x00\x10a\x00\x02\x00\x00'
+            b'\x00\x00')
+        self.assertEqual(BSON.encode(SON([('a', 2), ('b', 3)])),
+                         duplicates.with_changes({'b': 3}).raw)
+
     @client_context.require_connection
     def test_round_trip(self):
         db = self.client.get_database(
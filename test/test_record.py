@@ -0,0 +1,199 @@
+# Copyright 2019-present MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for decoding BSON documents to records."""
+
+import collections
+import contextlib
+import sys
+sys.path[0:0] = [""]
+
+try:
+    import dataclasses
+except ImportError:
+    dataclasses = None
+
+import bson
+from bson import BSON, decode_all
+from bson.codec_options import CodecOptions
+from bson.errors import InvalidBSON
+from bson.record import RecordType
+from bson.son import SON
+from pymongo.message import _OpMsg
+from pymongo.mongo_client import MongoClient
+from test import unittest
+
+Point = collections.namedtuple('Point', ['x', 'y'])
+
+
+class Slotted(object):
+    __slots__ = ('_id', 'name', '__weakref__')
+
+
+class Child(Slotted):
+    __slots__ = ('age',)
+
+
+class TestRecordType(unittest.TestCase):
+    def test_record_type(self):
+        self.assertEqual(('x', 'y'), RecordType(Point).fields)
+        self.assertEqual(Point, RecordType(Point).record_class)
+        self.assertEqual(('_id', 'name', 'age'), RecordType(Child).fields)
+        self.assertEqual(('name',), RecordType(Child, ['name']).fields)
+        self.assertEqual(RecordType(Point), RecordType(Point))
+        self.assertNotEqual(RecordType(Child), RecordType(Slotted))
+        self.assertRaises(TypeError, RecordType, Point(1, 2))
+        self.assertRaises(TypeError, RecordType, tuple)
+        self.assertRaises(TypeError, RecordType, dict)
+        self.assertRaises(TypeError, RecordType, Slotted, 'name')
+        self.assertRaises(ValueError, RecordType, Point, ['x'])
+        self.assertRaises(ValueError, RecordType, Slotted, ['name', 'name'])
+
+        options = CodecOptions(document_class=RecordType(Point))
+        self.assertEqual(
+            options, CodecOptions(document_class=RecordType(Point)))
+        self.assertIn("RecordType(%s.Point, fields=['x', 'y'])" % (__name__,),
+                      repr(options))
+        self.assertRaises(TypeError, CodecOptions, document_class=RecordType)
+
+    def test_namedtuple(self):
+        options = CodecOptions(document_class=RecordType(Point))
+        data = BSON.encode(SON([('_id', 1), ('y', {'a': [1]}), ('x', 2)]))
+        self.assertEqual(Point(2, {'a': [1]}), BSON(data).decode(options))
+        self.assertEqual([Point(2, {'a': [1]})] * 2,
+                         decode_all(data * 2, options))
+        self.assertEqual([Point(2, {'a': [1]})],
+                         list(bson.decode_iter(data, options)))
+        self.assertEqual([Point(2, {'a': [1]})],
+                         decode_all(data, options, fields=['x', 'y']))
+        self.assertRaises(InvalidBSON, decode_all, data, options, ['x'])
+
+        data = BSON.encode({'x': 1})
+        self.assertRaises(InvalidBSON, BSON(data).decode, options)
+
+        encoded = BSON.encode(Point(1, 2), codec_options=options)
+        self.assertEqual(SON([('x', 1), ('y', 2)]), encoded.decode(
+            CodecOptions(document_class=SON)))
+        self.assertEqual(Point(1, 2), encoded.decode(options))
+        self.assertEqual(len(encoded),
+                         bson.calculate_size(Point(1, 2),
+                                             codec_options=options))
+        # Records are only encoded with a RecordType of their class.
+        self.assertRaises(TypeError, BSON.encode, Point(1, 2))
+
+    def test_slots(self):
+        options = CodecOptions(document_class=RecordType(Child))
+        data = BSON.encode({'name': 'Alice', 'age': 30, '_id': 1, 'a': 'b'})
+        child = BSON(data).decode(options)
+        self.assertIsInstance(child, Child)
+        self.assertEqual((1, 'Alice', 30), (child._id, child.name, child.age))
+
+        del child.age
+        encoded = BSON.encode(child, codec_options=options)
+        self.assertEqual(SON([('_id', 1), ('name', 'Alice')]),
+                         encoded.decode(CodecOptions(document_class=SON)))
+
+        # Only the chosen fields are decoded and encoded.
+        options = CodecOptions(document_class=RecordType(Child, ['name']))
+        child = BSON(data).decode(options)
+        self.assertEqual('Alice', child.name)
+        self.assertFalse(hasattr(child, 'age'))
+        self.assertEqual({'name': 'Alice'},
+                         BSON.encode(child, codec_options=options).decode())
+
+        self.assertRaises(InvalidBSON, BSON.encode({'_id': 1}).decode,
+                          options)
+
+    @unittest.skipIf(dataclasses is None, "dataclasses requires Python 3.7")
+    def test_dataclass(self):
+        def __post_init__(self):
+            raise AssertionError("__post_init__ must not be called")
+
+        Person = dataclasses.make_dataclass(
+            'Person',
+            ['name', ('_id', int, 0),
+             ('tags', list, dataclasses.field(default_factory=list))],
+            namespace={'__post_init__': __post_init__}, frozen=True)
+        options = CodecOptions(document_class=RecordType(Person))
+        person = BSON.encode({'name': 'Bob', 'other': 1}).decode(options)
+        self.assertEqual(('Bob', 0, []),
+                         (person.name, person._id, person.tags))
+        self.assertIsNot(person.tags, BSON.encode(
+            {'name': 'Bob'}).decode(options).tags)
+
+        encoded = BSON.encode(person, codec_options=options)
+        self.assertEqual(SON([('_id', 0), ('name', 'Bob'), ('tags', [])]),
+                         encoded.decode(CodecOptions(document_class=SON)))
+
+    def test_cursor_reply(self):
+        options = CodecOptions(document_class=RecordType(Point))
+        docs = [{'_id': i, 'x': i, 'y': -i} for i in range(3)]
+        reply = BSON.encode(SON([
+            ('cursor', SON([('firstBatch', docs), ('id', 0),
+                            ('ns', 'db.coll')])),
+            ('ok', 1)]))
+        response = _OpMsg(0, reply).unpack_response(codec_options=options)
+        self.assertEqual(1, len(response))
+        self.assertIsInstance(response[0], dict)
+        self.assertEqual(1, response[0]['ok'])
+        cursor = response[0]['cursor']
+        self.assertEqual(0, cursor['id'])
+        self.assertEqual([Point(i, -i) for i in range(3)],
+                         cursor['firstBatch'])
+
+    def test_watch(self):
+        options = CodecOptions(document_class=RecordType(Point))
+        change = SON([('_id', {'_data': 'token'}),
+                      ('operationType', 'insert'),
+                      ('fullDocument', {'_id': 1, 'x': 1, 'y': 2})])
+        commands = []
+
+        class MockSocketInfo(object):
+            address = ('localhost', 27017)
+            max_wire_version = 7
+
+            def command(self, dbname, spec, slave_ok, read_preference,
+                        codec_options, **kwargs):
+                commands.append(spec)
+                reply = BSON.encode(SON([
+                    ('cursor', SON([('firstBatch', [change]), ('id', 0),
+                                    ('ns', 'db.coll')])),
+                    ('operationTime', bson.Timestamp(1, 1)),
+                    ('ok', 1)]))
+                return _OpMsg(0, reply).unpack_response(
+                    codec_options=codec_options)[0]
+
+        @contextlib.contextmanager
+        def socket_for_reads(read_preference, session):
+            yield MockSocketInfo(), False
+
+        @contextlib.contextmanager
+        def tmp_session(session, close=True):
+            yield None
+
+        client = MongoClient(connect=False)
+        self.addCleanup(client.close)
+        client._socket_for_reads = socket_for_reads
+        client._tmp_session = tmp_session
+        coll = client.db.get_collection('coll', codec_options=options)
+        with coll.watch() as change_stream:
+            self.assertEqual('coll', commands[0]['aggregate'])
+            event = next(change_stream)
+        self.assertIsInstance(event, dict)
+        self.assertEqual(change, event)
+        self.assertEqual({'_data': 'token'}, change_stream._resume_token)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -115,6 +115,25 @@ class TestSON(unittest.TestCase):
         son_2_1_1 = pickle.loads(pickled_with_2_1_1)
         self.assertEqual(son_2_1_1, SON([]))
 
+    def test_pickle_restores_key_order(self):
+        # A SON pickled by pymongo on Python 2, where the dict items are not
+        # in insertion order, but the _SON__keys list is.
+        pickled_with_python_2 = b(
+            "ccopy_reg\n_reconstructor\np0\n(cbson.son\nSON\np1\n"
+            "c__builtin__\ndict\np2\n(dp3\nS'b'\nI2\nsS'a'\nI1\nstp4\n"
+            "Rp5\n(dp6\nS'_SON__keys'\np7\n(lp8\nS'a'\naS'b'\nasb."
+        )
+        son = pickle.loads(pickled_with_python_2)
+        self.assertEqual(son, SON([('a', 1), ('b', 2)]))
+        self.assertEqual(['a', 'b'], list(son))
+
+        son = SON([('b', 2), ('a', 1), ('c', 3)])
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            pickled = pickle.loads(pickle.dumps(son, protocol=protocol))
+            self.assertEqual(['b', 'a', 'c'], list(pickled))
+            self.assertEqual(['b', 'a', 'c'],
+                             pickled.__getstate__()['_SON__keys'])
+
     def test_copying(self):
         simple_son = SON([])
         complex_son = SON([('son', simple_son),
@@ -191,5 +210,48 @@ class TestSON(unittest.TestCase):
         test_son.popitem()
         self.assertEqual(2, len(test_son))
 
+    def test_ordering(self):
+        test_son = SON([('c', 3), ('a', 1)], b=2)
+        self.assertEqual(['c', 'a', 'b'], test_son.keys())
+        self.assertEqual("SON([('c', 3), ('a', 1), ('b', 2)])",
+                         repr(test_son))
+
+        # Setting an existing key keeps its position.
+        test_son['a'] = 10
+        self.assertEqual([('c', 3), ('a', 10), ('b', 2)], test_son.items())
+
+        # A deleted key goes to the end when it is set again.
+        del test_son['c']
+        test_son['c'] = 30
+        self.assertEqual(['a', 'b', 'c'], list(test_son))
+        self.assertEqual([10, 2, 30], test_son.values())
+        self.assertRaises(KeyError, test_son.__delitem__, 'missing')
+
+        # pop and popitem, which removes the first item.
+        self.assertEqual(2, test_son.pop('b'))
+        self.assertEqual('default', test_son.pop('b', 'default'))
+        self.assertEqual(('a', 10), test_son.popitem())
+        self.assertEqual(('c', 30), test_son.popitem())
+        self.assertRaises(KeyError, test_son.popitem)
+
+        copied = SON([('x', 1), ('y', 2)]).copy()
+        self.assertIsInstance(copied, SON)
+        self.assertEqual(['x', 'y'], list(copied))
+
+    def test_subclass_setitem(self):
+        class Recording(SON):
+            def __init__(self, *args, **kwargs):
+                self.set_keys = []
+                super(Recording, self).__init__(*args, **kwargs)
+
+            def __setitem__(self, key, value):
+                self.set_keys.append(key)
+                super(Recording, self).__setitem__(key, value)
+
+        recording = Recording([('a', 1)])
+        recording.update({'b': 2})
+        self.assertEqual(['a', 'b'], recording.set_keys)
+        self.assertEqual(SON([('a', 1), ('b', 2)]), recording)
+
 if __name__ == "__main__":
     unittest.main()